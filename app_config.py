@@ -0,0 +1,199 @@
+"""
+Shared configuration for the Metal Price Calculator.
+
+Metals, tickers, unit conversions, formula metrics, sales tax rates and
+the names of the files in the app data folder - everything both the Tk GUI (metal_calculator_gui) and the
+headless command line (metal_cli) need. Nothing here imports tkinter.
+"""
+
+import os
+import sys
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+APP_NAME = "MetalCalculator"
+DATABASE_FILE = "metal_calculator.db"  # inventory, formulas and prediction history
+SETTINGS_FILE = "settings.json"
+
+# Files used before the database - imported into it once, then left alone
+INVENTORY_FILE = "metal_inventory.json"
+FORMULAS_FILE = "custom_formulas.json"
+PREDICTIONS_FILE = "prediction_history.json"
+PREDICTIONS_JOURNAL_FILE = "prediction_history.jsonl"
+
+# API endpoints
+GOLD_API_BASE = "https://api.gold-api.com/price"
+
+# gold-api.com retry policy (kept short so a retry still fits in the refresh deadline)
+GOLD_API_RETRIES = 1
+GOLD_API_BACKOFF = 0.5
+
+# Overall time limit (seconds) for refreshing every metal's spot price at once
+INVENTORY_REFRESH_DEADLINE = 30
+
+# Time limit (seconds) for one metal's spot price, Yahoo Finance fallback included
+SPOT_PRICE_DEADLINE = 60
+
+# Grading uses the closest bar from this many days before to this many days after a target date
+GRADE_DAYS_BEFORE = 3
+GRADE_DAYS_AFTER = 2
+
+# Metal configurations
+METALS = {
+    'Gold': {'symbol': 'XAU', 'yf_ticker': 'GC=F', 'color': '#FFD700'},
+    'Silver': {'symbol': 'XAG', 'yf_ticker': 'SI=F', 'color': '#C0C0C0'},
+    'Platinum': {'symbol': 'XPT', 'yf_ticker': 'PL=F', 'color': '#E5E4E2'},
+    'Copper': {'symbol': 'XCU', 'yf_ticker': 'HG=F', 'color': '#B87333'}
+}
+
+# Prediction secondary options (includes non-metals for correlation)
+PREDICTION_SECONDARIES = {
+    'Gold': {'yf_ticker': 'GC=F', 'type': 'metal'},
+    'Silver': {'yf_ticker': 'SI=F', 'type': 'metal'},
+    'Platinum': {'yf_ticker': 'PL=F', 'type': 'metal'},
+    'Copper': {'yf_ticker': 'HG=F', 'type': 'metal'},
+    'S&P 500': {'yf_ticker': '^GSPC', 'type': 'index'}
+}
+
+# Suggested secondary pairings (backtest: Silver/S&P 500 best in-range ~66%; Silver/Copper worst direction)
+SUGGESTED_PAIRINGS = {
+    'Silver': 'S&P 500',   # Best in-range and lowest error in backtests
+    'Gold': 'Silver',      # Inverse GSR
+    'Platinum': 'Gold',    # Both precious metals
+    'Copper': 'S&P 500'    # Industrial correlation
+}
+
+# DXY (US Dollar Index) ticker for confidence calculation
+DXY_TICKER = 'DX-Y.NYB'
+
+# Prediction v4: tickers for regime and crash detection (the regime constants live in prediction_engine)
+SP500_TICKER_REGIME = '^GSPC'
+VIX_TICKER = '^VIX'
+
+# Conversion factors
+TROY_OUNCE_TO_GRAMS = 31.1035
+POUND_TO_GRAMS = 453.592
+
+# Unit configurations
+UNITS = {
+    'gram': {'factor': 1, 'label': 'per gram'},
+    'oz': {'factor': TROY_OUNCE_TO_GRAMS, 'label': 'per troy oz'},
+    'lb': {'factor': POUND_TO_GRAMS, 'label': 'per lb'}
+}
+
+# Metric abbreviations for formula builder
+METRIC_ABBREVS = {
+    'current_price': 'cur',
+    '7_day_avg': '7davg',
+    '7_day_median': '7dmed',
+    '7_day_high': '7dhi',
+    '7_day_low': '7dlo',
+    '14_day_avg': '14davg',
+    '14_day_median': '14dmed',
+    '28_day_avg': '28davg',
+    '28_day_median': '28dmed',
+    '1_year_avg': '1yavg'
+}
+
+# Reverse lookup
+ABBREV_TO_METRIC = {v: k for k, v in METRIC_ABBREVS.items()}
+
+# US State Sales Tax Rates (as of 2024)
+# Note: Many states exempt precious metals from sales tax
+STATE_TAX_RATES = {
+    'None (0%)': 0.0,
+    'Alabama (4%)': 4.0,
+    'Alaska (0%)': 0.0,
+    'Arizona (5.6%)': 5.6,
+    'Arkansas (6.5%)': 6.5,
+    'California (7.25%)': 7.25,
+    'Colorado (2.9%)': 2.9,
+    'Connecticut (6.35%)': 6.35,
+    'Delaware (0%)': 0.0,
+    'Florida (6%)': 6.0,
+    'Georgia (4%)': 4.0,
+    'Hawaii (4%)': 4.0,
+    'Idaho (6%)': 6.0,
+    'Illinois (6.25%)': 6.25,
+    'Indiana (7%)': 7.0,
+    'Iowa (6%)': 6.0,
+    'Kansas (6.5%)': 6.5,
+    'Kentucky (6%)': 6.0,
+    'Louisiana (4.45%)': 4.45,
+    'Maine (5.5%)': 5.5,
+    'Maryland (6%)': 6.0,
+    'Massachusetts (6.25%)': 6.25,
+    'Michigan (6%)': 6.0,
+    'Minnesota (6.875%)': 6.875,
+    'Mississippi (7%)': 7.0,
+    'Missouri (4.225%)': 4.225,
+    'Montana (0%)': 0.0,
+    'Nebraska (5.5%)': 5.5,
+    'Nevada (6.85%)': 6.85,
+    'New Hampshire (0%)': 0.0,
+    'New Jersey (6.625%)': 6.625,
+    'New Mexico (4.875%)': 4.875,
+    'New York (4%)': 4.0,
+    'North Carolina (4.75%)': 4.75,
+    'North Dakota (5%)': 5.0,
+    'Ohio (5.75%)': 5.75,
+    'Oklahoma (4.5%)': 4.5,
+    'Oregon (0%)': 0.0,
+    'Pennsylvania (6%)': 6.0,
+    'Rhode Island (7%)': 7.0,
+    'South Carolina (6%)': 6.0,
+    'South Dakota (4.5%)': 4.5,
+    'Tennessee (7%)': 7.0,
+    'Texas (6.25%)': 6.25,
+    'Utah (6.1%)': 6.1,
+    'Vermont (6%)': 6.0,
+    'Virginia (5.3%)': 5.3,
+    'Washington (6.5%)': 6.5,
+    'West Virginia (6%)': 6.0,
+    'Wisconsin (5%)': 5.0,
+    'Wyoming (4%)': 4.0,
+    'Washington DC (6%)': 6.0,
+    'Custom...': -1  # Flag for custom entry
+}
+
+# Available metrics for formulas
+AVAILABLE_METRICS = [
+    'current_price',
+    '7_day_avg',
+    '7_day_median',
+    '7_day_high',
+    '7_day_low',
+    '14_day_avg',
+    '14_day_median',
+    '28_day_avg',
+    '28_day_median',
+    '1_year_avg'
+]
+
+METRIC_LABELS = {
+    'current_price': "Today's Price",
+    '7_day_avg': '7-Day Average',
+    '7_day_median': '7-Day Median',
+    '7_day_high': '7-Day High',
+    '7_day_low': '7-Day Low',
+    '14_day_avg': '14-Day Average',
+    '14_day_median': '14-Day Median',
+    '28_day_avg': '28-Day Average',
+    '28_day_median': '28-Day Median',
+    '1_year_avg': '1-Year Average'
+}
+
+
+def app_data_path():
+    """Get the path for app data storage (created on first use)"""
+    if sys.platform == 'win32':
+        app_data = os.environ.get('APPDATA', os.path.expanduser('~'))
+        app_folder = os.path.join(app_data, APP_NAME)
+    else:
+        app_folder = os.path.join(os.path.expanduser('~'), f'.{APP_NAME.lower()}')
+    
+    if not os.path.exists(app_folder):
+        os.makedirs(app_folder)
+    
+    return app_folder
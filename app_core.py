@@ -0,0 +1,953 @@
+"""
+The Metal Price Calculator without a window.
+
+AppCore owns everything the calculator does that needs no display: the app
+data folder and settings, the SQLite store, the price history cache, the
+spot price cache and HTTP client, and the prediction engine. On top of
+those it runs the same workflows the GUI buttons start:
+
+    spot prices      gold-api.com with a Yahoo Finance fallback
+    price metrics    today's price and the window metrics custom formulas use
+    predictions      fetch the histories, assemble prediction data, predict,
+                     score confidence and build the record that is saved
+    grading          grade matured predictions against one history per metal
+    back tests       the sources and full_data a back test pairing needs
+    inventory        value the stored holdings at the cached spot prices
+
+The Tk GUI (metal_calculator_gui) builds one AppCore and adds the widgets;
+the command line (metal_cli) uses it directly, so scheduled jobs read and
+write the same files as the desktop app without importing tkinter.
+
+Network work runs on one background event loop (market_loop.DataLoop,
+self.data). Each fetching workflow is a coroutine (the *_async methods) that
+the GUI submits to that loop; the plain methods of the same name run it
+there and wait, for the command line and the pricing service.
+"""
+
+import asyncio
+import json
+import math
+import os
+from datetime import datetime, timedelta
+
+from app_config import (DATABASE_FILE, SETTINGS_FILE, INVENTORY_FILE, FORMULAS_FILE, PREDICTIONS_FILE,
+                        PREDICTIONS_JOURNAL_FILE, GOLD_API_BASE, GOLD_API_RETRIES, GOLD_API_BACKOFF,
+                        INVENTORY_REFRESH_DEADLINE, SPOT_PRICE_DEADLINE, GRADE_DAYS_BEFORE, GRADE_DAYS_AFTER, METALS,
+                        PREDICTION_SECONDARIES, DXY_TICKER, SP500_TICKER_REGIME, VIX_TICKER,
+                        TROY_OUNCE_TO_GRAMS, METRIC_ABBREVS, STATE_TAX_RATES, app_data_path)
+from market_data import (HistoryStore, HISTORY_DIR, HttpClient, HTTP_POOL_SIZE, SpotPriceCache, SPOT_CACHE_TTL,
+                         period_covering)
+from market_loop import DataLoop, MarketData, run_blocking
+from indicators import SeriesIndicators
+from prediction_engine import PredictionEngine, MarketSnapshot, SQRT_7
+from data_store import DataStore
+from date_index import DateIndex, as_date
+from inventory_valuation import InventoryValuation
+from formulas import FormulaCache
+from rolling_metrics import RollingMetrics, window_metrics_in
+from backtest import BacktestCheckpoint, BACKTEST_CHECKPOINT_DIR, checkpoint_path
+
+# Try to import yfinance
+try:
+    import yfinance as yf
+except ImportError:
+    yf = None
+
+PREDICTION_HORIZON_DAYS = 7  # a saved prediction is graded this many days after it was made
+
+
+def read_settings(data_path):
+    """settings.json from the app data folder as a dict ({} if missing or unreadable)"""
+    try:
+        path = os.path.join(data_path, SETTINGS_FILE)
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f)
+    except Exception as e:
+        print(f"Error loading settings: {e}")
+    return {}
+
+
+def series_indicators(series):
+    """Incremental RSI/ATR state for a prediction_data entry (built on first use, then reused)"""
+    indicators = series.get('indicators')
+    closes = series.get('closes', [])
+    if indicators is None or len(indicators) != len(closes):
+        indicators = SeriesIndicators.from_series(closes, series.get('highs'), series.get('lows'))
+        series['indicators'] = indicators
+    return indicators
+
+
+def calculate_momentum(closes, period=7):
+    """Calculate momentum using log returns, displayed as percentage"""
+    if len(closes) < period + 1:
+        return None
+
+    current = closes[-1]
+    past = closes[-period-1]
+
+    if past <= 0 or current <= 0:
+        return None
+
+    # Use log return for internal calculation
+    log_return = math.log(current / past)
+
+    # Convert to percentage for display: (e^log_return - 1) * 100
+    momentum_pct = (math.exp(log_return) - 1) * 100
+    return momentum_pct
+
+
+def ratio_trend(primary_closes, secondary_closes):
+    """% change of the secondary/primary ratio, 7-day average vs 28-day average (None under 28 days)"""
+    if len(primary_closes) < 28 or len(secondary_closes) < 28:
+        return None
+    ratio_7d = sum([secondary_closes[i] / primary_closes[i] for i in range(-7, 0) if primary_closes[i] > 0]) / 7
+    ratio_28d = sum([secondary_closes[i] / primary_closes[i] for i in range(-28, 0) if primary_closes[i] > 0]) / 28
+    return ((ratio_7d - ratio_28d) / ratio_28d) * 100 if ratio_28d > 0 else 0
+
+
+def rsi_signal(rsi):
+    """OVERBOUGHT / OVERSOLD / NEUTRAL for an RSI value (None for None)"""
+    if rsi is None:
+        return None
+    if rsi >= 70:
+        return "OVERBOUGHT"
+    if rsi <= 30:
+        return "OVERSOLD"
+    return "NEUTRAL"
+
+
+def matured_predictions(records, now=None):
+    """Ungraded predictions whose target date has passed"""
+    now = now or datetime.now()
+    return [r for r in records if not r['graded'] and datetime.fromisoformat(r['target_date']) <= now]
+
+
+def settings_tax_rate(settings):
+    """Sales tax % for the state (or custom rate) saved in the settings"""
+    state = settings.get('sales_tax_state', 'None (0%)')
+    if state == 'Custom...':
+        try:
+            return float(settings.get('custom_tax_rate', 0.0))
+        except (TypeError, ValueError):
+            return 0.0
+    return STATE_TAX_RATES.get(state, 0.0)
+
+
+def formula_price(formula, metrics, rolling, tax_rate, cache):
+    """
+    Price ($/gram) of one custom formula for the calculator's metrics, after
+    sales tax when the formula applies it. rolling (RollingMetrics) supplies
+    any other Nd window the expression uses; cache is the FormulaCache the
+    expression is compiled in. None if it can't be calculated.
+    """
+    if not metrics:
+        return None
+
+    expression = formula.get('expression', '')
+    if not expression:
+        # Legacy support for old weight-based formulas
+        return legacy_formula_price(formula, metrics, tax_rate)
+
+    try:
+        # Build context with metric values using abbreviations
+        context = {}
+        for metric, abbrev in METRIC_ABBREVS.items():
+            if metric in metrics:
+                context[abbrev] = metrics[metric]
+            else:
+                # If metric not available, we can't calculate
+                return None
+
+        # Any other Nd window the expression uses (60davg, 90dmed ...)
+        for name in window_metrics_in(expression):
+            if name not in context:
+                value = rolling.latest(name) if rolling else None
+                if value is None:
+                    return None
+                context[name] = value
+
+        # Parse and validate expression
+        price = cache.evaluate(expression, context)
+
+        if price is None or price < 0:
+            return None
+
+        # Apply tax adjustment if enabled
+        if formula.get('apply_tax', True) and tax_rate > 0:
+            price = price * (1 - tax_rate / 100)
+
+        return price
+
+    except Exception as e:
+        print(f"Formula evaluation error: {e}")
+        return None
+
+
+def legacy_formula_price(formula, metrics, tax_rate):
+    """Price of an old weight-based formula (for backwards compatibility)"""
+    weights = formula.get('weights', {})
+    if not weights:
+        return None
+
+    total_weight = sum(weights.values())
+    if total_weight == 0:
+        return None
+
+    weighted_sum = 0
+    for metric, weight in weights.items():
+        if metric in metrics:
+            weighted_sum += metrics[metric] * weight
+        else:
+            return None
+
+    price = weighted_sum / total_weight
+
+    # Apply tax
+    if formula.get('apply_tax', True) and tax_rate > 0:
+        price = price * (1 - tax_rate / 100)
+
+    # Apply safety margin
+    margin = formula.get('safety_margin', 0)
+    if margin > 0:
+        price = price * (1 - margin / 100)
+
+    return price
+
+
+class AppCore:
+    """Data files, caches and engine of the calculator, plus the workflows that use them."""
+
+    def __init__(self, data_path=None, settings=None):
+        self.data_path = data_path or app_data_path()
+        self.settings = settings if settings is not None else read_settings(self.data_path)
+
+        # Shared HTTP client for all spot price calls (keep-alive pool, retries, latency counters)
+        self.http = HttpClient(pool_size=self.settings.get('http_pool_size', HTTP_POOL_SIZE))
+        self.http.configure_host(GOLD_API_BASE.split('/')[2], retries=GOLD_API_RETRIES, backoff=GOLD_API_BACKOFF)
+
+        # One spot price cache ($/oz per metal) read by the calculator, quick calc and inventory
+        self.spot_prices = SpotPriceCache(self.fetch_spot_price, ttl=self.settings.get('spot_cache_ttl', SPOT_CACHE_TTL))
+
+        self.history_store = HistoryStore(os.path.join(self.data_path, HISTORY_DIR))
+
+        # Background event loop every fetch runs on, and the rate-limited async history reads
+        self.data = DataLoop()
+        self.market = MarketData(self.history_store)
+        self.store = DataStore(os.path.join(self.data_path, DATABASE_FILE))
+        self.store.migrate_json(inventory_path=os.path.join(self.data_path, INVENTORY_FILE),
+                                formulas_path=os.path.join(self.data_path, FORMULAS_FILE),
+                                predictions_path=os.path.join(self.data_path, PREDICTIONS_FILE),
+                                journal_path=os.path.join(self.data_path, PREDICTIONS_JOURNAL_FILE))
+
+        self.formula_cache = FormulaCache()  # compiled formula expressions
+        self.prediction_engine = PredictionEngine()
+        # Passed to every snapshot for the RECOVERY buffer. Nothing records crashes, so it stays None and
+        # live predictions match the back test (which passes None too)
+        self.last_crash_time = None
+
+    # =========================================================================
+    # SPOT PRICES
+    # =========================================================================
+
+    def fetch_spot_price(self, metal_name):
+        """Fetch a metal's spot price ($/oz) from gold-api.com, falling back to Yahoo Finance"""
+        metal_config = METALS[metal_name]
+
+        # Try gold-api.com first
+        price_oz = self.get_current_spot_price(metal_config['symbol'])
+
+        # Fallback to Yahoo Finance with retry
+        if price_oz is None:
+            price_oz = self.get_yf_current_price_with_retry(metal_config['yf_ticker'])
+        return price_oz
+
+    def get_current_spot_price(self, symbol):
+        """Fetch current spot price from gold-api.com"""
+        try:
+            response = self.http.get(f"{GOLD_API_BASE}/{symbol}", timeout=15)
+            if response.status_code == 200:
+                data = response.json()
+                if "price" in data:
+                    return float(data["price"])
+        except Exception as e:
+            print(f"gold-api.com error: {e}")
+        return None
+
+    def get_yf_current_price_with_retry(self, ticker, timeout=15, max_retries=2):
+        """Get current price from Yahoo Finance with timeout and retry (rate limited with every other Yahoo call)"""
+        if yf is None:
+            return None
+
+        hist, error = self.data.run(self.market.download(ticker, timeout=timeout, max_retries=max_retries,
+                                                         period="1d"))
+        if hist is None:
+            print(f"YF current price error: {error}")
+            return None
+        return float(hist['Close'].iloc[-1])
+
+    @property
+    def inventory_prices(self):
+        """Current price per gram for every metal in the spot price cache"""
+        return {metal: price_oz / TROY_OUNCE_TO_GRAMS for metal, price_oz in self.spot_prices.snapshot().items()}
+
+    async def spot_price_async(self, metal, deadline=SPOT_PRICE_DEADLINE):
+        """A metal's spot price ($/oz) from the shared cache, fetched if stale; None on failure or past the deadline"""
+        try:
+            return await run_blocking(self.spot_prices.get, metal, timeout=deadline)
+        except asyncio.TimeoutError:
+            print(f"Spot price for {metal} not fetched within {deadline}s")
+            return self.spot_prices.peek(metal)
+
+    async def refresh_spot_prices_async(self, metals=None, deadline=INVENTORY_REFRESH_DEADLINE, on_progress=None):
+        """
+        Fetch the spot price of every metal (default: all) concurrently, within
+        one overall deadline in seconds. on_progress(fetched, total) is called
+        as each metal finishes. Returns how many prices were fetched.
+        """
+        metals = list(metals or METALS)
+        prices_fetched = 0
+
+        # All metals at once so the refresh takes as long as the slowest metal, not the sum
+        pending = {asyncio.ensure_future(run_blocking(self.spot_prices.get, name)) for name in metals}
+        loop = asyncio.get_running_loop()
+        end = loop.time() + deadline
+        try:
+            while pending:
+                remaining = end - loop.time()
+                if remaining <= 0:
+                    print(f"Spot price refresh stopped after {deadline}s deadline")
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and task.result() is not None:
+                        prices_fetched += 1
+                    if on_progress is not None:
+                        on_progress(prices_fetched, len(metals))
+        finally:
+            # Don't wait for stragglers past the deadline
+            for task in pending:
+                task.cancel()
+        return prices_fetched
+
+    def refresh_spot_prices(self, metals=None, deadline=INVENTORY_REFRESH_DEADLINE, on_progress=None):
+        """refresh_spot_prices_async, run on the data loop"""
+        return self.data.run(self.refresh_spot_prices_async(metals, deadline, on_progress))
+
+    # =========================================================================
+    # PRICE METRICS
+    # =========================================================================
+
+    async def price_metrics_async(self, metal, on_progress=None):
+        """
+        The calculator's metrics for one metal ($/gram): today's spot price
+        and every window metric as of the latest of a year of closes.
+
+        Returns (result, error). result holds 'metrics' ({metric: value},
+        windows longer than the history left out), 'rolling' (RollingMetrics
+        for any other window a formula asks for) and 'history' ((dates,
+        closes)); error is a message for the user. on_progress(message) is
+        called before each download.
+        """
+        # Step 1: Current spot price (shared cache - only hits the network when stale)
+        if on_progress is not None:
+            on_progress("Fetching current spot price...")
+        current_price_oz = await self.spot_price_async(metal)
+
+        if current_price_oz is None:
+            return None, ("Could not fetch current spot price.\n\nBoth price APIs failed to respond.\n"
+                          "Please check your internet connection and try again.")
+
+        # Step 2: Fetch historical data from Yahoo Finance with retry
+        if on_progress is not None:
+            on_progress("Fetching historical data...")
+        hist, error = await self.market.history(METALS[metal]['yf_ticker'], period="1y", timeout=30, max_retries=2)
+
+        if error or hist is None or len(hist) < 7:
+            error_msg = error if error else "No historical data returned"
+            return None, (f"Could not fetch historical data.\n\n{error_msg}\n\n"
+                          "Yahoo Finance may be temporarily unavailable.\nPlease try again in a moment.")
+
+        # Calculate all metrics (stored per gram as base unit)
+        all_prices = [float(p) / TROY_OUNCE_TO_GRAMS for p in hist['Close']]
+        rolling = RollingMetrics(all_prices)
+
+        metrics = {'current_price': current_price_oz / TROY_OUNCE_TO_GRAMS}
+
+        # Window metrics as of the latest close (left unset while the history is shorter than the window)
+        for metric, abbrev in METRIC_ABBREVS.items():
+            if metric != 'current_price':
+                value = rolling.latest(abbrev)
+                if value is not None:
+                    metrics[metric] = value
+
+        return {'metrics': metrics, 'rolling': rolling, 'history': (list(hist.index), all_prices)}, None
+
+    def price_metrics(self, metal, on_progress=None):
+        """price_metrics_async, run on the data loop"""
+        return self.data.run(self.price_metrics_async(metal, on_progress))
+
+    # =========================================================================
+    # PRICE HISTORY
+    # =========================================================================
+
+    def fetch_history(self, ticker_symbol, period="3mo", timeout=30, max_retries=2):
+        """(history, error) for one Yahoo Finance ticker, read through the local history store"""
+        return self.data.run(self.market.history(ticker_symbol, period=period, timeout=timeout,
+                                                 max_retries=max_retries))
+
+    async def fetch_histories_async(self, sources, period="3mo", timeout=30, max_retries=2, on_progress=None,
+                                    status_prefix="", deadline=None):
+        """
+        Fetch several Yahoo Finance histories at the same time.
+
+        Args:
+            sources: List of (label, ticker) pairs; a ticker listed twice is fetched once
+            period, timeout, max_retries: Passed to MarketData.history
+            on_progress: Optional callback receiving per-ticker progress messages
+            status_prefix: Text put in front of each progress message
+            deadline: Optional overall time limit in seconds
+
+        Returns:
+            dict: {ticker: (history_dataframe, error_message)}
+        """
+        labels = {}
+        for label, ticker in sources:
+            labels.setdefault(ticker, []).append(label)
+        total = len(labels)
+        done = []
+
+        def on_done(ticker, error):
+            done.append(ticker)
+            if on_progress is not None:
+                state = "failed" if error else "done"
+                on_progress(f"{status_prefix}{' / '.join(labels[ticker])} {state} ({len(done)}/{total})...")
+
+        if on_progress is not None:
+            names = ', '.join(' / '.join(l) for l in labels.values())
+            on_progress(f"{status_prefix}Fetching {names}...")
+
+        return await self.market.fetch_all(
+            lambda ticker: self.market.history(ticker, period=period, timeout=timeout, max_retries=max_retries),
+            list(labels),
+            on_done=on_done,
+            deadline=deadline,
+        )
+
+    def fetch_histories(self, sources, period="3mo", timeout=30, max_retries=2, on_progress=None, status_prefix="",
+                        deadline=None):
+        """fetch_histories_async, run on the data loop"""
+        return self.data.run(self.fetch_histories_async(sources, period, timeout, max_retries, on_progress,
+                                                        status_prefix, deadline))
+
+    # =========================================================================
+    # PREDICTIONS
+    # =========================================================================
+
+    def prediction_sources(self, primary_metal, secondary_name):
+        """(label, ticker) sources one live prediction needs"""
+        sources = [
+            (primary_metal, METALS[primary_metal]['yf_ticker']),
+            (secondary_name, PREDICTION_SECONDARIES[secondary_name]['yf_ticker']),
+            ('DXY', DXY_TICKER),
+            ('S&P 500 (regime)', SP500_TICKER_REGIME),
+            ('VIX', VIX_TICKER),
+        ]
+        if primary_metal != 'Gold' and secondary_name != 'Gold':
+            sources.append(('Gold (GSR)', METALS['Gold']['yf_ticker']))
+        if primary_metal != 'Silver' and secondary_name != 'Silver':
+            sources.append(('Silver (GSR)', METALS['Silver']['yf_ticker']))
+        return sources
+
+    def prediction_data(self, fetched, primary_metal, secondary_name):
+        """
+        Turn fetched histories ({ticker: (history, error)}) into prediction
+        data entries (metals in $/gram). Raises if the primary, secondary or
+        DXY history is missing; the regime, VIX and GSR series are optional.
+        """
+        primary_config = METALS[primary_metal]
+        secondary_config = PREDICTION_SECONDARIES[secondary_name]
+        data = {}
+
+        primary_hist, primary_err = fetched[primary_config['yf_ticker']]
+        if primary_err:
+            raise Exception(f"Could not fetch {primary_metal} data.\n\n{primary_err}")
+
+        secondary_hist, secondary_err = fetched[secondary_config['yf_ticker']]
+        if secondary_err:
+            raise Exception(f"Could not fetch {secondary_name} data.\n\n{secondary_err}")
+
+        dxy_hist, dxy_err = fetched[DXY_TICKER]
+        if dxy_err:
+            raise Exception(f"Could not fetch DXY (US Dollar Index) data.\n\n{dxy_err}")
+
+        # ===== Store primary metal data (convert to $/gram) =====
+        data[primary_metal] = {
+            'history': primary_hist,
+            'closes': [float(p) / TROY_OUNCE_TO_GRAMS for p in primary_hist['Close']],
+            'highs': [float(p) / TROY_OUNCE_TO_GRAMS for p in primary_hist['High']],
+            'lows': [float(p) / TROY_OUNCE_TO_GRAMS for p in primary_hist['Low']],
+        }
+
+        # ===== Store secondary data =====
+        if secondary_config['type'] == 'metal':
+            data[secondary_name] = {
+                'history': secondary_hist,
+                'closes': [float(p) / TROY_OUNCE_TO_GRAMS for p in secondary_hist['Close']],
+                'highs': [float(p) / TROY_OUNCE_TO_GRAMS for p in secondary_hist['High']],
+                'lows': [float(p) / TROY_OUNCE_TO_GRAMS for p in secondary_hist['Low']],
+            }
+        else:
+            data[secondary_name] = {
+                'history': secondary_hist,
+                'closes': [float(p) for p in secondary_hist['Close']],
+                'highs': [float(p) for p in secondary_hist['High']],
+                'lows': [float(p) for p in secondary_hist['Low']],
+            }
+
+        # ===== Store DXY data =====
+        data['DXY'] = {
+            'history': dxy_hist,
+            'closes': [float(p) for p in dxy_hist['Close']],
+        }
+
+        # ===== S&P 500 for regime detection (20d MA) - reuse if secondary is S&P 500 =====
+        if secondary_name == 'S&P 500':
+            data['SP500_REGIME'] = {'closes': data['S&P 500']['closes']}
+        else:
+            sp_hist, sp_err = fetched[SP500_TICKER_REGIME]
+            if not sp_err and sp_hist is not None:
+                data['SP500_REGIME'] = {
+                    'closes': [float(p) for p in sp_hist['Close']],
+                }
+            else:
+                data['SP500_REGIME'] = None  # regime unavailable
+
+        # ===== VIX for crash detection =====
+        vix_hist, vix_err = fetched[VIX_TICKER]
+        if not vix_err and vix_hist is not None:
+            data['VIX'] = {
+                'closes': [float(p) for p in vix_hist['Close']],
+            }
+        else:
+            data['VIX'] = None
+
+        # ===== Gold / Silver for GSR calculation (if not already primary/secondary) =====
+        for metal, key in (('Gold', 'Gold_GSR'), ('Silver', 'Silver_GSR')):
+            if primary_metal != metal and secondary_name != metal:
+                hist, err = fetched[METALS[metal]['yf_ticker']]
+                if not err and hist is not None:
+                    data[key] = {
+                        'closes': [float(p) / TROY_OUNCE_TO_GRAMS for p in hist['Close']],
+                    }
+                else:
+                    data[key] = None
+        return data
+
+    async def fetch_prediction_data_async(self, primary_metal, secondary_name, on_progress=None):
+        """Fetch every source of one prediction at once and assemble its prediction data"""
+        fetched = await self.fetch_histories_async(self.prediction_sources(primary_metal, secondary_name),
+                                                   period="3mo", timeout=30, max_retries=2, on_progress=on_progress)
+        return self.prediction_data(fetched, primary_metal, secondary_name)
+
+    def fetch_prediction_data(self, primary_metal, secondary_name, on_progress=None):
+        """fetch_prediction_data_async, run on the data loop"""
+        return self.data.run(self.fetch_prediction_data_async(primary_metal, secondary_name, on_progress))
+
+    def snapshot(self, prediction_data):
+        """Immutable copy of prediction_data for the prediction engine (indicator state cached on the live entries)"""
+        for entry in prediction_data.values():
+            if entry and entry.get('highs') is not None and entry.get('lows') is not None:
+                series_indicators(entry)
+        return MarketSnapshot(prediction_data, last_crash_time=self.last_crash_time)
+
+    def analyze_prediction(self, prediction_data, primary_metal, secondary_name):
+        """
+        Every number the prediction panel shows for one pairing: current
+        prices, ratio and its trend, RSI, ATR, momentum, the engine's
+        prediction ('prediction', None if it could not be calculated) with its
+        confidence and signals, the projected range, and 'result' - the
+        prediction as saved to the history. None without price data.
+        """
+        primary = prediction_data.get(primary_metal, {})
+        secondary = prediction_data.get(secondary_name, {})
+
+        primary_closes = primary.get('closes', [])
+        secondary_closes = secondary.get('closes', [])
+
+        if not primary_closes or not secondary_closes:
+            return None
+
+        # Current prices
+        primary_cur = primary_closes[-1]
+        secondary_cur = secondary_closes[-1]
+
+        primary_indicators = series_indicators(primary)
+        rsi = primary_indicators.rsi()
+        atr = primary_indicators.atr()
+
+        analysis = {
+            'primary_metal': primary_metal,
+            'secondary_metal': secondary_name,
+            'current_price': primary_cur,
+            'secondary_price': secondary_cur,
+            'current_ratio': secondary_cur / primary_cur if primary_cur > 0 else None,
+            'ratio_trend_pct': ratio_trend(primary_closes, secondary_closes),
+            'rsi': rsi,
+            'rsi_signal': rsi_signal(rsi),
+            'atr': atr,
+            'volatility_pct': (atr / primary_cur) * 100 if atr and primary_cur > 0 else None,
+            'momentum_7d': calculate_momentum(primary_closes, 7),
+            'momentum_14d': calculate_momentum(primary_closes, 14),
+            'prediction': None,
+            'result': None,
+        }
+
+        snapshot = self.snapshot(prediction_data)
+        prediction = self.prediction_engine.calculate_prediction(snapshot, primary_metal, secondary_name)
+        if not prediction:
+            return analysis
+
+        pred_price = prediction['predicted_price']
+        change = pred_price - primary_cur
+        change_pct = (change / primary_cur) * 100 if primary_cur > 0 else 0
+
+        # Price range (using ATR scaled by √7 for weekly projection)
+        low_est = pred_price - (atr * SQRT_7) if atr is not None else None
+        high_est = pred_price + (atr * SQRT_7) if atr is not None else None
+
+        confidence, signals = self.prediction_engine.calculate_confidence(snapshot, primary_metal,
+                                                                         secondary_name, prediction)
+        analysis.update({
+            'prediction': prediction,
+            'predicted_price': pred_price,
+            'predicted_change': change,
+            'predicted_change_pct': change_pct,
+            'range_low': low_est,
+            'range_high': high_est,
+            'confidence': confidence,
+            'signals': signals,
+        })
+
+        # The prediction as saved (includes ALL metrics for algorithm improvement)
+        analysis['result'] = {
+            # Basic identification
+            'primary_metal': primary_metal,
+            'secondary_metal': secondary_name,
+
+            # Core price data
+            'current_price': primary_cur,
+            'secondary_price': secondary_cur,
+            'predicted_price': pred_price,
+            'predicted_change_pct': change_pct,
+            'confidence': confidence,
+            'range_low': low_est if atr else None,
+            'range_high': high_est if atr else None,
+
+            # Beta & Correlation metrics
+            'beta': prediction.get('beta', 1.0),
+            'correlation': prediction.get('correlation', 0),
+
+            # RSI metrics
+            'rsi': rsi,
+            'rsi_signal': analysis['rsi_signal'],
+
+            # Volatility metrics
+            'atr': atr,
+            'volatility_pct': analysis['volatility_pct'],
+
+            # Momentum metrics
+            'momentum_7d': analysis['momentum_7d'],
+            'momentum_14d': analysis['momentum_14d'],
+            'secondary_momentum': prediction.get('secondary_momentum'),
+            'primary_expected_move': prediction.get('primary_expected_move'),
+
+            # Ratio metrics
+            'current_ratio': prediction.get('current_ratio'),
+            'avg_ratio_28d': prediction.get('avg_ratio'),
+            'ratio_deviation_pct': prediction.get('ratio_deviation'),
+            'ratio_trend_pct': analysis['ratio_trend_pct'],
+
+            # Pressure metrics
+            'ratio_pressure': prediction.get('ratio_pressure'),
+            'pressure_multiplier': prediction.get('pressure_multiplier'),
+
+            # v4 regime and clamp
+            'regime': prediction.get('regime'),
+            'regime_change': prediction.get('regime_change'),
+            'regime_extra': prediction.get('regime_extra', {}),
+            'clamp_used': prediction.get('clamp_used'),
+            'correlation_fast': prediction.get('correlation_fast'),
+            'correlation_slow': prediction.get('correlation_slow'),
+
+            # Confidence breakdown (store individual signals)
+            'confidence_signals': [(s[0], s[1], s[2]) for s in signals]
+        }
+        return analysis
+
+    def prediction_record(self, pred, sequence, now=None):
+        """
+        The history record for a prediction result (analyze_prediction's
+        'result'); sequence makes the id unique within one second.
+        """
+        now = now or datetime.now()
+        return {
+            # Identification
+            'id': f"{now.strftime('%Y%m%d%H%M%S')}_{sequence}",
+            'timestamp': now.isoformat(),
+            'target_date': (now + timedelta(days=PREDICTION_HORIZON_DAYS)).isoformat(),
+            'primary_metal': pred['primary_metal'],
+            'secondary_metal': pred['secondary_metal'],
+
+            # Core price data
+            'current_price': pred['current_price'],
+            'secondary_price': pred.get('secondary_price'),
+            'predicted_price': pred['predicted_price'],
+            'predicted_change_pct': pred['predicted_change_pct'],
+            'confidence': pred['confidence'],
+            'range_low': pred['range_low'],
+            'range_high': pred['range_high'],
+
+            # Beta & Correlation metrics
+            'beta': pred['beta'],
+            'correlation': pred['correlation'],
+
+            # RSI metrics
+            'rsi': pred['rsi'],
+            'rsi_signal': pred.get('rsi_signal'),
+
+            # Volatility metrics
+            'atr': pred['atr'],
+            'volatility_pct': pred.get('volatility_pct'),
+
+            # Momentum metrics
+            'momentum_7d': pred.get('momentum_7d'),
+            'momentum_14d': pred.get('momentum_14d'),
+            'secondary_momentum': pred.get('secondary_momentum'),
+            'primary_expected_move': pred.get('primary_expected_move'),
+
+            # Ratio metrics
+            'current_ratio': pred.get('current_ratio'),
+            'avg_ratio_28d': pred.get('avg_ratio_28d'),
+            'ratio_deviation_pct': pred.get('ratio_deviation_pct'),
+            'ratio_trend_pct': pred.get('ratio_trend_pct'),
+
+            # Pressure metrics
+            'ratio_pressure': pred.get('ratio_pressure'),
+            'pressure_multiplier': pred.get('pressure_multiplier'),
+
+            # Confidence breakdown
+            'confidence_signals': pred.get('confidence_signals', []),
+
+            # Grading fields (filled in later when prediction matures)
+            'actual_price': None,
+            'actual_change_pct': None,
+            'direction_correct': None,
+            'error_pct': None,
+            'in_range': None,  # Was actual price within predicted range?
+            'graded': False
+        }
+
+    # =========================================================================
+    # GRADING
+    # =========================================================================
+
+    def grade_predictions(self, ungraded):
+        """
+        Grade matured predictions against one price history per metal
+        (covering all their target dates). Each graded record is updated in
+        place and in the database. Returns (graded, failed) counts.
+        """
+        graded_count = 0
+        failed_count = 0
+
+        # Group by ticker so each metal's history is fetched once, reaching back to its oldest target date
+        by_ticker = {}
+        for record in ungraded:
+            by_ticker.setdefault(METALS[record['primary_metal']]['yf_ticker'], []).append(record)
+
+        async def fetch_grade_history(ticker):
+            earliest = min(datetime.fromisoformat(r['target_date']) for r in by_ticker[ticker])
+            start = earliest - timedelta(days=GRADE_DAYS_BEFORE)
+            period = period_covering(start)
+            if period is not None:
+                # Served from the local history store when it is fresh
+                return await self.market.history(ticker, period=period, timeout=20, max_retries=2)
+            return await self.market.download(ticker, timeout=20, max_retries=2, start=start.strftime('%Y-%m-%d'))
+
+        histories = self.data.run(self.market.fetch_all(fetch_grade_history, list(by_ticker)))
+
+        graded_records = []
+        for ticker, records in by_ticker.items():
+            hist, error = histories[ticker]
+            if hist is None or hist.empty:
+                print(f"Grading: no history for {ticker}: {error}")
+                failed_count += len(records)
+                continue
+
+            index = DateIndex.from_frame(hist)
+            for record in records:
+                graded_records.append((record, index))
+
+        for record, index in graded_records:
+            # Closest trading day to target_date (weekends/holidays resolve to the nearer side, earlier on a tie)
+            bar = index.nearest(as_date(record['target_date']), max_before=GRADE_DAYS_BEFORE, max_after=GRADE_DAYS_AFTER)
+            if bar is None:
+                failed_count += 1
+                continue
+            best_price = index.closes[bar]
+            actual_date_used = index.date(bar)
+
+            # Convert from $/oz to $/gram
+            actual_price = best_price / TROY_OUNCE_TO_GRAMS
+
+            # Calculate metrics
+            predicted_price = record['predicted_price']
+            current_price = record['current_price']
+
+            actual_change_pct = ((actual_price - current_price) / current_price) * 100 if current_price > 0 else 0
+            predicted_change_pct = record['predicted_change_pct']
+
+            # Was direction correct?
+            direction_correct = (actual_change_pct >= 0 and predicted_change_pct >= 0) or \
+                               (actual_change_pct < 0 and predicted_change_pct < 0)
+
+            # Error percentage (how far off was the prediction?)
+            error_pct = ((actual_price - predicted_price) / predicted_price) * 100 if predicted_price > 0 else 0
+
+            # Was actual price within predicted range?
+            range_low = record.get('range_low')
+            range_high = record.get('range_high')
+            if range_low is not None and range_high is not None:
+                in_range = range_low <= actual_price <= range_high
+            else:
+                in_range = None
+
+            # Update record (and its grade row in the database)
+            results = {
+                'actual_price': actual_price,
+                'actual_date_used': str(actual_date_used) if actual_date_used else None,
+                'actual_change_pct': actual_change_pct,
+                'direction_correct': direction_correct,
+                'error_pct': error_pct,
+                'in_range': in_range,
+                'graded': True,
+                'graded_timestamp': datetime.now().isoformat(),
+            }
+            record.update(results)
+            self.store.grade_prediction(record['id'], results)
+
+            graded_count += 1
+
+        return graded_count, failed_count
+
+    # =========================================================================
+    # BACK TEST DATA
+    # =========================================================================
+
+    def backtest_sources(self, pairings):
+        """(label, ticker) sources a back test of these (primary, secondary) pairings needs"""
+        sources = [('DXY', DXY_TICKER), ('S&P 500 (regime)', SP500_TICKER_REGIME), ('VIX', VIX_TICKER),
+                   ('Gold (GSR)', METALS['Gold']['yf_ticker']), ('Silver (GSR)', METALS['Silver']['yf_ticker'])]
+        for primary_metal, secondary_name in pairings:
+            sources.append((primary_metal, METALS[primary_metal]['yf_ticker']))
+            sources.append((secondary_name, PREDICTION_SECONDARIES[secondary_name]['yf_ticker']))
+        return sources
+
+    def backtest_checkpoint(self, primary_metal, secondary_name):
+        """Where a back test of this pairing keeps its partial results (see run_pairing)"""
+        directory = os.path.join(self.data_path, BACKTEST_CHECKPOINT_DIR)
+        return BacktestCheckpoint(checkpoint_path(directory, primary_metal, secondary_name))
+
+    def backtest_data(self, fetched, primary_metal, secondary_name):
+        """
+        Turn fetched histories ({ticker: (history, error)}) into the full_data
+        and primary dates run_pairing expects for one pairing.
+        Raises if the primary, secondary or DXY history is missing.
+        """
+        primary_config = METALS[primary_metal]
+        secondary_config = PREDICTION_SECONDARIES[secondary_name]
+
+        primary_hist, primary_err = fetched[primary_config['yf_ticker']]
+        if primary_err:
+            raise Exception(f"Could not fetch {primary_metal}: {primary_err}")
+
+        secondary_hist, secondary_err = fetched[secondary_config['yf_ticker']]
+        if secondary_err:
+            raise Exception(f"Could not fetch {secondary_name}: {secondary_err}")
+
+        dxy_hist, dxy_err = fetched[DXY_TICKER]
+        if dxy_err:
+            raise Exception(f"Could not fetch DXY: {dxy_err}")
+
+        if secondary_name == 'S&P 500':
+            sp500_hist = secondary_hist
+        else:
+            sp500_hist, sp_err = fetched[SP500_TICKER_REGIME]
+            if sp_err:
+                sp500_hist = None
+
+        vix_hist, vix_err = fetched[VIX_TICKER]
+        if vix_err:
+            vix_hist = None
+
+        # Gold/Silver for GSR if needed
+        gold_gsr_closes = None
+        silver_gsr_closes = None
+        if primary_metal != 'Gold' and secondary_name != 'Gold':
+            gold_hist, _ = fetched[METALS['Gold']['yf_ticker']]
+            if gold_hist is not None and not gold_hist.empty:
+                gold_gsr_closes = [float(p) / TROY_OUNCE_TO_GRAMS for p in gold_hist['Close']]
+        if primary_metal != 'Silver' and secondary_name != 'Silver':
+            silver_hist, _ = fetched[METALS['Silver']['yf_ticker']]
+            if silver_hist is not None and not silver_hist.empty:
+                silver_gsr_closes = [float(p) / TROY_OUNCE_TO_GRAMS for p in silver_hist['Close']]
+
+        # === Convert all data to lists ===
+        primary_closes_all = [float(p) / TROY_OUNCE_TO_GRAMS for p in primary_hist['Close']]
+        primary_highs_all = [float(p) / TROY_OUNCE_TO_GRAMS for p in primary_hist['High']]
+        primary_lows_all = [float(p) / TROY_OUNCE_TO_GRAMS for p in primary_hist['Low']]
+        primary_dates = list(primary_hist.index)
+
+        if secondary_config['type'] == 'metal':
+            secondary_closes_all = [float(p) / TROY_OUNCE_TO_GRAMS for p in secondary_hist['Close']]
+            secondary_highs_all = [float(p) / TROY_OUNCE_TO_GRAMS for p in secondary_hist['High']]
+            secondary_lows_all = [float(p) / TROY_OUNCE_TO_GRAMS for p in secondary_hist['Low']]
+        else:
+            secondary_closes_all = [float(p) for p in secondary_hist['Close']]
+            secondary_highs_all = [float(p) for p in secondary_hist['High']]
+            secondary_lows_all = [float(p) for p in secondary_hist['Low']]
+
+        dxy_closes_all = [float(p) for p in dxy_hist['Close']]
+
+        sp500_closes_all = None
+        if sp500_hist is not None and not sp500_hist.empty:
+            sp500_closes_all = [float(p) for p in sp500_hist['Close']]
+
+        vix_closes_all = None
+        if vix_hist is not None and not vix_hist.empty:
+            vix_closes_all = [float(p) for p in vix_hist['Close']]
+
+        # Everything the prediction reads, over the full history. The timeline hands each
+        # simulated day prefix views of these lists plus indicator state built once up front.
+        full_data = {
+            primary_metal: {'closes': primary_closes_all, 'highs': primary_highs_all, 'lows': primary_lows_all},
+            secondary_name: {'closes': secondary_closes_all, 'highs': secondary_highs_all, 'lows': secondary_lows_all},
+            'DXY': {'closes': dxy_closes_all},
+            'SP500_REGIME': {'closes': sp500_closes_all} if sp500_closes_all else None,
+            'VIX': {'closes': vix_closes_all} if vix_closes_all else None,
+        }
+        if gold_gsr_closes and primary_metal != 'Gold' and secondary_name != 'Gold':
+            full_data['Gold_GSR'] = {'closes': gold_gsr_closes}
+        if silver_gsr_closes and primary_metal != 'Silver' and secondary_name != 'Silver':
+            full_data['Silver_GSR'] = {'closes': silver_gsr_closes}
+        return full_data, primary_dates
+
+    # =========================================================================
+    # INVENTORY
+    # =========================================================================
+
+    def inventory_valuation(self):
+        """InventoryValuation of the stored inventory at the cached spot prices"""
+        return InventoryValuation(self.store.items(), self.inventory_prices)
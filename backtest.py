@@ -0,0 +1,669 @@
+"""
+Back test engine for the Metal Price Calculator.
+
+BacktestTimeline walks the full history once. Each simulated day gets a
+MarketSnapshot whose series are prefix views of the full lists (no copying)
+and whose indicators are views into state built once for the whole series,
+so a day costs the same no matter how much history came before it.
+
+run_pairing turns one pairing's history into graded back test rows without
+touching Tk, so run_batch can spread every primary/secondary pairing over a
+process pool. Rows can be streamed to a BacktestCsvWriter (optionally
+compressed) as they are produced, with the summary statistics kept as
+running totals (BacktestSummary), so a run of any length uses flat memory;
+export_batch writes the batch summary.
+
+A single pairing's run is a resumable job: run_pairing writes its partial
+results to a BacktestCheckpoint every BACKTEST_CHECKPOINT_DAYS days (and when
+it is cancelled or fails), picks up from a checkpoint of the same pairing,
+data and parameters, and reports progress as a BacktestProgress (days/sec
+and ETA).
+"""
+
+import bz2
+import concurrent.futures
+import csv
+import gzip
+import hashlib
+import itertools
+import json
+import lzma
+import math
+import os
+import time
+
+from grades import GRADES, grade_for_error  # same scale as saved predictions
+from indicators import SeriesIndicators
+from date_index import DateIndex
+from prediction_engine import PredictionEngine, MarketSnapshot, SQRT_7, CORRELATION_FAST_DAYS
+import vector_indicators
+
+BACKTEST_DAYS = 365          # simulate the last year of trading days
+BACKTEST_MIN_LOOKBACK = 90   # need ~90 days for 60d correlation + 28d ratio + buffer
+BACKTEST_HORIZON = 7         # graded against the close 7 trading days later
+BACKTEST_CHECKPOINT_DAYS = 25   # save partial results every this many simulated days
+BACKTEST_CHECKPOINT_DIR = "backtest_checkpoints"
+
+
+BACKTEST_FIELDS = [
+    'prediction_date', 'target_date', 'primary_metal', 'secondary_asset',
+    'current_price', 'predicted_price', 'actual_price',
+    'predicted_change_pct', 'actual_change_pct',
+    'error_pct', 'abs_error_pct', 'price_difference',
+    'direction_correct', 'grade', 'in_range',
+    'range_low', 'range_high', 'confidence',
+    'regime', 'regime_change',
+    'beta', 'correlation', 'rsi', 'atr', 'volatility_pct',
+    'secondary_momentum', 'primary_expected_move',
+    'ratio_deviation_pct', 'ratio_pressure',
+]
+
+SUMMARY_FIELDS = [
+    'primary_metal', 'secondary_asset', 'predictions', 'first_date', 'last_date',
+    'direction_correct', 'direction_accuracy_pct', 'avg_abs_error_pct',
+    'in_range', 'in_range_total', 'in_range_pct',
+] + [f'grade_{grade}' for grade in GRADES] + ['detail_file', 'error']
+
+
+class SeriesPrefix:
+    """The first 'length' items of a list, without copying - what one back test day can see."""
+
+    __slots__ = ('_base', '_length')
+
+    def __init__(self, base, length):
+        self._base = base
+        self._length = min(length, len(base))
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        return itertools.islice(self._base, self._length)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self._length)
+            if step == 1:
+                return self._base[start:stop]
+            return [self._base[i] for i in range(start, stop, step)]
+        if key < 0:
+            key += self._length
+        if not 0 <= key < self._length:
+            raise IndexError("series index out of range")
+        return self._base[key]
+
+    def __repr__(self):
+        return f"SeriesPrefix({self._length} of {len(self._base)})"
+
+
+class BacktestTimeline:
+    """
+    Full history for one back test, shaped like prediction_data.
+
+    full_data maps the same keys the prediction code reads ('Silver', 'DXY',
+    'SP500_REGIME', 'VIX', 'Gold_GSR', ...) to {'closes': [...], 'highs': [...],
+    'lows': [...]} (highs/lows optional) or None. Series with highs/lows get
+    RSI/ATR/MACD state computed once up front.
+
+    With pair=(primary_key, secondary_key) and NumPy available, the pair
+    statistics (correlations, beta, 20d sigma) are also computed once as whole
+    series, provided both series cover the same bars; each day's primary entry
+    then carries them as 'pair_stats'.
+    """
+
+    def __init__(self, full_data, pair=None, fast_period=10):
+        self.full_data = full_data
+        self.indicators = {}
+        for key, series in full_data.items():
+            if series and series.get('highs') is not None and series.get('lows') is not None:
+                self.indicators[key] = SeriesIndicators.from_series(series['closes'], series['highs'], series['lows'])
+
+        self.pair = pair
+        self.pair_stats = None
+        if pair is not None and vector_indicators.np is not None:
+            primary_closes = full_data[pair[0]]['closes']
+            secondary_closes = full_data[pair[1]]['closes']
+            # Unequal lengths would line the series up differently from day to day - leave those to the live path
+            if len(primary_closes) == len(secondary_closes):
+                self.pair_stats = vector_indicators.pair_statistics(primary_closes, secondary_closes,
+                                                                    fast_period=fast_period)
+                self.pair_stats['sigma'] = vector_indicators.rolling_sigma(primary_closes)
+
+    def day(self, day_idx):
+        """MarketSnapshot of the data as it looked at the close of bar day_idx"""
+        data = {}
+        for key, series in self.full_data.items():
+            if not series:
+                data[key] = None
+                continue
+            length = min(day_idx + 1, len(series['closes']))
+            entry = {name: SeriesPrefix(values, length) for name, values in series.items()}
+            if key in self.indicators:
+                entry['indicators'] = self.indicators[key].upto(length - 1)
+            data[key] = entry
+
+        if self.pair_stats is not None:
+            stats = {key: float(values[day_idx]) for key, values in self.pair_stats.items()}
+            if math.isnan(stats['sigma']):
+                stats['sigma'] = None
+            data[self.pair[0]]['pair_stats'] = stats
+        return MarketSnapshot(data)
+
+    def days(self, start, end):
+        """Yield (day_idx, snapshot) for each day in [start, end)"""
+        for day_idx in range(start, end):
+            yield day_idx, self.day(day_idx)
+
+
+class BacktestCancelled(Exception):
+    """Raised by run_pairing when its cancel event is set (the partial results are checkpointed)."""
+
+
+class BacktestCheckpoint:
+    """
+    Partial results of one pairing's back test, appended to a JSON lines file.
+
+    The first line holds the run's key (pairing, data fingerprint, window and
+    prediction parameters); load() only resumes a checkpoint saved under the
+    same key, so a run over different data or parameters starts over. Rows
+    are add()ed as they are produced and each save() appends them followed
+    by a {"next_day": ...} marker, so saving costs the new rows, not the whole
+    run so far. Rows after the last marker (a save cut short) are dropped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._key = None    # key of the file on disk once loaded or started by this run
+        self._pending = []  # rows added since the last save
+
+    def load(self, key):
+        """Day index to resume from if a checkpoint was saved under key, else None"""
+        next_day, end = None, 0
+        try:
+            with open(self.path, 'rb') as f:
+                header = json.loads(f.readline())
+                if header.get('key') != key:
+                    return None
+                position = f.tell()
+                for line in f:
+                    position += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # partial line from an interrupted save
+                    if 'next_day' in record:
+                        next_day, end = record['next_day'], position
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, AttributeError) as e:
+            print(f"Ignoring unreadable back test checkpoint {self.path}: {e}")
+            return None
+        if next_day is None:
+            return None
+        if end < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(end)  # new rows are appended after the last complete save
+        self._key = key
+        self._pending = []
+        return next_day
+
+    def rows(self):
+        """Yield the saved result rows of a loaded checkpoint, one at a time"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            f.readline()  # key
+            for line in f:
+                record = json.loads(line)
+                if 'next_day' not in record:
+                    yield record
+
+    def add(self, row):
+        self._pending.append(row)
+
+    def save(self, key, next_day):
+        """Record that every day before next_day is done, with the rows added so far"""
+        if self._key != key:
+            # New run: start the file over
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps({'key': key, 'started': time.strftime('%Y-%m-%dT%H:%M:%S')}) + '\n')
+            self._key = key
+
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for row in self._pending:
+                f.write(json.dumps(row) + '\n')
+            f.write(json.dumps({'next_day': next_day}) + '\n')
+        self._pending = []
+
+    def clear(self):
+        self._key = None
+        self._pending = []
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def checkpoint_path(directory, primary_metal, secondary_name):
+    """Checkpoint file of one pairing in directory"""
+    name = f"{primary_metal}_{secondary_name}".replace('&', 'and')
+    return os.path.join(directory, "".join(c if c.isalnum() else '_' for c in name) + ".jsonl")
+
+
+class BacktestProgress:
+    """How far a back test is: days done, days/sec and ETA (days resumed from a checkpoint don't count toward the rate)."""
+
+    def __init__(self, total, done=0):
+        self.total = total
+        self.done = done
+        self.resumed = done
+        self._started = time.monotonic()
+
+    def update(self, done):
+        self.done = done
+        return self
+
+    @property
+    def rate(self):
+        """Days simulated per second in this run, None until one day is done"""
+        elapsed = time.monotonic() - self._started
+        simulated = self.done - self.resumed
+        return simulated / elapsed if simulated > 0 and elapsed > 0 else None
+
+    @property
+    def eta(self):
+        """Seconds left at the current rate, None while unknown"""
+        rate = self.rate
+        return (self.total - self.done) / rate if rate else None
+
+    def __str__(self):
+        text = f"{self.done}/{self.total} days"
+        rate = self.rate
+        if rate:
+            eta = int(round(self.eta))
+            text += f", {rate:.0f} days/s, ETA {eta // 60}:{eta % 60:02d}"
+        if self.resumed:
+            text += f" (resumed at day {self.resumed})"
+        return text
+
+
+def _run_key(full_data, dates, primary_metal, secondary_name, engine, backtest_start, backtest_end):
+    """What a checkpoint must match to be resumed: pairing, window, parameters and a fingerprint of the data"""
+    digest = hashlib.sha1()
+    for key in sorted(full_data):
+        series = full_data[key]
+        digest.update(key.encode('utf-8'))
+        if series:
+            for name in sorted(series):
+                digest.update(repr(list(series[name])).encode('utf-8'))
+    return {
+        'primary_metal': primary_metal,
+        'secondary_asset': secondary_name,
+        'first_date': str(dates[0]) if len(dates) else '',
+        'last_date': str(dates[-1]) if len(dates) else '',
+        'window': [backtest_start, backtest_end],
+        'params': list(engine.params),
+        'data': digest.hexdigest(),
+    }
+
+
+def backtest_window(total_days):
+    """[start, end) bar indices to simulate for a primary history of total_days bars"""
+    # We need at least 90 days of lookback for the algorithm, and 7 days forward for the result
+    backtest_start = max(BACKTEST_MIN_LOOKBACK, total_days - BACKTEST_DAYS)
+    backtest_end = total_days - BACKTEST_HORIZON
+    if backtest_start >= backtest_end:
+        raise Exception("Insufficient data for backtesting. Need at least 97 trading days.")
+    return backtest_start, backtest_end
+
+
+def grade_outcome(current_price, pred_price, actual_price, atr_val):
+    """Error, direction and ATR×√7 range check of one prediction against the actual price"""
+    range_low = pred_price - (atr_val * SQRT_7) if atr_val else None
+    range_high = pred_price + (atr_val * SQRT_7) if atr_val else None
+
+    predicted_change_pct = ((pred_price - current_price) / current_price) * 100 if current_price > 0 else 0
+    actual_change_pct = ((actual_price - current_price) / current_price) * 100 if current_price > 0 else 0
+
+    error_pct = ((actual_price - pred_price) / pred_price) * 100 if pred_price > 0 else 0
+    direction_correct = (actual_change_pct >= 0 and predicted_change_pct >= 0) or \
+                        (actual_change_pct < 0 and predicted_change_pct < 0)
+    in_range = (range_low <= actual_price <= range_high) if (range_low is not None and range_high is not None) else None
+
+    return {
+        'range_low': range_low,
+        'range_high': range_high,
+        'predicted_change_pct': predicted_change_pct,
+        'actual_change_pct': actual_change_pct,
+        'error_pct': error_pct,
+        'abs_error_pct': abs(error_pct),
+        'direction_correct': direction_correct,
+        'in_range': in_range,
+    }
+
+
+def run_pairing(full_data, dates, primary_metal, secondary_name, engine=None, on_progress=None,
+                checkpoint=None, cancel=None, sink=None):
+    """
+    Back test one pairing over the last BACKTEST_DAYS days of full_data.
+
+    full_data is keyed like prediction_data (see BacktestTimeline) and dates
+    holds the primary's bar dates. Each day is predicted from the data up to
+    its close and graded against the primary close BACKTEST_HORIZON bars
+    later. on_progress(BacktestProgress) is called every 20 days. Returns the
+    result rows (BACKTEST_FIELDS); raises if there is too little history.
+    With a sink (BacktestCsvWriter or BacktestSummary) each row is passed to
+    sink.add() as it is produced instead, nothing is kept, and None is returned.
+
+    With a BacktestCheckpoint the run resumes from a matching checkpoint,
+    saves one every BACKTEST_CHECKPOINT_DAYS days and when it is cancelled or
+    fails, and clears it on completion. Setting cancel (a threading.Event)
+    stops the run with BacktestCancelled.
+    """
+    engine = engine or PredictionEngine()
+    primary_closes_all = full_data[primary_metal]['closes']
+    backtest_start, backtest_end = backtest_window(len(primary_closes_all))
+    index = DateIndex(dates, closes=primary_closes_all)
+    num_days = backtest_end - backtest_start
+    results = None
+    if sink is None:
+        results = []
+        sink = _RowList(results)
+
+    first_day = backtest_start
+    if checkpoint is not None:
+        run_key = _run_key(full_data, dates, primary_metal, secondary_name, engine, backtest_start, backtest_end)
+        saved = checkpoint.load(run_key)
+        if saved is not None:
+            first_day = saved
+            for row in checkpoint.rows():
+                sink.add(row)
+    progress = BacktestProgress(num_days, first_day - backtest_start)
+
+    timeline = BacktestTimeline(full_data, pair=(primary_metal, secondary_name), fast_period=CORRELATION_FAST_DAYS)
+    next_day = first_day
+    try:
+        for day_idx, snapshot in timeline.days(first_day, backtest_end):
+            if cancel is not None and cancel.is_set():
+                raise BacktestCancelled(f"Back test cancelled after {day_idx - backtest_start} of {num_days} days")
+            if checkpoint is not None and day_idx > first_day and (day_idx - first_day) % BACKTEST_CHECKPOINT_DAYS == 0:
+                checkpoint.save(run_key, day_idx)
+
+            # Progress update every 20 days (and straight away when resuming)
+            if on_progress is not None and (day_idx == first_day or (day_idx - backtest_start) % 20 == 0):
+                on_progress(progress.update(day_idx - backtest_start))
+
+            row = _simulate_day(day_idx, snapshot, index, engine, primary_metal, secondary_name)
+            if row is not None:
+                sink.add(row)
+                if checkpoint is not None:
+                    checkpoint.add(row)
+            next_day = day_idx + 1
+    except BaseException:
+        # Cancelled, failed or interrupted - keep the days done so far for the next run
+        if checkpoint is not None and next_day > first_day:
+            checkpoint.save(run_key, next_day)
+        raise
+
+    if checkpoint is not None:
+        checkpoint.clear()
+    return results
+
+
+class _RowList:
+    """Sink collecting the rows in a list (run_pairing without a sink)"""
+
+    def __init__(self, rows):
+        self.add = rows.append
+
+
+def _simulate_day(day_idx, snapshot, index, engine, primary_metal, secondary_name):
+    """Predict and grade one back test day: its result row, or None if there is no prediction"""
+    # Data as it was available at the close of this day (no crash history carried over)
+    p_closes = snapshot[primary_metal]['closes']
+    day_indicators = snapshot[primary_metal]['indicators']
+
+    # Run prediction and confidence
+    prediction = engine.calculate_prediction(snapshot, primary_metal, secondary_name)
+    if prediction is None:
+        return None
+    confidence, signals = engine.calculate_confidence(snapshot, primary_metal, secondary_name, prediction)
+
+    # Range, actual price 7 days later, error and grading
+    atr_val = day_indicators.atr()
+    rsi = day_indicators.rsi()
+    pred_price = prediction['predicted_price']
+    current_price = p_closes[-1]
+    target_idx = index.shift(day_idx, BACKTEST_HORIZON)
+    actual_price = index.closes[target_idx]
+    outcome = grade_outcome(current_price, pred_price, actual_price, atr_val)
+    range_low, range_high = outcome['range_low'], outcome['range_high']
+    abs_error_pct = outcome['abs_error_pct']
+
+    volatility_pct = (atr_val / current_price) * 100 if atr_val and current_price > 0 else None
+
+    return {
+        'prediction_date': index.date(day_idx).isoformat(),
+        'target_date': index.date(target_idx).isoformat(),
+        'primary_metal': primary_metal,
+        'secondary_asset': secondary_name,
+        'current_price': round(current_price, 6),
+        'predicted_price': round(pred_price, 6),
+        'actual_price': round(actual_price, 6),
+        'predicted_change_pct': round(outcome['predicted_change_pct'], 4),
+        'actual_change_pct': round(outcome['actual_change_pct'], 4),
+        'error_pct': round(outcome['error_pct'], 4),
+        'abs_error_pct': round(abs_error_pct, 4),
+        'price_difference': round(actual_price - pred_price, 6),
+        'direction_correct': outcome['direction_correct'],
+        'grade': grade_for_error(abs_error_pct),
+        'in_range': outcome['in_range'],
+        'range_low': round(range_low, 6) if range_low is not None else '',
+        'range_high': round(range_high, 6) if range_high is not None else '',
+        'confidence': round(confidence, 2),
+        'regime': prediction.get('regime', ''),
+        'regime_change': prediction.get('regime_change', False),
+        'beta': round(prediction.get('beta', 0), 4),
+        'correlation': round(prediction.get('correlation', 0), 4),
+        'rsi': round(rsi, 2) if rsi is not None else '',
+        'atr': round(atr_val, 6) if atr_val is not None else '',
+        'volatility_pct': round(volatility_pct, 4) if volatility_pct is not None else '',
+        'secondary_momentum': round(prediction.get('secondary_momentum', 0), 4),
+        'primary_expected_move': round(prediction.get('primary_expected_move', 0), 4),
+        'ratio_deviation_pct': round(prediction.get('ratio_deviation', 0), 4),
+        'ratio_pressure': round(prediction.get('ratio_pressure', 0), 4),
+    }
+
+
+class BacktestSummary:
+    """
+    Running direction accuracy, mean absolute error, in-range rate and grade
+    counts of back test rows - add() each row as it is produced, so the
+    statistics of any length of run take constant memory.
+    """
+
+    def __init__(self):
+        self.predictions = 0
+        self.first_date = ''
+        self.last_date = ''
+        self.direction_correct = 0
+        self.abs_error_total = 0
+        self.in_range = 0
+        self.in_range_total = 0
+        self.grade_counts = {}
+
+    def add(self, row):
+        if not self.predictions:
+            self.first_date = row['prediction_date']
+        self.last_date = row['prediction_date']
+        self.predictions += 1
+        if row['direction_correct']:
+            self.direction_correct += 1
+        self.abs_error_total += row['abs_error_pct']
+        if row['in_range'] is not None:
+            self.in_range_total += 1
+            if row['in_range']:
+                self.in_range += 1
+        self.grade_counts[row['grade']] = self.grade_counts.get(row['grade'], 0) + 1
+
+    def as_dict(self):
+        """The statistics as summarize() returns them"""
+        total = self.predictions
+        return {
+            'predictions': total,
+            'first_date': self.first_date,
+            'last_date': self.last_date,
+            'direction_correct': self.direction_correct,
+            'direction_accuracy_pct': self.direction_correct / total * 100 if total else 0,
+            'avg_abs_error_pct': self.abs_error_total / total if total else 0,
+            'in_range': self.in_range,
+            'in_range_total': self.in_range_total,
+            'in_range_pct': self.in_range / self.in_range_total * 100 if self.in_range_total else 0,
+            'grade_counts': dict(self.grade_counts),
+        }
+
+
+def summarize(results):
+    """Direction accuracy, mean absolute error, in-range rate and grade counts of back test rows"""
+    summary = BacktestSummary()
+    for row in results:
+        summary.add(row)
+    return summary.as_dict()
+
+
+# Output file suffix -> opener of a compressed text stream
+COMPRESSED_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+
+class BacktestCsvWriter:
+    """
+    Back test rows streamed to a CSV file (BACKTEST_FIELDS) as they are
+    produced, compressed when the path ends in .gz, .bz2 or .xz, with a
+    running BacktestSummary of everything written.
+
+    Rows go to path + '.part' and the file is renamed into place by
+    close(); discard() (or leaving a 'with' block on an exception) removes
+    it, as does closing a writer that never got a row.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.summary = BacktestSummary()
+        self._temp_path = filepath + '.part'
+        opener = COMPRESSED_OPENERS.get(os.path.splitext(filepath)[1].lower())
+        if opener is not None:
+            self._file = opener(self._temp_path, 'wt', encoding='utf-8', newline='')
+        else:
+            self._file = open(self._temp_path, 'w', encoding='utf-8', newline='')
+        self._writer = csv.DictWriter(self._file, fieldnames=BACKTEST_FIELDS)
+        self._writer.writeheader()
+
+    def add(self, row):
+        self._writer.writerow(row)
+        self.summary.add(row)
+
+    def close(self):
+        """Finish the file; True if it was written (it had rows)"""
+        self._file.close()
+        if not self.summary.predictions:
+            os.remove(self._temp_path)
+            return False
+        os.replace(self._temp_path, self.filepath)
+        return True
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self._temp_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+        return False
+
+
+# =============================================================================
+# BATCH BACK TEST
+# =============================================================================
+def batch_detail_file(primary_metal, secondary_name, stamp):
+    """File name of one pairing's detail CSV in a batch back test"""
+    return f"backtest_{primary_metal}_{secondary_name}_{stamp}.csv"
+
+
+def _pairing_worker(job):
+    """Process pool entry point: stream one pairing's rows to its detail CSV, return (primary, secondary, summary, error)"""
+    primary_metal, secondary_name, full_data, dates, detail_path = job
+    try:
+        with BacktestCsvWriter(detail_path) as writer:
+            run_pairing(full_data, dates, primary_metal, secondary_name, sink=writer)
+        return primary_metal, secondary_name, writer.summary.as_dict(), None
+    except Exception as e:
+        return primary_metal, secondary_name, None, str(e)
+
+
+def run_batch(jobs, max_workers=None, on_result=None):
+    """
+    Back test many pairings at once, one process per core.
+
+    jobs is a list of (primary, secondary, full_data, dates, detail_path).
+    Pairings are independent, so each runs start to finish in a worker
+    process, which streams its rows to detail_path (see BacktestCsvWriter;
+    no file if there are none) and sends back only the summary.
+    on_result(outcome, done, total) is called in this process as each one
+    finishes. Returns the (primary, secondary, summary, error) outcomes in
+    job order; summary is summarize()'s dict, None on error.
+    """
+    if not jobs:
+        return []
+    max_workers = max(1, min(len(jobs), max_workers or os.cpu_count() or 1))
+    outcomes = {}
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_pairing_worker, job): index for index, job in enumerate(jobs)}
+        for future in concurrent.futures.as_completed(futures):
+            index = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:  # worker died (e.g. BrokenProcessPool)
+                outcome = (jobs[index][0], jobs[index][1], None, str(e))
+            outcomes[index] = outcome
+            if on_result is not None:
+                on_result(outcome, len(outcomes), len(jobs))
+
+    return [outcomes[index] for index in range(len(jobs))]
+
+
+def export_batch(directory, outcomes, stamp):
+    """
+    Write the combined summary CSV of run_batch outcomes, best direction
+    accuracy first (the detail CSVs were written by the workers). Returns
+    the summary path.
+    """
+    rows = []
+    for primary_metal, secondary_name, summary, error in outcomes:
+        row = {'primary_metal': primary_metal, 'secondary_asset': secondary_name, 'error': error or ''}
+        if summary and summary['predictions']:
+            summary = dict(summary)
+            grade_counts = summary.pop('grade_counts')
+            row.update(summary)
+            for key in ('direction_accuracy_pct', 'avg_abs_error_pct', 'in_range_pct'):
+                row[key] = round(row[key], 2)
+            for grade in GRADES:
+                row[f'grade_{grade}'] = grade_counts.get(grade, 0)
+            row['detail_file'] = batch_detail_file(primary_metal, secondary_name, stamp)
+        rows.append(row)
+
+    rows.sort(key=lambda r: (r.get('direction_accuracy_pct', -1), -r.get('avg_abs_error_pct', 0)), reverse=True)
+
+    summary_path = os.path.join(directory, f"backtest_summary_{stamp}.csv")
+    with open(summary_path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS, restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+    return summary_path
@@ -0,0 +1,339 @@
+"""
+SQLite storage for the Metal Price Calculator.
+
+One database file in the app data folder holds everything that used to be
+whole-file JSON:
+
+    items        inventory holdings (one row per item)
+    formulas     custom formulas, in display order
+    predictions  saved predictions (one row per prediction)
+    grades       grading results, one row per graded prediction
+
+Each row keeps the full record as JSON in its 'data' column, so fields the
+app adds later need no schema change. The columns used for filtering,
+sorting and the accuracy statistics are copied out and indexed. Adding,
+editing, grading or deleting one item or prediction is a single-row
+transaction.
+
+migrate_json() imports metal_inventory.json, custom_formulas.json and the
+prediction history (journal or the older JSON file) the first time the
+database is opened. The old files are left in place untouched.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+
+from grades import grade_for_error
+
+SCHEMA_VERSION = 1
+
+# Fields written by grading - kept in the grades table, merged back into the record on load
+GRADE_FIELDS = ('actual_price', 'actual_date_used', 'actual_change_pct', 'direction_correct',
+                'error_pct', 'in_range', 'graded', 'graded_timestamp')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT PRIMARY KEY,
+    position INTEGER NOT NULL,
+    metal TEXT,
+    purchase_date TEXT,
+    purchase_price REAL,
+    metal_content REAL,
+    profit_goal REAL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_metal ON items (metal, position);
+CREATE INDEX IF NOT EXISTS items_purchase_date ON items (purchase_date, position);
+CREATE INDEX IF NOT EXISTS items_id_nocase ON items (id COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS formulas (
+    position INTEGER PRIMARY KEY,
+    name TEXT,
+    grp TEXT,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS predictions (
+    id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    timestamp TEXT,
+    target_date TEXT,
+    primary_metal TEXT,
+    confidence REAL,
+    graded INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS predictions_ungraded ON predictions (graded, target_date);
+CREATE INDEX IF NOT EXISTS predictions_timestamp ON predictions (timestamp);
+CREATE TABLE IF NOT EXISTS grades (
+    prediction_id TEXT PRIMARY KEY REFERENCES predictions (id) ON DELETE CASCADE,
+    graded_timestamp TEXT,
+    direction_correct INTEGER,
+    error_pct REAL,
+    in_range INTEGER,
+    confidence REAL,
+    grade TEXT,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS grades_grade ON grades (grade);
+CREATE INDEX IF NOT EXISTS grades_confidence ON grades (confidence);
+"""
+
+
+def _dumps(record):
+    return json.dumps(record, separators=(',', ':'))
+
+
+class DataStore:
+    """Inventory, formulas and prediction history in one SQLite file (safe to share between threads)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        with self._conn:
+            self._conn.executescript(_SCHEMA)
+            self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('schema_version', ?)",
+                               (str(SCHEMA_VERSION),))
+        self._predictions_cache = None
+        self._predictions_stamp = None
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # -------------------------------------------------------------------------
+    # Migration
+    # -------------------------------------------------------------------------
+
+    def migrate_json(self, inventory_path=None, formulas_path=None, predictions_path=None, journal_path=None):
+        """
+        One-time import of the JSON files used before the database existed.
+        Does nothing once it has run (even if it found no files).
+        """
+        with self._lock:
+            if self._meta('migrated_json') is not None:
+                return
+
+            inventory = self._read_json(inventory_path, "inventory")
+            formulas = self._read_json(formulas_path, "formulas")
+            if journal_path and os.path.exists(journal_path):
+                predictions = self._read_journal(journal_path)
+            else:
+                predictions = self._read_json(predictions_path, "prediction history")
+
+            with self._conn:
+                for item in inventory:
+                    self._insert_item(item, replace=True)
+                self._replace_formulas(formulas)
+                for record in predictions:
+                    self._insert_prediction(record, replace=True)
+                    if record.get('graded'):
+                        self._insert_grade(record)
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_json', '1')")
+
+            if inventory or formulas or predictions:
+                print(f"Imported {len(inventory)} items, {len(formulas)} formulas and "
+                      f"{len(predictions)} predictions into {os.path.basename(self.path)}")
+
+    @staticmethod
+    def _read_json(path, label):
+        if not path or not os.path.exists(path):
+            return []
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error reading {label} for import: {e}")
+            return []
+
+    @staticmethod
+    def _read_journal(path):
+        """
+        Prediction records replayed from the append-only prediction_history.jsonl
+        ('put', 'update' and 'delete' lines, in order). Read only: an
+        incomplete last line or a bad entry is skipped, not repaired.
+        """
+        records = {}  # id -> record, in the order predictions were saved
+        try:
+            with open(path, 'rb') as f:
+                for line in f:
+                    if not line.endswith(b'\n'):
+                        print(f"Skipping incomplete last entry of {path}")
+                        break
+                    if not line.strip():
+                        continue
+                    try:
+                        entry = json.loads(line)
+                        op = entry.get('op')
+                        if op == 'put':
+                            records[entry['record']['id']] = entry['record']
+                        elif op == 'update' and entry['id'] in records:
+                            records[entry['id']].update(entry['fields'])
+                        elif op == 'delete':
+                            records.pop(entry['id'], None)
+                    except (ValueError, KeyError, TypeError, AttributeError) as e:
+                        print(f"Skipping bad prediction journal entry: {e}")
+        except Exception as e:
+            print(f"Error reading prediction journal for import: {e}")
+        return list(records.values())
+
+    def _meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    # -------------------------------------------------------------------------
+    # Inventory
+    # -------------------------------------------------------------------------
+
+    def items(self):
+        """Every inventory item, in the order they were added"""
+        with self._lock:
+            return [json.loads(data) for (data,) in
+                    self._conn.execute("SELECT data FROM items ORDER BY position")]
+
+    def add_item(self, item):
+        with self._lock, self._conn:
+            self._insert_item(item)
+
+    def update_item(self, old_id, item):
+        """Replace one item (its id may have changed)"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT position FROM items WHERE id = ?", (old_id,)).fetchone()
+            self._conn.execute("DELETE FROM items WHERE id = ?", (old_id,))
+            self._insert_item(item, position=row[0] if row else None)
+
+    def delete_item(self, item_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM items WHERE id = ?", (item_id,))
+
+    def _insert_item(self, item, position=None, replace=False):
+        if position is None:
+            position = self._conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM items").fetchone()[0]
+        self._conn.execute(
+            f"INSERT {'OR REPLACE ' if replace else ''}INTO items "
+            "(id, position, metal, purchase_date, purchase_price, metal_content, profit_goal, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (item['id'], position, item.get('metal', 'Silver'), item.get('purchase_date'),
+             item.get('purchase_price', 0), item.get('metal_content', 0), item.get('profit_goal', 100), _dumps(item)))
+
+    # -------------------------------------------------------------------------
+    # Formulas
+    # -------------------------------------------------------------------------
+
+    def formulas(self):
+        """Every custom formula, in display order"""
+        with self._lock:
+            return [json.loads(data) for (data,) in
+                    self._conn.execute("SELECT data FROM formulas ORDER BY position")]
+
+    def save_formulas(self, formulas):
+        """Store the formula list (one transaction - the list is short and edits can reorder it)"""
+        with self._lock, self._conn:
+            self._replace_formulas(formulas)
+
+    def _replace_formulas(self, formulas):
+        self._conn.execute("DELETE FROM formulas")
+        self._conn.executemany(
+            "INSERT INTO formulas (position, name, grp, data) VALUES (?, ?, ?, ?)",
+            [(i, f.get('name'), f.get('group', 'Default'), _dumps(f)) for i, f in enumerate(formulas)])
+
+    # -------------------------------------------------------------------------
+    # Predictions
+    # -------------------------------------------------------------------------
+
+    def predictions(self):
+        """Every saved prediction (grading results merged in), oldest first"""
+        with self._lock:
+            # data_version changes when another connection writes, total_changes when we do
+            stamp = (self._conn.execute("PRAGMA data_version").fetchone()[0], self._conn.total_changes)
+            if self._predictions_cache is None or stamp != self._predictions_stamp:
+                records = []
+                for data, grade_data in self._conn.execute(
+                        "SELECT p.data, g.data FROM predictions p "
+                        "LEFT JOIN grades g ON g.prediction_id = p.id ORDER BY p.seq"):
+                    record = json.loads(data)
+                    if grade_data is not None:
+                        record.update(json.loads(grade_data))
+                    records.append(record)
+                self._predictions_cache = records
+                self._predictions_stamp = stamp
+            return list(self._predictions_cache)
+
+    def add_prediction(self, record):
+        with self._lock, self._conn:
+            self._insert_prediction(record)
+
+    def grade_prediction(self, record_id, results):
+        """Store one prediction's grading results (the GRADE_FIELDS)"""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT data FROM predictions WHERE id = ?", (record_id,)).fetchone()
+            if row is None:
+                return
+            record = json.loads(row[0])
+            record.update(results)
+            self._insert_grade(record)
+            self._conn.execute("UPDATE predictions SET graded = 1 WHERE id = ?", (record_id,))
+
+    def delete_prediction(self, record_id):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM predictions WHERE id = ?", (record_id,))
+
+    def clear_predictions(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM predictions")
+
+    def _insert_prediction(self, record, replace=False):
+        seq = self._conn.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM predictions").fetchone()[0]
+        self._conn.execute(
+            f"INSERT {'OR REPLACE ' if replace else ''}INTO predictions "
+            "(id, seq, timestamp, target_date, primary_metal, confidence, graded, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (record['id'], seq, record.get('timestamp'), record.get('target_date'), record.get('primary_metal'),
+             record.get('confidence'), 1 if record.get('graded') else 0, _dumps(record)))
+
+    def _insert_grade(self, record):
+        error_pct = record.get('error_pct') or 0
+        in_range = record.get('in_range')
+        self._conn.execute(
+            "INSERT OR REPLACE INTO grades "
+            "(prediction_id, graded_timestamp, direction_correct, error_pct, in_range, confidence, grade, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (record['id'], record.get('graded_timestamp'), 1 if record.get('direction_correct') else 0,
+             error_pct, None if in_range is None else (1 if in_range else 0), record.get('confidence'),
+             grade_for_error(abs(error_pct)),
+             _dumps({field: record[field] for field in GRADE_FIELDS if field in record})))
+
+    def accuracy(self, high_confidence=60):
+        """
+        Aggregate grading statistics: total, direction_correct, avg_abs_error,
+        grade_counts {grade: n}, in_range / in_range_total, and the average
+        absolute error of high- and low-confidence predictions (None if none).
+        """
+        with self._lock:
+            total, direction_correct, avg_abs_error, in_range, in_range_total = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(direction_correct), 0), AVG(ABS(error_pct)), "
+                "COALESCE(SUM(in_range), 0), COUNT(in_range) FROM grades").fetchone()
+            grade_counts = dict(self._conn.execute("SELECT grade, COUNT(*) FROM grades GROUP BY grade"))
+            high_err, high_n, low_err, low_n = self._conn.execute(
+                "SELECT AVG(CASE WHEN confidence >= ? THEN ABS(error_pct) END), "
+                "       COUNT(CASE WHEN confidence >= ? THEN 1 END), "
+                "       AVG(CASE WHEN confidence < ? THEN ABS(error_pct) END), "
+                "       COUNT(CASE WHEN confidence < ? THEN 1 END) FROM grades",
+                (high_confidence,) * 4).fetchone()
+        return {
+            'total': total,
+            'direction_correct': direction_correct,
+            'avg_abs_error': avg_abs_error or 0.0,
+            'grade_counts': grade_counts,
+            'in_range': in_range,
+            'in_range_total': in_range_total,
+            'high_conf_error': high_err if high_n else None,
+            'low_conf_error': low_err if low_n else None,
+        }
@@ -0,0 +1,125 @@
+"""
+Date lookups into a daily price history for the Metal Price Calculator.
+
+DateIndex holds one history's bar dates (sorted, as datetime.date) with
+its opens and closes as plain lists, and answers "which bar" questions
+with a binary search instead of scanning or indexing the DataFrame row by
+row:
+
+    nearest(d)     closest bar to d, optionally within N days before/after
+    previous(d)    last bar on or before d  - the close in force on d
+    next(d)        first bar on or after d  - the next open from d
+    shift(i, n)    the bar n trading days after bar i
+
+Markets are closed on weekends and holidays, so a calendar date often has
+no bar. Each lookup says which way it resolves that: previous() falls back
+to the last trading day, next() moves forward to the next one and
+nearest() picks the closer side (the earlier bar on a tie).
+"""
+
+import bisect
+from datetime import date, datetime
+
+
+def as_date(value):
+    """datetime.date for a date, datetime, pandas Timestamp or 'YYYY-MM-DD...' string"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if hasattr(value, 'date'):
+        return value.date()
+    return date.fromisoformat(str(value)[:10])
+
+
+class DateIndex:
+    """Sorted bar dates of one daily history plus their opens/closes."""
+
+    def __init__(self, dates, closes=None, opens=None):
+        """dates must already be strictly increasing (ValueError otherwise); see from_frame for raw frames"""
+        self.dates = [as_date(d) for d in dates]
+        self.closes = list(closes) if closes is not None else None
+        self.opens = list(opens) if opens is not None else None
+        if any(a >= b for a, b in zip(self.dates, self.dates[1:])):
+            raise ValueError("DateIndex dates must be strictly increasing")
+
+    @classmethod
+    def from_frame(cls, hist):
+        """
+        Index a yfinance/HistoryStore frame (columns are read once, not per
+        row). Raw downloads can repeat a bar (Yahoo sometimes sends the last
+        day twice), so rows are sorted by date and the last row of each date
+        is kept.
+        """
+        last_row = {}  # date -> position of its last row in the frame
+        for i, day in enumerate(hist.index):
+            last_row[as_date(day)] = i
+        dates = sorted(last_row)
+        rows = [last_row[day] for day in dates]
+
+        closes = opens = None
+        if 'Close' in hist.columns:
+            column = hist['Close'].tolist()
+            closes = [float(column[i]) for i in rows]
+        if 'Open' in hist.columns:
+            column = hist['Open'].tolist()
+            opens = [float(column[i]) for i in rows]
+        return cls(dates, closes=closes, opens=opens)
+
+    def __len__(self):
+        return len(self.dates)
+
+    def date(self, i):
+        return self.dates[i]
+
+    def position(self, day):
+        """Index of the bar dated exactly 'day', or None (weekend, holiday, outside the history)"""
+        day = as_date(day)
+        i = bisect.bisect_left(self.dates, day)
+        return i if i < len(self.dates) and self.dates[i] == day else None
+
+    def previous(self, day):
+        """Index of the last bar on or before 'day', or None if the history starts later"""
+        i = bisect.bisect_right(self.dates, as_date(day)) - 1
+        return i if i >= 0 else None
+
+    def next(self, day):
+        """Index of the first bar on or after 'day', or None if the history ends earlier"""
+        i = bisect.bisect_left(self.dates, as_date(day))
+        return i if i < len(self.dates) else None
+
+    def nearest(self, day, max_before=None, max_after=None):
+        """
+        Index of the bar closest to 'day' (the earlier one when two are equally
+        close). max_before / max_after limit how many calendar days before or
+        after 'day' the bar may be; None if no bar qualifies.
+        """
+        day = as_date(day)
+        after = bisect.bisect_left(self.dates, day)
+        best = None
+        for i in (after - 1, after):
+            if not 0 <= i < len(self.dates):
+                continue
+            offset = (self.dates[i] - day).days
+            if max_before is not None and offset < -max_before:
+                continue
+            if max_after is not None and offset > max_after:
+                continue
+            if best is None or abs(offset) < abs((self.dates[best] - day).days):
+                best = i
+        return best
+
+    def shift(self, i, bars):
+        """Index 'bars' trading days after (negative: before) bar i, or None if outside the history"""
+        j = i + bars
+        return j if 0 <= j < len(self.dates) else None
+
+    def close_on(self, day):
+        """Close in force on 'day' - that day's close, or the last trading day's before it (None if none)"""
+        i = self.previous(day)
+        return self.closes[i] if i is not None else None
+
+    def open_on(self, day):
+        """Open of 'day', or of the next trading day after it (None if the history ends earlier)"""
+        i = self.next(day)
+        return self.opens[i] if i is not None else None
@@ -0,0 +1,234 @@
+"""
+Compiled custom formulas for the Metal Price Calculator.
+
+A formula expression ("iif(cur < 7davg, cur, 7davg) * 0.9") is validated
+once against an AST whitelist (numbers, metric variables, arithmetic,
+comparisons, iif/min/max) and compiled to a plain Python function. The
+FormulaCache keeps compiled formulas by expression text, so a price refresh
+that evaluates every formula only pays for the arithmetic.
+
+Variables that start with a digit (7davg, 1yavg) are not Python identifiers,
+so they are renamed with a leading underscore before parsing, exactly as
+the original string-based evaluator did.
+
+A compiled formula can also be evaluated over whole series at once
+(evaluate_series): every variable is a NumPy array, one element per day,
+and the expression runs element-wise - iif and conditional expressions
+become np.where, min/max become np.minimum/np.maximum and and/or/not keep
+their Python meaning per element.
+"""
+
+import ast
+import functools
+import re
+import threading
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FORMULA_FUNCTIONS = ('min', 'max', 'iif')
+FORMULA_CACHE_SIZE = 256  # the formula editor compiles on every keystroke - keep the cache bounded
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp, ast.Call,
+    ast.Name, ast.Load, ast.Constant,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow, ast.UAdd, ast.USub, ast.Not,
+    ast.And, ast.Or, ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE,
+)
+
+
+def safe_name(name):
+    """Python-safe spelling of a formula variable (7davg -> _7davg)"""
+    return f"_{name}" if name[0].isdigit() else name
+
+
+def iif(condition, true_val, false_val):
+    """Immediate If function: iif(condition, true_value, false_value)"""
+    return true_val if condition else false_val
+
+
+def _vector_iif(condition, true_val, false_val):
+    return np.where(condition, true_val, false_val)
+
+
+def _vector_min(*args):
+    return functools.reduce(np.minimum, args)
+
+
+def _vector_max(*args):
+    return functools.reduce(np.maximum, args)
+
+
+def _vector_and(*args):
+    # x and y == (y if x else x), element by element
+    return functools.reduce(lambda x, y: np.where(x, y, x), args)
+
+
+def _vector_or(*args):
+    # x or y == (x if x else y), element by element
+    return functools.reduce(lambda x, y: np.where(x, x, y), args)
+
+
+_VECTOR_HELPERS = ('_and', '_or', '_not', '_where')  # extra parameters of the element-wise lambda
+
+
+class _Vectorize(ast.NodeTransformer):
+    """Rewrite the constructs that branch on one truth value into element-wise calls."""
+
+    @staticmethod
+    def _call(name, args):
+        return ast.Call(func=ast.Name(id=name, ctx=ast.Load()), args=args, keywords=[])
+
+    def visit_IfExp(self, node):
+        self.generic_visit(node)
+        return self._call('_where', [node.test, node.body, node.orelse])
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        return self._call('_and' if isinstance(node.op, ast.And) else '_or', node.values)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return self._call('_not', [node.operand])
+        return node
+
+    def visit_Compare(self, node):
+        # a < b < c -> _and(a < b, b < c)
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        operands = [node.left] + node.comparators
+        pairs = [ast.Compare(left=operands[i], ops=[op], comparators=[operands[i + 1]])
+                 for i, op in enumerate(node.ops)]
+        return self._call('_and', pairs)
+
+
+class CompiledFormula:
+    """One validated expression, compiled to a function of the variables it uses."""
+
+    def __init__(self, expression, names):
+        self.expression = expression
+
+        # Transform the expression to use safe names
+        # Sort by length (longest first) to avoid partial replacements
+        name_mapping = {name: safe_name(name) for name in names}
+        safe_expression = expression
+        for original, safe in sorted(name_mapping.items(), key=lambda x: len(x[0]), reverse=True):
+            if original != safe:
+                safe_expression = re.sub(r'(?<![a-zA-Z0-9_])' + re.escape(original) + r'(?![a-zA-Z0-9_])',
+                                         safe, safe_expression)
+
+        try:
+            tree = ast.parse(safe_expression.strip(), mode='eval')
+        except SyntaxError as e:
+            raise ValueError(f"Invalid expression: {e.msg}") from None
+
+        safe_to_name = {safe: original for original, safe in name_mapping.items()}
+        used = []
+        for node in ast.walk(tree):
+            if not isinstance(node, _ALLOWED_NODES):
+                if isinstance(node, (ast.operator, ast.unaryop, ast.cmpop, ast.boolop)):
+                    raise ValueError(f"Unsupported operator: {type(node).__name__}")
+                raise ValueError(f"Invalid token: '{ast.unparse(node)}'")
+            if isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+                raise ValueError(f"Invalid token: {node.value!r}")
+            if isinstance(node, ast.Call):
+                if not isinstance(node.func, ast.Name) or node.func.id not in FORMULA_FUNCTIONS or node.keywords:
+                    raise ValueError(f"Invalid function call: '{ast.unparse(node)}'")
+                if node.func.id == 'iif' and len(node.args) != 3:
+                    raise ValueError("iif needs 3 arguments: iif(condition, true_value, false_value)")
+            if isinstance(node, ast.Name) and node.id not in FORMULA_FUNCTIONS:
+                if node.id not in safe_to_name:
+                    # Invalid token - show user-friendly variable names in error
+                    user_vars = ', '.join(sorted(names))
+                    raise ValueError(f"Invalid token: '{node.id}'. Valid variables are: {user_vars}")
+                if safe_to_name[node.id] not in used:
+                    used.append(safe_to_name[node.id])
+
+        # The variables (and the three functions) become parameters of one compiled lambda
+        self.names = tuple(used)
+        params = ', '.join(list(FORMULA_FUNCTIONS) + [safe_name(name) for name in self.names])
+        code = compile(f"lambda {params}: ({ast.unparse(tree)})", '<formula>', 'eval')
+        self._function = eval(code, {"__builtins__": {}})
+
+        self._tree = tree
+        self._params = params
+        self._vector_function = None  # compiled on first evaluate_series
+
+    def evaluate(self, context):
+        """Value of the formula for a {variable: number} context"""
+        return float(self._function(min, max, iif, *[context[name] for name in self.names]))
+
+    def evaluate_series(self, context, length=None):
+        """
+        Element-wise value of the formula for a {variable: array} context (all
+        arrays the same length). Days where the result is undefined - NaN
+        inputs, division by zero - come out as NaN. 'length' is only needed
+        when the expression uses no variables at all.
+        """
+        if np is None:
+            raise RuntimeError("NumPy is required to evaluate formulas over a series")
+        if self._vector_function is None:
+            tree = ast.fix_missing_locations(_Vectorize().visit(ast.parse(ast.unparse(self._tree), mode='eval')))
+            code = compile(f"lambda {', '.join(_VECTOR_HELPERS)}, {self._params}: ({ast.unparse(tree)})",
+                           '<formula>', 'eval')
+            self._vector_function = eval(code, {"__builtins__": {}})
+
+        arrays = [np.asarray(context[name], dtype=np.float64) for name in self.names]
+        if length is None:
+            length = len(next(iter(context.values()))) if context else 1
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            result = self._vector_function(_vector_and, _vector_or, np.logical_not, np.where,
+                                           _vector_min, _vector_max, _vector_iif, *arrays)
+            result = np.broadcast_to(np.asarray(result, dtype=np.float64), (length,)).copy()
+        result[~np.isfinite(result)] = np.nan
+        return result
+
+
+class FormulaCache:
+    """Compiled formulas by expression text (least recently used dropped past FORMULA_CACHE_SIZE)."""
+
+    def __init__(self, size=FORMULA_CACHE_SIZE):
+        self.size = size
+        self._formulas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, expression, names):
+        """CompiledFormula for expression over the variables 'names' (raises ValueError if invalid)"""
+        key = (expression, frozenset(names))
+        with self._lock:
+            formula = self._formulas.get(key)
+            if formula is not None:
+                self._formulas.move_to_end(key)
+                return formula
+        formula = CompiledFormula(expression, names)
+        with self._lock:
+            self._formulas[key] = formula
+            if len(self._formulas) > self.size:
+                self._formulas.popitem(last=False)
+        return formula
+
+    def evaluate(self, expression, context):
+        """Compile (once) and evaluate expression for a {variable: number} context"""
+        return self.get(expression, context.keys()).evaluate(context)
+
+    def evaluate_series(self, expression, context, length=None):
+        """Compile (once) and evaluate expression element-wise for a {variable: array} context"""
+        return self.get(expression, context.keys()).evaluate_series(context, length)
+
+    def invalidate(self, expression):
+        """Forget every compiled form of expression (after the formula using it is edited or deleted)"""
+        with self._lock:
+            for key in [key for key in self._formulas if key[0] == expression]:
+                del self._formulas[key]
+
+    def clear(self):
+        with self._lock:
+            self._formulas.clear()
+
+    def __len__(self):
+        return len(self._formulas)
@@ -0,0 +1,17 @@
+"""
+Letter grades for prediction errors, shared by the back test, the
+prediction history (data_store) and the GUI. No imports, so the storage
+layer can grade a row without loading the back test or prediction engine.
+"""
+
+# (max abs error %, grade) - anything at or above the last limit is an F
+GRADE_SCALE = ((1, "A+"), (2, "A"), (3, "B+"), (4, "B"), (5, "C+"), (7, "C"), (10, "D"))
+GRADES = [grade for _, grade in GRADE_SCALE] + ["F"]
+
+
+def grade_for_error(abs_error_pct):
+    """Letter grade for an absolute prediction error in %"""
+    for limit, grade in GRADE_SCALE:
+        if abs_error_pct < limit:
+            return grade
+    return "F"
@@ -0,0 +1,264 @@
+"""
+Incremental technical indicators for the Metal Price Calculator.
+
+SeriesIndicators keeps the running Wilder state (average gain/loss for RSI,
+smoothed true range for ATR) and the MACD EMAs of one price series.
+Appending a bar is O(1), and the value after any earlier bar stays
+queryable, so the live prediction and every simulated day of the back test
+share one pass over the data.
+
+Values match prediction_engine.calculate_rsi / calculate_atr /
+calculate_macd_histogram run on the series cut off at the same bar. When
+NumPy is available a whole series is loaded with the vectorized functions
+in vector_indicators (same values within vector_indicators.PARITY_TOLERANCE)
+and later appends continue from the resulting state.
+"""
+
+import math
+
+import vector_indicators
+
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+MACD_FAST = 12
+MACD_SLOW = 26
+MACD_SIGNAL = 9
+MACD_MIN_BARS = 35  # histogram is reported once this many closes are available
+
+
+class _EMA:
+    """EMA seeded with the SMA of its first 'period' inputs."""
+
+    def __init__(self, period):
+        self.period = period
+        self.multiplier = 2 / (period + 1)
+        self.value = None
+        self._seed = []
+
+    def update(self, x):
+        if self.value is None:
+            self._seed.append(x)
+            if len(self._seed) == self.period:
+                self.value = sum(self._seed) / self.period
+                self._seed = None
+        else:
+            self.value = (x - self.value) * self.multiplier + self.value
+        return self.value
+
+
+class SeriesIndicators:
+    """Running RSI, ATR and MACD histogram for one series of closes (plus highs/lows for ATR)."""
+
+    def __init__(self, rsi_period=RSI_PERIOD, atr_period=ATR_PERIOD):
+        self.rsi_period = rsi_period
+        self.atr_period = atr_period
+
+        self._count = 0
+        self._prev_close = None
+
+        # RSI state: first 'period' gains/losses seed the average, then Wilder smoothing
+        self._seed_gains = []
+        self._seed_losses = []
+        self._avg_gain = None
+        self._avg_loss = None
+
+        # ATR state
+        self._seed_ranges = []
+        self._atr = None
+
+        # MACD state (12/26 EMAs of closes, 9 EMA of the MACD line)
+        self._ema_fast = _EMA(MACD_FAST)
+        self._ema_slow = _EMA(MACD_SLOW)
+        self._ema_signal = _EMA(MACD_SIGNAL)
+
+        # Value after each bar (None until enough bars)
+        self._rsi_values = []
+        self._atr_values = []
+        self._macd_values = []
+
+    @classmethod
+    def from_series(cls, closes, highs=None, lows=None, **periods):
+        """Build the state for a whole series in one pass"""
+        indicators = cls(**periods)
+        min_bars = max(MACD_MIN_BARS, indicators.rsi_period + 1, indicators.atr_period + 1)
+        if vector_indicators.np is not None and len(closes) >= min_bars:
+            indicators._load_vectorized(closes, highs, lows)
+        else:
+            indicators.extend(closes, highs, lows)
+        return indicators
+
+    def _load_vectorized(self, closes, highs, lows):
+        """Fill an empty state from whole-series vectorized results (every average already seeded)"""
+        def as_values(series):
+            return [None if math.isnan(x) else x for x in series.tolist()]
+
+        rsi, avg_gain, avg_loss = vector_indicators.rsi_components(closes, self.rsi_period)
+        self._rsi_values = as_values(rsi)
+        self._avg_gain = float(avg_gain[-1])
+        self._avg_loss = float(avg_loss[-1])
+        self._seed_gains = self._seed_losses = None
+
+        if highs is None or lows is None or len(highs) < len(closes) or len(lows) < len(closes):
+            self._atr_values = [None] * len(closes)
+        else:
+            atr = vector_indicators.atr(highs[:len(closes)], lows[:len(closes)], closes, self.atr_period)
+            self._atr_values = as_values(atr)
+            self._atr = float(atr[-1])
+            self._seed_ranges = None
+
+        histogram, fast_ema, slow_ema, signal_ema = vector_indicators.macd_components(
+            closes, MACD_FAST, MACD_SLOW, MACD_SIGNAL, MACD_MIN_BARS)
+        self._macd_values = as_values(histogram)
+        for state, series in ((self._ema_fast, fast_ema), (self._ema_slow, slow_ema), (self._ema_signal, signal_ema)):
+            state.value = float(series[-1])
+            state._seed = None
+
+        self._count = len(closes)
+        self._prev_close = closes[-1]
+
+    def __len__(self):
+        return self._count
+
+    def extend(self, closes, highs=None, lows=None):
+        """Append several bars (highs/lows optional; ATR stays None without them)"""
+        if highs is None or lows is None or len(highs) < len(closes) or len(lows) < len(closes):
+            for close in closes:
+                self.append(close)
+        else:
+            for close, high, low in zip(closes, highs, lows):
+                self.append(close, high, low)
+
+    def append(self, close, high=None, low=None):
+        """Add the next bar and update RSI/ATR/MACD in O(1)"""
+        prev_close = self._prev_close
+        self._prev_close = close
+        self._count += 1
+
+        self._macd_values.append(self._update_macd(close))
+
+        if prev_close is None:
+            self._rsi_values.append(None)
+            self._atr_values.append(None)
+            return
+
+        self._rsi_values.append(self._update_rsi(close - prev_close))
+
+        if high is None or low is None:
+            self._atr_values.append(None)
+        else:
+            true_range = max(high - low, abs(high - prev_close), abs(low - prev_close))
+            self._atr_values.append(self._update_atr(true_range))
+
+    def _update_rsi(self, change):
+        period = self.rsi_period
+        gain = max(change, 0)
+        loss = max(-change, 0)
+
+        if self._avg_gain is None:
+            self._seed_gains.append(gain)
+            self._seed_losses.append(loss)
+            if len(self._seed_gains) < period:
+                return None
+            # Initialize with SMA for first 'period' values (seed the EMA)
+            self._avg_gain = sum(self._seed_gains) / period
+            self._avg_loss = sum(self._seed_losses) / period
+            self._seed_gains = self._seed_losses = None
+        else:
+            # Wilder's smoothing
+            self._avg_gain = (self._avg_gain * (period - 1) + gain) / period
+            self._avg_loss = (self._avg_loss * (period - 1) + loss) / period
+
+        if self._avg_loss == 0:
+            return 100  # No losses = RSI of 100
+        rs = self._avg_gain / self._avg_loss
+        return 100 - (100 / (1 + rs))
+
+    def _update_atr(self, true_range):
+        period = self.atr_period
+
+        if self._atr is None:
+            self._seed_ranges.append(true_range)
+            if len(self._seed_ranges) < period:
+                return None
+            self._atr = sum(self._seed_ranges) / period
+            self._seed_ranges = None
+        else:
+            self._atr = (self._atr * (period - 1) + true_range) / period
+        return self._atr
+
+    def _update_macd(self, close):
+        fast = self._ema_fast.update(close)
+        slow = self._ema_slow.update(close)
+        if slow is None:
+            return None
+        macd = fast - slow
+        signal = self._ema_signal.update(macd)
+        if signal is None or self._count < MACD_MIN_BARS:
+            return None
+        return macd - signal
+
+    def rsi_at(self, index):
+        """RSI using bars 0..index (negative index counts from the end); None if too few bars"""
+        return self._rsi_values[index]
+
+    def atr_at(self, index):
+        """ATR using bars 0..index (negative index counts from the end); None if too few bars"""
+        return self._atr_values[index]
+
+    def macd_histogram_at(self, index):
+        """MACD histogram (12/26/9) using bars 0..index; None if too few bars"""
+        return self._macd_values[index]
+
+    def rsi(self):
+        """RSI after the latest bar"""
+        return self._rsi_values[-1] if self._count else None
+
+    def atr(self):
+        """ATR after the latest bar"""
+        return self._atr_values[-1] if self._count else None
+
+    def macd_histogram(self):
+        """MACD histogram after the latest bar"""
+        return self._macd_values[-1] if self._count else None
+
+    def upto(self, index):
+        """Read-only view of the indicators as they were after bar 'index'"""
+        return IndicatorView(self, index)
+
+
+class IndicatorView:
+    """SeriesIndicators cut off at one bar, as seen by a back test day."""
+
+    def __init__(self, indicators, end):
+        self._indicators = indicators
+        self._end = end if end >= 0 else len(indicators) + end
+
+    def __len__(self):
+        return self._end + 1
+
+    def _absolute(self, index):
+        absolute = index if index >= 0 else self._end + 1 + index
+        if not 0 <= absolute <= self._end:
+            raise IndexError("indicator index out of range")
+        return absolute
+
+    def rsi_at(self, index):
+        return self._indicators.rsi_at(self._absolute(index))
+
+    def atr_at(self, index):
+        return self._indicators.atr_at(self._absolute(index))
+
+    def macd_histogram_at(self, index):
+        return self._indicators.macd_histogram_at(self._absolute(index))
+
+    def rsi(self):
+        return self._indicators.rsi_at(self._end)
+
+    def atr(self):
+        return self._indicators.atr_at(self._end)
+
+    def macd_histogram(self):
+        return self._indicators.macd_histogram_at(self._end)
+
+    def upto(self, index):
+        return IndicatorView(self._indicators, self._absolute(index))
@@ -0,0 +1,211 @@
+"""
+Inventory valuation for the Metal Price Calculator.
+
+InventoryValuation keeps the numbers the inventory tab shows and sorts by
+in flat per-item arrays, parallel to the item list (which stays in the
+order items were added):
+
+    value       metal_content * price per gram
+    profit_pct  profit over purchase price (100% for free items with a value)
+    goal_pct    profit_pct as a percentage of the item's profit goal
+    priced      1 once the item's metal has a price
+
+They are computed when an item is added or edited, and again only for the
+items of a metal whose price changed. Sort permutations are cached per
+(sort key, metal filter): an item change drops them all, a price change
+only the value/profit/goal orderings. Totals (count, invested, pure metal)
+are kept per metal and adjusted by each change, so the summary line is a
+sum over a handful of metals.
+
+Orderings (the Sort combobox keys, <field>_asc / <field>_desc):
+
+    date        purchase_date as stored (ISO text; missing sorts first)
+    metal       metal name
+    id          item id, case-insensitive (ASCII only, like SQLite NOCASE)
+    value, profit_pct, goal_pct
+                the valuation arrays; items whose metal has no price count as 0
+
+Any other key keeps the order items were added, and within every ordering
+ties keep that order too (in both directions).
+"""
+
+from array import array
+
+_PRICE_SORTS = {'profit_pct', 'goal_pct', 'value'}
+_NOCASE = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')  # SQLite NOCASE folds ASCII only
+
+
+def _sort_field(sort_key):
+    """'profit_pct_desc' -> ('profit_pct', True)"""
+    field, _, direction = (sort_key or '').rpartition('_')
+    return field, direction == 'desc'
+
+
+def item_valuation(item, prices):
+    """(value, profit %, goal %, priced) of one item at prices ({metal: $/gram})"""
+    metal = item.get('metal', 'Silver')
+    if metal not in prices:
+        return 0.0, 0.0, 0.0, False
+    value = item['metal_content'] * prices[metal]
+    paid = item['purchase_price']
+    if paid > 0:
+        profit_pct = (value - paid) / paid * 100
+    else:
+        profit_pct = 100.0 if value > 0 else 0.0  # 100% profit on free items
+    goal = item.get('profit_goal', 100)
+    goal_pct = profit_pct / goal * 100 if goal > 0 else 0.0
+    return value, profit_pct, goal_pct, True
+
+
+class InventoryValuation:
+    """Valuation arrays, cached sort orders and running totals for the inventory list."""
+
+    def __init__(self, items=(), prices=None):
+        self.prices = dict(prices or {})
+        self.set_items(items)
+
+    # -------------------------------------------------------------------------
+    # Items and prices
+    # -------------------------------------------------------------------------
+
+    def set_items(self, items):
+        """Value a whole item list from scratch (after loading the inventory)"""
+        self.items = list(items)
+        self.value = array('d')
+        self.profit_pct = array('d')
+        self.goal_pct = array('d')
+        self.priced = bytearray()
+        self._metal = []       # metal / purchase price / pure metal as last valued, to undo from the totals
+        self._paid = array('d')
+        self._content = array('d')
+        self._totals = {}      # metal -> [items, invested, pure metal grams]
+        for item in self.items:
+            self._append(item)
+        self._reindex()
+        self._orders = {}
+
+    def add(self, item):
+        self.items.append(item)
+        self._append(item)
+        self._index[item['id']] = len(self.items) - 1
+        self._orders.clear()
+
+    def update(self, old_id, item):
+        """Revalue one item after an edit (its id may have changed)"""
+        i = self._index.get(old_id)
+        if i is None:
+            self.add(item)
+            return
+        self._count(i, -1)
+        self.items[i] = item
+        self._fill(i, item)
+        self._count(i, 1)
+        if old_id != item['id']:
+            del self._index[old_id]
+            self._index[item['id']] = i
+        self._orders.clear()
+
+    def remove(self, item_id):
+        i = self._index.get(item_id)
+        if i is None:
+            return
+        self._count(i, -1)
+        for column in (self.items, self.value, self.profit_pct, self.goal_pct, self.priced,
+                       self._metal, self._paid, self._content):
+            del column[i]
+        self._reindex()
+        self._orders.clear()
+
+    def set_prices(self, prices):
+        """Revalue the items of every metal whose price changed; True if anything did"""
+        changed = {metal for metal in set(prices) | set(self.prices) if prices.get(metal) != self.prices.get(metal)}
+        if not changed:
+            return False
+        self.prices = dict(prices)
+        for i, metal in enumerate(self._metal):
+            if metal in changed:
+                self._fill(i, self.items[i])
+        for key in [key for key in self._orders if _sort_field(key[0])[0] in _PRICE_SORTS]:
+            del self._orders[key]
+        return True
+
+    # -------------------------------------------------------------------------
+    # Queries
+    # -------------------------------------------------------------------------
+
+    def index_of(self, item_id):
+        return self._index.get(item_id)
+
+    def order(self, sort_key, metal=None):
+        """Item positions for one Sort combobox key and metal filter (None for all), cached"""
+        key = (sort_key, metal)
+        order = self._orders.get(key)
+        if order is None:
+            order = self._sort(sort_key)
+            if metal is not None:
+                order = [i for i in order if self._metal[i] == metal]
+            self._orders[key] = order
+        return order
+
+    def sorted_items(self, sort_key, metal=None):
+        return [self.items[i] for i in self.order(sort_key, metal)]
+
+    def totals(self, metal=None):
+        """(items, invested, current value of the priced items) for one metal or all"""
+        count = invested = value = 0
+        for name, (n, paid, content) in self._totals.items():
+            if metal is not None and name != metal:
+                continue
+            count += n
+            invested += paid
+            if name in self.prices:
+                value += content * self.prices[name]
+        return count, invested, value
+
+    # -------------------------------------------------------------------------
+    # Internals
+    # -------------------------------------------------------------------------
+
+    def _append(self, item):
+        for column in (self.value, self.profit_pct, self.goal_pct, self._paid, self._content):
+            column.append(0.0)
+        self.priced.append(0)
+        self._metal.append(None)
+        self._fill(len(self.value) - 1, item)
+        self._count(len(self.value) - 1, 1)
+
+    def _fill(self, i, item):
+        value, profit_pct, goal_pct, priced = item_valuation(item, self.prices)
+        self.value[i] = value
+        self.profit_pct[i] = profit_pct
+        self.goal_pct[i] = goal_pct
+        self.priced[i] = priced
+        self._metal[i] = item.get('metal', 'Silver')
+        self._paid[i] = item['purchase_price']
+        self._content[i] = item['metal_content']
+
+    def _count(self, i, sign):
+        totals = self._totals.setdefault(self._metal[i], [0, 0.0, 0.0])
+        totals[0] += sign
+        totals[1] += sign * self._paid[i]
+        totals[2] += sign * self._content[i]
+        if totals[0] == 0:
+            del self._totals[self._metal[i]]  # also drops the rounding left over from the sums
+
+    def _reindex(self):
+        self._index = {item['id']: i for i, item in enumerate(self.items)}
+
+    def _sort(self, sort_key):
+        field, descending = _sort_field(sort_key)
+        if field == 'date':
+            key = lambda i: self.items[i].get('purchase_date') or ''
+        elif field == 'metal':
+            key = lambda i: self._metal[i] or ''
+        elif field == 'id':
+            key = lambda i: str(self.items[i]['id']).translate(_NOCASE)
+        elif field in _PRICE_SORTS:
+            key = getattr(self, field).__getitem__
+        else:
+            return list(range(len(self.items)))
+        # sorted() is stable in both directions, so ties stay in the order items were added
+        return sorted(range(len(self.items)), key=key, reverse=descending)
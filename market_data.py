@@ -0,0 +1,518 @@
+"""
+Market data layer for the Metal Price Calculator.
+
+HistoryStore keeps a local copy of daily OHLC bars per Yahoo Finance ticker in
+the app data folder. Period requests ("3mo", "1y", "18mo", ...) are answered
+from disk; only the bars added since the last sync are downloaded.
+
+HttpClient is the shared HTTP layer for spot price APIs: pooled keep-alive
+connections, per-host retry/backoff and per-host latency counters.
+
+SpotPriceCache holds the latest spot price per metal for every tab, with a
+TTL and single-flight fetching so simultaneous requests share one call.
+
+yfinance and requests only have blocking APIs, so they run on shared thread
+pools: Yahoo Finance requests on network_pool, store reads/writes and other
+CPU or disk work on blocking_pool. A stalled upstream can only fill the
+small network pool, and each request carries its deadline as a socket
+timeout so its worker is freed when the deadline passes. The asyncio layer
+in market_loop awaits both pools with deadlines and rate limits; nothing
+here creates an executor per request.
+"""
+
+import os
+import re
+import csv
+import time
+import threading
+import concurrent.futures
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Try to import yfinance (pandas comes with it)
+try:
+    import yfinance as yf
+    import pandas as pd
+except ImportError:
+    yf = None
+    pd = None
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+HISTORY_DIR = "history"
+HISTORY_SYNC_TTL = 15 * 60  # seconds a synced ticker is served from disk without a network call
+
+# Calendar days covered by each supported period string
+PERIOD_DAYS = {
+    '5d': 5,
+    '1mo': 31,
+    '3mo': 92,
+    '6mo': 183,
+    '1y': 366,
+    '18mo': 549,
+    '2y': 731,
+    '5y': 1827,
+    '10y': 3653,
+}
+
+OHLC_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# HTTP client defaults
+HTTP_POOL_SIZE = 8          # keep-alive connections kept open per host
+HTTP_RETRIES = 2            # retries after the first attempt (connect errors, 429 and 5xx)
+HTTP_BACKOFF = 0.5          # seconds; doubles on each retry
+HTTP_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+SPOT_CACHE_TTL = 60  # seconds a spot price is reused before fetching again
+
+BLOCKING_POOL_SIZE = 16  # worker threads for blocking store, simulation and spot price work
+NETWORK_POOL_SIZE = 8    # worker threads for Yahoo Finance requests, kept apart from the pool above
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _shared_pool(name, size):
+    """The thread pool registered under name (created on first use)"""
+    with _pools_lock:
+        if name not in _pools:
+            _pools[name] = concurrent.futures.ThreadPoolExecutor(max_workers=size, thread_name_prefix=name)
+        return _pools[name]
+
+
+def blocking_pool():
+    """The shared pool for blocking disk and CPU work (history store, back test simulations)"""
+    return _shared_pool('market-data', BLOCKING_POOL_SIZE)
+
+
+def network_pool():
+    """The shared pool Yahoo Finance requests run on, so a slow upstream can't hold up blocking_pool"""
+    return _shared_pool('market-net', NETWORK_POOL_SIZE)
+
+
+def history_cutoff(period):
+    """First date ('YYYY-MM-DD') a period string reaches back to"""
+    return (datetime.now() - timedelta(days=PERIOD_DAYS[period])).strftime('%Y-%m-%d')
+
+
+class HistoryStore:
+    """On-disk daily OHLC cache, one CSV per ticker plus a small sync record."""
+
+    def __init__(self, folder, sync_ttl=HISTORY_SYNC_TTL):
+        self.folder = folder
+        self.sync_ttl = sync_ttl
+        self._series = {}  # ticker -> {'bars': {date_str: row}, 'frame': DataFrame, 'synced_at', 'covered_from'}
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+
+    # -------------------------------------------------------------------------
+    # Public API
+    # -------------------------------------------------------------------------
+
+    def history(self, ticker_symbol, period="3mo", timeout=30, max_retries=2):
+        """
+        Return daily history for a ticker, syncing with Yahoo Finance only when needed.
+
+        Args:
+            ticker_symbol: Yahoo Finance ticker (e.g., 'GC=F', 'SI=F')
+            period: History period (e.g., '3mo', '1y', '18mo')
+            timeout: Timeout in seconds per download attempt
+            max_retries: Number of download attempts
+
+        Returns:
+            tuple: (history_dataframe, error_message)
+            - On success: (DataFrame, None)
+            - On failure: (None, "error description")
+        """
+        if period not in PERIOD_DAYS:
+            # Not something we can answer from disk - plain download
+            return download_history(ticker_symbol, timeout, max_retries, period=period)
+
+        with self._lock_for(ticker_symbol):
+            hist, start = self.plan(ticker_symbol, period)
+            if hist is not None:
+                return hist, None
+            new_hist, error = download_history(ticker_symbol, timeout, max_retries, start=start)
+            return self.commit(ticker_symbol, period, start, new_hist, error)
+
+    def plan(self, ticker_symbol, period):
+        """
+        First half of history(): (stored history, None) while the store is
+        fresh for the period, otherwise (None, start) - the date to download
+        from. The download itself is left to the caller (history() or the
+        asyncio layer), which then hands it to commit().
+        """
+        cutoff = history_cutoff(period)
+
+        with self._lock_for(ticker_symbol):
+            entry = self._load(ticker_symbol)
+
+            covered = entry['covered_from'] is not None and entry['covered_from'] <= cutoff
+            fresh = covered and (time.time() - entry['synced_at']) < self.sync_ttl
+            if fresh:
+                hist = self._slice(entry, cutoff)
+                if hist is not None:
+                    return hist, None
+
+            # Download only what is missing: the whole period if the store does not
+            # reach back far enough, otherwise from the last stored bar (re-fetching
+            # it, since it may have been a partial day when last synced)
+            if covered and entry['bars']:
+                return None, max(entry['bars'])
+            return None, cutoff
+
+    def commit(self, ticker_symbol, period, start, new_hist, error):
+        """
+        Second half of history(): merge the bars downloaded from start (None
+        if the download failed with error) and return (history, error).
+        """
+        cutoff = history_cutoff(period)
+
+        with self._lock_for(ticker_symbol):
+            entry = self._load(ticker_symbol)
+            covered = entry['covered_from'] is not None and entry['covered_from'] <= cutoff
+
+            if new_hist is None:
+                # Serve what we have on disk rather than failing outright
+                if covered:
+                    hist = self._slice(entry, cutoff)
+                    if hist is not None:
+                        print(f"Using stored history for {ticker_symbol}: {error}")
+                        return hist, None
+                return None, error
+
+            self._merge(entry, new_hist)
+            entry['synced_at'] = time.time()
+            if entry['covered_from'] is None or start < entry['covered_from']:
+                entry['covered_from'] = start
+            self._save(ticker_symbol, entry)
+
+            hist = self._slice(entry, cutoff)
+            if hist is None:
+                return None, f"No data returned for {ticker_symbol}"
+            return hist, None
+
+    # -------------------------------------------------------------------------
+    # Internals
+    # -------------------------------------------------------------------------
+
+    def _lock_for(self, ticker_symbol):
+        with self._locks_guard:
+            if ticker_symbol not in self._locks:
+                self._locks[ticker_symbol] = threading.RLock()  # history() holds it around plan/commit
+            return self._locks[ticker_symbol]
+
+    def _paths(self, ticker_symbol):
+        safe_name = re.sub(r'[^A-Za-z0-9.\-]', '_', ticker_symbol)
+        base = os.path.join(self.folder, safe_name)
+        return base + '.csv', base + '.sync'
+
+    def _load(self, ticker_symbol):
+        """Get the in-memory entry for a ticker, reading it from disk on first use"""
+        entry = self._series.get(ticker_symbol)
+        if entry is not None:
+            return entry
+
+        entry = {'bars': {}, 'frame': None, 'synced_at': 0.0, 'covered_from': None}
+        csv_path, sync_path = self._paths(ticker_symbol)
+        try:
+            if os.path.exists(csv_path) and os.path.exists(sync_path):
+                with open(csv_path, 'r', newline='') as f:
+                    for row in csv.DictReader(f):
+                        entry['bars'][row['Date']] = [float(row[c]) for c in OHLC_COLUMNS]
+                with open(sync_path, 'r') as f:
+                    synced_at, covered_from = f.read().split()
+                entry['synced_at'] = float(synced_at)
+                entry['covered_from'] = covered_from
+        except Exception as e:
+            print(f"Error loading stored history for {ticker_symbol}: {e}")
+            entry = {'bars': {}, 'frame': None, 'synced_at': 0.0, 'covered_from': None}
+
+        self._series[ticker_symbol] = entry
+        return entry
+
+    def _save(self, ticker_symbol, entry):
+        """Write bars and sync record (temp file + rename so a crash never leaves half a file)"""
+        csv_path, sync_path = self._paths(ticker_symbol)
+        try:
+            tmp_path = csv_path + '.tmp'
+            with open(tmp_path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['Date'] + OHLC_COLUMNS)
+                for date_str in sorted(entry['bars']):
+                    writer.writerow([date_str] + entry['bars'][date_str])
+            os.replace(tmp_path, csv_path)
+
+            tmp_path = sync_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(f"{entry['synced_at']} {entry['covered_from']}")
+            os.replace(tmp_path, sync_path)
+        except Exception as e:
+            print(f"Error saving stored history for {ticker_symbol}: {e}")
+
+    def _merge(self, entry, hist):
+        """Merge a downloaded frame into the stored bars (newer rows replace older ones)"""
+        columns = [hist[c].tolist() if c in hist.columns else [0.0] * len(hist) for c in OHLC_COLUMNS]
+        for i, idx in enumerate(hist.index):
+            date_str = idx.strftime('%Y-%m-%d') if hasattr(idx, 'strftime') else str(idx)[:10]
+            entry['bars'][date_str] = [float(col[i]) for col in columns]
+        entry['frame'] = None
+
+    def _slice(self, entry, cutoff):
+        """Return the stored bars on or after cutoff as a DataFrame (None if empty)"""
+        if not entry['bars']:
+            return None
+        if entry['frame'] is None:
+            dates = sorted(entry['bars'])
+            entry['frame'] = pd.DataFrame(
+                [entry['bars'][d] for d in dates],
+                columns=OHLC_COLUMNS,
+                index=pd.DatetimeIndex(dates, name='Date'),
+            )
+        frame = entry['frame']
+        hist = frame[frame.index >= pd.Timestamp(cutoff)]
+        if hist.empty:
+            return None
+        return hist
+
+
+class HttpClient:
+    """
+    Thread-safe HTTP client shared by every spot price call.
+
+    One requests.Session holds a keep-alive connection pool per host, so only
+    the first request to a host pays for DNS, TCP connect and the TLS
+    handshake. Retries with exponential backoff can be tuned per host, and
+    every request is timed so the savings are visible in stats().
+    """
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
+        self.pool_size = pool_size
+        self.session = requests.Session()
+        adapter = self._adapter(retries, backoff)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._stats = {}  # host -> counters, see _record()
+        self._stats_lock = threading.Lock()
+
+    def _adapter(self, retries, backoff):
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=HTTP_RETRY_STATUSES,
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False,
+        )
+        return HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retry)
+
+    def configure_host(self, host, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF):
+        """Use a different retry/backoff policy for one host (e.g. 'api.gold-api.com')"""
+        self.session.mount(f"https://{host}/", self._adapter(retries, backoff))
+
+    def get(self, url, timeout=15, **kwargs):
+        """GET through the shared pool; exceptions propagate like requests.get"""
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=timeout, **kwargs)
+        except Exception:
+            self._record(host, time.perf_counter() - start, failed=True)
+            raise
+        self._record(host, time.perf_counter() - start, failed=response.status_code >= 400)
+        return response
+
+    def _record(self, host, elapsed, failed):
+        ms = elapsed * 1000.0
+        with self._stats_lock:
+            entry = self._stats.get(host)
+            if entry is None:
+                # The first request to a host includes connection setup
+                entry = {'requests': 0, 'errors': 0, 'first_ms': ms, 'warm_total_ms': 0.0,
+                         'min_ms': ms, 'max_ms': ms, 'last_ms': ms}
+                self._stats[host] = entry
+            else:
+                entry['warm_total_ms'] += ms
+            entry['requests'] += 1
+            if failed:
+                entry['errors'] += 1
+            entry['min_ms'] = min(entry['min_ms'], ms)
+            entry['max_ms'] = max(entry['max_ms'], ms)
+            entry['last_ms'] = ms
+
+    def stats(self):
+        """Per-host latency counters: {host: {requests, errors, first_ms, warm_avg_ms, min_ms, max_ms, last_ms}}"""
+        with self._stats_lock:
+            result = {}
+            for host, entry in self._stats.items():
+                warm = entry['requests'] - 1
+                result[host] = {
+                    'requests': entry['requests'],
+                    'errors': entry['errors'],
+                    'first_ms': entry['first_ms'],
+                    'warm_avg_ms': entry['warm_total_ms'] / warm if warm > 0 else None,
+                    'min_ms': entry['min_ms'],
+                    'max_ms': entry['max_ms'],
+                    'last_ms': entry['last_ms'],
+                }
+            return result
+
+    def stats_summary(self):
+        """One line per host, e.g. 'api.gold-api.com: 12 requests, first 310 ms, then avg 45 ms'"""
+        lines = []
+        for host, entry in sorted(self.stats().items()):
+            line = f"{host}: {entry['requests']} requests, first {entry['first_ms']:.0f} ms"
+            if entry['warm_avg_ms'] is not None:
+                line += f", then avg {entry['warm_avg_ms']:.0f} ms"
+            if entry['errors']:
+                line += f", {entry['errors']} errors"
+            lines.append(line)
+        return "\n".join(lines) if lines else "No requests yet"
+
+    def close(self):
+        self.session.close()
+
+
+class SpotPriceCache:
+    """
+    Latest spot price per key (metal name), shared by all consumers.
+
+    get() returns the cached price while it is younger than ttl, otherwise it
+    calls fetch(key). If several threads ask for the same key while a fetch is
+    running they wait for that fetch instead of starting their own. When a
+    fetch fails the previous price is returned (check age() for staleness).
+    """
+
+    def __init__(self, fetch, ttl=SPOT_CACHE_TTL):
+        self.fetch = fetch
+        self.ttl = ttl
+        self._entries = {}   # key -> (price, fetched_at)
+        self._inflight = {}  # key -> Future of the running fetch
+        self._lock = threading.Lock()
+
+    def get(self, key, max_age=None):
+        """Return the price for key, fetching it if missing or older than max_age (default ttl)"""
+        max_age = self.ttl if max_age is None else max_age
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] < max_age:
+                return entry[0]
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                self._inflight[key] = future
+
+        if not owner:
+            return future.result()
+
+        price = None
+        try:
+            price = self.fetch(key)
+        except Exception as e:
+            print(f"Spot price fetch error for {key}: {e}")
+
+        with self._lock:
+            if price is not None:
+                self._entries[key] = (price, time.time())
+            elif entry is not None:
+                price = entry[0]
+            del self._inflight[key]
+        future.set_result(price)
+        return price
+
+    def peek(self, key):
+        """Cached price for key regardless of age (None if never fetched)"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return entry[0] if entry is not None else None
+
+    def age(self, key):
+        """Seconds since key was last fetched successfully (None if never fetched)"""
+        with self._lock:
+            entry = self._entries.get(key)
+        return time.time() - entry[1] if entry is not None else None
+
+    def snapshot(self):
+        """{key: price} for every cached key"""
+        with self._lock:
+            return {key: entry[0] for key, entry in self._entries.items()}
+
+
+def format_age(seconds):
+    """Short age label for the UI: 'just now', '45s', '12m', '3h'"""
+    if seconds is None:
+        return "--"
+    if seconds < 5:
+        return "just now"
+    if seconds < 60:
+        return f"{int(seconds)}s"
+    if seconds < 3600:
+        return f"{int(seconds // 60)}m"
+    return f"{int(seconds // 3600)}h"
+
+
+def period_covering(start):
+    """Shortest supported period that reaches back to start (a datetime), or None if none does"""
+    days = (datetime.now() - start).days + 1
+    for period, period_days in sorted(PERIOD_DAYS.items(), key=lambda item: item[1]):
+        if period_days >= days:
+            return period
+    return None
+
+
+def yahoo_history(ticker_symbol, start=None, period=None, timeout=None):
+    """
+    One blocking Yahoo Finance history request (start 'YYYY-MM-DD' or
+    period). timeout (seconds) is passed on as the socket timeout, so the
+    request gives up - and frees its worker - once the caller stops waiting.
+    """
+    ticker = yf.Ticker(ticker_symbol)
+    options = {} if timeout is None else {'timeout': timeout}
+    if start is not None:
+        return ticker.history(start=start, **options)
+    return ticker.history(period=period, **options)
+
+
+def download_history(ticker_symbol, timeout=30, max_retries=2, start=None, period=None):
+    """
+    Download Yahoo Finance history with timeout and retry logic.
+
+    Pass either start ('YYYY-MM-DD') or period. Returns (DataFrame, None) on
+    success or (None, "error description") on failure. Blocking version for
+    callers outside the data loop (see market_loop.MarketData.download).
+    """
+    last_error = None
+
+    for attempt in range(max_retries):
+        try:
+            # Run on the network pool for timeout control
+            future = network_pool().submit(yahoo_history, ticker_symbol, start, period, timeout)
+
+            try:
+                hist = future.result(timeout=timeout)
+
+                if hist is not None and not hist.empty:
+                    return hist, None
+                else:
+                    last_error = f"No data returned for {ticker_symbol}"
+
+            except concurrent.futures.TimeoutError:
+                last_error = f"Timeout fetching {ticker_symbol} (attempt {attempt + 1}/{max_retries})"
+
+        except Exception as e:
+            last_error = f"Error fetching {ticker_symbol}: {str(e)}"
+
+        # Wait before retry (if not last attempt)
+        if attempt < max_retries - 1:
+            time.sleep(1)
+
+    return None, last_error
@@ -0,0 +1,252 @@
+"""
+One background event loop for the Metal Price Calculator's network calls.
+
+DataLoop runs an asyncio event loop on a single daemon thread. The GUI, the
+command line and the pricing service hand it coroutines instead of starting
+a thread per button press:
+
+    submit(coro, key)   run coro; a job under the same key (e.g. 'prices')
+                        cancels the previous one - switching metal mid-fetch
+                        drops the old fetch
+    cancel(key)         cancel the job running under key
+    run(coro)           submit and wait for the result (blocking callers)
+
+yfinance and requests have no async API, so the calls themselves run on
+market_data's shared thread pools and are awaited with a deadline - Yahoo
+Finance requests on network_pool (run_network), store and simulation work
+on blocking_pool (run_blocking, also the loop's default executor) - no
+executor is created per request. Cancelling a job or hitting a deadline
+stops waiting at once; a Yahoo request already in flight was given the
+same deadline as its socket timeout, so it ends soon after and its result
+is dropped. A slow upstream can fill only the network pool.
+
+MarketData is the async side of the history store:
+
+    download(ticker)    Yahoo Finance download with retries and a per-attempt deadline
+    history(ticker)     stored history, downloading only the missing bars
+    fetch_all(fetch)    several fetches as one group: an overall deadline or
+                        a cancellation cancels every member
+
+Every Yahoo Finance request goes through one RateLimiter (requests per
+second plus a cap on requests in flight), whichever job or tab makes it.
+"""
+
+import asyncio
+import functools
+import threading
+import time
+
+from market_data import PERIOD_DAYS, blocking_pool, network_pool, yahoo_history
+
+YAHOO_REQUESTS_PER_SECOND = 4  # sustained rate of Yahoo Finance requests ...
+YAHOO_BURST = 8                # ... after an initial burst of this many
+YAHOO_MAX_IN_FLIGHT = 6        # requests running at the same time
+RETRY_DELAY = 1                # seconds between download attempts
+
+
+async def run_blocking(fn, *args, timeout=None, pool=None):
+    """fn(*args) on pool (default: the shared blocking pool); asyncio.TimeoutError after timeout seconds"""
+    future = asyncio.get_running_loop().run_in_executor(pool or blocking_pool(), functools.partial(fn, *args))
+    if timeout is None:
+        return await future
+    return await asyncio.wait_for(future, timeout)
+
+
+async def run_network(fn, *args, timeout=None):
+    """fn(*args) on the shared network pool; asyncio.TimeoutError after timeout seconds"""
+    return await run_blocking(fn, *args, timeout=timeout, pool=network_pool())
+
+
+class RateLimiter:
+    """Token bucket plus in-flight cap for one upstream service (use as 'async with limiter:')."""
+
+    def __init__(self, rate, burst, max_in_flight):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = None   # asyncio primitives are created on the data loop, on first use
+        self._slots = None
+
+    async def __aenter__(self):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        await self._slots.acquire()
+        try:
+            async with self._lock:
+                while True:
+                    now = time.monotonic()
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        break
+                    await asyncio.sleep((1 - self._tokens) / self.rate)
+        except BaseException:
+            self._slots.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._slots.release()
+
+
+class DataLoop:
+    """The background event loop thread, started on first use, and its keyed jobs."""
+
+    def __init__(self):
+        self._loop = None
+        self._thread = None
+        self._jobs = {}  # key -> concurrent.futures.Future of the job running under it
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                loop.set_default_executor(blocking_pool())
+                ready = threading.Event()
+
+                def run():
+                    asyncio.set_event_loop(loop)
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                self._thread = threading.Thread(target=run, name='market-data-loop', daemon=True)
+                self._thread.start()
+                ready.wait()
+                self._loop = loop
+            return self._loop
+
+    def in_loop(self):
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro, key=None, on_done=None):
+        """
+        Run coro on the loop. Returns a concurrent.futures.Future; cancel() on
+        it cancels the job. With a key, the job previously submitted under it
+        is cancelled. on_done(future) runs on the loop thread once the job
+        has finished, failed or been cancelled.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        if key is not None:
+            with self._lock:
+                previous = self._jobs.get(key)
+                self._jobs[key] = future
+            if previous is not None:
+                previous.cancel()
+            future.add_done_callback(lambda f: self._forget(key, f))
+        if on_done is not None:
+            future.add_done_callback(on_done)
+        return future
+
+    def cancel(self, key):
+        """Cancel the job running under key; True if there was one"""
+        with self._lock:
+            future = self._jobs.pop(key, None)
+        return future is not None and future.cancel()
+
+    def running(self, key):
+        with self._lock:
+            future = self._jobs.get(key)
+        return future is not None and not future.done()
+
+    def run(self, coro, timeout=None):
+        """Run coro on the loop and wait for its result (from any thread but the loop's own)"""
+        if self.in_loop():
+            coro.close()
+            raise RuntimeError("DataLoop.run() called on the data loop - await the coroutine instead")
+        return self.submit(coro).result(timeout)
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._jobs.get(key) is future:
+                del self._jobs[key]
+
+
+class MarketData:
+    """Async Yahoo Finance downloads and history store reads, rate limited as one client."""
+
+    def __init__(self, history_store):
+        self.store = history_store
+        self.yahoo = RateLimiter(YAHOO_REQUESTS_PER_SECOND, YAHOO_BURST, YAHOO_MAX_IN_FLIGHT)
+        self._ticker_locks = {}  # ticker -> asyncio.Lock, so one ticker is synced once at a time
+
+    async def download(self, ticker_symbol, timeout=30, max_retries=2, start=None, period=None):
+        """
+        Download Yahoo Finance history (start 'YYYY-MM-DD' or period) with
+        retries, each attempt limited to timeout seconds. Returns
+        (DataFrame, None) on success or (None, "error description").
+        """
+        last_error = None
+
+        for attempt in range(max_retries):
+            try:
+                async with self.yahoo:
+                    hist = await run_network(yahoo_history, ticker_symbol, start, period, timeout,
+                                             timeout=timeout)
+
+                if hist is not None and not hist.empty:
+                    return hist, None
+                last_error = f"No data returned for {ticker_symbol}"
+
+            except asyncio.TimeoutError:
+                last_error = f"Timeout fetching {ticker_symbol} (attempt {attempt + 1}/{max_retries})"
+            except Exception as e:
+                last_error = f"Error fetching {ticker_symbol}: {str(e)}"
+
+            # Wait before retry (if not last attempt)
+            if attempt < max_retries - 1:
+                await asyncio.sleep(RETRY_DELAY)
+
+        return None, last_error
+
+    async def history(self, ticker_symbol, period="3mo", timeout=30, max_retries=2):
+        """Daily history for a ticker through the history store (see HistoryStore.history)"""
+        if period not in PERIOD_DAYS:
+            # Not something we can answer from disk - plain download
+            return await self.download(ticker_symbol, timeout, max_retries, period=period)
+
+        lock = self._ticker_locks.setdefault(ticker_symbol, asyncio.Lock())
+        async with lock:
+            hist, start = await run_blocking(self.store.plan, ticker_symbol, period)
+            if hist is not None:
+                return hist, None
+            new_hist, error = await self.download(ticker_symbol, timeout, max_retries, start=start)
+            return await run_blocking(self.store.commit, ticker_symbol, period, start, new_hist, error)
+
+    async def fetch_all(self, fetch, tickers, on_done=None, deadline=None):
+        """
+        Await fetch(ticker) -> (hist, error) for several tickers at the same time.
+
+        Duplicate tickers are fetched once. on_done(ticker, error) is called as
+        each ticker finishes. Tickers still running after deadline seconds
+        get an error result. The fetches live only as long as this call:
+        cancelling it (or the deadline) cancels every one still running.
+        Returns {ticker: (hist, error)}.
+        """
+        unique = list(dict.fromkeys(tickers))
+        results = {}
+
+        async def fetch_one(ticker):
+            try:
+                results[ticker] = await fetch(ticker)
+            except Exception as e:
+                results[ticker] = (None, f"Error fetching {ticker}: {str(e)}")
+            if on_done:
+                on_done(ticker, results[ticker][1])
+
+        tasks = [asyncio.ensure_future(fetch_one(ticker)) for ticker in unique]
+        try:
+            if tasks:
+                await asyncio.wait(tasks, timeout=deadline)
+        finally:
+            for task in tasks:
+                task.cancel()
+        for ticker in unique:
+            if ticker not in results:
+                results[ticker] = (None, f"Deadline of {deadline}s passed fetching {ticker}")
+        return results
@@ -23,6 +23,15 @@ PREDICTION HISTORY saves ALL metrics for analysis:
 - Beta, correlation, pressure multiplier
 - Confidence breakdown signals
 
+HEADLESS: the fetch/predict/grade/back test/valuation logic lives in
+app_core (no tkinter); metal_cli.py runs it from cron or a systemd timer:
+    python metal_cli.py predict Silver --save
+and `metal_cli.py serve` shares the calculator's prices over local HTTP (price_service).
+
+Network fetches run on one background asyncio loop (market_loop.DataLoop),
+rate limited as a single Yahoo Finance client; switching metal or pairing
+mid-fetch cancels the fetch that no longer applies.
+
 To convert to .exe:
 1. pip install pyinstaller yfinance requests
 2. pyinstaller --onefile --windowed --icon=metal.ico --name="MetalCalculator" metal_calculator_gui.py
@@ -32,131 +41,48 @@ Requires: pip install yfinance requests
 
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog, simpledialog
-from datetime import datetime, timedelta
+from datetime import datetime
+import asyncio
 import threading
+import multiprocessing
 import sys
 import os
 import json
 import csv
 import re
-import requests
 import math
 
+from app_config import (SETTINGS_FILE, INVENTORY_REFRESH_DEADLINE, METALS, PREDICTION_SECONDARIES,
+                        SUGGESTED_PAIRINGS, TROY_OUNCE_TO_GRAMS, POUND_TO_GRAMS, UNITS, METRIC_ABBREVS,
+                        ABBREV_TO_METRIC, STATE_TAX_RATES, AVAILABLE_METRICS, METRIC_LABELS, app_data_path)
+from app_core import AppCore, read_settings, matured_predictions, formula_price
+from market_data import HTTP_POOL_SIZE, SPOT_CACHE_TTL, format_age
+from market_loop import run_blocking
+from prediction_engine import SQRT_7, CLAMP_NORMAL, CRASH_TRIGGERS_NEEDED
+from grades import grade_for_error
+from backtest import (run_pairing, run_batch, backtest_window, export_batch, batch_detail_file,
+                      BacktestCsvWriter)
+from rolling_metrics import window_metrics_in
+from inventory_valuation import InventoryValuation
+from optimizer import grid_candidates, random_candidates, run_sweep, best, export_sweep_csv
+
 # Try to import yfinance
 try:
     import yfinance as yf
 except ImportError:
     yf = None
 
+# NumPy is only needed for evaluating formulas over the price history
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 # =============================================================================
 # CONFIGURATION
 # =============================================================================
-APP_NAME = "MetalCalculator"
-INVENTORY_FILE = "metal_inventory.json"
-FORMULAS_FILE = "custom_formulas.json"
-SETTINGS_FILE = "settings.json"
-PREDICTIONS_FILE = "prediction_history.json"
-
-# API endpoints
-GOLD_API_BASE = "https://api.gold-api.com/price"
-
-# Metal configurations
-METALS = {
-    'Gold': {'symbol': 'XAU', 'yf_ticker': 'GC=F', 'color': '#FFD700'},
-    'Silver': {'symbol': 'XAG', 'yf_ticker': 'SI=F', 'color': '#C0C0C0'},
-    'Platinum': {'symbol': 'XPT', 'yf_ticker': 'PL=F', 'color': '#E5E4E2'},
-    'Copper': {'symbol': 'XCU', 'yf_ticker': 'HG=F', 'color': '#B87333'}
-}
-
-# Prediction secondary options (includes non-metals for correlation)
-PREDICTION_SECONDARIES = {
-    'Gold': {'yf_ticker': 'GC=F', 'type': 'metal'},
-    'Silver': {'yf_ticker': 'SI=F', 'type': 'metal'},
-    'Platinum': {'yf_ticker': 'PL=F', 'type': 'metal'},
-    'Copper': {'yf_ticker': 'HG=F', 'type': 'metal'},
-    'S&P 500': {'yf_ticker': '^GSPC', 'type': 'index'}
-}
-
-# Suggested secondary pairings (backtest: Silver/S&P 500 best in-range ~66%; Silver/Copper worst direction)
-SUGGESTED_PAIRINGS = {
-    'Silver': 'S&P 500',   # Best in-range and lowest error in backtests
-    'Gold': 'Silver',      # Inverse GSR
-    'Platinum': 'Gold',    # Both precious metals
-    'Copper': 'S&P 500'    # Industrial correlation
-}
-
-# DXY (US Dollar Index) ticker for confidence calculation
-DXY_TICKER = 'DX-Y.NYB'
-
-# Square root of 7 for weekly volatility scaling
-SQRT_7 = 2.6457513110645907  # math.sqrt(7)
-
-# Prediction v4: Regime and clamp constants
-SP500_TICKER_REGIME = '^GSPC'
-VIX_TICKER = '^VIX'
-REGIME_MA_DAYS = 20
-CORRELATION_FAST_DAYS = 10
-CORRELATION_REGIME_DIVERGENCE = 0.3   # fast vs slow correlation diff = regime change
-
-# Clamp levels
-CLAMP_NORMAL = 0.10      # ±10% normal volatility
-CLAMP_ELEVATED = 0.15    # ±15% elevated vol
-CLAMP_CRISIS = 0.25      # ±25% crisis / regime change
-CLAMP_RECOVERY = 0.15    # ±15% recovery
-CLAMP_CRASH_SIGMA = 3.0  # dynamic σ-based (3σ max) for crash
-
-VOLATILITY_ELEVATED_PCT = 4.0   # ATR/price % threshold for elevated clamp
-VOLATILITY_CRISIS_PCT = 8.0     # ATR/price % for crisis clamp
-
-# Beta adjustments
-BEAR_BETA_SHRINK = 0.7          # bear beta 0.7x
-REGIME_BETA_SHRINK = 0.7        # shrink beta when regime change (reduce amplification)
-
-# Crash detection thresholds (3/5 triggers needed)
-CRASH_VIX_THRESHOLD = 25.0
-CRASH_GSR_THRESHOLD = 85.0
-CRASH_ATR_PCT_THRESHOLD = 5.0
-CRASH_CONSECUTIVE_DAYS = 3       # 3+ days with >2% moves
-CRASH_CONSECUTIVE_MOVE = 0.02    # 2% daily move threshold
-CRASH_DXY_RISE = 0.01           # DXY +1% (5-day)
-CRASH_METAL_DROP = -0.02        # Metal -2% (5-day)
-CRASH_TRIGGERS_NEEDED = 3       # 3 out of 5 triggers
-CRASH_REVERSION_FACTOR = 0.30   # 30% towards 50d MA
-CRASH_REVERSION_MA = 50         # revert towards 50d MA
-
-# Recovery constants
-RECOVERY_BUFFER_DAYS = 10       # 10 day buffer after crash
-RECOVERY_REVERSION_FACTOR = 0.20  # 20% towards 20d MA
-RECOVERY_REVERSION_MA = 20      # revert towards 20d MA
-
-# Ratio pressure
-RATIO_BASE_MULTIPLIER_FACTOR = 0.15  # |ρ| × 0.15
-RATIO_SIDEWAYS_BOOST = 2.0
-BEARISH_MOMENTUM_CUT_RATIO = 0.0  # zero ratio pressure when primary 14d momentum negative
-
-CONFIDENCE_CAP_REGIME_CHANGE = 50   # cap confidence % when regime change detected
-
-# Confidence weights (8-factor, total = 100%)
-CONF_W_CORRELATION = 40        # Correlation (60d) 40%
-CONF_W_DXY = 7                 # DXY health 7% (4% for copper)
-CONF_W_DXY_COPPER = 4          # Copper DXY weight
-CONF_W_REGIME_FIT = 10         # Regime fit 10%
-CONF_W_RSI = 10                # RSI range 10%
-CONF_W_VOLATILITY = 5          # Volatility 5%
-CONF_W_RATIO = 10              # Ratio stability 10%
-CONF_W_RSI_DIVERGENCE = 8      # RSI Divergence 8%
-CONF_W_CORR_AGREEMENT = 10     # Correlation Agreement 10%
-
-# Conversion factors
-TROY_OUNCE_TO_GRAMS = 31.1035
-POUND_TO_GRAMS = 453.592
-
-# Unit configurations
-UNITS = {
-    'gram': {'factor': 1, 'label': 'per gram'},
-    'oz': {'factor': TROY_OUNCE_TO_GRAMS, 'label': 'per troy oz'},
-    'lb': {'factor': POUND_TO_GRAMS, 'label': 'per lb'}
-}
+# How often the "spot price age" labels are refreshed (ms)
+SPOT_AGE_REFRESH_MS = 10000
 
 # Metal-specific purity grades
 PURITY_GRADES = {
@@ -202,108 +128,6 @@ PURITY_GRADES = {
     ]
 }
 
-# Metric abbreviations for formula builder
-METRIC_ABBREVS = {
-    'current_price': 'cur',
-    '7_day_avg': '7davg',
-    '7_day_median': '7dmed',
-    '7_day_high': '7dhi',
-    '7_day_low': '7dlo',
-    '14_day_avg': '14davg',
-    '14_day_median': '14dmed',
-    '28_day_avg': '28davg',
-    '28_day_median': '28dmed',
-    '1_year_avg': '1yavg'
-}
-
-# Reverse lookup
-ABBREV_TO_METRIC = {v: k for k, v in METRIC_ABBREVS.items()}
-
-# US State Sales Tax Rates (as of 2024)
-# Note: Many states exempt precious metals from sales tax
-STATE_TAX_RATES = {
-    'None (0%)': 0.0,
-    'Alabama (4%)': 4.0,
-    'Alaska (0%)': 0.0,
-    'Arizona (5.6%)': 5.6,
-    'Arkansas (6.5%)': 6.5,
-    'California (7.25%)': 7.25,
-    'Colorado (2.9%)': 2.9,
-    'Connecticut (6.35%)': 6.35,
-    'Delaware (0%)': 0.0,
-    'Florida (6%)': 6.0,
-    'Georgia (4%)': 4.0,
-    'Hawaii (4%)': 4.0,
-    'Idaho (6%)': 6.0,
-    'Illinois (6.25%)': 6.25,
-    'Indiana (7%)': 7.0,
-    'Iowa (6%)': 6.0,
-    'Kansas (6.5%)': 6.5,
-    'Kentucky (6%)': 6.0,
-    'Louisiana (4.45%)': 4.45,
-    'Maine (5.5%)': 5.5,
-    'Maryland (6%)': 6.0,
-    'Massachusetts (6.25%)': 6.25,
-    'Michigan (6%)': 6.0,
-    'Minnesota (6.875%)': 6.875,
-    'Mississippi (7%)': 7.0,
-    'Missouri (4.225%)': 4.225,
-    'Montana (0%)': 0.0,
-    'Nebraska (5.5%)': 5.5,
-    'Nevada (6.85%)': 6.85,
-    'New Hampshire (0%)': 0.0,
-    'New Jersey (6.625%)': 6.625,
-    'New Mexico (4.875%)': 4.875,
-    'New York (4%)': 4.0,
-    'North Carolina (4.75%)': 4.75,
-    'North Dakota (5%)': 5.0,
-    'Ohio (5.75%)': 5.75,
-    'Oklahoma (4.5%)': 4.5,
-    'Oregon (0%)': 0.0,
-    'Pennsylvania (6%)': 6.0,
-    'Rhode Island (7%)': 7.0,
-    'South Carolina (6%)': 6.0,
-    'South Dakota (4.5%)': 4.5,
-    'Tennessee (7%)': 7.0,
-    'Texas (6.25%)': 6.25,
-    'Utah (6.1%)': 6.1,
-    'Vermont (6%)': 6.0,
-    'Virginia (5.3%)': 5.3,
-    'Washington (6.5%)': 6.5,
-    'West Virginia (6%)': 6.0,
-    'Wisconsin (5%)': 5.0,
-    'Wyoming (4%)': 4.0,
-    'Washington DC (6%)': 6.0,
-    'Custom...': -1  # Flag for custom entry
-}
-
-# Available metrics for formulas
-AVAILABLE_METRICS = [
-    'current_price',
-    '7_day_avg',
-    '7_day_median',
-    '7_day_high',
-    '7_day_low',
-    '14_day_avg',
-    '14_day_median',
-    '28_day_avg',
-    '28_day_median',
-    '1_year_avg'
-]
-
-METRIC_LABELS = {
-    'current_price': "Today's Price",
-    '7_day_avg': '7-Day Average',
-    '7_day_median': '7-Day Median',
-    '7_day_high': '7-Day High',
-    '7_day_low': '7-Day Low',
-    '14_day_avg': '14-Day Average',
-    '14_day_median': '14-Day Median',
-    '28_day_avg': '28-Day Average',
-    '28_day_median': '28-Day Median',
-    '1_year_avg': '1-Year Average'
-}
-
 
 class MetalCalculatorApp:
     def __init__(self, root):
@@ -320,15 +144,10 @@ class MetalCalculatorApp:
         self.style = ttk.Style()
         self.style.theme_use('vista' if 'vista' in self.style.theme_names() else 'clam')
         
-        # Configure custom styles
-        self.style.configure("green.Horizontal.TProgressbar", troughcolor='#e0e0e0', background='#4CAF50')
-        self.style.configure("yellow.Horizontal.TProgressbar", troughcolor='#e0e0e0', background='#FFC107')
-        self.style.configure("orange.Horizontal.TProgressbar", troughcolor='#e0e0e0', background='#FF9800')
-        self.style.configure("red.Horizontal.TProgressbar", troughcolor='#e0e0e0', background='#f44336')
-        
         # Data storage - metrics per gram (base unit)
         self.metrics = {}  # Will hold all calculated metrics for current metal
-        self.inventory_prices = {}  # Will hold current prices for ALL metals (for inventory tab)
+        self.price_history = None  # (dates, closes per gram) behind self.metrics - for formula history
+        self.rolling_metrics = None  # RollingMetrics over those closes (any Nd window a formula asks for)
         self.prediction_data = {}  # Will hold prediction metrics for each metal {metal: {daily_prices, rsi, atr, etc}}
         self.current_prediction_result = None  # Stores the most recent prediction for saving
         self.current_metal = 'Silver'
@@ -336,6 +155,7 @@ class MetalCalculatorApp:
         
         # Storage
         self.inventory = []
+        self.valuation = InventoryValuation()  # value/profit/goal arrays, sort orders and totals of the inventory
         self.custom_formulas = []
         self.prediction_history = []  # Stores past predictions for grading
         self.settings = {
@@ -347,6 +167,15 @@ class MetalCalculatorApp:
         
         # Load saved data
         self.load_settings()
+        
+        # Data files, caches and prediction engine - shared with the headless CLI (metal_cli)
+        self.core = AppCore(self.get_app_data_path(), self.settings)
+        self.http = self.core.http
+        self.spot_prices = self.core.spot_prices
+        self.history_store = self.core.history_store
+        self.store = self.core.store
+        self.prediction_engine = self.core.prediction_engine
+        self.formula_cache = self.core.formula_cache  # compiled formula expressions
         self.load_inventory()
         self.load_formulas()
         self.load_prediction_history()
@@ -367,14 +196,15 @@ class MetalCalculatorApp:
         # Create UI
         self.create_widgets()
         
+        # Keep the spot price age labels current
+        self.update_spot_age_display()
+        
         # Check for matured predictions to grade on startup (delayed to not block UI)
         self.root.after(2000, self.check_and_auto_grade)
     
     def check_and_auto_grade(self):
         """Check for matured predictions and offer to grade them"""
-        now = datetime.now()
-        ungraded = [r for r in self.prediction_history 
-                   if not r['graded'] and datetime.fromisoformat(r['target_date']) <= now]
+        ungraded = matured_predictions(self.prediction_history)
         
         if ungraded:
             if messagebox.askyesno("Matured Predictions", 
@@ -417,26 +247,11 @@ class MetalCalculatorApp:
     
     def get_app_data_path(self):
         """Get the path for app data storage"""
-        if sys.platform == 'win32':
-            app_data = os.environ.get('APPDATA', os.path.expanduser('~'))
-            app_folder = os.path.join(app_data, APP_NAME)
-        else:
-            app_folder = os.path.join(os.path.expanduser('~'), f'.{APP_NAME.lower()}')
-        
-        if not os.path.exists(app_folder):
-            os.makedirs(app_folder)
-        
-        return app_folder
+        return app_data_path()
     
     def load_settings(self):
         """Load settings from JSON file"""
-        try:
-            path = os.path.join(self.get_app_data_path(), SETTINGS_FILE)
-            if os.path.exists(path):
-                with open(path, 'r') as f:
-                    self.settings.update(json.load(f))
-        except Exception as e:
-            print(f"Error loading settings: {e}")
+        self.settings.update(read_settings(self.get_app_data_path()))
     
     def save_settings(self):
         """Save settings to JSON file"""
@@ -448,33 +263,26 @@ class MetalCalculatorApp:
             print(f"Error saving settings: {e}")
     
     def load_inventory(self):
-        """Load inventory from JSON file"""
+        """Load inventory from the database"""
         try:
-            path = os.path.join(self.get_app_data_path(), INVENTORY_FILE)
-            if os.path.exists(path):
-                with open(path, 'r') as f:
-                    self.inventory = json.load(f)
+            self.inventory = self.store.items()
         except Exception as e:
             print(f"Error loading inventory: {e}")
             self.inventory = []
+        self.valuation.set_items(self.inventory)
     
-    def save_inventory(self):
-        """Save inventory to JSON file"""
+    def save_inventory_change(self, action, *args):
+        """Write one inventory change (store.add_item / update_item / delete_item) to the database"""
         try:
-            path = os.path.join(self.get_app_data_path(), INVENTORY_FILE)
-            with open(path, 'w') as f:
-                json.dump(self.inventory, f, indent=2)
+            action(*args)
         except Exception as e:
             print(f"Error saving inventory: {e}")
             messagebox.showerror("Save Error", f"Could not save inventory: {e}")
     
     def load_formulas(self):
-        """Load custom formulas from JSON file"""
+        """Load custom formulas from the database"""
         try:
-            path = os.path.join(self.get_app_data_path(), FORMULAS_FILE)
-            if os.path.exists(path):
-                with open(path, 'r') as f:
-                    self.custom_formulas = json.load(f)
+            self.custom_formulas = self.store.formulas()
         except Exception as e:
             print(f"Error loading formulas: {e}")
             self.custom_formulas = []
@@ -523,33 +331,19 @@ class MetalCalculatorApp:
         self.selected_formula_group = self.settings.get('selected_formula_group', 'All Groups')
     
     def save_formulas(self):
-        """Save custom formulas to JSON file"""
+        """Save custom formulas to the database"""
         try:
-            path = os.path.join(self.get_app_data_path(), FORMULAS_FILE)
-            with open(path, 'w') as f:
-                json.dump(self.custom_formulas, f, indent=2)
+            self.store.save_formulas(self.custom_formulas)
         except Exception as e:
             print(f"Error saving formulas: {e}")
     
     def load_prediction_history(self):
-        """Load prediction history from JSON file"""
+        """Load prediction history from the database"""
         try:
-            path = os.path.join(self.get_app_data_path(), PREDICTIONS_FILE)
-            if os.path.exists(path):
-                with open(path, 'r') as f:
-                    self.prediction_history = json.load(f)
+            self.prediction_history = self.store.predictions()
         except Exception as e:
             print(f"Error loading prediction history: {e}")
             self.prediction_history = []
-    
-    def save_prediction_history(self):
-        """Save prediction history to JSON file"""
-        try:
-            path = os.path.join(self.get_app_data_path(), PREDICTIONS_FILE)
-            with open(path, 'w') as f:
-                json.dump(self.prediction_history, f, indent=2)
-        except Exception as e:
-            print(f"Error saving prediction history: {e}")
         
     def create_widgets(self):
         # Create notebook for tabs
@@ -617,6 +411,9 @@ class MetalCalculatorApp:
         self.status_label = ttk.Label(control_frame, text="", foreground="gray")
         self.status_label.pack(side='left', padx=(10, 0))
         
+        self.spot_age_label = ttk.Label(control_frame, text="", foreground="gray", font=('Segoe UI', 8))
+        self.spot_age_label.pack(side='right')
+        
         # Progress bar (hidden initially)
         self.progress = ttk.Progressbar(parent, mode='indeterminate', length=300)
         
@@ -817,6 +614,7 @@ class MetalCalculatorApp:
         ttk.Button(toolbar, text="🗑️ Delete Selected", command=self.delete_formula).pack(side='left', padx=(5, 0))
         ttk.Button(toolbar, text="📋 Duplicate", command=self.duplicate_formula).pack(side='left', padx=(5, 0))
         ttk.Button(toolbar, text="🧪 Test Selected", command=self.test_formula).pack(side='left', padx=(5, 0))
+        ttk.Button(toolbar, text="📈 History", command=self.show_formula_history).pack(side='left', padx=(5, 0))
         
         # Formula listbox
         listbox_frame = ttk.Frame(list_frame)
@@ -866,6 +664,7 @@ class MetalCalculatorApp:
         self.pred_secondary_combo = ttk.Combobox(select_grid, textvariable=self.pred_secondary_var, state='readonly', width=12)
         self.pred_secondary_combo['values'] = list(PREDICTION_SECONDARIES.keys())
         self.pred_secondary_combo.grid(row=0, column=3, sticky='w', pady=5)
+        self.pred_secondary_combo.bind('<<ComboboxSelected>>', self.cancel_prediction_fetch)
         
         # Fetch button
         self.pred_fetch_btn = ttk.Button(select_grid, text="📊 Fetch Prediction Data", command=self.fetch_prediction_data_thread)
@@ -878,6 +677,18 @@ class MetalCalculatorApp:
         # Back Test button
         self.pred_backtest_btn = ttk.Button(select_grid, text="📉 Back Test", command=self.run_backtest_thread)
         self.pred_backtest_btn.grid(row=0, column=6, padx=(5, 0), pady=5)
+
+        # Cancel the running back test (its progress is checkpointed; Back Test resumes it)
+        self.pred_backtest_cancel_btn = ttk.Button(select_grid, text="⏹ Cancel", command=self.cancel_backtest, state='disabled')
+        self.pred_backtest_cancel_btn.grid(row=0, column=7, padx=(5, 0), pady=5)
+
+        # Batch Back Test button (every pairing at once)
+        self.pred_batch_btn = ttk.Button(select_grid, text="📑 Batch Back Test", command=self.run_batch_backtest_thread)
+        self.pred_batch_btn.grid(row=0, column=8, padx=(5, 0), pady=5)
+
+        # Parameter sweep button (tries other regime/clamp constants on the selected pairing)
+        self.pred_sweep_btn = ttk.Button(select_grid, text="🎛 Optimize", command=self.run_parameter_sweep_thread)
+        self.pred_sweep_btn.grid(row=0, column=9, padx=(5, 0), pady=5)
         
         self.pred_status_var = tk.StringVar(value="Select metals and click 'Fetch Prediction Data'")
         ttk.Label(select_frame, textvariable=self.pred_status_var, foreground="gray", font=('Segoe UI', 9)).pack(anchor='w', pady=(5, 0))
@@ -1136,6 +947,9 @@ class MetalCalculatorApp:
         self.inv_status_label = ttk.Label(toolbar, text="", foreground="gray", font=('Segoe UI', 8))
         self.inv_status_label.pack(side='left', padx=(5, 10))
         
+        self.inv_age_label = ttk.Label(toolbar, text="", foreground="gray", font=('Segoe UI', 8))
+        self.inv_age_label.pack(side='right')
+        
         ttk.Separator(toolbar, orient='vertical').pack(side='left', fill='y', padx=5)
         
         ttk.Button(toolbar, text="🔄 Refresh Display", command=self.refresh_inventory_display).pack(side='left')
@@ -1174,30 +988,41 @@ class MetalCalculatorApp:
         self.inv_summary_var = tk.StringVar(value="")
         ttk.Label(toolbar, textvariable=self.inv_summary_var, font=('Segoe UI', 9, 'bold')).pack(side='right')
         
-        # Scrollable frame for inventory items
-        canvas_frame = ttk.Frame(list_frame)
-        canvas_frame.pack(fill='both', expand=True)
-        
-        self.inv_canvas = tk.Canvas(canvas_frame, highlightthickness=0)
-        scrollbar = ttk.Scrollbar(canvas_frame, orient="vertical", command=self.inv_canvas.yview)
-        self.inv_scrollable_frame = ttk.Frame(self.inv_canvas)
-        
-        self.inv_scrollable_frame.bind(
-            "<Configure>",
-            lambda e: self.inv_canvas.configure(scrollregion=self.inv_canvas.bbox("all"))
-        )
-        
-        self.inv_canvas.create_window((0, 0), window=self.inv_scrollable_frame, anchor="nw")
-        self.inv_canvas.configure(yscrollcommand=scrollbar.set)
-        
-        self.inv_canvas.pack(side="left", fill="both", expand=True)
+        # Inventory list - a Treeview only draws the rows in view, and rows are
+        # updated in place (keyed by item id) instead of rebuilt on every refresh
+        tree_frame = ttk.Frame(list_frame)
+        tree_frame.pack(fill='both', expand=True)
+        
+        columns = ('metal', 'description', 'weight', 'pure', 'paid', 'value', 'profit', 'goal', 'purchased')
+        self.inv_tree = ttk.Treeview(tree_frame, columns=columns, show='tree headings', selectmode='browse')
+        self.inv_tree.heading('#0', text='Item ID')
+        self.inv_tree.column('#0', width=110, stretch=False)
+        for col, heading, width, anchor in (('metal', 'Metal', 75, 'w'), ('description', 'Description', 160, 'w'),
+                                            ('weight', 'Weight', 150, 'e'), ('pure', 'Pure (g)', 75, 'e'),
+                                            ('paid', 'Paid', 140, 'e'), ('value', 'Value', 85, 'e'),
+                                            ('profit', 'Profit', 150, 'e'), ('goal', 'Goal', 130, 'w'),
+                                            ('purchased', 'Purchased', 115, 'w')):
+            self.inv_tree.heading(col, text=heading)
+            self.inv_tree.column(col, width=width, anchor=anchor)
+        self.inv_tree.tag_configure('profit', foreground='green')
+        self.inv_tree.tag_configure('loss', foreground='red')
+        self.inv_tree.tag_configure('goal', foreground='green', font=('Segoe UI', 9, 'bold'))
+        self.inv_tree.tag_configure('unpriced', foreground='gray')
+        
+        scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=self.inv_tree.yview)
+        self.inv_tree.configure(yscrollcommand=scrollbar.set)
+        self.inv_tree.pack(side="left", fill="both", expand=True)
         scrollbar.pack(side="right", fill="y")
         
-        # Bind mousewheel
-        self.inv_canvas.bind_all("<MouseWheel>", lambda e: self.inv_canvas.yview_scroll(int(-1*(e.delta/120)), "units"))
+        self.inv_tree.bind('<<TreeviewSelect>>', self.on_inventory_select)
+        self.inv_tree.bind('<Double-1>', lambda e: self.edit_selected_item() if self.inv_tree.identify_row(e.y) else None)
+        
+        # Shown over the list when there is nothing to display
+        self.inv_empty_label = ttk.Label(tree_frame, text="", foreground="gray")
         
         # Track selected item
         self.selected_item_id = None
+        self.inv_rows = {}  # Treeview iid -> (item id, column values, tag) as last drawn
         
         # Initial display
         self.refresh_inventory_display()
@@ -1227,6 +1052,28 @@ class MetalCalculatorApp:
         default_unit_combo['values'] = list(UNITS.keys())
         default_unit_combo.grid(row=1, column=1, sticky='w', pady=5)
         
+        # =====================
+        # NETWORK
+        # =====================
+        network_frame = ttk.LabelFrame(parent, text=" Network ", padding="10")
+        network_frame.pack(fill='x', pady=(0, 10))
+        
+        network_grid = ttk.Frame(network_frame)
+        network_grid.pack(fill='x')
+        
+        ttk.Label(network_grid, text="Connection Pool Size:").grid(row=0, column=0, sticky='e', padx=(0, 10), pady=5)
+        self.http_pool_size_var = tk.StringVar(value=str(self.settings.get('http_pool_size', HTTP_POOL_SIZE)))
+        ttk.Spinbox(network_grid, from_=1, to=32, textvariable=self.http_pool_size_var, width=8).grid(row=0, column=1, sticky='w', pady=5)
+        ttk.Label(network_grid, text="(applies after restart)", foreground="gray", font=('Segoe UI', 8)).grid(row=0, column=2, sticky='w', padx=(10, 0))
+        
+        ttk.Label(network_grid, text="Reuse Spot Prices For (sec):").grid(row=1, column=0, sticky='e', padx=(0, 10), pady=5)
+        self.spot_cache_ttl_var = tk.StringVar(value=str(self.settings.get('spot_cache_ttl', SPOT_CACHE_TTL)))
+        ttk.Spinbox(network_grid, from_=0, to=3600, increment=30, textvariable=self.spot_cache_ttl_var, width=8).grid(row=1, column=1, sticky='w', pady=5)
+        
+        self.http_stats_var = tk.StringVar(value=self.http.stats_summary())
+        ttk.Label(network_frame, textvariable=self.http_stats_var, foreground="gray", font=('Segoe UI', 8), justify='left').pack(anchor='w', pady=(10, 5))
+        ttk.Button(network_frame, text="🔄 Refresh Stats", command=lambda: self.http_stats_var.set(self.http.stats_summary())).pack(anchor='w')
+        
         # =====================
         # SALES TAX
         # =====================
@@ -1287,8 +1134,16 @@ class MetalCalculatorApp:
     def on_metal_change(self, event=None):
         """Handle metal selection change"""
         self.current_metal = self.metal_var.get()
+        # A fetch still running is for the old metal - drop it
+        if self.core.data.cancel('prices'):
+            self.progress.stop()
+            self.progress.pack_forget()
+            self.status_label.config(text="")
+            self.fetch_btn.config(state='normal')
         # Clear metrics when metal changes
         self.metrics = {}
+        self.price_history = None
+        self.rolling_metrics = None
         for var in self.metric_vars.values():
             var.set("--")
         self.refresh_calculated_prices_display()
@@ -1395,134 +1250,57 @@ class MetalCalculatorApp:
     # =========================================================================
     
     def fetch_prices_thread(self):
-        """Start fetching prices in a separate thread"""
+        """Start fetching prices on the data loop"""
         self.fetch_btn.config(state='disabled')
         self.status_label.config(text="Connecting...")
         self.progress.pack(pady=(5, 0))
         self.progress.start(10)
         
-        thread = threading.Thread(target=self.fetch_prices, daemon=True)
-        thread.start()
+        self.core.data.submit(self.fetch_prices(self.current_metal), key='prices')
     
-    def fetch_prices(self):
-        """Fetch prices for current metal with timeout and retry logic"""
+    async def fetch_prices(self, metal):
+        """Fetch prices for one metal with timeout and retry logic (AppCore.price_metrics_async)"""
         try:
-            metal_config = METALS[self.current_metal]
-            
-            # Step 1: Fetch current spot price from gold-api.com (with timeout)
-            self.update_status("Fetching current spot price...")
-            current_price_oz = self.get_current_spot_price(metal_config['symbol'])
-            
-            if current_price_oz is None:
-                # Fallback to Yahoo Finance with retry
-                self.update_status("Primary API failed, trying backup...")
-                current_price_oz = self.get_yf_current_price_with_retry(metal_config['yf_ticker'])
+            result, error = await self.core.price_metrics_async(metal, on_progress=self.update_status)
             
-            if current_price_oz is None:
-                self.fetch_error("Could not fetch current spot price.\n\nBoth price APIs failed to respond.\nPlease check your internet connection and try again.")
+            if error:
+                self.fetch_error(error)
                 return
             
-            # Step 2: Fetch historical data from Yahoo Finance with retry
-            self.update_status("Fetching historical data...")
-            hist, error = self.fetch_yf_history_with_retry(
-                metal_config['yf_ticker'],
-                period="1y",
-                timeout=30,
-                max_retries=2
-            )
-            
-            if error or hist is None or len(hist) < 7:
-                error_msg = error if error else "No historical data returned"
-                self.fetch_error(f"Could not fetch historical data.\n\n{error_msg}\n\nYahoo Finance may be temporarily unavailable.\nPlease try again in a moment.")
-                return
-            
-            # Calculate all metrics (stored per gram as base unit)
-            all_prices = [float(p) / TROY_OUNCE_TO_GRAMS for p in hist['Close']]
-            
-            # Current price
-            self.metrics['current_price'] = current_price_oz / TROY_OUNCE_TO_GRAMS
-            
-            # 7-day metrics
-            if len(all_prices) >= 7:
-                last_7 = all_prices[-7:]
-                self.metrics['7_day_avg'] = sum(last_7) / len(last_7)
-                self.metrics['7_day_median'] = sorted(last_7)[len(last_7)//2]
-                self.metrics['7_day_high'] = max(last_7)
-                self.metrics['7_day_low'] = min(last_7)
-            
-            # 14-day metrics
-            if len(all_prices) >= 14:
-                last_14 = all_prices[-14:]
-                self.metrics['14_day_avg'] = sum(last_14) / len(last_14)
-                self.metrics['14_day_median'] = sorted(last_14)[len(last_14)//2]
-            
-            # 28-day metrics
-            if len(all_prices) >= 28:
-                last_28 = all_prices[-28:]
-                self.metrics['28_day_avg'] = sum(last_28) / len(last_28)
-                self.metrics['28_day_median'] = sorted(last_28)[len(last_28)//2]
-            
-            # 1-year average
-            self.metrics['1_year_avg'] = sum(all_prices) / len(all_prices)
+            def show():
+                if metal != self.current_metal:
+                    return  # switched metal as the fetch finished
+                
+                # Current price and window metrics (stored per gram as base unit)
+                self.metrics.update(result['metrics'])
+                
+                # Keep the daily closes so formulas can use other windows and be evaluated over the whole year
+                self.rolling_metrics = result['rolling']
+                self.price_history = result['history']
+                
+                self.display_results()
             
             # Update UI on main thread
-            self.root.after(0, self.display_results)
+            self.root.after(0, show)
             
         except Exception as e:
             self.fetch_error(f"Error fetching data:\n{str(e)}\n\nPlease try again.")
     
-    def get_yf_current_price_with_retry(self, ticker, timeout=15, max_retries=2):
-        """Get current price from Yahoo Finance with timeout and retry"""
-        import concurrent.futures
-        import time
+    @property
+    def inventory_prices(self):
+        """Current price per gram for every metal in the spot price cache"""
+        return self.core.inventory_prices
+    
+    def update_spot_age_display(self):
+        """Show how old the cached spot prices are (reschedules itself)"""
+        age = self.spot_prices.age(self.current_metal)
+        self.spot_age_label.config(text=f"Spot price age: {format_age(age)}" if age is not None else "")
         
-        for attempt in range(max_retries):
-            try:
-                with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-                    def fetch():
-                        stock = yf.Ticker(ticker)
-                        data = stock.history(period="1d")
-                        if not data.empty:
-                            return float(data['Close'].iloc[-1])
-                        return None
-                    
-                    future = executor.submit(fetch)
-                    result = future.result(timeout=timeout)
-                    if result is not None:
-                        return result
-                        
-            except concurrent.futures.TimeoutError:
-                print(f"YF current price timeout (attempt {attempt + 1}/{max_retries})")
-            except Exception as e:
-                print(f"YF current price error: {e}")
-            
-            if attempt < max_retries - 1:
-                time.sleep(1)
+        ages = [f"{metal} {format_age(self.spot_prices.age(metal))}" for metal in METALS
+                if self.spot_prices.age(metal) is not None]
+        self.inv_age_label.config(text=("Price age: " + ", ".join(ages)) if ages else "")
         
-        return None
-    
-    def get_current_spot_price(self, symbol):
-        """Fetch current spot price from gold-api.com"""
-        try:
-            response = requests.get(f"{GOLD_API_BASE}/{symbol}", timeout=15)
-            if response.status_code == 200:
-                data = response.json()
-                if "price" in data:
-                    return float(data["price"])
-        except Exception as e:
-            print(f"gold-api.com error: {e}")
-        return None
-    
-    def get_yf_current_price(self, ticker):
-        """Fallback: get current price from Yahoo Finance"""
-        try:
-            stock = yf.Ticker(ticker)
-            data = stock.history(period="1d")
-            if not data.empty:
-                return float(data['Close'].iloc[-1])
-        except Exception as e:
-            print(f"Yahoo Finance error: {e}")
-        return None
+        self.root.after(SPOT_AGE_REFRESH_MS, self.update_spot_age_display)
     
     # =========================================================================
     # PREDICTION METHODS
@@ -1532,9 +1310,12 @@ class MetalCalculatorApp:
         """
         Fetch Yahoo Finance history with timeout and retry logic.
         
+        Reads through the local history store: fresh data is served from disk
+        and only bars added since the last sync are downloaded.
+        
         Args:
             ticker_symbol: Yahoo Finance ticker (e.g., 'GC=F', 'SI=F')
-            period: History period (e.g., '3mo', '1y')
+            period: History period (e.g., '3mo', '1y', '18mo')
             timeout: Timeout in seconds per attempt
             max_retries: Number of retry attempts
             
@@ -1543,196 +1324,65 @@ class MetalCalculatorApp:
             - On success: (DataFrame, None)
             - On failure: (None, "error description")
         """
-        import concurrent.futures
-        
-        last_error = None
+        return self.core.fetch_history(ticker_symbol, period=period, timeout=timeout, max_retries=max_retries)
+    
+    def fetch_yf_histories(self, sources, period="3mo", timeout=30, max_retries=2, status_var=None, status_prefix=""):
+        """
+        Fetch several Yahoo Finance histories at the same time (AppCore.fetch_histories).
         
-        for attempt in range(max_retries):
-            try:
-                # Use ThreadPoolExecutor for timeout control
-                with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-                    def fetch_data():
-                        ticker = yf.Ticker(ticker_symbol)
-                        return ticker.history(period=period)
-                    
-                    future = executor.submit(fetch_data)
-                    
-                    try:
-                        hist = future.result(timeout=timeout)
-                        
-                        if hist is not None and not hist.empty:
-                            return hist, None
-                        else:
-                            last_error = f"No data returned for {ticker_symbol}"
-                            
-                    except concurrent.futures.TimeoutError:
-                        last_error = f"Timeout fetching {ticker_symbol} (attempt {attempt + 1}/{max_retries})"
-                        
-            except Exception as e:
-                last_error = f"Error fetching {ticker_symbol}: {str(e)}"
+        Args:
+            sources: List of (label, ticker) pairs; a ticker listed twice is fetched once
+            period, timeout, max_retries: Passed to fetch_yf_history_with_retry
+            status_var: Optional StringVar that receives per-ticker progress
+            status_prefix: Text put in front of each progress message
             
-            # Wait before retry (if not last attempt)
-            if attempt < max_retries - 1:
-                import time
-                time.sleep(1)
-        
-        return None, last_error
+        Returns:
+            dict: {ticker: (history_dataframe, error_message)}
+        """
+        on_progress = None
+        if status_var is not None:
+            on_progress = lambda msg: self.root.after(0, lambda: status_var.set(msg))
+        return self.core.fetch_histories(sources, period=period, timeout=timeout, max_retries=max_retries,
+                                         on_progress=on_progress, status_prefix=status_prefix)
     
     def on_pred_primary_change(self, event=None):
         """Auto-suggest secondary when primary changes"""
+        self.cancel_prediction_fetch()
         primary = self.pred_primary_var.get()
         if primary in SUGGESTED_PAIRINGS:
             suggested = SUGGESTED_PAIRINGS[primary]
             self.pred_secondary_var.set(suggested)
     
+    def cancel_prediction_fetch(self, event=None):
+        """Drop a prediction fetch still running for the previous pairing"""
+        if self.core.data.cancel('prediction'):
+            self.pred_fetch_btn.config(state='normal')
+            self.pred_status_var.set("Fetch cancelled - pairing changed")
+    
     def fetch_prediction_data_thread(self):
-        """Start fetching prediction data in a separate thread"""
+        """Start fetching prediction data on the data loop"""
         self.pred_fetch_btn.config(state='disabled')
         self.pred_status_var.set("Fetching data...")
         
-        thread = threading.Thread(target=self.fetch_prediction_data, daemon=True)
-        thread.start()
+        self.core.data.submit(self.fetch_prediction_data(self.pred_primary_var.get(), self.pred_secondary_var.get()),
+                              key='prediction')
     
-    def fetch_prediction_data(self):
+    async def fetch_prediction_data(self, primary_metal, secondary_name):
         """Fetch price data for both metals/indices for prediction plus DXY"""
-        errors = []
-        
         try:
-            primary_metal = self.pred_primary_var.get()
-            secondary_name = self.pred_secondary_var.get()
-            
             if primary_metal == secondary_name:
                 self.root.after(0, lambda: messagebox.showwarning("Same Selection", "Please select two different items for ratio comparison."))
                 self.root.after(0, lambda: self.pred_fetch_btn.config(state='normal'))
                 self.root.after(0, lambda: self.pred_status_var.set("Select different items"))
                 return
             
-            # ===== Fetch primary metal =====
-            self.root.after(0, lambda: self.pred_status_var.set(f"Fetching {primary_metal} data..."))
+            # ===== Fetch every source at once (one download per unique ticker) =====
+            fetched = await self.core.fetch_histories_async(
+                self.core.prediction_sources(primary_metal, secondary_name), period="3mo", timeout=30, max_retries=2,
+                on_progress=lambda msg: self.root.after(0, lambda: self.pred_status_var.set(msg)))
             
-            primary_config = METALS[primary_metal]
-            primary_hist, primary_err = self.fetch_yf_history_with_retry(
-                primary_config['yf_ticker'], 
-                period="3mo",
-                timeout=30,
-                max_retries=2
-            )
-            
-            if primary_err:
-                errors.append(f"{primary_metal}: {primary_err}")
-                raise Exception(f"Could not fetch {primary_metal} data.\n\n{primary_err}")
-            
-            # ===== Fetch secondary =====
-            self.root.after(0, lambda: self.pred_status_var.set(f"Fetching {secondary_name} data..."))
-            
-            secondary_config = PREDICTION_SECONDARIES[secondary_name]
-            secondary_hist, secondary_err = self.fetch_yf_history_with_retry(
-                secondary_config['yf_ticker'],
-                period="3mo",
-                timeout=30,
-                max_retries=2
-            )
-            
-            if secondary_err:
-                errors.append(f"{secondary_name}: {secondary_err}")
-                raise Exception(f"Could not fetch {secondary_name} data.\n\n{secondary_err}")
-            
-            # ===== Fetch DXY =====
-            self.root.after(0, lambda: self.pred_status_var.set("Fetching DXY (US Dollar Index)..."))
-            
-            dxy_hist, dxy_err = self.fetch_yf_history_with_retry(
-                DXY_TICKER,
-                period="3mo",
-                timeout=30,
-                max_retries=2
-            )
-            
-            if dxy_err:
-                errors.append(f"DXY: {dxy_err}")
-                raise Exception(f"Could not fetch DXY (US Dollar Index) data.\n\n{dxy_err}")
-            
-            # ===== Store primary metal data (convert to $/gram) =====
-            self.prediction_data[primary_metal] = {
-                'history': primary_hist,
-                'closes': [float(p) / TROY_OUNCE_TO_GRAMS for p in primary_hist['Close']],
-                'highs': [float(p) / TROY_OUNCE_TO_GRAMS for p in primary_hist['High']],
-                'lows': [float(p) / TROY_OUNCE_TO_GRAMS for p in primary_hist['Low']],
-            }
-            
-            # ===== Store secondary data =====
-            if secondary_config['type'] == 'metal':
-                self.prediction_data[secondary_name] = {
-                    'history': secondary_hist,
-                    'closes': [float(p) / TROY_OUNCE_TO_GRAMS for p in secondary_hist['Close']],
-                    'highs': [float(p) / TROY_OUNCE_TO_GRAMS for p in secondary_hist['High']],
-                    'lows': [float(p) / TROY_OUNCE_TO_GRAMS for p in secondary_hist['Low']],
-                }
-            else:
-                self.prediction_data[secondary_name] = {
-                    'history': secondary_hist,
-                    'closes': [float(p) for p in secondary_hist['Close']],
-                    'highs': [float(p) for p in secondary_hist['High']],
-                    'lows': [float(p) for p in secondary_hist['Low']],
-                }
-            
-            # ===== Store DXY data =====
-            self.prediction_data['DXY'] = {
-                'history': dxy_hist,
-                'closes': [float(p) for p in dxy_hist['Close']],
-            }
-            
-            # ===== S&P 500 for regime detection (20d MA) - reuse if secondary is S&P 500 =====
-            if secondary_name == 'S&P 500':
-                self.prediction_data['SP500_REGIME'] = {'closes': self.prediction_data['S&P 500']['closes']}
-            else:
-                self.root.after(0, lambda: self.pred_status_var.set("Fetching S&P 500 (regime)..."))
-                sp_hist, sp_err = self.fetch_yf_history_with_retry(
-                    SP500_TICKER_REGIME, period="3mo", timeout=30, max_retries=2
-                )
-                if not sp_err and sp_hist is not None:
-                    self.prediction_data['SP500_REGIME'] = {
-                        'closes': [float(p) for p in sp_hist['Close']],
-                    }
-                else:
-                    self.prediction_data['SP500_REGIME'] = None  # regime unavailable
-
-            # ===== Fetch VIX for crash detection =====
-            self.root.after(0, lambda: self.pred_status_var.set("Fetching VIX (crash detection)..."))
-            vix_hist, vix_err = self.fetch_yf_history_with_retry(
-                VIX_TICKER, period="3mo", timeout=30, max_retries=2
-            )
-            if not vix_err and vix_hist is not None:
-                self.prediction_data['VIX'] = {
-                    'closes': [float(p) for p in vix_hist['Close']],
-                }
-            else:
-                self.prediction_data['VIX'] = None
-
-            # ===== Fetch Gold for GSR calculation (if not already primary/secondary) =====
-            if primary_metal != 'Gold' and secondary_name != 'Gold':
-                self.root.after(0, lambda: self.pred_status_var.set("Fetching Gold (GSR)..."))
-                gold_hist, gold_err = self.fetch_yf_history_with_retry(
-                    METALS['Gold']['yf_ticker'], period="3mo", timeout=30, max_retries=2
-                )
-                if not gold_err and gold_hist is not None:
-                    self.prediction_data['Gold_GSR'] = {
-                        'closes': [float(p) / TROY_OUNCE_TO_GRAMS for p in gold_hist['Close']],
-                    }
-                else:
-                    self.prediction_data['Gold_GSR'] = None
-
-            # ===== Fetch Silver for GSR calculation (if not already primary/secondary) =====
-            if primary_metal != 'Silver' and secondary_name != 'Silver':
-                self.root.after(0, lambda: self.pred_status_var.set("Fetching Silver (GSR)..."))
-                silver_hist, silver_err = self.fetch_yf_history_with_retry(
-                    METALS['Silver']['yf_ticker'], period="3mo", timeout=30, max_retries=2
-                )
-                if not silver_err and silver_hist is not None:
-                    self.prediction_data['Silver_GSR'] = {
-                        'closes': [float(p) / TROY_OUNCE_TO_GRAMS for p in silver_hist['Close']],
-                    }
-                else:
-                    self.prediction_data['Silver_GSR'] = None
+            # ===== Prices in $/gram plus the regime, VIX and GSR series (raises if a required one is missing) =====
+            self.prediction_data.update(self.core.prediction_data(fetched, primary_metal, secondary_name))
             
             # ===== Calculate all indicators and prediction =====
             self.root.after(0, lambda: self.pred_status_var.set("Calculating indicators..."))
@@ -1746,772 +1396,11 @@ class MetalCalculatorApp:
                 error_msg = str(e)
                 if "Timeout" in error_msg:
                     error_msg += "\n\nYahoo Finance may be slow or temporarily unavailable.\nPlease try again in a moment."
-                elif "No data" in error_msg:
-                    error_msg += "\n\nThe market may be closed or data unavailable.\nPlease try again later."
-                
-                messagebox.showerror("Fetch Error", error_msg)
-            self.root.after(0, show_error)
-    
-    def calculate_rsi(self, closes, period=14):
-        """Calculate Relative Strength Index using Wilder's smoothed EMA"""
-        if len(closes) < period + 1:
-            return None
-        
-        # Calculate daily changes
-        changes = []
-        for i in range(1, len(closes)):
-            changes.append(closes[i] - closes[i-1])
-        
-        if len(changes) < period:
-            return None
-        
-        # Separate gains and losses
-        gains = [max(c, 0) for c in changes]
-        losses = [max(-c, 0) for c in changes]
-        
-        # Initialize with SMA for first 'period' values (seed the EMA)
-        avg_gain = sum(gains[:period]) / period
-        avg_loss = sum(losses[:period]) / period
-        
-        # Apply Wilder's smoothing (EMA) for remaining values
-        for i in range(period, len(gains)):
-            avg_gain = (avg_gain * (period - 1) + gains[i]) / period
-            avg_loss = (avg_loss * (period - 1) + losses[i]) / period
-        
-        if avg_loss == 0:
-            return 100  # No losses = RSI of 100
-        
-        rs = avg_gain / avg_loss
-        rsi = 100 - (100 / (1 + rs))
-        
-        return rsi
-    
-    def calculate_atr(self, highs, lows, closes, period=14):
-        """Calculate Average True Range using Wilder's smoothed EMA"""
-        if len(closes) < period + 1:
-            return None
-        
-        true_ranges = []
-        for i in range(1, len(closes)):
-            high_low = highs[i] - lows[i]
-            high_close = abs(highs[i] - closes[i-1])
-            low_close = abs(lows[i] - closes[i-1])
-            tr = max(high_low, high_close, low_close)
-            true_ranges.append(tr)
-        
-        if len(true_ranges) < period:
-            return None
-        
-        # Initialize with SMA for first 'period' values (seed the EMA)
-        atr = sum(true_ranges[:period]) / period
-        
-        # Apply Wilder's smoothing (EMA) for remaining values
-        for i in range(period, len(true_ranges)):
-            atr = (atr * (period - 1) + true_ranges[i]) / period
-        
-        return atr
-    
-    def calculate_momentum(self, closes, period=7):
-        """Calculate momentum using log returns, displayed as percentage"""
-        if len(closes) < period + 1:
-            return None
-        
-        current = closes[-1]
-        past = closes[-period-1]
-        
-        if past <= 0 or current <= 0:
-            return None
-        
-        # Use log return for internal calculation
-        log_return = math.log(current / past)
-        
-        # Convert to percentage for display: (e^log_return - 1) * 100
-        momentum_pct = (math.exp(log_return) - 1) * 100
-        return momentum_pct
-    
-    def _detect_crash_triggers(self, primary_metal):
-        """
-        Crash Detection System with 5 triggers. Returns (trigger_count, trigger_details).
-        Triggers:
-          1. VIX > 25
-          2. Gold/Silver Ratio (GSR) > 85
-          3. ATR% > 5%
-          4. 3+ consecutive days with >2% daily moves
-          5. DXY +1% AND metal -2% (5-day divergence)
-        """
-        triggers = []
-        trigger_count = 0
-
-        # Get primary data
-        primary = self.prediction_data.get(primary_metal, {})
-        primary_closes = primary.get('closes', [])
-
-        # Trigger 1: VIX > 25
-        vix_data = self.prediction_data.get('VIX')
-        if vix_data and vix_data.get('closes'):
-            vix_cur = vix_data['closes'][-1]
-            if vix_cur > CRASH_VIX_THRESHOLD:
-                trigger_count += 1
-                triggers.append(f"VIX={vix_cur:.1f} > {CRASH_VIX_THRESHOLD}")
-            else:
-                triggers.append(f"VIX={vix_cur:.1f} OK")
-        else:
-            triggers.append("VIX: no data")
-
-        # Trigger 2: GSR > 85
-        gold_closes = None
-        silver_closes = None
-        # Try to get gold/silver data from various sources
-        if 'Gold' in self.prediction_data:
-            gold_closes = self.prediction_data['Gold'].get('closes', [])
-        elif 'Gold_GSR' in self.prediction_data and self.prediction_data['Gold_GSR']:
-            gold_closes = self.prediction_data['Gold_GSR'].get('closes', [])
-        if 'Silver' in self.prediction_data:
-            silver_closes = self.prediction_data['Silver'].get('closes', [])
-        elif 'Silver_GSR' in self.prediction_data and self.prediction_data['Silver_GSR']:
-            silver_closes = self.prediction_data['Silver_GSR'].get('closes', [])
-
-        if gold_closes and silver_closes and silver_closes[-1] > 0:
-            gsr = gold_closes[-1] / silver_closes[-1]
-            if gsr > CRASH_GSR_THRESHOLD:
-                trigger_count += 1
-                triggers.append(f"GSR={gsr:.1f} > {CRASH_GSR_THRESHOLD}")
-            else:
-                triggers.append(f"GSR={gsr:.1f} OK")
-        else:
-            triggers.append("GSR: no data")
-
-        # Trigger 3: ATR% > 5%
-        primary_highs = primary.get('highs', [])
-        primary_lows = primary.get('lows', [])
-        atr_val = self.calculate_atr(primary_highs, primary_lows, primary_closes)
-        if atr_val and len(primary_closes) > 0 and primary_closes[-1] > 0:
-            atr_pct = (atr_val / primary_closes[-1]) * 100
-            if atr_pct > CRASH_ATR_PCT_THRESHOLD:
-                trigger_count += 1
-                triggers.append(f"ATR%={atr_pct:.1f}% > {CRASH_ATR_PCT_THRESHOLD}%")
-            else:
-                triggers.append(f"ATR%={atr_pct:.1f}% OK")
-        else:
-            triggers.append("ATR%: no data")
-
-        # Trigger 4: 3+ consecutive days with >2% daily moves
-        if len(primary_closes) >= CRASH_CONSECUTIVE_DAYS + 1:
-            consecutive = 0
-            max_consecutive = 0
-            for i in range(-CRASH_CONSECUTIVE_DAYS - 5, 0):
-                if i - 1 >= -len(primary_closes) and primary_closes[i - 1] > 0:
-                    daily_move = abs(primary_closes[i] / primary_closes[i - 1] - 1)
-                    if daily_move > CRASH_CONSECUTIVE_MOVE:
-                        consecutive += 1
-                        max_consecutive = max(max_consecutive, consecutive)
-                    else:
-                        consecutive = 0
-            if max_consecutive >= CRASH_CONSECUTIVE_DAYS:
-                trigger_count += 1
-                triggers.append(f"Consecutive={max_consecutive}d > {CRASH_CONSECUTIVE_DAYS}d")
-            else:
-                triggers.append(f"Consecutive={max_consecutive}d OK")
-        else:
-            triggers.append("Consecutive: no data")
-
-        # Trigger 5: DXY +1% AND metal -2% (5-day divergence)
-        dxy_data = self.prediction_data.get('DXY')
-        if dxy_data and dxy_data.get('closes') and len(dxy_data['closes']) >= 6 and len(primary_closes) >= 6:
-            dxy_closes = dxy_data['closes']
-            dxy_5d_change = (dxy_closes[-1] / dxy_closes[-6]) - 1
-            metal_5d_change = (primary_closes[-1] / primary_closes[-6]) - 1
-            if dxy_5d_change >= CRASH_DXY_RISE and metal_5d_change <= CRASH_METAL_DROP:
-                trigger_count += 1
-                triggers.append(f"DXY={dxy_5d_change*100:+.1f}%/Metal={metal_5d_change*100:+.1f}% DIVERGE")
-            else:
-                triggers.append(f"DXY={dxy_5d_change*100:+.1f}%/Metal={metal_5d_change*100:+.1f}% OK")
-        else:
-            triggers.append("DXY/Metal divergence: no data")
-
-        return trigger_count, triggers
-
-    def _get_regime(self, primary_metal):
-        """
-        Classify market regime with 5 regimes.
-        CRASH: 3/5 crash triggers active. Mean reversion to 20d MA, 30% reversion towards 50d MA.
-        RECOVERY: 10 day buffer after crash. Mean reversion to 20d MA, 20% reversion towards 20d MA.
-        SIDEWAYS: Primary RSI 45-55, 7d/14d SMA momentum, beta 1.0x.
-        BULL: S&P 500 > 20d MA, 7d/14d SMA momentum, beta 1.0x.
-        BEAR: S&P 500 < 20d MA, 7d/14d SMA momentum, beta 0.7x.
-        Returns (regime_str, sp500_cur, sp500_ma, extra_info) where extra_info is a dict.
-        """
-        sp_data = self.prediction_data.get('SP500_REGIME') if self.prediction_data else None
-        if not sp_data or not sp_data.get('closes'):
-            return None, None, None, {}
-        closes = sp_data['closes']
-        if len(closes) < REGIME_MA_DAYS:
-            return None, None, None, {}
-        sp500_cur = closes[-1]
-        sp500_ma = sum(closes[-REGIME_MA_DAYS:]) / REGIME_MA_DAYS
-
-        extra_info = {}
-
-        # Check for CRASH first (highest priority)
-        crash_triggers, crash_details = self._detect_crash_triggers(primary_metal)
-        extra_info['crash_triggers'] = crash_triggers
-        extra_info['crash_details'] = crash_details
-
-        if crash_triggers >= CRASH_TRIGGERS_NEEDED:
-            return 'CRASH', sp500_cur, sp500_ma, extra_info
-
-        # Check for RECOVERY (if we were recently in crash)
-        # Use a simple heuristic: if crash triggers were recently high but now below threshold,
-        # and VIX is still elevated (> 20), treat as recovery
-        if not hasattr(self, '_last_crash_timestamp'):
-            self._last_crash_timestamp = None
-        if not hasattr(self, '_recovery_start'):
-            self._recovery_start = None
-
-        # Track crash state for recovery buffer
-        if crash_triggers >= CRASH_TRIGGERS_NEEDED:
-            self._last_crash_timestamp = datetime.now()
-
-        if self._last_crash_timestamp:
-            days_since_crash = (datetime.now() - self._last_crash_timestamp).days
-            if days_since_crash <= RECOVERY_BUFFER_DAYS:
-                if crash_triggers < CRASH_TRIGGERS_NEEDED:
-                    extra_info['recovery_days_remaining'] = RECOVERY_BUFFER_DAYS - days_since_crash
-                    return 'RECOVERY', sp500_cur, sp500_ma, extra_info
-
-        # Check primary RSI for SIDEWAYS
-        primary = self.prediction_data.get(primary_metal, {})
-        primary_closes = primary.get('closes', [])
-        rsi = self.calculate_rsi(primary_closes) if len(primary_closes) >= 15 else None
-
-        if rsi is not None and 45 <= rsi <= 55:
-            return 'SIDEWAYS', sp500_cur, sp500_ma, extra_info
-
-        # BULL vs BEAR based on S&P 500 vs 20d MA
-        if sp500_cur > sp500_ma:
-            return 'BULL', sp500_cur, sp500_ma, extra_info
-        return 'BEAR', sp500_cur, sp500_ma, extra_info
-
-    def _correlation_over_period(self, primary_closes, secondary_closes, period):
-        """Return Pearson correlation of log returns over the given period (for fast/slow correlation)."""
-        n = min(len(primary_closes), len(secondary_closes), period)
-        if n < 5:
-            return 0.0
-        primary_returns = []
-        secondary_returns = []
-        for i in range(-n + 1, 0):
-            if primary_closes[i-1] > 0 and secondary_closes[i-1] > 0 and primary_closes[i] > 0 and secondary_closes[i] > 0:
-                primary_returns.append(math.log(primary_closes[i] / primary_closes[i-1]))
-                secondary_returns.append(math.log(secondary_closes[i] / secondary_closes[i-1]))
-        if len(primary_returns) < 5:
-            return 0.0
-        p_mean = sum(primary_returns) / len(primary_returns)
-        s_mean = sum(secondary_returns) / len(secondary_returns)
-        cov = sum((p - p_mean) * (s - s_mean) for p, s in zip(primary_returns, secondary_returns)) / len(primary_returns)
-        var_p = sum((p - p_mean) ** 2 for p in primary_returns) / len(primary_returns)
-        var_s = sum((s - s_mean) ** 2 for s in secondary_returns) / len(secondary_returns)
-        if var_p <= 0 or var_s <= 0:
-            return 0.0
-        return cov / (math.sqrt(var_p) * math.sqrt(var_s))
-
-    def calculate_beta(self, primary_closes, secondary_closes, period=60):
-        """
-        Calculate dynamic beta between two assets based on their log returns.
-        
-        Beta = Covariance(primary, secondary) / Variance(secondary)
-        
-        Uses log returns for better statistical properties.
-        """
-        # Use the most recent 'period' days, or all available data
-        n = min(len(primary_closes), len(secondary_closes), period)
-        
-        if n < 14:  # Need at least 14 days for meaningful calculation
-            return 1.0, 0.0  # Default fallback
-        
-        # Calculate daily LOG returns for both assets
-        primary_returns = []
-        secondary_returns = []
-        
-        for i in range(-n + 1, 0):
-            if primary_closes[i-1] > 0 and secondary_closes[i-1] > 0 and \
-               primary_closes[i] > 0 and secondary_closes[i] > 0:
-                p_return = math.log(primary_closes[i] / primary_closes[i-1])
-                s_return = math.log(secondary_closes[i] / secondary_closes[i-1])
-                primary_returns.append(p_return)
-                secondary_returns.append(s_return)
-        
-        if len(primary_returns) < 10:
-            return 1.0, 0.0
-        
-        # Calculate means
-        p_mean = sum(primary_returns) / len(primary_returns)
-        s_mean = sum(secondary_returns) / len(secondary_returns)
-        
-        # Calculate covariance and variance
-        covariance = 0
-        s_variance = 0
-        p_variance = 0
-        
-        for i in range(len(primary_returns)):
-            p_diff = primary_returns[i] - p_mean
-            s_diff = secondary_returns[i] - s_mean
-            covariance += p_diff * s_diff
-            s_variance += s_diff * s_diff
-            p_variance += p_diff * p_diff
-        
-        covariance /= len(primary_returns)
-        s_variance /= len(secondary_returns)
-        p_variance /= len(primary_returns)
-        
-        # Calculate beta
-        if s_variance == 0:
-            beta = 1.0
-        else:
-            beta = covariance / s_variance
-        
-        # Calculate correlation (for confidence)
-        if p_variance > 0 and s_variance > 0:
-            correlation = covariance / (math.sqrt(p_variance) * math.sqrt(s_variance))
-        else:
-            correlation = 0
-        
-        # Clamp beta to reasonable range (0.1 to 5.0)
-        beta = max(0.1, min(5.0, beta))
-        
-        return beta, correlation
-    
-    def _calculate_macd_histogram(self, closes):
-        """Calculate MACD histogram (MACD line - Signal line) using 12/26/9 EMA."""
-        if len(closes) < 35:
-            return None
-        # EMA helper
-        def ema(data, period):
-            multiplier = 2 / (period + 1)
-            result = [sum(data[:period]) / period]
-            for i in range(period, len(data)):
-                result.append((data[i] - result[-1]) * multiplier + result[-1])
-            return result
-
-        ema12 = ema(closes, 12)
-        ema26 = ema(closes, 26)
-        # Align lengths (ema26 starts later)
-        offset = 26 - 12
-        macd_line = [ema12[i + offset] - ema26[i] for i in range(len(ema26))]
-        if len(macd_line) < 9:
-            return None
-        signal_line = ema(macd_line, 9)
-        # Histogram is last value of macd_line - last value of signal_line
-        histogram = macd_line[-1] - signal_line[-1]
-        return histogram
-
-    def calculate_prediction(self, primary_metal, secondary_name):
-        """Calculate predicted price using v4 regime-aware logic with 5 regimes."""
-        if primary_metal not in self.prediction_data or secondary_name not in self.prediction_data:
-            return None
-
-        primary = self.prediction_data[primary_metal]
-        secondary = self.prediction_data[secondary_name]
-
-        primary_closes = primary['closes']
-        secondary_closes = secondary['closes']
-
-        if len(primary_closes) < 30 or len(secondary_closes) < 30:
-            return None
-
-        # Current prices
-        primary_cur = primary_closes[-1]
-        secondary_cur = secondary_closes[-1]
-
-        # Regime detection (5 regimes: CRASH, RECOVERY, SIDEWAYS, BULL, BEAR)
-        regime, sp500_cur, sp500_ma, regime_extra = self._get_regime(primary_metal)
-
-        # Dual correlation: fast (10d) vs slow (60d) for regime-change detection
-        corr_slow = self._correlation_over_period(primary_closes, secondary_closes, 60)
-        corr_fast = self._correlation_over_period(primary_closes, secondary_closes, CORRELATION_FAST_DAYS)
-        regime_change = abs(corr_fast - corr_slow) > CORRELATION_REGIME_DIVERGENCE
-
-        # ATR and volatility
-        atr_val = None
-        volatility_pct = None
-        if primary_cur > 0:
-            atr_val = self.calculate_atr(primary.get('highs', []), primary.get('lows', []), primary_closes)
-            volatility_pct = (atr_val / primary_cur) * 100 if atr_val else 0
-
-        # === MOMENTUM CALCULATION (regime-dependent) ===
-        if regime == 'CRASH':
-            # Mean reversion to 20d MA momentum calculation
-            if len(primary_closes) >= REGIME_MA_DAYS:
-                ma_20d = sum(primary_closes[-REGIME_MA_DAYS:]) / REGIME_MA_DAYS
-                # Reversion: 30% towards 50d MA
-                if len(primary_closes) >= CRASH_REVERSION_MA:
-                    ma_50d = sum(primary_closes[-CRASH_REVERSION_MA:]) / CRASH_REVERSION_MA
-                    reversion_target = primary_cur + CRASH_REVERSION_FACTOR * (ma_50d - primary_cur)
-                    secondary_momentum = (reversion_target / primary_cur) - 1
-                else:
-                    secondary_momentum = (ma_20d / primary_cur) - 1
-            else:
-                secondary_momentum = 0
-        elif regime == 'RECOVERY':
-            # Mean reversion to 20d MA momentum calculation
-            if len(primary_closes) >= RECOVERY_REVERSION_MA:
-                ma_20d = sum(primary_closes[-RECOVERY_REVERSION_MA:]) / RECOVERY_REVERSION_MA
-                reversion_target = primary_cur + RECOVERY_REVERSION_FACTOR * (ma_20d - primary_cur)
-                secondary_momentum = (reversion_target / primary_cur) - 1
-            else:
-                secondary_momentum = 0
-        else:
-            # SIDEWAYS, BULL, BEAR: 7d/14d SMA momentum calculation
-            secondary_7davg = sum(secondary_closes[-7:]) / 7
-            secondary_14davg = sum(secondary_closes[-14:]) / 14
-            if secondary_14davg <= 0 or secondary_7davg <= 0:
-                return None
-            secondary_momentum_log = math.log(secondary_7davg / secondary_14davg)
-            secondary_momentum = math.exp(secondary_momentum_log) - 1
-
-        # === DYNAMIC BETA with regime adjustment ===
-        beta, correlation = self.calculate_beta(primary_closes, secondary_closes)
-        beta_for_move = beta
-
-        if regime == 'CRASH' or regime == 'RECOVERY':
-            # Crash/Recovery use mean reversion, beta not applied to momentum
-            beta_for_move = 1.0
-        elif regime == 'SIDEWAYS':
-            beta_for_move = beta * 1.0  # full beta
-        elif regime == 'BULL':
-            beta_for_move = beta * 1.0  # full beta
-        elif regime == 'BEAR':
-            beta_for_move = beta * BEAR_BETA_SHRINK  # 0.7x
-
-        # Apply regime change shrink on top
-        if regime_change and regime not in ('CRASH', 'RECOVERY'):
-            beta_for_move = beta_for_move * REGIME_BETA_SHRINK
-
-        # Expected move
-        primary_expected_move = secondary_momentum * beta_for_move
-
-        # === DYNAMIC CLAMP (regime-dependent) ===
-        if regime == 'CRASH':
-            # Dynamic σ-based clamp (3σ max)
-            if atr_val and primary_cur > 0:
-                # Use daily returns std dev * sqrt(7) for weekly σ
-                if len(primary_closes) >= 21:
-                    daily_returns = []
-                    for i in range(-20, 0):
-                        if primary_closes[i - 1] > 0:
-                            daily_returns.append(primary_closes[i] / primary_closes[i - 1] - 1)
-                    if daily_returns:
-                        mean_ret = sum(daily_returns) / len(daily_returns)
-                        variance = sum((r - mean_ret) ** 2 for r in daily_returns) / len(daily_returns)
-                        daily_sigma = math.sqrt(variance)
-                        weekly_sigma = daily_sigma * SQRT_7
-                        clamp = min(weekly_sigma * CLAMP_CRASH_SIGMA, 0.50)  # cap at 50% max
-                    else:
-                        clamp = CLAMP_CRISIS
-                else:
-                    clamp = CLAMP_CRISIS
-            else:
-                clamp = CLAMP_CRISIS
-        elif regime == 'RECOVERY':
-            clamp = CLAMP_RECOVERY
-        elif regime_change:
-            clamp = CLAMP_CRISIS
-        elif volatility_pct is not None and volatility_pct >= VOLATILITY_CRISIS_PCT:
-            clamp = CLAMP_CRISIS
-        elif volatility_pct is not None and volatility_pct >= VOLATILITY_ELEVATED_PCT:
-            clamp = CLAMP_ELEVATED
-        else:
-            clamp = CLAMP_NORMAL
-
-        primary_expected_move = max(-clamp, min(clamp, primary_expected_move))
-
-        # === RATIO AND MEAN REVERSION PRESSURE ===
-        current_ratio = secondary_cur / primary_cur if primary_cur > 0 else 0
-        if len(primary_closes) >= 28 and len(secondary_closes) >= 28:
-            ratio_history = []
-            for i in range(-28, 0):
-                if primary_closes[i] > 0:
-                    ratio_history.append(secondary_closes[i] / primary_closes[i])
-            avg_ratio = sum(ratio_history) / len(ratio_history) if ratio_history else current_ratio
-        else:
-            avg_ratio = current_ratio
-
-        ratio_deviation = (current_ratio - avg_ratio) / avg_ratio if avg_ratio > 0 else 0
-
-        # Base multiplier: |ρ| × 0.15
-        if correlation < 0:
-            pressure_multiplier = 0  # Negative correlation pressure = 0
-        else:
-            pressure_multiplier = abs(correlation) * RATIO_BASE_MULTIPLIER_FACTOR
-
-        # SIDEWAYS: 2.0x boost
-        if regime == 'SIDEWAYS':
-            pressure_multiplier *= RATIO_SIDEWAYS_BOOST
-
-        ratio_pressure = ratio_deviation * pressure_multiplier
-
-        # Bear disable condition: primary 14d momentum < 0
-        primary_14d_momentum = None
-        if len(primary_closes) >= 15 and primary_closes[-15] > 0:
-            primary_14d_momentum = (primary_closes[-1] / primary_closes[-15]) - 1
-        if regime == 'BEAR' and primary_14d_momentum is not None and primary_14d_momentum < 0:
-            ratio_pressure = 0.0
-
-        # Bull disable condition: MACD histogram < 0
-        if regime == 'BULL':
-            macd_hist = self._calculate_macd_histogram(secondary_closes)
-            if macd_hist is not None and macd_hist < 0:
-                ratio_pressure = 0.0
-
-        # No ratio pressure in crash/recovery (mean reversion handles it)
-        if regime in ('CRASH', 'RECOVERY'):
-            ratio_pressure = 0.0
-
-        # === FINAL PREDICTION ===
-        predicted_price = primary_cur * (1 + primary_expected_move + ratio_pressure)
-
-        return {
-            'predicted_price': predicted_price,
-            'current_price': primary_cur,
-            'secondary_momentum': secondary_momentum * 100,
-            'primary_expected_move': primary_expected_move * 100,
-            'current_ratio': current_ratio,
-            'avg_ratio': avg_ratio,
-            'ratio_deviation': ratio_deviation * 100,
-            'ratio_pressure': ratio_pressure * 100,
-            'pressure_multiplier': pressure_multiplier,
-            'beta': beta,
-            'correlation': correlation,
-            'regime': regime,
-            'regime_change': regime_change,
-            'regime_extra': regime_extra,
-            'clamp_used': clamp,
-            'correlation_fast': corr_fast,
-            'correlation_slow': corr_slow,
-            'volatility_pct': volatility_pct,
-        }
-    
-    def calculate_confidence(self, primary_metal, secondary_name, prediction_result):
-        """Calculate confidence percentage based on 8 weighted factors (v4)."""
-        if not prediction_result:
-            return 0, []
-
-        primary = self.prediction_data.get(primary_metal, {})
-        secondary = self.prediction_data.get(secondary_name, {})
-        dxy_data = self.prediction_data.get('DXY', None)
-
-        signals = []
-        confidence_points = 0
-
-        # v4 weights: Correlation 40%, DXY 7%(4% copper), Regime Fit 10%, RSI 10%,
-        #             Volatility 5%, Ratio 10%, RSI Divergence 8%, Correlation Agreement 10%
-        is_copper = (primary_metal == 'Copper')
-        W_CORRELATION = CONF_W_CORRELATION          # 40
-        W_DXY = CONF_W_DXY_COPPER if is_copper else CONF_W_DXY  # 4 or 7
-        W_REGIME_FIT = CONF_W_REGIME_FIT            # 10
-        W_RSI = CONF_W_RSI                          # 10
-        W_VOLATILITY = CONF_W_VOLATILITY            # 5
-        W_RATIO = CONF_W_RATIO                      # 10
-        W_RSI_DIVERGENCE = CONF_W_RSI_DIVERGENCE    # 8
-        W_CORR_AGREEMENT = CONF_W_CORR_AGREEMENT    # 10
-        max_points = W_CORRELATION + W_DXY + W_REGIME_FIT + W_RSI + W_VOLATILITY + W_RATIO + W_RSI_DIVERGENCE + W_CORR_AGREEMENT
-
-        primary_closes = primary.get('closes', [])
-        secondary_closes = secondary.get('closes', [])
-        regime = prediction_result.get('regime')
-        regime_change = prediction_result.get('regime_change', False)
-        ratio_deviation_abs = abs(prediction_result.get('ratio_deviation', 0)) / 100
-
-        # =====================
-        # FACTOR 1: Correlation (60d) - 40%
-        # =====================
-        correlation = prediction_result.get('correlation', 0)
-        abs_corr = abs(correlation)
-        if abs_corr >= 0.7:
-            confidence_points += W_CORRELATION
-            signals.append(("Correlation", f"✓ Strong ({correlation:.2f}) - reliable beta (+{W_CORRELATION}pts)", True))
-        elif abs_corr >= 0.5:
-            scaled_pts = int(W_CORRELATION * (abs_corr - 0.3) / 0.4)
-            confidence_points += scaled_pts
-            signals.append(("Correlation", f"△ Moderate ({correlation:.2f}) (+{scaled_pts}pts)", False))
-        elif abs_corr >= 0.3:
-            quarter_pts = W_CORRELATION // 4
-            confidence_points += quarter_pts
-            signals.append(("Correlation", f"✗ Weak ({correlation:.2f}) (+{quarter_pts}pts)", False))
-        else:
-            signals.append(("Correlation", f"✗ Very weak ({correlation:.2f}) - beta unreliable (+0pts)", False))
-
-        # =====================
-        # FACTOR 2: DXY Health - 7% (4% copper)
-        # =====================
-        if dxy_data is not None and 'closes' in dxy_data:
-            dxy_closes = dxy_data['closes']
-            if len(primary_closes) >= 14 and len(dxy_closes) >= 14:
-                dxy_corr = self._calculate_simple_correlation(
-                    primary_closes[-14:], dxy_closes[-min(14, len(dxy_closes)):]
-                )
-                if dxy_corr <= -0.5:
-                    confidence_points += W_DXY
-                    signals.append(("DXY Health", f"✓ Healthy inverse ({dxy_corr:.2f}) (+{W_DXY}pts)", True))
-                elif dxy_corr < 0:
-                    scaled_pts = int(W_DXY * abs(dxy_corr) / 0.5)
-                    confidence_points += scaled_pts
-                    signals.append(("DXY Health", f"△ Mild inverse ({dxy_corr:.2f}) (+{scaled_pts}pts)", False))
-                else:
-                    signals.append(("DXY Health", f"✗ Moving with USD ({dxy_corr:.2f}) (+0pts)", False))
-            else:
-                signals.append(("DXY Health", "? Insufficient DXY data", False))
-        else:
-            signals.append(("DXY Health", "? DXY data unavailable", False))
-
-        # =====================
-        # FACTOR 3: Regime Fit - 10%
-        # =====================
-        regime_fit = False
-        if regime == 'BULL' and secondary_name == 'Gold':
-            regime_fit = True
-            regime_desc = "Bull + Gold anchor"
-        elif regime == 'BEAR' and secondary_name == 'S&P 500':
-            regime_fit = True
-            regime_desc = "Bear + S&P 500 anchor"
-        elif regime == 'SIDEWAYS' and ratio_deviation_abs < 0.10:
-            regime_fit = True
-            regime_desc = "Sideways + stable ratio"
-        elif regime == 'CRASH':
-            regime_fit = True  # crash regime is always a "fit" since it overrides
-            regime_desc = "Crash - mean reversion active"
-        elif regime == 'RECOVERY':
-            regime_fit = True
-            regime_desc = "Recovery - buffer active"
-        else:
-            regime_desc = f"Regime {regime or '?'} / {secondary_name}"
-        if regime_fit:
-            confidence_points += W_REGIME_FIT
-            signals.append(("Regime Fit", f"✓ {regime_desc} (+{W_REGIME_FIT}pts)", True))
-        else:
-            signals.append(("Regime Fit", f"△ {regime_desc} (+0pts)", False))
-
-        # =====================
-        # FACTOR 4: RSI Range - 10%
-        # =====================
-        rsi = self.calculate_rsi(primary_closes)
-        if rsi is not None:
-            if 30 <= rsi <= 70:
-                confidence_points += W_RSI
-                signals.append(("RSI Range", f"✓ RSI ({rsi:.1f}) neutral (+{W_RSI}pts)", True))
-            elif 20 <= rsi < 30 or 70 < rsi <= 80:
-                half_pts = W_RSI // 2
-                confidence_points += half_pts
-                signals.append(("RSI Range", f"△ RSI ({rsi:.1f}) near extreme (+{half_pts}pts)", False))
-            else:
-                signals.append(("RSI Range", f"✗ RSI ({rsi:.1f}) extreme (+0pts)", False))
-
-        # =====================
-        # FACTOR 5: Volatility - 5%
-        # =====================
-        atr = self.calculate_atr(primary.get('highs', []), primary.get('lows', []), primary_closes)
-        if atr is not None and len(primary_closes) > 0:
-            current_price = primary_closes[-1]
-            volatility_pct = (atr / current_price) * 100 if current_price > 0 else 0
-            if volatility_pct < 2:
-                confidence_points += W_VOLATILITY
-                signals.append(("Volatility", f"✓ Low ({volatility_pct:.1f}%) (+{W_VOLATILITY}pts)", True))
-            elif volatility_pct < 4:
-                half_pts = W_VOLATILITY // 2
-                confidence_points += half_pts
-                signals.append(("Volatility", f"△ Moderate ({volatility_pct:.1f}%) (+{half_pts}pts)", False))
-            else:
-                signals.append(("Volatility", f"✗ High ({volatility_pct:.1f}%) (+0pts)", False))
-
-        # =====================
-        # FACTOR 6: Ratio Stability - 10%
-        # =====================
-        if ratio_deviation_abs < 0.05:
-            confidence_points += W_RATIO
-            signals.append(("Ratio Stability", f"✓ Near average ({ratio_deviation_abs*100:.1f}% dev) (+{W_RATIO}pts)", True))
-        elif ratio_deviation_abs < 0.15:
-            half_pts = W_RATIO // 2
-            confidence_points += half_pts
-            signals.append(("Ratio Stability", f"△ Extended ({ratio_deviation_abs*100:.1f}% dev) (+{half_pts}pts)", False))
-        else:
-            signals.append(("Ratio Stability", f"✗ Far from avg ({ratio_deviation_abs*100:.1f}% dev) (+0pts)", False))
-
-        # =====================
-        # FACTOR 7: RSI Divergence - 8%
-        # Price making new highs/lows but RSI isn't confirming
-        # =====================
-        rsi_divergence_pts = 0
-        if rsi is not None and len(primary_closes) >= 14:
-            # Check if price trend matches RSI trend (last 14 days)
-            price_trend = (primary_closes[-1] / primary_closes[-14]) - 1
-
-            # Calculate RSI from 14 days ago for comparison
-            if len(primary_closes) >= 28:
-                rsi_old = self.calculate_rsi(primary_closes[:-14])
-                if rsi_old is not None:
-                    rsi_trend = rsi - rsi_old
-                    # Divergence: price up but RSI down, or price down but RSI up
-                    if (price_trend > 0.02 and rsi_trend < -5) or (price_trend < -0.02 and rsi_trend > 5):
-                        # Divergence detected - this is informative but lowers confidence
-                        signals.append(("RSI Divergence", f"✗ Divergence detected (price {price_trend*100:+.1f}%, RSI {rsi_trend:+.1f}) (+0pts)", False))
-                    else:
-                        # No divergence - price and RSI agree
-                        rsi_divergence_pts = W_RSI_DIVERGENCE
-                        confidence_points += rsi_divergence_pts
-                        signals.append(("RSI Divergence", f"✓ Price/RSI aligned (+{W_RSI_DIVERGENCE}pts)", True))
-                else:
-                    signals.append(("RSI Divergence", "? Insufficient RSI history", False))
-            else:
-                signals.append(("RSI Divergence", "? Insufficient data for RSI divergence", False))
-        else:
-            signals.append(("RSI Divergence", "? RSI unavailable", False))
-
-        # =====================
-        # FACTOR 8: Correlation Agreement - 10%
-        # Fast (10d) and slow (60d) correlations should agree in sign and magnitude
-        # =====================
-        corr_fast = prediction_result.get('correlation_fast', 0)
-        corr_slow = prediction_result.get('correlation_slow', 0)
-        corr_diff = abs(corr_fast - corr_slow)
-        if corr_diff < 0.15 and (corr_fast * corr_slow > 0):
-            # Strong agreement: same sign and close magnitude
-            confidence_points += W_CORR_AGREEMENT
-            signals.append(("Corr Agreement", f"✓ Fast/slow aligned ({corr_fast:.2f}/{corr_slow:.2f}, diff={corr_diff:.2f}) (+{W_CORR_AGREEMENT}pts)", True))
-        elif corr_diff < 0.30 and (corr_fast * corr_slow > 0):
-            # Moderate agreement
-            half_pts = W_CORR_AGREEMENT // 2
-            confidence_points += half_pts
-            signals.append(("Corr Agreement", f"△ Partial alignment ({corr_fast:.2f}/{corr_slow:.2f}, diff={corr_diff:.2f}) (+{half_pts}pts)", False))
-        else:
-            signals.append(("Corr Agreement", f"✗ Fast/slow diverging ({corr_fast:.2f}/{corr_slow:.2f}, diff={corr_diff:.2f}) (+0pts)", False))
-
-        confidence_pct = (confidence_points / max_points) * 100 if max_points > 0 else 0
-        # Cap confidence when regime change detected
-        if regime_change:
-            confidence_pct = min(confidence_pct, CONFIDENCE_CAP_REGIME_CHANGE)
-            signals.append(("Regime Change", f"⚠ Confidence capped at {CONFIDENCE_CAP_REGIME_CHANGE}% (fast/slow correlation divergence)", False))
-
-        return confidence_pct, signals
-    
-    def _calculate_simple_correlation(self, series1, series2):
-        """Calculate Pearson correlation between two price series"""
-        n = min(len(series1), len(series2))
-        if n < 5:
-            return 0
-        
-        s1 = series1[-n:]
-        s2 = series2[-n:]
-        
-        mean1 = sum(s1) / n
-        mean2 = sum(s2) / n
-        
-        cov = sum((s1[i] - mean1) * (s2[i] - mean2) for i in range(n)) / n
-        var1 = sum((x - mean1) ** 2 for x in s1) / n
-        var2 = sum((x - mean2) ** 2 for x in s2) / n
-        
-        if var1 <= 0 or var2 <= 0:
-            return 0
-        
-        return cov / (math.sqrt(var1) * math.sqrt(var2))
+                elif "No data" in error_msg:
+                    error_msg += "\n\nThe market may be closed or data unavailable.\nPlease try again later."
+                
+                messagebox.showerror("Fetch Error", error_msg)
+            self.root.after(0, show_error)
     
     def _set_breakdown_text(self, text):
         """Set the breakdown text widget content"""
@@ -2522,67 +1411,50 @@ class MetalCalculatorApp:
             self.pred_breakdown_text.config(state='disabled')
     
     def calculate_and_display_prediction(self):
-        """Calculate all indicators and update the prediction display"""
+        """Calculate all indicators (AppCore.analyze_prediction) and update the prediction display"""
         try:
             primary_metal = self.pred_primary_var.get()
             secondary_metal = self.pred_secondary_var.get()
             
-            primary = self.prediction_data.get(primary_metal, {})
-            secondary = self.prediction_data.get(secondary_metal, {})
-            
-            primary_closes = primary.get('closes', [])
-            secondary_closes = secondary.get('closes', [])
-            primary_highs = primary.get('highs', [])
-            primary_lows = primary.get('lows', [])
+            analysis = self.core.analyze_prediction(self.prediction_data, primary_metal, secondary_metal)
             
-            if not primary_closes or not secondary_closes:
+            if analysis is None:
                 self.pred_status_var.set("No data available")
                 self.pred_fetch_btn.config(state='normal')
                 return
             
             # Current prices
-            primary_cur = primary_closes[-1]
-            secondary_cur = secondary_closes[-1]
+            primary_cur = analysis['current_price']
             
             # Update current price display
             self.pred_current_var.set(f"${primary_cur:.4f}/g")
             
-            # Calculate Metal Ratio
+            # Metal Ratio
             if primary_cur > 0:
-                current_ratio = secondary_cur / primary_cur
+                current_ratio = analysis['current_ratio']
                 self.pred_ratio_var.set(f"{current_ratio:.2f} ({secondary_metal}/{primary_metal})")
                 
                 # Ratio trend (7d avg vs 28d avg)
-                if len(primary_closes) >= 28 and len(secondary_closes) >= 28:
-                    ratio_7d = sum([secondary_closes[i] / primary_closes[i] for i in range(-7, 0) if primary_closes[i] > 0]) / 7
-                    ratio_28d = sum([secondary_closes[i] / primary_closes[i] for i in range(-28, 0) if primary_closes[i] > 0]) / 28
-                    
-                    ratio_change = ((ratio_7d - ratio_28d) / ratio_28d) * 100 if ratio_28d > 0 else 0
+                ratio_change = analysis['ratio_trend_pct']
+                if ratio_change is not None:
                     trend_dir = "↑" if ratio_change > 0 else "↓"
                     self.pred_ratio_trend_var.set(f"{trend_dir} {abs(ratio_change):.1f}% (7d vs 28d)")
                 else:
                     self.pred_ratio_trend_var.set("Insufficient data")
             
-            # Calculate RSI
-            rsi = self.calculate_rsi(primary_closes)
+            # RSI
+            rsi = analysis['rsi']
             if rsi is not None:
                 self.pred_rsi_var.set(f"{rsi:.1f}")
-                
-                if rsi >= 70:
-                    self.pred_rsi_signal_var.set("OVERBOUGHT")
-                    self.pred_rsi_signal_label.config(foreground='#CC0000')
-                elif rsi <= 30:
-                    self.pred_rsi_signal_var.set("OVERSOLD")
-                    self.pred_rsi_signal_label.config(foreground='#008000')
-                else:
-                    self.pred_rsi_signal_var.set("NEUTRAL")
-                    self.pred_rsi_signal_label.config(foreground='#666666')
+                self.pred_rsi_signal_var.set(analysis['rsi_signal'])
+                self.pred_rsi_signal_label.config(foreground={'OVERBOUGHT': '#CC0000', 'OVERSOLD': '#008000'}.get(
+                    analysis['rsi_signal'], '#666666'))
             else:
                 self.pred_rsi_var.set("N/A")
                 self.pred_rsi_signal_var.set("--")
             
-            # Calculate ATR
-            atr = self.calculate_atr(primary_highs, primary_lows, primary_closes)
+            # ATR
+            atr = analysis['atr']
             if atr is not None:
                 self.pred_atr_var.set(f"${atr:.4f}/g")
                 
@@ -2597,12 +1469,11 @@ class MetalCalculatorApp:
                 self.pred_atr_var.set("N/A")
                 self.pred_volatility_var.set("--")
             
-            # Calculate Momentum
-            momentum_7d = self.calculate_momentum(primary_closes, 7)
-            momentum_14d = self.calculate_momentum(primary_closes, 14)
+            # Momentum
+            momentum_7d = analysis['momentum_7d']
+            momentum_14d = analysis['momentum_14d']
             
             if momentum_7d is not None:
-                color = "green" if momentum_7d > 0 else "red"
                 self.pred_momentum_7d_var.set(f"{momentum_7d:+.2f}%")
             else:
                 self.pred_momentum_7d_var.set("N/A")
@@ -2612,16 +1483,16 @@ class MetalCalculatorApp:
             else:
                 self.pred_momentum_14d_var.set("N/A")
             
-            # Calculate Prediction
-            prediction = self.calculate_prediction(primary_metal, secondary_metal)
+            # Prediction
+            prediction = analysis['prediction']
             
             if prediction:
-                pred_price = prediction['predicted_price']
+                pred_price = analysis['predicted_price']
                 self.pred_price_var.set(f"${pred_price:.4f}")
                 
                 # Predicted change
-                change = pred_price - primary_cur
-                change_pct = (change / primary_cur) * 100 if primary_cur > 0 else 0
+                change = analysis['predicted_change']
+                change_pct = analysis['predicted_change_pct']
                 
                 if change >= 0:
                     self.pred_change_var.set(f"+${change:.4f} (+{change_pct:.2f}%)")
@@ -2631,13 +1502,9 @@ class MetalCalculatorApp:
                     self.pred_change_label.config(foreground='#CC0000')
                 
                 # Price range (using ATR scaled by √7 for weekly projection)
-                low_est = None
-                high_est = None
                 if atr is not None:
-                    low_est = pred_price - (atr * SQRT_7)
-                    high_est = pred_price + (atr * SQRT_7)
-                    self.pred_range_low_var.set(f"${low_est:.4f}/g")
-                    self.pred_range_high_var.set(f"${high_est:.4f}/g")
+                    self.pred_range_low_var.set(f"${analysis['range_low']:.4f}/g")
+                    self.pred_range_high_var.set(f"${analysis['range_high']:.4f}/g")
                 else:
                     self.pred_range_low_var.set("N/A")
                     self.pred_range_high_var.set("N/A")
@@ -2655,8 +1522,8 @@ class MetalCalculatorApp:
                     corr_text = f"{correlation:.2f} (weak)"
                 self.pred_correlation_var.set(corr_text)
                 
-                # Calculate confidence
-                confidence, signals = self.calculate_confidence(primary_metal, secondary_metal, prediction)
+                # Confidence
+                confidence, signals = analysis['confidence'], analysis['signals']
                 self.pred_confidence_var.set(f"{confidence:.0f}%")
                 self.confidence_bar['value'] = confidence
                 
@@ -2722,80 +1589,7 @@ class MetalCalculatorApp:
                 self._set_breakdown_text("\n".join(breakdown_lines))
                 
                 # Store current prediction for saving (includes ALL metrics for algorithm improvement)
-                # Calculate RSI signal
-                if rsi is not None:
-                    if rsi >= 70:
-                        rsi_signal = "OVERBOUGHT"
-                    elif rsi <= 30:
-                        rsi_signal = "OVERSOLD"
-                    else:
-                        rsi_signal = "NEUTRAL"
-                else:
-                    rsi_signal = None
-                
-                # Calculate volatility percentage
-                volatility_pct = (atr / primary_cur) * 100 if atr and primary_cur > 0 else None
-                
-                # Get ratio trend from display (calculate it here for storage)
-                ratio_trend_pct = None
-                if len(primary_closes) >= 28 and len(secondary_closes) >= 28:
-                    ratio_7d = sum([secondary_closes[i] / primary_closes[i] for i in range(-7, 0) if primary_closes[i] > 0]) / 7
-                    ratio_28d = sum([secondary_closes[i] / primary_closes[i] for i in range(-28, 0) if primary_closes[i] > 0]) / 28
-                    ratio_trend_pct = ((ratio_7d - ratio_28d) / ratio_28d) * 100 if ratio_28d > 0 else 0
-                
-                self.current_prediction_result = {
-                    # Basic identification
-                    'primary_metal': primary_metal,
-                    'secondary_metal': secondary_metal,
-                    
-                    # Core price data
-                    'current_price': primary_cur,
-                    'secondary_price': secondary_cur,
-                    'predicted_price': pred_price,
-                    'predicted_change_pct': change_pct,
-                    'confidence': confidence,
-                    'range_low': low_est if atr else None,
-                    'range_high': high_est if atr else None,
-                    
-                    # Beta & Correlation metrics
-                    'beta': prediction.get('beta', 1.0),
-                    'correlation': prediction.get('correlation', 0),
-                    
-                    # RSI metrics
-                    'rsi': rsi,
-                    'rsi_signal': rsi_signal,
-                    
-                    # Volatility metrics
-                    'atr': atr,
-                    'volatility_pct': volatility_pct,
-                    
-                    # Momentum metrics
-                    'momentum_7d': momentum_7d,
-                    'momentum_14d': momentum_14d,
-                    'secondary_momentum': prediction.get('secondary_momentum'),
-                    'primary_expected_move': prediction.get('primary_expected_move'),
-                    
-                    # Ratio metrics
-                    'current_ratio': prediction.get('current_ratio'),
-                    'avg_ratio_28d': prediction.get('avg_ratio'),
-                    'ratio_deviation_pct': prediction.get('ratio_deviation'),
-                    'ratio_trend_pct': ratio_trend_pct,
-                    
-                    # Pressure metrics
-                    'ratio_pressure': prediction.get('ratio_pressure'),
-                    'pressure_multiplier': prediction.get('pressure_multiplier'),
-                    
-                    # v4 regime and clamp
-                    'regime': prediction.get('regime'),
-                    'regime_change': prediction.get('regime_change'),
-                    'regime_extra': prediction.get('regime_extra', {}),
-                    'clamp_used': prediction.get('clamp_used'),
-                    'correlation_fast': prediction.get('correlation_fast'),
-                    'correlation_slow': prediction.get('correlation_slow'),
-                    
-                    # Confidence breakdown (store individual signals)
-                    'confidence_signals': [(s[0], s[1], s[2]) for s in signals]
-                }
+                self.current_prediction_result = analysis['result']
                 
                 # Enable save button
                 self.pred_save_btn.config(state='normal')
@@ -2828,68 +1622,13 @@ class MetalCalculatorApp:
         
         # Create prediction record with unique ID
         # Includes ALL metrics for algorithm improvement and analysis
-        record = {
-            # Identification
-            'id': f"{datetime.now().strftime('%Y%m%d%H%M%S')}_{len(self.prediction_history)}",
-            'timestamp': datetime.now().isoformat(),
-            'target_date': (datetime.now() + timedelta(days=7)).isoformat(),
-            'primary_metal': pred['primary_metal'],
-            'secondary_metal': pred['secondary_metal'],
-            
-            # Core price data
-            'current_price': pred['current_price'],
-            'secondary_price': pred.get('secondary_price'),
-            'predicted_price': pred['predicted_price'],
-            'predicted_change_pct': pred['predicted_change_pct'],
-            'confidence': pred['confidence'],
-            'range_low': pred['range_low'],
-            'range_high': pred['range_high'],
-            
-            # Beta & Correlation metrics
-            'beta': pred['beta'],
-            'correlation': pred['correlation'],
-            
-            # RSI metrics
-            'rsi': pred['rsi'],
-            'rsi_signal': pred.get('rsi_signal'),
-            
-            # Volatility metrics
-            'atr': pred['atr'],
-            'volatility_pct': pred.get('volatility_pct'),
-            
-            # Momentum metrics
-            'momentum_7d': pred.get('momentum_7d'),
-            'momentum_14d': pred.get('momentum_14d'),
-            'secondary_momentum': pred.get('secondary_momentum'),
-            'primary_expected_move': pred.get('primary_expected_move'),
-            
-            # Ratio metrics
-            'current_ratio': pred.get('current_ratio'),
-            'avg_ratio_28d': pred.get('avg_ratio_28d'),
-            'ratio_deviation_pct': pred.get('ratio_deviation_pct'),
-            'ratio_trend_pct': pred.get('ratio_trend_pct'),
-            
-            # Pressure metrics
-            'ratio_pressure': pred.get('ratio_pressure'),
-            'pressure_multiplier': pred.get('pressure_multiplier'),
-            
-            # Confidence breakdown
-            'confidence_signals': pred.get('confidence_signals', []),
-            
-            # Grading fields (filled in later when prediction matures)
-            'actual_price': None,
-            'actual_change_pct': None,
-            'direction_correct': None,
-            'error_pct': None,
-            'in_range': None,  # Was actual price within predicted range?
-            'graded': False
-        }
+        record = self.core.prediction_record(pred, len(self.prediction_history))
         
         # Append to list
         self.prediction_history.append(record)
         
-        # Save to file
-        self.save_prediction_history()
+        # Save to the database
+        self.store.add_prediction(record)
         
         # Disable save button
         self.pred_save_btn.config(state='disabled')
@@ -2898,7 +1637,7 @@ class MetalCalculatorApp:
         metal = pred['primary_metal']
         secondary = pred['secondary_metal']
         price = pred['predicted_price']
-        target = (datetime.now() + timedelta(days=7)).strftime('%Y-%m-%d')
+        target = record['target_date'][:10]
         count = len(self.prediction_history)
         
         # Show message first
@@ -2914,380 +1653,314 @@ class MetalCalculatorApp:
         self.root.after(50, self._force_refresh_history)
 
     def run_backtest_thread(self):
-        """Start the backtest in a separate thread"""
+        """Ask where to save the results, then start the backtest on the data loop"""
+        primary_metal = self.pred_primary_var.get()
+        secondary_name = self.pred_secondary_var.get()
+        if primary_metal == secondary_name:
+            messagebox.showwarning("Same Selection", "Please select two different items for ratio comparison.")
+            return
+
+        # Rows are written to the file as they are produced, so it is chosen up front
+        default_name = f"backtest_{primary_metal}_{secondary_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("Compressed CSV files", "*.csv.gz"), ("All files", "*.*")],
+            initialfile=default_name,
+            title="Export Back Test Results"
+        )
+        if not filepath:
+            return
+
         self.pred_backtest_btn.config(state='disabled')
+        self.pred_backtest_cancel_btn.config(state='normal')
         self.pred_status_var.set("Starting back test (fetching 18 months of data)...")
-        thread = threading.Thread(target=self.run_backtest, daemon=True)
-        thread.start()
+        self.core.data.submit(self.run_backtest(primary_metal, secondary_name, filepath), key='backtest')
 
-    def run_backtest(self):
+    def cancel_backtest(self):
+        """Stop the running back test; the days done so far are checkpointed for the next run"""
+        self.pred_backtest_cancel_btn.config(state='disabled')
+        if self.core.data.cancel('backtest'):
+            self.pred_status_var.set("Cancelling back test...")
+
+    def _backtest_finished(self):
+        self.pred_backtest_btn.config(state='normal')
+        self.pred_backtest_cancel_btn.config(state='disabled')
+
+    async def run_backtest(self, primary_metal, secondary_name, filepath):
         """
         Run a 365-day backtest using the prediction algorithm.
 
         For each trading day in the past year (excluding the last 7 days),
         simulates a prediction using only data available up to that date,
         then compares with the actual price 7 days later. Results are
-        exported to CSV with grades and error metrics.
+        streamed to the CSV at filepath (compressed for .gz) with grades and
+        error metrics; the summary is kept as running totals.
+
+        Partial results are checkpointed as the run goes (see run_pairing),
+        so a cancelled or failed back test of the same pairing resumes
+        where it stopped.
         """
-        import time as _time
+        checkpoint = self.core.backtest_checkpoint(primary_metal, secondary_name)
 
         try:
-            primary_metal = self.pred_primary_var.get()
-            secondary_name = self.pred_secondary_var.get()
-
-            if primary_metal == secondary_name:
-                self.root.after(0, lambda: messagebox.showwarning(
-                    "Same Selection", "Please select two different items for ratio comparison."))
-                self.root.after(0, lambda: self.pred_backtest_btn.config(state='normal'))
-                self.root.after(0, lambda: self.pred_status_var.set("Back test cancelled"))
-                return
-
             # === Fetch extended historical data (18 months for sufficient lookback) ===
             fetch_period = "18mo"
 
             def update_status(msg):
                 self.root.after(0, lambda: self.pred_status_var.set(msg))
 
-            update_status(f"Back test: Fetching {primary_metal} (18mo)...")
-            primary_config = METALS[primary_metal]
-            primary_hist, primary_err = self.fetch_yf_history_with_retry(
-                primary_config['yf_ticker'], period=fetch_period, timeout=60, max_retries=3)
-            if primary_err:
-                raise Exception(f"Could not fetch {primary_metal}: {primary_err}")
+            fetched = await self.core.fetch_histories_async(self.core.backtest_sources([(primary_metal, secondary_name)]),
+                                                            period=fetch_period, timeout=60, max_retries=3,
+                                                            on_progress=update_status, status_prefix="Back test: ")
+            full_data, primary_dates = self.core.backtest_data(fetched, primary_metal, secondary_name)
 
-            update_status(f"Back test: Fetching {secondary_name} (18mo)...")
-            secondary_config = PREDICTION_SECONDARIES[secondary_name]
-            secondary_hist, secondary_err = self.fetch_yf_history_with_retry(
-                secondary_config['yf_ticker'], period=fetch_period, timeout=60, max_retries=3)
-            if secondary_err:
-                raise Exception(f"Could not fetch {secondary_name}: {secondary_err}")
-
-            update_status("Back test: Fetching DXY (18mo)...")
-            dxy_hist, dxy_err = self.fetch_yf_history_with_retry(
-                DXY_TICKER, period=fetch_period, timeout=60, max_retries=3)
-            if dxy_err:
-                raise Exception(f"Could not fetch DXY: {dxy_err}")
-
-            update_status("Back test: Fetching S&P 500 (18mo)...")
-            if secondary_name == 'S&P 500':
-                sp500_hist = secondary_hist
-            else:
-                sp500_hist, sp_err = self.fetch_yf_history_with_retry(
-                    SP500_TICKER_REGIME, period=fetch_period, timeout=60, max_retries=3)
-                if sp_err:
-                    sp500_hist = None
-
-            update_status("Back test: Fetching VIX (18mo)...")
-            vix_hist, vix_err = self.fetch_yf_history_with_retry(
-                VIX_TICKER, period=fetch_period, timeout=60, max_retries=3)
-            if vix_err:
-                vix_hist = None
-
-            # Fetch Gold/Silver for GSR if needed
-            gold_gsr_closes = None
-            silver_gsr_closes = None
-            if primary_metal != 'Gold' and secondary_name != 'Gold':
-                update_status("Back test: Fetching Gold (GSR)...")
-                gold_hist, _ = self.fetch_yf_history_with_retry(
-                    METALS['Gold']['yf_ticker'], period=fetch_period, timeout=60, max_retries=3)
-                if gold_hist is not None and not gold_hist.empty:
-                    gold_gsr_closes = [float(p) / TROY_OUNCE_TO_GRAMS for p in gold_hist['Close']]
-            if primary_metal != 'Silver' and secondary_name != 'Silver':
-                update_status("Back test: Fetching Silver (GSR)...")
-                silver_hist, _ = self.fetch_yf_history_with_retry(
-                    METALS['Silver']['yf_ticker'], period=fetch_period, timeout=60, max_retries=3)
-                if silver_hist is not None and not silver_hist.empty:
-                    silver_gsr_closes = [float(p) / TROY_OUNCE_TO_GRAMS for p in silver_hist['Close']]
-
-            # === Convert all data to lists ===
-            primary_closes_all = [float(p) / TROY_OUNCE_TO_GRAMS for p in primary_hist['Close']]
-            primary_highs_all = [float(p) / TROY_OUNCE_TO_GRAMS for p in primary_hist['High']]
-            primary_lows_all = [float(p) / TROY_OUNCE_TO_GRAMS for p in primary_hist['Low']]
-            primary_dates = list(primary_hist.index)
-
-            if secondary_config['type'] == 'metal':
-                secondary_closes_all = [float(p) / TROY_OUNCE_TO_GRAMS for p in secondary_hist['Close']]
-                secondary_highs_all = [float(p) / TROY_OUNCE_TO_GRAMS for p in secondary_hist['High']]
-                secondary_lows_all = [float(p) / TROY_OUNCE_TO_GRAMS for p in secondary_hist['Low']]
-            else:
-                secondary_closes_all = [float(p) for p in secondary_hist['Close']]
-                secondary_highs_all = [float(p) for p in secondary_hist['High']]
-                secondary_lows_all = [float(p) for p in secondary_hist['Low']]
-
-            dxy_closes_all = [float(p) for p in dxy_hist['Close']]
-
-            sp500_closes_all = None
-            if sp500_hist is not None and not sp500_hist.empty:
-                sp500_closes_all = [float(p) for p in sp500_hist['Close']]
-
-            vix_closes_all = None
-            if vix_hist is not None and not vix_hist.empty:
-                vix_closes_all = [float(p) for p in vix_hist['Close']]
-
-            # Gold/Silver for GSR - use from primary/secondary if available
-            if primary_metal == 'Gold':
-                gold_gsr_closes = primary_closes_all
-            elif secondary_name == 'Gold':
-                gold_gsr_closes = secondary_closes_all
-            if primary_metal == 'Silver':
-                silver_gsr_closes = primary_closes_all
-            elif secondary_name == 'Silver':
-                silver_gsr_closes = secondary_closes_all
-
-            # === Determine backtest range ===
-            # We need at least 90 days of lookback for the algorithm, and 7 days forward for the result
-            total_days = len(primary_closes_all)
-            min_lookback = 90  # need ~90 days for 60d correlation + 28d ratio + buffer
-            backtest_start = max(min_lookback, total_days - 365)
-            backtest_end = total_days - 7  # need 7 days forward for actual price
-
-            if backtest_start >= backtest_end:
-                raise Exception("Insufficient data for backtesting. Need at least 97 trading days.")
-
-            results = []
+            backtest_start, backtest_end = backtest_window(len(full_data[primary_metal]['closes']))
             num_days = backtest_end - backtest_start
             update_status(f"Back test: Running {num_days} predictions...")
 
-            # Save original prediction_data and crash state
-            original_prediction_data = self.prediction_data.copy() if hasattr(self, 'prediction_data') else {}
-            original_crash_ts = getattr(self, '_last_crash_timestamp', None)
-            original_recovery = getattr(self, '_recovery_start', None)
-
-            try:
-                for day_idx in range(backtest_start, backtest_end):
-                    # Progress update every 20 days
-                    if (day_idx - backtest_start) % 20 == 0:
-                        progress = day_idx - backtest_start
-                        update_status(f"Back test: Day {progress}/{num_days}...")
-
-                    # Slice data up to this day (simulating what was available)
-                    p_closes = primary_closes_all[:day_idx + 1]
-                    p_highs = primary_highs_all[:day_idx + 1]
-                    p_lows = primary_lows_all[:day_idx + 1]
-                    s_closes = secondary_closes_all[:day_idx + 1]
-                    s_highs = secondary_highs_all[:day_idx + 1]
-                    s_lows = secondary_lows_all[:day_idx + 1]
-                    d_closes = dxy_closes_all[:min(day_idx + 1, len(dxy_closes_all))]
-                    sp_closes = sp500_closes_all[:min(day_idx + 1, len(sp500_closes_all))] if sp500_closes_all else None
-                    v_closes = vix_closes_all[:min(day_idx + 1, len(vix_closes_all))] if vix_closes_all else None
-
-                    # Set up prediction_data for this simulated day
-                    self.prediction_data = {}
-                    self.prediction_data[primary_metal] = {
-                        'closes': p_closes, 'highs': p_highs, 'lows': p_lows
-                    }
-                    self.prediction_data[secondary_name] = {
-                        'closes': s_closes, 'highs': s_highs, 'lows': s_lows
-                    }
-                    self.prediction_data['DXY'] = {'closes': d_closes}
-                    if sp_closes:
-                        self.prediction_data['SP500_REGIME'] = {'closes': sp_closes}
-                    else:
-                        self.prediction_data['SP500_REGIME'] = None
-                    if v_closes:
-                        self.prediction_data['VIX'] = {'closes': v_closes}
-                    else:
-                        self.prediction_data['VIX'] = None
-
-                    # GSR data
-                    if gold_gsr_closes:
-                        gsr_gold_slice = gold_gsr_closes[:min(day_idx + 1, len(gold_gsr_closes))]
-                        if primary_metal == 'Gold':
-                            pass  # already in prediction_data
-                        elif secondary_name == 'Gold':
-                            pass  # already in prediction_data
-                        else:
-                            self.prediction_data['Gold_GSR'] = {'closes': gsr_gold_slice}
-                    if silver_gsr_closes:
-                        gsr_silver_slice = silver_gsr_closes[:min(day_idx + 1, len(silver_gsr_closes))]
-                        if primary_metal == 'Silver':
-                            pass
-                        elif secondary_name == 'Silver':
-                            pass
-                        else:
-                            self.prediction_data['Silver_GSR'] = {'closes': gsr_silver_slice}
+            # The simulation is CPU work - run it off the event loop. Cancelling
+            # this job only stops the wait, so also tell the simulation to stop
+            # and let it write its checkpoint before reporting.
+            stop = threading.Event()
 
-                    # Reset crash tracking state for clean simulation
-                    self._last_crash_timestamp = None
-                    self._recovery_start = None
+            def simulate():
+                with BacktestCsvWriter(filepath) as writer:
+                    run_pairing(full_data, primary_dates, primary_metal, secondary_name, self.prediction_engine,
+                                on_progress=lambda progress: update_status(f"Back test: {progress}"),
+                                checkpoint=checkpoint, cancel=stop, sink=writer)
+                return writer.summary.as_dict()
 
-                    # Run prediction
-                    prediction = self.calculate_prediction(primary_metal, secondary_name)
-                    if prediction is None:
-                        continue
-
-                    # Calculate confidence
-                    confidence, signals = self.calculate_confidence(primary_metal, secondary_name, prediction)
-
-                    # Calculate ATR and range
-                    atr_val = self.calculate_atr(p_highs, p_lows, p_closes)
-                    pred_price = prediction['predicted_price']
-                    current_price = p_closes[-1]
-                    range_low = pred_price - (atr_val * SQRT_7) if atr_val else None
-                    range_high = pred_price + (atr_val * SQRT_7) if atr_val else None
-
-                    # RSI
-                    rsi = self.calculate_rsi(p_closes)
+            simulation = asyncio.ensure_future(run_blocking(simulate))
+            try:
+                summary = await asyncio.shield(simulation)
+            except asyncio.CancelledError:
+                stop.set()
+                try:
+                    await simulation
+                except Exception:
+                    pass  # BacktestCancelled - reported below
+                raise
+
+            if not summary['predictions']:
+                raise Exception("No predictions could be generated. Insufficient data.")
 
-                    # Predicted change
-                    predicted_change_pct = ((pred_price - current_price) / current_price) * 100 if current_price > 0 else 0
+            # === Summary stats (running totals kept by the writer) ===
+            total = summary['predictions']
+            direction_correct_count = summary['direction_correct']
+            avg_error = summary['avg_abs_error_pct']
+            in_range_count = summary['in_range']
+            in_range_total = summary['in_range_total']
+            in_range_pct = summary['in_range_pct']
+            grade_counts = summary['grade_counts']
+
+            def show_summary():
+                grade_summary = ", ".join(f"{g}: {c}" for g, c in sorted(grade_counts.items()))
+                self._backtest_finished()
+                self.pred_status_var.set(f"Back test complete: {total} predictions, avg error {avg_error:.2f}%")
+                messagebox.showinfo("Back Test Complete",
+                    f"Back test complete!\n\n"
+                    f"Period: {summary['first_date']} to {summary['last_date']}\n"
+                    f"Total predictions: {total}\n\n"
+                    f"Direction accuracy: {direction_correct_count}/{total} ({direction_correct_count/total*100:.1f}%)\n"
+                    f"Average error: {avg_error:.2f}%\n"
+                    f"In-range: {in_range_count}/{in_range_total} ({in_range_pct:.1f}%)\n\n"
+                    f"Grades: {grade_summary}\n\n"
+                    f"Results exported to:\n{filepath}")
+
+            self.root.after(0, show_summary)
+
+        except asyncio.CancelledError:
+            saved = os.path.exists(checkpoint.path)
+            def show_cancelled():
+                self._backtest_finished()
+                self.pred_status_var.set("Back test cancelled" +
+                                         (" - progress saved, Back Test resumes it" if saved else ""))
+            self.root.after(0, show_cancelled)
+            raise
 
-                    # === Actual price 7 days later ===
-                    actual_price = primary_closes_all[day_idx + 7]
-                    actual_change_pct = ((actual_price - current_price) / current_price) * 100 if current_price > 0 else 0
+        except Exception as e:
+            saved = os.path.exists(checkpoint.path)
+            def show_error():
+                self._backtest_finished()
+                self.pred_status_var.set("Back test failed")
+                messagebox.showerror("Back Test Error", f"Error during back test:\n\n{str(e)}" +
+                                     ("\n\nThe days done so far were saved; Back Test resumes from there." if saved else ""))
+            self.root.after(0, show_error)
 
-                    # Error and grading
-                    error_pct = ((actual_price - pred_price) / pred_price) * 100 if pred_price > 0 else 0
-                    abs_error_pct = abs(error_pct)
-                    direction_correct = (actual_change_pct >= 0 and predicted_change_pct >= 0) or \
-                                        (actual_change_pct < 0 and predicted_change_pct < 0)
-                    in_range = (range_low <= actual_price <= range_high) if (range_low is not None and range_high is not None) else None
+    def run_batch_backtest_thread(self):
+        """Ask for an output folder, then back test every pairing in a separate thread"""
+        directory = filedialog.askdirectory(title="Choose a Folder for the Batch Back Test CSVs")
+        if not directory:
+            return
+        self.pred_backtest_btn.config(state='disabled')
+        self.pred_batch_btn.config(state='disabled')
+        self.pred_status_var.set("Starting batch back test (fetching 18 months of data)...")
+        thread = threading.Thread(target=self.run_batch_backtest, args=(directory,), daemon=True)
+        thread.start()
 
-                    # Grade using the same grading scale
-                    if abs_error_pct < 1:
-                        grade = "A+"
-                    elif abs_error_pct < 2:
-                        grade = "A"
-                    elif abs_error_pct < 3:
-                        grade = "B+"
-                    elif abs_error_pct < 4:
-                        grade = "B"
-                    elif abs_error_pct < 5:
-                        grade = "C+"
-                    elif abs_error_pct < 7:
-                        grade = "C"
-                    elif abs_error_pct < 10:
-                        grade = "D"
-                    else:
-                        grade = "F"
+    def run_batch_backtest(self, directory):
+        """
+        Back test every METALS x PREDICTION_SECONDARIES pairing.
 
-                    # Get the date for this prediction
-                    pred_date = primary_dates[day_idx]
-                    pred_date_str = pred_date.strftime('%Y-%m-%d') if hasattr(pred_date, 'strftime') else str(pred_date)[:10]
-                    target_date = primary_dates[day_idx + 7]
-                    target_date_str = target_date.strftime('%Y-%m-%d') if hasattr(target_date, 'strftime') else str(target_date)[:10]
+        Each ticker's history is fetched once and shared by all pairings; the
+        pairings then run in a process pool (one worker per core). Writes one
+        detail CSV per pairing plus a combined summary CSV to directory.
+        """
+        def update_status(msg):
+            self.root.after(0, lambda: self.pred_status_var.set(msg))
 
-                    volatility_pct = (atr_val / current_price) * 100 if atr_val and current_price > 0 else None
+        def finish():
+            self.pred_backtest_btn.config(state='normal')
+            self.pred_batch_btn.config(state='normal')
 
-                    results.append({
-                        'prediction_date': pred_date_str,
-                        'target_date': target_date_str,
-                        'primary_metal': primary_metal,
-                        'secondary_asset': secondary_name,
-                        'current_price': round(current_price, 6),
-                        'predicted_price': round(pred_price, 6),
-                        'actual_price': round(actual_price, 6),
-                        'predicted_change_pct': round(predicted_change_pct, 4),
-                        'actual_change_pct': round(actual_change_pct, 4),
-                        'error_pct': round(error_pct, 4),
-                        'abs_error_pct': round(abs_error_pct, 4),
-                        'price_difference': round(actual_price - pred_price, 6),
-                        'direction_correct': direction_correct,
-                        'grade': grade,
-                        'in_range': in_range,
-                        'range_low': round(range_low, 6) if range_low is not None else '',
-                        'range_high': round(range_high, 6) if range_high is not None else '',
-                        'confidence': round(confidence, 2),
-                        'regime': prediction.get('regime', ''),
-                        'regime_change': prediction.get('regime_change', False),
-                        'beta': round(prediction.get('beta', 0), 4),
-                        'correlation': round(prediction.get('correlation', 0), 4),
-                        'rsi': round(rsi, 2) if rsi is not None else '',
-                        'atr': round(atr_val, 6) if atr_val is not None else '',
-                        'volatility_pct': round(volatility_pct, 4) if volatility_pct is not None else '',
-                        'secondary_momentum': round(prediction.get('secondary_momentum', 0), 4),
-                        'primary_expected_move': round(prediction.get('primary_expected_move', 0), 4),
-                        'ratio_deviation_pct': round(prediction.get('ratio_deviation', 0), 4),
-                        'ratio_pressure': round(prediction.get('ratio_pressure', 0), 4),
-                    })
-            finally:
-                # Restore original state
-                self.prediction_data = original_prediction_data
-                self._last_crash_timestamp = original_crash_ts
-                self._recovery_start = original_recovery
+        try:
+            pairings = [(primary, secondary) for primary in METALS for secondary in PREDICTION_SECONDARIES
+                        if primary != secondary]
+            fetched = self.fetch_yf_histories(self.core.backtest_sources(pairings), period="18mo", timeout=60,
+                                              max_retries=3, status_var=self.pred_status_var,
+                                              status_prefix="Batch back test: ")
+
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            jobs = []
+            failed = []
+            for primary_metal, secondary_name in pairings:
+                try:
+                    full_data, primary_dates = self.core.backtest_data(fetched, primary_metal, secondary_name)
+                    detail_path = os.path.join(directory, batch_detail_file(primary_metal, secondary_name, stamp))
+                    jobs.append((primary_metal, secondary_name, full_data, primary_dates, detail_path))
+                except Exception as e:
+                    failed.append((primary_metal, secondary_name, None, str(e)))
+
+            update_status(f"Batch back test: Running {len(jobs)} pairings...")
+
+            def on_result(outcome, done, total):
+                state = "failed" if outcome[3] else "done"
+                update_status(f"Batch back test: {outcome[0]} vs {outcome[1]} {state} ({done}/{total})...")
+
+            # Each worker streams its pairing's detail CSV and sends back only the summary
+            outcomes = run_batch(jobs, on_result=on_result) + failed
+            summary_path = export_batch(directory, outcomes, stamp)
+
+            completed = [(p, s, summary) for p, s, summary, error in outcomes if summary and summary['predictions']]
+            if not completed:
+                raise Exception("No pairing produced any predictions. Insufficient data.")
+            best_direction = max(completed, key=lambda c: c[2]['direction_accuracy_pct'])
+            best_error = min(completed, key=lambda c: c[2]['avg_abs_error_pct'])
+            best_range = max(completed, key=lambda c: c[2]['in_range_pct'])
+            failed_count = len(outcomes) - len(completed)
+
+            def show_summary():
+                finish()
+                self.pred_status_var.set(f"Batch back test complete: {len(completed)} pairings")
+                messagebox.showinfo("Batch Back Test Complete",
+                    f"Batch back test complete!\n\n"
+                    f"Pairings tested: {len(completed)}" + (f" ({failed_count} failed)" if failed_count else "") + "\n\n"
+                    f"Best direction: {best_direction[0]} vs {best_direction[1]} "
+                    f"({best_direction[2]['direction_accuracy_pct']:.1f}%)\n"
+                    f"Lowest error: {best_error[0]} vs {best_error[1]} ({best_error[2]['avg_abs_error_pct']:.2f}%)\n"
+                    f"Best in-range: {best_range[0]} vs {best_range[1]} ({best_range[2]['in_range_pct']:.1f}%)\n\n"
+                    f"Summary exported to:\n{summary_path}")
+            self.root.after(0, show_summary)
 
-            if not results:
-                raise Exception("No predictions could be generated. Insufficient data.")
+        except Exception as e:
+            error_msg = str(e)
+            def show_error():
+                finish()
+                self.pred_status_var.set("Batch back test failed")
+                messagebox.showerror("Batch Back Test Error", f"Error during batch back test:\n\n{error_msg}")
+            self.root.after(0, show_error)
 
-            # === Calculate summary stats ===
-            total = len(results)
-            direction_correct_count = sum(1 for r in results if r['direction_correct'])
-            avg_error = sum(r['abs_error_pct'] for r in results) / total
-            in_range_results = [r for r in results if r['in_range'] is not None]
-            in_range_count = sum(1 for r in in_range_results if r['in_range'])
-            in_range_pct = (in_range_count / len(in_range_results) * 100) if in_range_results else 0
+    def run_parameter_sweep_thread(self):
+        """Ask how many parameter sets to try and where to save them, then run the sweep in a thread"""
+        primary_metal = self.pred_primary_var.get()
+        secondary_name = self.pred_secondary_var.get()
+        if primary_metal == secondary_name:
+            messagebox.showwarning("Same Selection", "Please select two different items for ratio comparison.")
+            return
 
-            grade_counts = {}
-            for r in results:
-                grade_counts[r['grade']] = grade_counts.get(r['grade'], 0) + 1
+        grid_size = sum(1 for _ in grid_candidates())
+        count = simpledialog.askinteger(
+            "Parameter Sweep",
+            f"Back test other regime/clamp constants on {primary_metal} vs {secondary_name}.\n\n"
+            f"Random parameter sets to try (0 = full grid of {grid_size}):",
+            initialvalue=0, minvalue=0, maxvalue=100000, parent=self.root)
+        if count is None:
+            return
 
-            # === Prompt for save location ===
-            def ask_save():
-                default_name = f"backtest_{primary_metal}_{secondary_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-                filepath = filedialog.asksaveasfilename(
-                    defaultextension=".csv",
-                    filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
-                    initialfile=default_name,
-                    title="Export Back Test Results"
-                )
-                if filepath:
-                    self._export_backtest_csv(filepath, results)
+        filepath = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+            initialfile=f"sweep_{primary_metal}_{secondary_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+            title="Export Parameter Sweep Results"
+        )
+        if not filepath:
+            return
 
-                    # Show summary
-                    grade_summary = ", ".join(f"{g}: {c}" for g, c in sorted(grade_counts.items()))
-                    messagebox.showinfo("Back Test Complete",
-                        f"Back test complete!\n\n"
-                        f"Period: {results[0]['prediction_date']} to {results[-1]['prediction_date']}\n"
-                        f"Total predictions: {total}\n\n"
-                        f"Direction accuracy: {direction_correct_count}/{total} ({direction_correct_count/total*100:.1f}%)\n"
-                        f"Average error: {avg_error:.2f}%\n"
-                        f"In-range: {in_range_count}/{len(in_range_results)} ({in_range_pct:.1f}%)\n\n"
-                        f"Grades: {grade_summary}\n\n"
-                        f"Results exported to:\n{filepath}")
-                else:
-                    self.pred_status_var.set("Back test complete (export cancelled)")
+        self.pred_sweep_btn.config(state='disabled')
+        self.pred_status_var.set("Starting parameter sweep (fetching 18 months of data)...")
+        thread = threading.Thread(target=self.run_parameter_sweep,
+                                  args=(primary_metal, secondary_name, count, filepath), daemon=True)
+        thread.start()
 
-                self.pred_backtest_btn.config(state='normal')
-                self.pred_status_var.set(f"Back test complete: {total} predictions, avg error {avg_error:.2f}%")
+    def run_parameter_sweep(self, primary_metal, secondary_name, count, filepath):
+        """
+        Score the current constants plus a grid (count=0) or 'count' random
+        parameter sets on one pairing's back test, export every result and
+        show the best sets by direction accuracy, error and in-range rate.
+        """
+        def update_status(msg):
+            self.root.after(0, lambda: self.pred_status_var.set(msg))
 
-            self.root.after(0, ask_save)
+        try:
+            fetched = self.fetch_yf_histories(self.core.backtest_sources([(primary_metal, secondary_name)]),
+                                              period="18mo", timeout=60, max_retries=3,
+                                              status_var=self.pred_status_var, status_prefix="Parameter sweep: ")
+            full_data, _ = self.core.backtest_data(fetched, primary_metal, secondary_name)
+
+            defaults = self.prediction_engine.params
+            candidates = [defaults] + list(random_candidates(count, base=defaults) if count else grid_candidates(base=defaults))
+            update_status(f"Parameter sweep: Scoring {len(candidates)} parameter sets...")
+
+            results = run_sweep(full_data, primary_metal, secondary_name, candidates,
+                                on_progress=lambda done, total: update_status(f"Parameter sweep: {done}/{total} scored..."))
+            export_sweep_csv(filepath, results)
+
+            def describe(result):
+                changed = ", ".join(f"{name}={value}" for name, value in result['params']._asdict().items()
+                                    if value != getattr(defaults, name))
+                return (f"{result['direction_accuracy_pct']:.1f}% dir, {result['avg_abs_error_pct']:.2f}% err, "
+                        f"{result['in_range_pct']:.1f}% in-range\n    {changed or 'current constants'}")
+
+            lines = [f"Current constants: {describe(results[0]).splitlines()[0]}", ""]
+            for metric, label in (('direction_accuracy_pct', "Best direction accuracy"),
+                                  ('avg_abs_error_pct', "Lowest average error"),
+                                  ('in_range_pct', "Best in-range")):
+                top = best(results, metric, count=1)
+                if top:
+                    lines.append(f"{label}:\n  {describe(top[0])}")
+
+            def show_summary():
+                self.pred_sweep_btn.config(state='normal')
+                self.pred_status_var.set(f"Parameter sweep complete: {len(results)} parameter sets")
+                messagebox.showinfo("Parameter Sweep Complete",
+                    f"{primary_metal} vs {secondary_name}: {len(results)} parameter sets\n\n"
+                    + "\n".join(lines) + f"\n\nAll results exported to:\n{filepath}")
+            self.root.after(0, show_summary)
 
         except Exception as e:
+            error_msg = str(e)
             def show_error():
-                self.pred_backtest_btn.config(state='normal')
-                self.pred_status_var.set("Back test failed")
-                messagebox.showerror("Back Test Error", f"Error during back test:\n\n{str(e)}")
+                self.pred_sweep_btn.config(state='normal')
+                self.pred_status_var.set("Parameter sweep failed")
+                messagebox.showerror("Parameter Sweep Error", f"Error during parameter sweep:\n\n{error_msg}")
             self.root.after(0, show_error)
 
-    def _export_backtest_csv(self, filepath, results):
-        """Export backtest results to a CSV file."""
-        if not results:
-            return
-
-        fieldnames = [
-            'prediction_date', 'target_date', 'primary_metal', 'secondary_asset',
-            'current_price', 'predicted_price', 'actual_price',
-            'predicted_change_pct', 'actual_change_pct',
-            'error_pct', 'abs_error_pct', 'price_difference',
-            'direction_correct', 'grade', 'in_range',
-            'range_low', 'range_high', 'confidence',
-            'regime', 'regime_change',
-            'beta', 'correlation', 'rsi', 'atr', 'volatility_pct',
-            'secondary_momentum', 'primary_expected_move',
-            'ratio_deviation_pct', 'ratio_pressure',
-        ]
-
-        with open(filepath, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(results)
-
     def _force_refresh_history(self):
         """Force a complete refresh of the prediction history display"""
         if not hasattr(self, 'pred_history_listbox'):
             return
         
-        # Reload from file to ensure we have latest data
+        # Reload from the database to ensure we have latest data
         self.load_prediction_history()
         
         # Clear listbox
@@ -3335,44 +2008,26 @@ class MetalCalculatorApp:
         if not record['graded']:
             return "?"
         
-        error = abs(record['error_pct'])
-        
-        if error < 1:
-            return "A+"
-        elif error < 2:
-            return "A"
-        elif error < 3:
-            return "B+"
-        elif error < 4:
-            return "B"
-        elif error < 5:
-            return "C+"
-        elif error < 7:
-            return "C"
-        elif error < 10:
-            return "D"
-        else:
-            return "F"
+        return grade_for_error(abs(record['error_pct']))
     
     def update_accuracy_display(self):
-        """Calculate and display accuracy metrics"""
-        graded = [r for r in self.prediction_history if r['graded']]
+        """Calculate and display accuracy metrics (aggregated by the database)"""
+        stats = self.store.accuracy()
         
-        if not graded:
+        if not stats['total']:
             self.pred_accuracy_var.set("No graded predictions yet")
             return
         
         # Calculate metrics
-        total = len(graded)
-        direction_correct = sum(1 for r in graded if r['direction_correct'])
+        total = stats['total']
+        direction_correct = stats['direction_correct']
         direction_pct = (direction_correct / total) * 100 if total > 0 else 0
         
-        avg_error = sum(abs(r['error_pct']) for r in graded) / total
+        avg_error = stats['avg_abs_error']
         
         # Calculate average grade
-        grades = [self.get_prediction_grade(r) for r in graded]
         grade_values = {'A+': 4.3, 'A': 4.0, 'B+': 3.3, 'B': 3.0, 'C+': 2.3, 'C': 2.0, 'D': 1.0, 'F': 0}
-        avg_grade_val = sum(grade_values.get(g, 0) for g in grades) / len(grades)
+        avg_grade_val = sum(grade_values.get(g, 0) * n for g, n in stats['grade_counts'].items()) / total
         
         # Convert back to letter
         if avg_grade_val >= 4.15:
@@ -3393,24 +2048,14 @@ class MetalCalculatorApp:
             avg_grade = "F"
         
         # Confidence correlation (do high confidence predictions do better?)
-        if len(graded) >= 3:
-            high_conf = [r for r in graded if r['confidence'] >= 60]
-            low_conf = [r for r in graded if r['confidence'] < 60]
-            
-            if high_conf and low_conf:
-                high_conf_err = sum(abs(r['error_pct']) for r in high_conf) / len(high_conf)
-                low_conf_err = sum(abs(r['error_pct']) for r in low_conf) / len(low_conf)
-                conf_note = f" | High conf: {high_conf_err:.1f}% err, Low conf: {low_conf_err:.1f}% err"
-            else:
-                conf_note = ""
+        if total >= 3 and stats['high_conf_error'] is not None and stats['low_conf_error'] is not None:
+            conf_note = f" | High conf: {stats['high_conf_error']:.1f}% err, Low conf: {stats['low_conf_error']:.1f}% err"
         else:
             conf_note = ""
         
         # Calculate in-range percentage
-        range_graded = [r for r in graded if r.get('in_range') is not None]
-        if range_graded:
-            in_range_count = sum(1 for r in range_graded if r.get('in_range'))
-            in_range_pct = (in_range_count / len(range_graded)) * 100
+        if stats['in_range_total']:
+            in_range_pct = (stats['in_range'] / stats['in_range_total']) * 100
             range_note = f" | In Range: {in_range_pct:.0f}%"
         else:
             range_note = ""
@@ -3423,9 +2068,7 @@ class MetalCalculatorApp:
     def grade_predictions_thread(self):
         """Start grading predictions in a separate thread"""
         # Find ungraded predictions that have matured
-        now = datetime.now()
-        ungraded = [r for r in self.prediction_history 
-                   if not r['graded'] and datetime.fromisoformat(r['target_date']) <= now]
+        ungraded = matured_predictions(self.prediction_history)
         
         if not ungraded:
             messagebox.showinfo("No Predictions to Grade", 
@@ -3438,115 +2081,11 @@ class MetalCalculatorApp:
         thread.start()
     
     def grade_predictions(self, ungraded):
-        """Grade matured predictions by fetching actual prices from the target date"""
-        import concurrent.futures
-        import time
-        
+        """Grade matured predictions against one price history per metal (AppCore.grade_predictions)"""
         try:
-            graded_count = 0
-            failed_count = 0
-            
-            for record in ungraded:
-                metal = record['primary_metal']
-                target_date = datetime.fromisoformat(record['target_date'])
-                
-                # Fetch price data for the target date with retry
-                metal_config = METALS[metal]
-                start_date = target_date - timedelta(days=3)
-                end_date = target_date + timedelta(days=3)
-                
-                hist = None
-                last_error = None
-                
-                for attempt in range(2):  # 2 retries
-                    try:
-                        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
-                            def fetch_grade_data():
-                                ticker = yf.Ticker(metal_config['yf_ticker'])
-                                return ticker.history(
-                                    start=start_date.strftime('%Y-%m-%d'), 
-                                    end=end_date.strftime('%Y-%m-%d')
-                                )
-                            
-                            future = executor.submit(fetch_grade_data)
-                            hist = future.result(timeout=20)
-                            
-                            if hist is not None and not hist.empty:
-                                break
-                            else:
-                                last_error = "No data returned"
-                                
-                    except concurrent.futures.TimeoutError:
-                        last_error = f"Timeout (attempt {attempt + 1})"
-                    except Exception as e:
-                        last_error = str(e)
-                    
-                    if attempt < 1:
-                        time.sleep(1)
-                
-                if hist is None or hist.empty:
-                    failed_count += 1
-                    continue
-                
-                # Find the closest date to target_date
-                target_date_only = target_date.date()
-                best_price = None
-                best_date_diff = None
-                actual_date_used = None
-                
-                for idx in hist.index:
-                    idx_date = idx.date() if hasattr(idx, 'date') else idx
-                    date_diff = abs((idx_date - target_date_only).days)
-                    
-                    if best_date_diff is None or date_diff < best_date_diff:
-                        best_date_diff = date_diff
-                        best_price = float(hist.loc[idx, 'Close'])
-                        actual_date_used = idx_date
-                
-                if best_price is None:
-                    failed_count += 1
-                    continue
-                
-                # Convert from $/oz to $/gram
-                actual_price = best_price / TROY_OUNCE_TO_GRAMS
-                
-                # Calculate metrics
-                predicted_price = record['predicted_price']
-                current_price = record['current_price']
-                
-                actual_change_pct = ((actual_price - current_price) / current_price) * 100 if current_price > 0 else 0
-                predicted_change_pct = record['predicted_change_pct']
-                
-                # Was direction correct?
-                direction_correct = (actual_change_pct >= 0 and predicted_change_pct >= 0) or \
-                                   (actual_change_pct < 0 and predicted_change_pct < 0)
-                
-                # Error percentage (how far off was the prediction?)
-                error_pct = ((actual_price - predicted_price) / predicted_price) * 100 if predicted_price > 0 else 0
-                
-                # Was actual price within predicted range?
-                range_low = record.get('range_low')
-                range_high = record.get('range_high')
-                if range_low is not None and range_high is not None:
-                    in_range = range_low <= actual_price <= range_high
-                else:
-                    in_range = None
-                
-                # Update record
-                record['actual_price'] = actual_price
-                record['actual_date_used'] = str(actual_date_used) if actual_date_used else None
-                record['actual_change_pct'] = actual_change_pct
-                record['direction_correct'] = direction_correct
-                record['error_pct'] = error_pct
-                record['in_range'] = in_range
-                record['graded'] = True
-                record['graded_timestamp'] = datetime.now().isoformat()
-                
-                graded_count += 1
-            
-            # Save and refresh
-            self.save_prediction_history()
+            graded_count, failed_count = self.core.grade_predictions(ungraded)
             
+            # Refresh
             def update_ui():
                 self.refresh_prediction_history_display()
                 if failed_count > 0:
@@ -3572,7 +2111,7 @@ class MetalCalculatorApp:
                               f"Clear all {len(self.prediction_history)} prediction records?\n\n"
                               "This cannot be undone."):
             self.prediction_history = []
-            self.save_prediction_history()
+            self.store.clear_predictions()
             self.refresh_prediction_history_display()
             self.pred_accuracy_var.set("No graded predictions yet")
             messagebox.showinfo("Cleared", "Prediction history cleared.")
@@ -3616,7 +2155,7 @@ class MetalCalculatorApp:
             # Find and remove from the actual list
             self.prediction_history = [r for r in self.prediction_history 
                                        if r['id'] != record_to_delete['id']]
-            self.save_prediction_history()
+            self.store.delete_prediction(record_to_delete['id'])
             self.refresh_prediction_history_display()
             self.pred_history_status_var.set("Prediction deleted")
 
@@ -3733,158 +2272,51 @@ class MetalCalculatorApp:
             quick_label.grid(row=i, column=1, sticky='w', pady=2)
     
     def calculate_formula_price(self, formula):
-        """Calculate price based on formula expression"""
-        if not self.metrics:
-            return None
-        
-        expression = formula.get('expression', '')
-        if not expression:
-            # Legacy support for old weight-based formulas
-            return self.calculate_legacy_formula(formula)
-        
-        try:
-            # Build context with metric values using abbreviations
-            context = {}
-            for metric, abbrev in METRIC_ABBREVS.items():
-                if metric in self.metrics:
-                    context[abbrev] = self.metrics[metric]
-                else:
-                    # If metric not available, we can't calculate
-                    return None
-            
-            # Safely evaluate the expression
-            # Only allow basic math operations and our variables
-            allowed_names = set(METRIC_ABBREVS.values())
-            
-            # Parse and validate expression
-            price = self.safe_eval(expression, context)
-            
-            if price is None or price < 0:
-                return None
-            
-            # Apply tax adjustment if enabled
-            if formula.get('apply_tax', True):
-                tax_rate = self.get_current_tax_rate()
-                if tax_rate > 0:
-                    price = price * (1 - tax_rate / 100)
-            
-            return price
-            
-        except Exception as e:
-            print(f"Formula evaluation error: {e}")
-            return None
+        """Calculate price based on formula expression (legacy weight-based formulas too)"""
+        return formula_price(formula, self.metrics, self.rolling_metrics, self.get_current_tax_rate(),
+                             self.formula_cache)
     
-    def calculate_legacy_formula(self, formula):
-        """Calculate using old weight-based formula (for backwards compatibility)"""
-        weights = formula.get('weights', {})
-        if not weights:
-            return None
-        
-        total_weight = sum(weights.values())
-        if total_weight == 0:
-            return None
-        
-        weighted_sum = 0
-        for metric, weight in weights.items():
-            if metric in self.metrics:
-                weighted_sum += self.metrics[metric] * weight
-            else:
-                return None
-        
-        price = weighted_sum / total_weight
+    def formula_history_context(self, expression=''):
+        """
+        Every formula variable (plus any other Nd window the expression uses)
+        as a daily series over the fetched history ({abbrev: array}, NaN on
+        days before a window fills). 'cur' is each day's close and '1yavg'
+        the average of every close up to that day.
+        """
+        names = list(METRIC_ABBREVS.values()) + [n for n in window_metrics_in(expression) if n not in ABBREV_TO_METRIC]
+        return {name: np.asarray(self.rolling_metrics.series(name), dtype=np.float64) for name in names}
+    
+    def calculate_formula_history(self, formula):
+        """Formula price ($/gram) for every day of the fetched history, NaN where it can't be calculated"""
+        expression = formula.get('expression', '')
+        context = self.formula_history_context(expression)
         
-        # Apply tax
+        if expression:
+            prices = self.formula_cache.evaluate_series(expression, context)
+        else:
+            # Legacy weight-based formula
+            weights = formula.get('weights', {})
+            total_weight = sum(weights.values())
+            if total_weight == 0 or any(metric not in METRIC_ABBREVS for metric in weights):
+                raise ValueError("Formula has no usable expression or weights")
+            prices = sum(context[METRIC_ABBREVS[metric]] * weight for metric, weight in weights.items()) / total_weight
+            margin = formula.get('safety_margin', 0)
+            if margin > 0:
+                prices = prices * (1 - margin / 100)
+        
+        prices[prices < 0] = np.nan
+        
+        # Apply tax adjustment if enabled
         if formula.get('apply_tax', True):
             tax_rate = self.get_current_tax_rate()
             if tax_rate > 0:
-                price = price * (1 - tax_rate / 100)
+                prices = prices * (1 - tax_rate / 100)
         
-        # Apply safety margin
-        margin = formula.get('safety_margin', 0)
-        if margin > 0:
-            price = price * (1 - margin / 100)
-        
-        return price
+        return prices
     
     def safe_eval(self, expression, context):
-        """Safely evaluate a mathematical expression with conditionals"""
-        # Variables starting with numbers aren't valid Python identifiers
-        # So we need to transform them (e.g., 7davg -> _7davg) for evaluation
-        
-        # Create mapping of user-facing names to Python-safe names
-        safe_context = {}
-        name_mapping = {}  # original -> safe
-        for name, value in context.items():
-            if name[0].isdigit():
-                safe_name = f"_{name}"  # Prefix with underscore
-            else:
-                safe_name = name
-            safe_context[safe_name] = value
-            name_mapping[name] = safe_name
-        
-        # Transform the expression to use safe names
-        # Sort by length (longest first) to avoid partial replacements
-        safe_expression = expression
-        for original, safe in sorted(name_mapping.items(), key=lambda x: len(x[0]), reverse=True):
-            # Use word boundary matching to avoid partial replacements
-            safe_expression = re.sub(r'(?<![a-zA-Z0-9_])' + re.escape(original) + r'(?![a-zA-Z0-9_])', 
-                                    safe, safe_expression)
-        
-        # Build regex pattern for validation - include function names and comparison operators
-        allowed_functions = ['min', 'max', 'iif']
-        var_pattern = '|'.join(sorted(list(safe_context.keys()) + allowed_functions, key=len, reverse=True))
-        # Pattern includes comparison operators
-        pattern = f'({var_pattern})|([\\d.]+)|([+\\-*/()<>=!,]+)|\\s+'
-        
-        # Tokenize
-        tokens = re.findall(pattern, safe_expression)
-        
-        # Flatten and filter empty strings
-        flat_tokens = []
-        for match in tokens:
-            for group in match:
-                if group and group.strip():
-                    flat_tokens.append(group.strip())
-        
-        # Validate each token
-        allowed_names = set(safe_context.keys()) | set(allowed_functions)
-        allowed_operators = set(['+-*/()<>=!,', '+', '-', '*', '/', '(', ')', '<', '>', '<=', '>=', '==', '!=', ','])
-        
-        for token in flat_tokens:
-            # Check if it's a number
-            try:
-                float(token)
-                continue  # Valid number
-            except ValueError:
-                pass
-            
-            # Check if it's a known variable or function
-            if token in allowed_names:
-                continue
-            
-            # Check if it's an operator (including comparison)
-            if all(c in '+-*/()<>=!,' for c in token):
-                continue
-            
-            # Invalid token - show user-friendly variable names in error
-            user_vars = ', '.join(sorted(context.keys()))
-            raise ValueError(f"Invalid token: '{token}'. Valid variables are: {user_vars}")
-        
-        # Create safe evaluation environment with allowed functions
-        def safe_iif(condition, true_val, false_val):
-            """Immediate If function: iif(condition, true_value, false_value)"""
-            return true_val if condition else false_val
-        
-        eval_dict = {
-            "__builtins__": {},
-            "min": min,
-            "max": max,
-            "iif": safe_iif,
-        }
-        eval_dict.update(safe_context)
-        
-        result = eval(safe_expression, eval_dict, {})
-        return float(result)
+        """Safely evaluate a mathematical expression with conditionals (compiled once per expression, see formulas.py)"""
+        return self.formula_cache.evaluate(expression, context)
     
     # =========================================================================
     # QUICK CALCULATOR
@@ -4020,6 +2452,7 @@ class MetalCalculatorApp:
             return
         
         if messagebox.askyesno("Confirm Delete", "Delete this formula?"):
+            self.formula_cache.invalidate(self.custom_formulas[idx].get('expression', ''))
             del self.custom_formulas[idx]
             self.save_formulas()
             self.refresh_formula_list()
@@ -4154,6 +2587,110 @@ class MetalCalculatorApp:
         
         ttk.Button(main_frame, text="Close", command=dialog.destroy).pack(pady=(20, 0))
     
+    def show_formula_history(self):
+        """Show how the selected formula would have tracked the market over the fetched year"""
+        formula = self.get_selected_formula()
+        if not formula:
+            messagebox.showwarning("No Selection", "Please select a formula.")
+            return
+        
+        if not self.price_history:
+            messagebox.showwarning("No Price Data", "Please fetch live prices first to see a formula's history.")
+            return
+        
+        if np is None:
+            messagebox.showerror("NumPy Required", "Formula history needs NumPy.\n\npip install numpy")
+            return
+        
+        try:
+            prices = self.calculate_formula_history(formula)
+        except Exception as e:
+            messagebox.showerror("Formula Error", f"Could not evaluate {formula['name']} over the history:\n\n{e}")
+            return
+        
+        dates, closes = self.price_history
+        unit_factor = UNITS[self.current_unit]['factor']
+        unit_label = UNITS[self.current_unit]['label']
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Formula History: {formula['name']}")
+        dialog.geometry("620x520")
+        dialog.transient(self.root)
+        
+        main_frame = ttk.Frame(dialog, padding="15")
+        main_frame.pack(fill='both', expand=True)
+        
+        ttk.Label(main_frame, text=f"{formula['name']} - {self.current_metal}", font=('Segoe UI', 12, 'bold')).pack(anchor='w')
+        ttk.Label(main_frame, text=f"Expression: {formula.get('expression', 'N/A')}", font=('Consolas', 9)).pack(anchor='w', pady=(5, 5))
+        
+        # Summary over the days the formula could be calculated
+        valid = ~np.isnan(prices)
+        if valid.any():
+            closes_arr = np.asarray(closes)
+            diff_pct = (prices[valid] - closes_arr[valid]) / closes_arr[valid] * 100
+            summary = (f"{int(valid.sum())} of {len(prices)} days   "
+                       f"Low ${np.min(prices[valid]) * unit_factor:.4f}   "
+                       f"Avg ${np.mean(prices[valid]) * unit_factor:.4f}   "
+                       f"High ${np.max(prices[valid]) * unit_factor:.4f} {unit_label}\n"
+                       f"Average vs close: {np.mean(diff_pct):+.2f}%   "
+                       f"At or below close on {np.mean(diff_pct <= 0) * 100:.0f}% of days")
+        else:
+            summary = "The formula could not be calculated on any day of the history."
+        ttk.Label(main_frame, text=summary, font=('Segoe UI', 9), foreground='gray', justify='left').pack(anchor='w', pady=(0, 10))
+        
+        # Daily values, newest first
+        tree_frame = ttk.Frame(main_frame)
+        tree_frame.pack(fill='both', expand=True)
+        
+        columns = ('date', 'close', 'formula', 'diff')
+        tree = ttk.Treeview(tree_frame, columns=columns, show='headings', height=15)
+        for col, heading, width in (('date', 'Date', 110), ('close', f'Close {unit_label}', 150),
+                                    ('formula', f'Formula {unit_label}', 150), ('diff', 'vs Close', 90)):
+            tree.heading(col, text=heading)
+            tree.column(col, width=width, anchor='e' if col != 'date' else 'w')
+        scrollbar = ttk.Scrollbar(tree_frame, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=scrollbar.set)
+        tree.pack(side='left', fill='both', expand=True)
+        scrollbar.pack(side='right', fill='y')
+        
+        rows = []
+        for date, close, price in zip(dates, closes, prices.tolist()):
+            date_str = date.strftime('%Y-%m-%d') if hasattr(date, 'strftime') else str(date)[:10]
+            if math.isnan(price):
+                rows.append((date_str, close, None, None))
+            else:
+                rows.append((date_str, close, price, (price - close) / close * 100))
+        for date_str, close, price, diff in reversed(rows):
+            tree.insert('', 'end', values=(
+                date_str, f"${close * unit_factor:.4f}",
+                f"${price * unit_factor:.4f}" if price is not None else "--",
+                f"{diff:+.2f}%" if diff is not None else "--"))
+        
+        def export_csv():
+            filepath = filedialog.asksaveasfilename(
+                parent=dialog,
+                defaultextension=".csv",
+                filetypes=[("CSV files", "*.csv"), ("All files", "*.*")],
+                initialfile=f"formula_history_{formula['name']}_{self.current_metal}.csv".replace(' ', '_'))
+            if not filepath:
+                return
+            try:
+                with open(filepath, 'w', newline='', encoding='utf-8') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(['date', f'close_{self.current_unit}', f'formula_{self.current_unit}', 'diff_pct'])
+                    for date_str, close, price, diff in rows:
+                        writer.writerow([date_str, round(close * unit_factor, 6),
+                                         round(price * unit_factor, 6) if price is not None else '',
+                                         round(diff, 4) if diff is not None else ''])
+                messagebox.showinfo("Export Complete", f"Formula history exported to:\n{filepath}", parent=dialog)
+            except Exception as e:
+                messagebox.showerror("Export Error", f"Failed to export:\n{str(e)}", parent=dialog)
+        
+        btn_frame = ttk.Frame(main_frame)
+        btn_frame.pack(fill='x', pady=(10, 0))
+        ttk.Button(btn_frame, text="📄 Export CSV", command=export_csv).pack(side='left')
+        ttk.Button(btn_frame, text="Close", command=dialog.destroy).pack(side='right')
+    
     def new_formula_group(self):
         """Create a new formula group"""
         name = simpledialog.askstring("New Group", "Enter group name:", parent=self.root)
@@ -4337,6 +2874,7 @@ class MetalCalculatorApp:
         
         ref_text = "  ".join([f"{abbrev}={METRIC_LABELS[metric]}" for metric, abbrev in METRIC_ABBREVS.items()])
         ttk.Label(ref_frame, text=ref_text, font=('Consolas', 8), wraplength=550).pack(anchor='w')
+        ttk.Label(ref_frame, text="Any window: Nd + avg/med/hi/lo, e.g. 60davg  90dmed  20dhi", font=('Consolas', 8), foreground='gray').pack(anchor='w')
         ttk.Label(ref_frame, text="Functions: min(a,b)  max(a,b)  iif(condition, true_val, false_val)", font=('Consolas', 8), foreground='gray').pack(anchor='w')
         ttk.Label(ref_frame, text="Compare: < > <= >= == !=    Math: + - * / ( )", font=('Consolas', 8), foreground='gray').pack(anchor='w')
         
@@ -4403,6 +2941,7 @@ class MetalCalculatorApp:
             try:
                 # Create dummy context for validation
                 dummy_context = {abbrev: 1.0 for abbrev in METRIC_ABBREVS.values()}
+                dummy_context.update((name, 1.0) for name in window_metrics_in(expression))
                 result = self.safe_eval(expression, dummy_context)
                 
                 if self.metrics:
@@ -4410,6 +2949,13 @@ class MetalCalculatorApp:
                     real_context = {}
                     for metric, abbrev in METRIC_ABBREVS.items():
                         real_context[abbrev] = self.metrics.get(metric, 0)
+                    for name in window_metrics_in(expression):
+                        if name not in real_context:
+                            value = self.rolling_metrics.latest(name) if self.rolling_metrics else None
+                            if value is None:
+                                preview_var.set(f"✓ Valid expression (not enough price history for {name} yet)")
+                                return
+                            real_context[name] = value
                     
                     real_result = self.safe_eval(expression, real_context)
                     
@@ -4447,6 +2993,7 @@ class MetalCalculatorApp:
             # Validate expression
             try:
                 dummy_context = {abbrev: 1.0 for abbrev in METRIC_ABBREVS.values()}
+                dummy_context.update((name, 1.0) for name in window_metrics_in(expression))
                 self.safe_eval(expression, dummy_context)
             except Exception as e:
                 messagebox.showerror("Invalid Expression", f"The expression has an error:\n{e}")
@@ -4472,6 +3019,7 @@ class MetalCalculatorApp:
             if is_new:
                 self.custom_formulas.append(new_formula)
             else:
+                self.formula_cache.invalidate(self.custom_formulas[index].get('expression', ''))
                 self.custom_formulas[index] = new_formula
             
             self.save_formulas()
@@ -4544,7 +3092,8 @@ class MetalCalculatorApp:
             }
             
             self.inventory.append(item)
-            self.save_inventory()
+            self.valuation.add(item)
+            self.save_inventory_change(self.store.add_item, item)
             
             # Clear inputs
             self.inv_id_entry.delete(0, tk.END)
@@ -4566,7 +3115,8 @@ class MetalCalculatorApp:
         
         if messagebox.askyesno("Confirm Delete", f"Delete item '{self.selected_item_id}'?"):
             self.inventory = [item for item in self.inventory if item['id'] != self.selected_item_id]
-            self.save_inventory()
+            self.valuation.remove(self.selected_item_id)
+            self.save_inventory_change(self.store.delete_item, self.selected_item_id)
             self.selected_item_id = None
             self.refresh_inventory_display()
     
@@ -4698,7 +3248,8 @@ class MetalCalculatorApp:
                 # Update selected item ID tracker
                 self.selected_item_id = new_id
                 
-                self.save_inventory()
+                self.valuation.update(old_id, item)
+                self.save_inventory_change(self.store.update_item, old_id, item)
                 self.refresh_inventory_display()
                 dialog.destroy()
                 messagebox.showinfo("Success", f"Item '{new_id}' updated.")
@@ -4712,33 +3263,23 @@ class MetalCalculatorApp:
         ttk.Button(btn_frame, text="Cancel", command=dialog.destroy).pack(side='left', padx=5)
     
     def fetch_inventory_prices_thread(self):
-        """Start fetching prices for all metals in a separate thread"""
+        """Start fetching prices for all metals on the data loop"""
         self.inv_fetch_btn.config(state='disabled')
         self.inv_status_label.config(text="Fetching prices...")
         
-        thread = threading.Thread(target=self.fetch_inventory_prices, daemon=True)
-        thread.start()
+        self.core.data.submit(self.fetch_inventory_prices(), key='inventory')
     
-    def fetch_inventory_prices(self):
-        """Fetch current prices for all metals"""
+    async def fetch_inventory_prices(self):
+        """Fetch current prices for all metals concurrently, within one overall deadline"""
         try:
-            prices_fetched = 0
             total_metals = len(METALS)
             
-            for metal_name, metal_config in METALS.items():
-                self.root.after(0, lambda m=metal_name: self.inv_status_label.config(text=f"Fetching {m}..."))
-                
-                # Try gold-api.com first
-                price_oz = self.get_current_spot_price(metal_config['symbol'])
-                
-                # Fallback to Yahoo Finance with retry
-                if price_oz is None:
-                    price_oz = self.get_yf_current_price_with_retry(metal_config['yf_ticker'])
-                
-                if price_oz is not None:
-                    # Store price per gram
-                    self.inventory_prices[metal_name] = price_oz / TROY_OUNCE_TO_GRAMS
-                    prices_fetched += 1
+            self.root.after(0, lambda: self.inv_status_label.config(text=f"Fetching {', '.join(METALS)}..."))
+            
+            prices_fetched = await self.core.refresh_spot_prices_async(
+                METALS, deadline=INVENTORY_REFRESH_DEADLINE,
+                on_progress=lambda n, total: self.root.after(0, lambda: self.inv_status_label.config(
+                    text=f"{n}/{total} metals fetched...")))
             
             # Update UI on main thread
             def update_ui():
@@ -4760,225 +3301,122 @@ class MetalCalculatorApp:
                 messagebox.showerror("Fetch Error", f"Error fetching prices:\n{e}")
             self.root.after(0, show_error)
     
-    def get_sorted_inventory(self):
-        """Return sorted and filtered inventory"""
-        # Filter
+    def get_inventory_order(self):
+        """
+        Positions (in self.valuation) of the filtered, sorted inventory. Items
+        are revalued only if a price changed since the last call, and the
+        order is re-sorted only after a price or item change.
+        """
         filter_metal = self.filter_var.get()
-        if filter_metal == 'All Metals':
-            filtered = self.inventory
-        else:
-            filtered = [i for i in self.inventory if i.get('metal') == filter_metal]
-        
-        # Calculate values for sorting
-        items_with_calc = []
-        for item in filtered:
-            profit_pct = 0
-            goal_pct = 0
-            current_value = 0
-            
-            metal = item.get('metal', 'Silver')
-            # Use inventory_prices which has all metals
-            if metal in self.inventory_prices:
-                current_value = item['metal_content'] * self.inventory_prices[metal]
-                profit = current_value - item['purchase_price']
-                profit_pct = (profit / item['purchase_price']) * 100 if item['purchase_price'] > 0 else (100 if current_value > 0 else 0)
-                goal = item.get('profit_goal', 100)
-                goal_pct = (profit_pct / goal) * 100 if goal > 0 else 0
-            
-            items_with_calc.append({
-                'item': item,
-                'profit_pct': profit_pct,
-                'goal_pct': goal_pct,
-                'current_value': current_value
-            })
-        
-        # Sort
-        sort_key = self.sort_var.get()
-        if sort_key == "date_desc":
-            items_with_calc.sort(key=lambda x: x['item'].get('purchase_date', ''), reverse=True)
-        elif sort_key == "date_asc":
-            items_with_calc.sort(key=lambda x: x['item'].get('purchase_date', ''))
-        elif sort_key == "profit_pct_desc":
-            items_with_calc.sort(key=lambda x: x['profit_pct'], reverse=True)
-        elif sort_key == "profit_pct_asc":
-            items_with_calc.sort(key=lambda x: x['profit_pct'])
-        elif sort_key == "goal_pct_desc":
-            items_with_calc.sort(key=lambda x: x['goal_pct'], reverse=True)
-        elif sort_key == "goal_pct_asc":
-            items_with_calc.sort(key=lambda x: x['goal_pct'])
-        elif sort_key == "value_desc":
-            items_with_calc.sort(key=lambda x: x['current_value'], reverse=True)
-        elif sort_key == "value_asc":
-            items_with_calc.sort(key=lambda x: x['current_value'])
-        elif sort_key == "metal_asc":
-            items_with_calc.sort(key=lambda x: x['item'].get('metal', ''))
-        elif sort_key == "metal_desc":
-            items_with_calc.sort(key=lambda x: x['item'].get('metal', ''), reverse=True)
-        elif sort_key == "id_asc":
-            items_with_calc.sort(key=lambda x: x['item']['id'].lower())
-        elif sort_key == "id_desc":
-            items_with_calc.sort(key=lambda x: x['item']['id'].lower(), reverse=True)
-        
-        return [x['item'] for x in items_with_calc]
+        self.valuation.set_prices(self.inventory_prices)
+        return self.valuation.order(self.sort_var.get(), None if filter_metal == 'All Metals' else filter_metal)
     
     def refresh_inventory_display(self):
-        """Refresh the inventory display"""
-        for widget in self.inv_scrollable_frame.winfo_children():
-            widget.destroy()
-        
-        if not self.inventory:
-            ttk.Label(self.inv_scrollable_frame, text="No items in inventory. Add items above.", 
-                     foreground="gray").pack(pady=20)
-            self.inv_summary_var.set("")
-            return
-        
-        sorted_inventory = self.get_sorted_inventory()
-        
-        if not sorted_inventory:
-            ttk.Label(self.inv_scrollable_frame, text="No items match the current filter.", 
-                     foreground="gray").pack(pady=20)
+        """
+        Bring the inventory list up to date. Rows are keyed by item id: only
+        rows whose text changed are rewritten, new items are inserted, removed
+        ones deleted, and the order is applied with one set_children call.
+        """
+        tree = self.inv_tree
+        order = self.get_inventory_order()
+        
+        rows = {}
+        for i in order:
+            item = self.valuation.items[i]
+            values, tag = self.inventory_row_values(i)
+            rows[str(item['id'])] = (item['id'], values, tag)
+        
+        stale = [iid for iid in self.inv_rows if iid not in rows]
+        if stale:
+            tree.delete(*stale)
+        for iid, row in rows.items():
+            if iid not in self.inv_rows:
+                tree.insert('', 'end', iid=iid, text=str(row[0]), values=row[1], tags=(row[2],))
+            elif self.inv_rows[iid] != row:
+                tree.item(iid, values=row[1], tags=(row[2],))
+        iids = list(rows)
+        if list(tree.get_children()) != iids:
+            tree.set_children('', *iids)
+        self.inv_rows = rows
+        
+        # Keep the selection on the same item (it may have been renamed or filtered out)
+        selected = str(self.selected_item_id) if self.selected_item_id is not None else None
+        if selected in rows:
+            if tree.selection() != (selected,):
+                tree.selection_set(selected)
+                tree.see(selected)
+        elif tree.selection():
+            tree.selection_remove(*tree.selection())
+        
+        if not order:
+            self.inv_empty_label.config(text="No items match the current filter." if self.inventory
+                                        else "No items in inventory. Add items above.")
+            self.inv_empty_label.place(relx=0.5, y=40, anchor='n')
             self.inv_summary_var.set("")
             return
+        self.inv_empty_label.place_forget()
         
-        total_invested = 0
-        total_current_value = 0
-        
-        for i, item in enumerate(sorted_inventory):
-            self.create_inventory_item_widget(item, i)
-            total_invested += item['purchase_price']
-            
-            metal = item.get('metal', 'Silver')
-            # Use inventory_prices which has all metals
-            if metal in self.inventory_prices:
-                total_current_value += item['metal_content'] * self.inventory_prices[metal]
+        # Running totals of the valuation - no pass over the items
+        filter_metal = self.filter_var.get()
+        count, total_invested, total_current_value = self.valuation.totals(
+            None if filter_metal == 'All Metals' else filter_metal)
         
         # Update summary
-        if self.inventory_prices and total_current_value > 0:
+        if total_current_value > 0:
             total_profit = total_current_value - total_invested
             total_profit_pct = (total_profit / total_invested * 100) if total_invested > 0 else 0
             self.inv_summary_var.set(
-                f"Showing: {len(sorted_inventory)} items | "
+                f"Showing: {count} items | "
                 f"Invested: ${total_invested:.2f} | "
                 f"Value: ${total_current_value:.2f} | "
                 f"Profit: ${total_profit:+.2f} ({total_profit_pct:+.1f}%)"
             )
         else:
-            self.inv_summary_var.set(f"Showing: {len(sorted_inventory)} items | Invested: ${total_invested:.2f} | Click 'Fetch All Metal Prices' for values")
-    
-    def create_inventory_item_widget(self, item, index):
-        """Create widget for inventory item"""
-        item_frame = ttk.Frame(self.inv_scrollable_frame, relief='solid', borderwidth=1)
-        item_frame.pack(fill='x', pady=2, padx=2)
-        
-        def select_item(event=None):
-            self.selected_item_id = item['id']
-            self.refresh_inventory_display()
-        
-        item_frame.bind('<Button-1>', select_item)
-        
-        if self.selected_item_id == item['id']:
-            item_frame.configure(relief='sunken')
-        
-        # Top row
-        top_row = ttk.Frame(item_frame)
-        top_row.pack(fill='x', padx=5, pady=(5, 2))
-        top_row.bind('<Button-1>', select_item)
-        
+            self.inv_summary_var.set(f"Showing: {count} items | Invested: ${total_invested:.2f} | Click 'Fetch All Metal Prices' for values")
+    
+    def on_inventory_select(self, event=None):
+        """Remember the clicked item for Edit/Delete (no redraw needed - the Treeview highlights it)"""
+        selection = self.inv_tree.selection()
+        if selection and selection[0] in self.inv_rows:
+            self.selected_item_id = self.inv_rows[selection[0]][0]
+    
+    def inventory_row_values(self, i):
+        """Column values and colour tag of the row of item i (a position in self.valuation)"""
+        valuation = self.valuation
+        item = valuation.items[i]
         metal = item.get('metal', 'Silver')
-        metal_color = METALS.get(metal, {}).get('color', '#000000')
-        
-        id_label = ttk.Label(top_row, text=f"[{metal}] {item['id']}", font=('Segoe UI', 10, 'bold'))
-        id_label.pack(side='left')
-        id_label.bind('<Button-1>', select_item)
-        
-        if item.get('description'):
-            desc_label = ttk.Label(top_row, text=f" - {item['description']}", foreground="gray")
-            desc_label.pack(side='left')
-            desc_label.bind('<Button-1>', select_item)
-        
-        date_label = ttk.Label(top_row, text=f"Purchased: {item.get('purchase_date', 'N/A')}", foreground="gray", font=('Segoe UI', 8))
-        date_label.pack(side='right')
-        date_label.bind('<Button-1>', select_item)
-        
-        # Middle row
-        mid_row = ttk.Frame(item_frame)
-        mid_row.pack(fill='x', padx=5, pady=2)
-        mid_row.bind('<Button-1>', select_item)
-        
-        weight_label = ttk.Label(mid_row, text=f"Weight: {item['weight']:.2f} {item.get('weight_unit', 'g')} @ {item['purity']}% = {item['metal_content']:.2f}g pure")
-        weight_label.pack(side='left')
-        weight_label.bind('<Button-1>', select_item)
-        
+        weight_text = f"{item['weight']:.2f} {item.get('weight_unit', 'g')} @ {item['purity']}%"
         if item['purchase_price'] > 0:
-            price_text = f"Paid: ${item['purchase_price']:.2f} (${item['cost_per_gram']:.4f}/g)"
+            paid_text = f"${item['purchase_price']:.2f} (${item['cost_per_gram']:.4f}/g)"
         else:
-            price_text = "Paid: $0.00 (FREE/Gift)"
-        price_label = ttk.Label(mid_row, text=price_text)
-        price_label.pack(side='left', padx=(20, 0))
-        price_label.bind('<Button-1>', select_item)
-        
-        # Bottom row
-        bottom_row = ttk.Frame(item_frame)
-        bottom_row.pack(fill='x', padx=5, pady=(2, 5))
-        bottom_row.bind('<Button-1>', select_item)
-        
-        # Use inventory_prices which has all metals
-        if metal in self.inventory_prices:
-            current_value = item['metal_content'] * self.inventory_prices[metal]
+            paid_text = "$0.00 (FREE/Gift)"
+        
+        if valuation.priced[i]:
+            current_value = valuation.value[i]
             profit = current_value - item['purchase_price']
-            # Handle $0 purchase price (gift/found items)
             if item['purchase_price'] > 0:
-                profit_pct = (profit / item['purchase_price']) * 100
-            else:
-                profit_pct = 100 if current_value > 0 else 0  # 100% profit on free items
-            
-            value_label = ttk.Label(bottom_row, text=f"Value: ${current_value:.2f}")
-            value_label.pack(side='left')
-            value_label.bind('<Button-1>', select_item)
-            
-            profit_color = "green" if profit >= 0 else "red"
-            if item['purchase_price'] == 0:
-                profit_text = f"Profit: ${profit:+.2f} (FREE ITEM)"
+                profit_text = f"${profit:+.2f} ({valuation.profit_pct[i]:+.1f}%)"
             else:
-                profit_text = f"Profit: ${profit:+.2f} ({profit_pct:+.1f}%)"
-            profit_label = ttk.Label(bottom_row, text=profit_text, 
-                                    foreground=profit_color, font=('Segoe UI', 9, 'bold'))
-            profit_label.pack(side='left', padx=(15, 0))
-            profit_label.bind('<Button-1>', select_item)
-            
-            # Progress bar
-            progress_frame = ttk.Frame(bottom_row)
-            progress_frame.pack(side='right', padx=(10, 0))
-            progress_frame.bind('<Button-1>', select_item)
+                profit_text = f"${profit:+.2f} (FREE ITEM)"
+            value_text = f"${current_value:.2f}"
             
             goal_pct = item.get('profit_goal', 100)
-            progress_value = min(100, max(0, (profit_pct / goal_pct) * 100)) if goal_pct > 0 else 0
-            
+            progress_value = min(100, max(0, valuation.goal_pct[i]))
             if progress_value >= 100:
-                bar_style = "green.Horizontal.TProgressbar"
                 goal_text = "🎯 GOAL REACHED!"
-            elif progress_value >= 75:
-                bar_style = "yellow.Horizontal.TProgressbar"
-                goal_text = f"{progress_value:.0f}% to {goal_pct}% goal"
-            elif progress_value >= 50:
-                bar_style = "orange.Horizontal.TProgressbar"
-                goal_text = f"{progress_value:.0f}% to {goal_pct}% goal"
+                tag = 'goal'
             else:
-                bar_style = "red.Horizontal.TProgressbar"
-                goal_text = f"{progress_value:.0f}% to {goal_pct}% goal"
-            
-            goal_label = ttk.Label(progress_frame, text=goal_text, font=('Segoe UI', 8))
-            goal_label.pack(side='top')
-            goal_label.bind('<Button-1>', select_item)
-            
-            progress_bar = ttk.Progressbar(progress_frame, length=120, mode='determinate', 
-                                          value=progress_value, style=bar_style)
-            progress_bar.pack(side='top')
+                filled = int(progress_value // 20)
+                goal_text = f"{'▰' * filled}{'▱' * (5 - filled)} {progress_value:.0f}% of {goal_pct}%"
+                tag = 'profit' if profit >= 0 else 'loss'
         else:
-            note = f"Click 'Fetch All Metal Prices' to see {metal} value"
-            no_price_label = ttk.Label(bottom_row, text=note, foreground="gray", font=('Segoe UI', 8, 'italic'))
-            no_price_label.pack(side='left')
-            no_price_label.bind('<Button-1>', select_item)
+            value_text = profit_text = "--"
+            goal_text = "Fetch prices for value"
+            tag = 'unpriced'
+        
+        values = (metal, item.get('description', ''), weight_text, f"{item['metal_content']:.2f}",
+                  paid_text, value_text, profit_text, goal_text, item.get('purchase_date', 'N/A'))
+        return values, tag
     
     def export_inventory_csv(self):
         """Export inventory to CSV"""
@@ -5038,6 +3476,7 @@ class MetalCalculatorApp:
                 writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
                 writer.writeheader()
                 
+                prices = self.inventory_prices
                 for item in self.inventory:
                     current_value = ''
                     profit = ''
@@ -5046,8 +3485,8 @@ class MetalCalculatorApp:
                     
                     metal = item.get('metal', 'Silver')
                     # Use inventory_prices which has all metals
-                    if metal in self.inventory_prices:
-                        current_value = item['metal_content'] * self.inventory_prices[metal]
+                    if metal in prices:
+                        current_value = item['metal_content'] * prices[metal]
                         profit = current_value - item['purchase_price']
                         if item['purchase_price'] > 0:
                             profit_pct = (profit / item['purchase_price']) * 100
@@ -5101,6 +3540,17 @@ class MetalCalculatorApp:
         except:
             self.settings['custom_tax_rate'] = 0.0
         
+        try:
+            self.settings['http_pool_size'] = max(1, int(self.http_pool_size_var.get()))
+        except:
+            self.settings['http_pool_size'] = HTTP_POOL_SIZE
+        
+        try:
+            self.settings['spot_cache_ttl'] = max(0, int(self.spot_cache_ttl_var.get()))
+        except:
+            self.settings['spot_cache_ttl'] = SPOT_CACHE_TTL
+        self.spot_prices.ttl = self.settings['spot_cache_ttl']
+        
         self.save_settings()
         self.update_tax_display()
         self.refresh_calculated_prices_display()
@@ -5120,6 +3570,7 @@ class MetalCalculatorApp:
         """Reset formulas to default"""
         if messagebox.askyesno("Confirm Reset", "Reset all formulas to default? This cannot be undone."):
             self.custom_formulas = []
+            self.save_formulas()
             self.load_formulas()  # Will create defaults
             self.refresh_formula_list()
             self.refresh_calculated_prices_display()
@@ -5141,4 +3592,5 @@ def main():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # batch back test workers in the frozen .exe
     main()
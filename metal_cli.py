@@ -0,0 +1,323 @@
+"""
+Command line for the Metal Price Calculator - no window, no tkinter.
+
+Runs the calculator's workflows against the same app data folder (database,
+settings and price history cache) as the desktop app, so it can be started
+from cron or a systemd timer on a machine without a display:
+
+    python metal_cli.py fetch                      spot prices of every metal
+    python metal_cli.py predict Silver --save      7-day prediction (saved to the history)
+    python metal_cli.py grade                      grade matured predictions
+    python metal_cli.py backtest Gold Silver -o bt.csv
+    python metal_cli.py value-inventory --sort value_desc
+    python metal_cli.py daemon --interval 3600     predict + grade in a loop
+    python metal_cli.py serve --port 8765          local JSON pricing service (price_service)
+
+--json prints machine-readable output instead of text. The secondary of a
+prediction or back test defaults to the suggested pairing of the primary.
+An interrupted back test (Ctrl+C) keeps a checkpoint of the days it has
+done; running it again resumes from there (--fresh starts over).
+Exit status is 0 on success and 1 on any failure.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+from app_config import METALS, PREDICTION_SECONDARIES, SUGGESTED_PAIRINGS, TROY_OUNCE_TO_GRAMS
+from app_core import AppCore, matured_predictions
+from backtest import run_pairing, BacktestCsvWriter, BacktestSummary
+from price_service import (PriceService, SERVICE_HOST, SERVICE_PORT, SERVICE_REFRESH_INTERVAL,
+                           PREDICTION_REFRESH_INTERVAL)
+
+SORT_KEYS = ['date_desc', 'date_asc', 'metal_asc', 'metal_desc', 'id_asc', 'id_desc',
+             'profit_pct_desc', 'profit_pct_asc', 'goal_pct_desc', 'goal_pct_asc', 'value_desc', 'value_asc']
+
+
+def emit(args, data, text):
+    """Print data as JSON with --json, otherwise the text lines"""
+    if args.json:
+        print(json.dumps(data, indent=2, default=str), file=args.out)
+    else:
+        for line in text:
+            print(line, file=args.out)
+
+
+def secondary_for(primary, secondary):
+    """The given secondary, or the suggested pairing for the primary"""
+    secondary = secondary or SUGGESTED_PAIRINGS[primary]
+    if secondary == primary:
+        raise ValueError("Please select two different items for ratio comparison.")
+    return secondary
+
+
+def progress(args):
+    """Progress callback writing to stderr (silent with --quiet)"""
+    if args.quiet:
+        return None
+    return lambda message: print(message, file=sys.stderr)
+
+
+# =============================================================================
+# COMMANDS
+# =============================================================================
+
+def cmd_fetch(core, args):
+    """Refresh and print the spot price of every metal"""
+    fetched = core.refresh_spot_prices()
+    prices = core.spot_prices.snapshot()
+    data = {metal: {'per_oz': prices.get(metal),
+                    'per_gram': prices[metal] / TROY_OUNCE_TO_GRAMS if metal in prices else None}
+            for metal in METALS}
+    text = [f"{metal:<10} ${p['per_oz']:,.2f}/oz  ${p['per_gram']:,.4f}/g" if p['per_oz'] is not None
+            else f"{metal:<10} unavailable" for metal, p in data.items()]
+    emit(args, data, text)
+    return 0 if fetched else 1
+
+
+def run_prediction(core, primary, secondary, save, on_progress=None):
+    """Analyze one pairing (and save it); the analysis dict plus the saved record or None"""
+    data = core.fetch_prediction_data(primary, secondary, on_progress=on_progress)
+    analysis = core.analyze_prediction(data, primary, secondary)
+    if analysis is None or analysis['result'] is None:
+        raise Exception(f"Could not calculate a prediction for {primary} / {secondary}.")
+    record = None
+    if save:
+        record = core.prediction_record(analysis['result'], len(core.store.predictions()))
+        core.store.add_prediction(record)
+    return analysis, record
+
+
+def cmd_predict(core, args):
+    """Predict one pairing 7 days ahead"""
+    secondary = secondary_for(args.primary, args.secondary)
+    analysis, record = run_prediction(core, args.primary, secondary, args.save, progress(args))
+    result = analysis['result']
+
+    data = dict(result, saved_id=record['id'] if record else None,
+                target_date=record['target_date'] if record else None)
+    text = [
+        f"{args.primary} vs {secondary}",
+        f"  Current:    ${result['current_price'] * TROY_OUNCE_TO_GRAMS:,.2f}/oz",
+        f"  Predicted:  ${result['predicted_price'] * TROY_OUNCE_TO_GRAMS:,.2f}/oz "
+        f"({result['predicted_change_pct']:+.2f}%)",
+    ]
+    if result['range_low'] is not None:
+        text.append(f"  Range:      ${result['range_low'] * TROY_OUNCE_TO_GRAMS:,.2f} - "
+                    f"${result['range_high'] * TROY_OUNCE_TO_GRAMS:,.2f}/oz")
+    text.append(f"  Confidence: {result['confidence']:.0f}%  Regime: {result['regime']}")
+    if record:
+        text.append(f"  Saved as {record['id']} (target {record['target_date'][:10]})")
+    emit(args, data, text)
+    return 0
+
+
+def cmd_grade(core, args):
+    """Grade every matured, ungraded prediction"""
+    ungraded = matured_predictions(core.store.predictions())
+    graded, failed = core.grade_predictions(ungraded) if ungraded else (0, 0)
+    emit(args, {'matured': len(ungraded), 'graded': graded, 'failed': failed},
+         [f"Graded {graded} of {len(ungraded)} matured predictions ({failed} failed)"])
+    return 1 if failed else 0
+
+
+def cmd_backtest(core, args):
+    """Back test one pairing over the last year, optionally exporting the rows to CSV"""
+    secondary = secondary_for(args.primary, args.secondary)
+    on_progress = progress(args)
+    fetched = core.fetch_histories(core.backtest_sources([(args.primary, secondary)]), period="18mo",
+                                   timeout=60, max_retries=3, on_progress=on_progress, status_prefix="Back test: ")
+    full_data, primary_dates = core.backtest_data(fetched, args.primary, secondary)
+
+    # Interrupted runs leave a checkpoint behind; the next run of the same pairing resumes it
+    checkpoint = core.backtest_checkpoint(args.primary, secondary)
+    if args.fresh:
+        checkpoint.clear()
+
+    day_progress = None
+    if on_progress is not None:
+        day_progress = lambda progress: on_progress(f"Back test: {progress}")
+    # Rows stream to the output file as they are produced (or only into the running summary)
+    if args.output:
+        with BacktestCsvWriter(args.output) as writer:
+            run_pairing(full_data, primary_dates, args.primary, secondary, core.prediction_engine,
+                        on_progress=day_progress, checkpoint=checkpoint, sink=writer)
+        summary = writer.summary.as_dict()
+    else:
+        running = BacktestSummary()
+        run_pairing(full_data, primary_dates, args.primary, secondary, core.prediction_engine,
+                    on_progress=day_progress, checkpoint=checkpoint, sink=running)
+        summary = running.as_dict()
+    if not summary['predictions']:
+        raise Exception("No predictions could be generated. Insufficient data.")
+
+    grades = ", ".join(f"{g}: {c}" for g, c in sorted(summary['grade_counts'].items()))
+    text = [
+        f"{args.primary} vs {secondary}: {summary['first_date']} to {summary['last_date']}",
+        f"  Predictions:        {summary['predictions']}",
+        f"  Direction accuracy: {summary['direction_accuracy_pct']:.1f}%",
+        f"  Avg error:          {summary['avg_abs_error_pct']:.2f}%",
+        f"  In range:           {summary['in_range_pct']:.1f}% ({summary['in_range']}/{summary['in_range_total']})",
+        f"  Grades:             {grades}",
+    ]
+    if args.output:
+        text.append(f"  Results saved to {args.output}")
+    emit(args, dict(summary, primary_metal=args.primary, secondary_asset=secondary, output=args.output), text)
+    return 0
+
+
+def cmd_value_inventory(core, args):
+    """Value the stored inventory at current spot prices"""
+    core.refresh_spot_prices()
+    valuation = core.inventory_valuation()
+    rows = []
+    for i in valuation.order(args.sort, args.metal):
+        item = valuation.items[i]
+        priced = bool(valuation.priced[i])
+        rows.append({
+            'id': item['id'],
+            'metal': item.get('metal', 'Silver'),
+            'metal_content': item['metal_content'],
+            'purchase_price': item['purchase_price'],
+            'value': valuation.value[i] if priced else None,
+            'profit_pct': valuation.profit_pct[i] if priced else None,
+            'goal_pct': valuation.goal_pct[i] if priced else None,
+        })
+    count, invested, value = valuation.totals(args.metal)
+
+    text = []
+    for row in rows:
+        if row['value'] is None:
+            text.append(f"{row['id']:<20} {row['metal']:<9} {row['metal_content']:>10.3f}g  no price")
+        else:
+            text.append(f"{row['id']:<20} {row['metal']:<9} {row['metal_content']:>10.3f}g  "
+                        f"${row['value']:>11,.2f}  {row['profit_pct']:+7.1f}%")
+    text.append(f"{count} items  invested ${invested:,.2f}  value ${value:,.2f}  "
+                f"profit ${value - invested:+,.2f}")
+    emit(args, {'items': rows, 'count': count, 'invested': invested, 'value': value}, text)
+    return 0
+
+
+def cmd_daemon(core, args):
+    """Save a prediction for each pairing and grade matured ones, every --interval seconds"""
+    pairs = []
+    for pair in args.pair or [f"{metal}/{secondary}" for metal, secondary in SUGGESTED_PAIRINGS.items()]:
+        primary, _, secondary = pair.partition('/')
+        if primary not in METALS or (secondary and secondary not in PREDICTION_SECONDARIES):
+            raise ValueError(f"Unknown pairing: {pair}")
+        pairs.append((primary, secondary_for(primary, secondary)))
+
+    def log(message):
+        print(f"{stamp} {message}", file=args.out, flush=True)
+
+    while True:
+        stamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        for primary, secondary in pairs:
+            try:
+                _, record = run_prediction(core, primary, secondary, save=True)
+                log(f"saved {primary}/{secondary} prediction {record['id']}")
+            except Exception as e:
+                log(f"{primary}/{secondary} prediction failed: {e}")
+        try:
+            ungraded = matured_predictions(core.store.predictions())
+            if ungraded:
+                graded, failed = core.grade_predictions(ungraded)
+                log(f"graded {graded} predictions ({failed} failed)")
+        except Exception as e:
+            log(f"grading failed: {e}")
+        if args.once:
+            return 0
+        time.sleep(args.interval)
+
+
+def cmd_serve(core, args):
+    """Serve prices, formula prices and predictions over local HTTP until interrupted"""
+    service = PriceService(core, refresh_interval=args.interval, prediction_interval=args.prediction_interval,
+                           predictions=not args.no_predictions)
+
+    def ready(server):
+        host, port = server.sockets[0].getsockname()[:2]
+        print(f"Serving on http://{host}:{port}/ (refresh every {args.interval}s)", file=args.out, flush=True)
+
+    asyncio.run(service.serve(args.host, args.port, ready=ready))
+    return 0
+
+
+# =============================================================================
+# MAIN ENTRY POINT
+# =============================================================================
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='metal_cli', description="Metal Price Calculator without the GUI")
+    parser.add_argument('--data-dir', help="app data folder (default: the desktop app's)")
+    parser.add_argument('--json', action='store_true', help="print JSON instead of text")
+    parser.add_argument('-q', '--quiet', action='store_true', help="no progress messages on stderr")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    fetch = commands.add_parser('fetch', help="current spot prices")
+    fetch.set_defaults(run=cmd_fetch)
+
+    predict = commands.add_parser('predict', help="7-day price prediction for one pairing")
+    predict.add_argument('primary', choices=list(METALS))
+    predict.add_argument('secondary', nargs='?', choices=list(PREDICTION_SECONDARIES))
+    predict.add_argument('--save', action='store_true', help="save it to the prediction history")
+    predict.set_defaults(run=cmd_predict)
+
+    grade = commands.add_parser('grade', help="grade matured predictions")
+    grade.set_defaults(run=cmd_grade)
+
+    backtest = commands.add_parser('backtest', help="365-day back test of one pairing")
+    backtest.add_argument('primary', choices=list(METALS))
+    backtest.add_argument('secondary', nargs='?', choices=list(PREDICTION_SECONDARIES))
+    backtest.add_argument('-o', '--output', help="stream the result rows to this CSV file (.gz, .bz2, .xz: compressed)")
+    backtest.add_argument('--fresh', action='store_true', help="ignore a saved checkpoint and start over")
+    backtest.set_defaults(run=cmd_backtest)
+
+    value = commands.add_parser('value-inventory', help="value the inventory at spot prices")
+    value.add_argument('--metal', choices=list(METALS), help="only items of this metal")
+    value.add_argument('--sort', choices=SORT_KEYS, default='date_desc')
+    value.set_defaults(run=cmd_value_inventory)
+
+    daemon = commands.add_parser('daemon', help="save predictions and grade them on a timer")
+    daemon.add_argument('--interval', type=int, default=24 * 3600, help="seconds between runs (default: a day)")
+    daemon.add_argument('--pair', action='append', metavar='PRIMARY[/SECONDARY]',
+                        help="pairing to predict (repeatable; default: the suggested pairings)")
+    daemon.add_argument('--once', action='store_true', help="run once and exit")
+    daemon.set_defaults(run=cmd_daemon)
+
+    serve = commands.add_parser('serve', help="local HTTP pricing service (JSON)")
+    serve.add_argument('--host', default=SERVICE_HOST)
+    serve.add_argument('--port', type=int, default=SERVICE_PORT)
+    serve.add_argument('--interval', type=int, default=SERVICE_REFRESH_INTERVAL,
+                       help="seconds between price refreshes")
+    serve.add_argument('--prediction-interval', type=int, default=PREDICTION_REFRESH_INTERVAL,
+                       help="seconds between prediction refreshes")
+    serve.add_argument('--no-predictions', action='store_true', help="serve prices and formulas only")
+    serve.set_defaults(run=cmd_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    # Results go to stdout; the engine's own diagnostics (print) go to stderr so --json stays parseable
+    args.out = sys.stdout
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            if args.data_dir:
+                os.makedirs(args.data_dir, exist_ok=True)
+            core = AppCore(args.data_dir)
+            return args.run(core, args)
+    except KeyboardInterrupt:
+        return 1
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,184 @@
+"""
+Parameter sweep for the Metal Price Calculator's v4 prediction constants.
+
+Scores many PredictionParams candidates on one pairing's back test. The
+work that does not depend on the parameters is done once per process: the
+timeline (indicator series, pair statistics), each day's MarketSnapshot
+and the actual price 7 bars later. Each candidate then only re-runs the
+prediction itself. Candidates are split into chunks over a process pool,
+one worker per core, and each worker builds the shared state once in its
+initializer.
+
+Candidates come from a grid (every combination in SWEEP_SPACE) or from a
+random search over the same ranges. Each result has the candidate's
+direction accuracy, mean absolute error and in-range %, and best()
+ranks them by any of those.
+"""
+
+import concurrent.futures
+import csv
+import itertools
+import os
+import random
+
+from prediction_engine import PredictionEngine, DEFAULT_PARAMS, PREDICTION_PARAM_NAMES, CORRELATION_FAST_DAYS
+from backtest import BacktestTimeline, backtest_window, grade_outcome, BACKTEST_HORIZON
+
+# Default search space: parameter -> values tried by the grid (the random search samples between min and max)
+SWEEP_SPACE = {
+    'clamp_normal': (0.06, 0.08, 0.10, 0.12, 0.15),
+    'bear_beta_shrink': (0.5, 0.6, 0.7, 0.85, 1.0),
+    'ratio_base_multiplier_factor': (0.05, 0.10, 0.15, 0.20, 0.30),
+    'crash_triggers_needed': (2, 3, 4),
+    'correlation_regime_divergence': (0.2, 0.3, 0.4, 0.5),
+}
+
+SWEEP_CHUNK_SIZE = 25  # candidates per task handed to a worker
+
+# Metrics best() can rank by: name -> True if higher is better
+SWEEP_METRICS = {
+    'direction_accuracy_pct': True,
+    'avg_abs_error_pct': False,
+    'in_range_pct': True,
+}
+
+
+def grid_candidates(space=None, base=DEFAULT_PARAMS):
+    """Every combination of the values in space, applied on top of base"""
+    space = space or SWEEP_SPACE
+    names = list(space)
+    for values in itertools.product(*(space[name] for name in names)):
+        yield base._replace(**dict(zip(names, values)))
+
+
+def random_candidates(count, space=None, base=DEFAULT_PARAMS, seed=None):
+    """count candidates sampled uniformly between each parameter's min and max in space"""
+    space = space or SWEEP_SPACE
+    rng = random.Random(seed)
+    for _ in range(count):
+        changes = {}
+        for name, values in space.items():
+            low, high = min(values), max(values)
+            if all(isinstance(v, int) for v in values):
+                changes[name] = rng.randint(low, high)
+            else:
+                changes[name] = round(rng.uniform(low, high), 4)
+        yield base._replace(**changes)
+
+
+class SweepDays:
+    """The parameter-independent part of one pairing's back test, built once and shared by every candidate."""
+
+    def __init__(self, full_data, primary_metal, secondary_name):
+        self.primary_metal = primary_metal
+        self.secondary_name = secondary_name
+        primary_closes_all = full_data[primary_metal]['closes']
+        start, end = backtest_window(len(primary_closes_all))
+        timeline = BacktestTimeline(full_data, pair=(primary_metal, secondary_name), fast_period=CORRELATION_FAST_DAYS)
+
+        # (snapshot, current price, actual price, ATR) per simulated day
+        self.days = []
+        for day_idx, snapshot in timeline.days(start, end):
+            self.days.append((
+                snapshot,
+                snapshot[primary_metal]['closes'][-1],
+                primary_closes_all[day_idx + BACKTEST_HORIZON],
+                snapshot[primary_metal]['indicators'].atr(),
+            ))
+
+    def score(self, params):
+        """Back test metrics for one candidate"""
+        engine = PredictionEngine(params)
+        total = direction_correct = in_range = in_range_total = 0
+        abs_error_sum = 0.0
+
+        for snapshot, current_price, actual_price, atr_val in self.days:
+            prediction = engine.calculate_prediction(snapshot, self.primary_metal, self.secondary_name)
+            if prediction is None:
+                continue
+            outcome = grade_outcome(current_price, prediction['predicted_price'], actual_price, atr_val)
+            total += 1
+            abs_error_sum += outcome['abs_error_pct']
+            direction_correct += outcome['direction_correct']
+            if outcome['in_range'] is not None:
+                in_range_total += 1
+                in_range += outcome['in_range']
+
+        return {
+            'params': params,
+            'predictions': total,
+            'direction_accuracy_pct': direction_correct / total * 100 if total else 0,
+            'avg_abs_error_pct': abs_error_sum / total if total else 0,
+            'in_range_pct': in_range / in_range_total * 100 if in_range_total else 0,
+        }
+
+
+# Per-process shared state for the pool workers
+_worker_days = None
+
+
+def _init_worker(full_data, primary_metal, secondary_name):
+    global _worker_days
+    _worker_days = SweepDays(full_data, primary_metal, secondary_name)
+
+
+def _score_chunk(candidates):
+    return [_worker_days.score(params) for params in candidates]
+
+
+def run_sweep(full_data, primary_metal, secondary_name, candidates, max_workers=None, on_progress=None):
+    """
+    Score every candidate on one pairing. Returns one result dict per
+    candidate (see SweepDays.score), in candidate order.
+    on_progress(done, total) is called as chunks finish.
+    """
+    candidates = list(candidates)
+    if not candidates:
+        return []
+    chunks = [candidates[i:i + SWEEP_CHUNK_SIZE] for i in range(0, len(candidates), SWEEP_CHUNK_SIZE)]
+    max_workers = max(1, min(len(chunks), max_workers or os.cpu_count() or 1))
+
+    if max_workers == 1:
+        # Not worth a pool - score in this process
+        days = SweepDays(full_data, primary_metal, secondary_name)
+        results = []
+        for chunk in chunks:
+            results.extend(days.score(params) for params in chunk)
+            if on_progress is not None:
+                on_progress(len(results), len(candidates))
+        return results
+
+    scored = {}
+    done = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                                initargs=(full_data, primary_metal, secondary_name)) as pool:
+        futures = {pool.submit(_score_chunk, chunk): index for index, chunk in enumerate(chunks)}
+        for future in concurrent.futures.as_completed(futures):
+            scored[futures[future]] = future.result()
+            done += len(chunks[futures[future]])
+            if on_progress is not None:
+                on_progress(done, len(candidates))
+
+    return [result for index in range(len(chunks)) for result in scored[index]]
+
+
+def best(results, metric='direction_accuracy_pct', count=10):
+    """The top 'count' results by one of SWEEP_METRICS (ties broken by the other two)"""
+    def key(result):
+        return tuple(result[name] if higher else -result[name]
+                     for name, higher in sorted(SWEEP_METRICS.items(), key=lambda item: item[0] != metric))
+    return sorted((r for r in results if r['predictions']), key=key, reverse=True)[:count]
+
+
+def export_sweep_csv(filepath, results):
+    """One row per candidate: its parameters followed by its metrics"""
+    fieldnames = list(PREDICTION_PARAM_NAMES) + ['predictions'] + list(SWEEP_METRICS)
+    with open(filepath, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for result in results:
+            row = result['params']._asdict()
+            row['predictions'] = result['predictions']
+            for name in SWEEP_METRICS:
+                row[name] = round(result[name], 4)
+            writer.writerow(row)
@@ -0,0 +1,1033 @@
+"""
+Prediction engine for the Metal Price Calculator.
+
+PredictionEngine is the v4 regime-aware prediction and its confidence score,
+free of any Tk state. It reads everything from a MarketSnapshot - an
+immutable copy of the prediction data (closes/highs/lows per series plus
+indicator state) taken at one point in time - so the GUI, the back test and
+any number of worker threads or processes can run predictions side by side,
+and the engine can be benchmarked without a display.
+
+The scalar indicator functions below are the reference definitions that
+indicators.SeriesIndicators and vector_indicators are checked against; the
+engine itself only falls back to them when NumPy is unavailable.
+"""
+
+import math
+from collections import namedtuple
+from collections.abc import Mapping
+from datetime import datetime
+
+from indicators import SeriesIndicators, IndicatorView
+import vector_indicators
+
+# Square root of 7 for weekly volatility scaling
+SQRT_7 = 2.6457513110645907  # math.sqrt(7)
+
+# Prediction v4: Regime and clamp constants
+REGIME_MA_DAYS = 20
+CORRELATION_FAST_DAYS = 10
+CORRELATION_REGIME_DIVERGENCE = 0.3   # fast vs slow correlation diff = regime change
+
+# Clamp levels
+CLAMP_NORMAL = 0.10      # ±10% normal volatility
+CLAMP_ELEVATED = 0.15    # ±15% elevated vol
+CLAMP_CRISIS = 0.25      # ±25% crisis / regime change
+CLAMP_RECOVERY = 0.15    # ±15% recovery
+CLAMP_CRASH_SIGMA = 3.0  # dynamic σ-based (3σ max) for crash
+
+VOLATILITY_ELEVATED_PCT = 4.0   # ATR/price % threshold for elevated clamp
+VOLATILITY_CRISIS_PCT = 8.0     # ATR/price % for crisis clamp
+
+# Beta adjustments
+BEAR_BETA_SHRINK = 0.7          # bear beta 0.7x
+REGIME_BETA_SHRINK = 0.7        # shrink beta when regime change (reduce amplification)
+
+# Crash detection thresholds (3/5 triggers needed)
+CRASH_VIX_THRESHOLD = 25.0
+CRASH_GSR_THRESHOLD = 85.0
+CRASH_ATR_PCT_THRESHOLD = 5.0
+CRASH_CONSECUTIVE_DAYS = 3       # 3+ days with >2% moves
+CRASH_CONSECUTIVE_MOVE = 0.02    # 2% daily move threshold
+CRASH_DXY_RISE = 0.01           # DXY +1% (5-day)
+CRASH_METAL_DROP = -0.02        # Metal -2% (5-day)
+CRASH_TRIGGERS_NEEDED = 3       # 3 out of 5 triggers
+CRASH_REVERSION_FACTOR = 0.30   # 30% towards 50d MA
+CRASH_REVERSION_MA = 50         # revert towards 50d MA
+
+# Recovery constants
+RECOVERY_BUFFER_DAYS = 10       # 10 day buffer after crash
+RECOVERY_REVERSION_FACTOR = 0.20  # 20% towards 20d MA
+RECOVERY_REVERSION_MA = 20      # revert towards 20d MA
+
+# Ratio pressure
+RATIO_BASE_MULTIPLIER_FACTOR = 0.15  # |ρ| × 0.15
+RATIO_SIDEWAYS_BOOST = 2.0
+BEARISH_MOMENTUM_CUT_RATIO = 0.0  # zero ratio pressure when primary 14d momentum negative
+
+CONFIDENCE_CAP_REGIME_CHANGE = 50   # cap confidence % when regime change detected
+
+# Confidence weights (8-factor, total = 100%)
+CONF_W_CORRELATION = 40        # Correlation (60d) 40%
+CONF_W_DXY = 7                 # DXY health 7% (4% for copper)
+CONF_W_DXY_COPPER = 4          # Copper DXY weight
+CONF_W_REGIME_FIT = 10         # Regime fit 10%
+CONF_W_RSI = 10                # RSI range 10%
+CONF_W_VOLATILITY = 5          # Volatility 5%
+CONF_W_RATIO = 10              # Ratio stability 10%
+CONF_W_RSI_DIVERGENCE = 8      # RSI Divergence 8%
+CONF_W_CORR_AGREEMENT = 10     # Correlation Agreement 10%
+
+# Keys of a prediction_data entry that go into a snapshot (everything else, e.g. the raw history frame, is left out)
+SNAPSHOT_SERIES_KEYS = ('closes', 'highs', 'lows', 'indicators', 'pair_stats')
+
+
+# =============================================================================
+# MARKET SNAPSHOT
+# =============================================================================
+class _ReadOnlyMapping(Mapping):
+    """A dict that can be read but not changed (and, unlike MappingProxyType, can be pickled)."""
+
+    __slots__ = ('_data',)
+
+    def __init__(self, data):
+        object.__setattr__(self, '_data', dict(data))
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __iter__(self):
+        return iter(self._data)
+
+    def __len__(self):
+        return len(self._data)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __reduce__(self):
+        return (type(self), (self._data,))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self._data!r})"
+
+
+def _freeze_series(entry):
+    """Read-only copy of one prediction_data entry: tuples for lists, a bounded view for indicators"""
+    frozen = {}
+    for key in SNAPSHOT_SERIES_KEYS:
+        if key not in entry:
+            continue
+        value = entry[key]
+        if isinstance(value, list):
+            value = tuple(value)
+        elif key == 'pair_stats' and value is not None:
+            value = _ReadOnlyMapping(value)
+        frozen[key] = value
+
+    closes = frozen.get('closes', ())
+    indicators = frozen.get('indicators')
+    if indicators is not None and len(indicators) != len(closes):
+        indicators = None  # stale state from an earlier fetch
+    if indicators is None and closes and frozen.get('highs') is not None and frozen.get('lows') is not None:
+        indicators = SeriesIndicators.from_series(closes, frozen['highs'], frozen['lows'])
+    if indicators is not None and not isinstance(indicators, IndicatorView) and closes:
+        # Pin the state at the last bar so later appends to a shared SeriesIndicators can't leak in
+        indicators = indicators.upto(len(closes) - 1)
+    if indicators is not None:
+        frozen['indicators'] = indicators
+    else:
+        frozen.pop('indicators', None)
+    return _ReadOnlyMapping(frozen)
+
+
+class MarketSnapshot(_ReadOnlyMapping):
+    """
+    Immutable market data for one prediction, keyed like prediction_data
+    (primary/secondary names, 'DXY', 'SP500_REGIME', 'VIX', 'Gold_GSR', ...).
+
+    Each series is a read-only mapping with 'closes' (plus 'highs'/'lows' and
+    'indicators' where available); missing sources map to None. as_of is the
+    time the data describes and last_crash_time the last CRASH regime the
+    caller has seen (for the RECOVERY buffer), or None. AppCore and the back
+    test both pass None today, so live runs and back tests agree.
+    """
+
+    __slots__ = ('as_of', 'last_crash_time')
+
+    def __init__(self, data, as_of=None, last_crash_time=None):
+        super().__init__({key: _freeze_series(entry) if entry else None for key, entry in data.items()})
+        object.__setattr__(self, 'as_of', as_of or datetime.now())
+        object.__setattr__(self, 'last_crash_time', last_crash_time)
+
+    def __reduce__(self):
+        return (type(self), (self._data, self.as_of, self.last_crash_time))
+
+
+def series_indicators(series):
+    """RSI/ATR/MACD state for a snapshot series (built from the closes if the snapshot has none)"""
+    indicators = series.get('indicators')
+    if indicators is None:
+        indicators = SeriesIndicators.from_series(series.get('closes', ()), series.get('highs'), series.get('lows'))
+    return indicators
+
+
+# =============================================================================
+# SCALAR INDICATORS
+# =============================================================================
+def calculate_rsi(closes, period=14):
+    """Calculate Relative Strength Index using Wilder's smoothed EMA"""
+    if len(closes) < period + 1:
+        return None
+
+    # Calculate daily changes
+    changes = []
+    for i in range(1, len(closes)):
+        changes.append(closes[i] - closes[i-1])
+
+    if len(changes) < period:
+        return None
+
+    # Separate gains and losses
+    gains = [max(c, 0) for c in changes]
+    losses = [max(-c, 0) for c in changes]
+
+    # Initialize with SMA for first 'period' values (seed the EMA)
+    avg_gain = sum(gains[:period]) / period
+    avg_loss = sum(losses[:period]) / period
+
+    # Apply Wilder's smoothing (EMA) for remaining values
+    for i in range(period, len(gains)):
+        avg_gain = (avg_gain * (period - 1) + gains[i]) / period
+        avg_loss = (avg_loss * (period - 1) + losses[i]) / period
+
+    if avg_loss == 0:
+        return 100  # No losses = RSI of 100
+
+    rs = avg_gain / avg_loss
+    rsi = 100 - (100 / (1 + rs))
+
+    return rsi
+
+def calculate_atr(highs, lows, closes, period=14):
+    """Calculate Average True Range using Wilder's smoothed EMA"""
+    if len(closes) < period + 1:
+        return None
+
+    true_ranges = []
+    for i in range(1, len(closes)):
+        high_low = highs[i] - lows[i]
+        high_close = abs(highs[i] - closes[i-1])
+        low_close = abs(lows[i] - closes[i-1])
+        tr = max(high_low, high_close, low_close)
+        true_ranges.append(tr)
+
+    if len(true_ranges) < period:
+        return None
+
+    # Initialize with SMA for first 'period' values (seed the EMA)
+    atr = sum(true_ranges[:period]) / period
+
+    # Apply Wilder's smoothing (EMA) for remaining values
+    for i in range(period, len(true_ranges)):
+        atr = (atr * (period - 1) + true_ranges[i]) / period
+
+    return atr
+
+def calculate_macd_histogram(closes):
+    """Calculate MACD histogram (MACD line - Signal line) using 12/26/9 EMA."""
+    if len(closes) < 35:
+        return None
+    # EMA helper
+    def ema(data, period):
+        multiplier = 2 / (period + 1)
+        result = [sum(data[:period]) / period]
+        for i in range(period, len(data)):
+            result.append((data[i] - result[-1]) * multiplier + result[-1])
+        return result
+
+    ema12 = ema(closes, 12)
+    ema26 = ema(closes, 26)
+    # Align lengths (ema26 starts later)
+    offset = 26 - 12
+    macd_line = [ema12[i + offset] - ema26[i] for i in range(len(ema26))]
+    if len(macd_line) < 9:
+        return None
+    signal_line = ema(macd_line, 9)
+    # Histogram is last value of macd_line - last value of signal_line
+    histogram = macd_line[-1] - signal_line[-1]
+    return histogram
+
+def correlation_over_period(primary_closes, secondary_closes, period):
+    """Return Pearson correlation of log returns over the given period (for fast/slow correlation)."""
+    n = min(len(primary_closes), len(secondary_closes), period)
+    if n < 5:
+        return 0.0
+    primary_returns = []
+    secondary_returns = []
+    for i in range(-n + 1, 0):
+        if primary_closes[i-1] > 0 and secondary_closes[i-1] > 0 and primary_closes[i] > 0 and secondary_closes[i] > 0:
+            primary_returns.append(math.log(primary_closes[i] / primary_closes[i-1]))
+            secondary_returns.append(math.log(secondary_closes[i] / secondary_closes[i-1]))
+    if len(primary_returns) < 5:
+        return 0.0
+    p_mean = sum(primary_returns) / len(primary_returns)
+    s_mean = sum(secondary_returns) / len(secondary_returns)
+    cov = sum((p - p_mean) * (s - s_mean) for p, s in zip(primary_returns, secondary_returns)) / len(primary_returns)
+    var_p = sum((p - p_mean) ** 2 for p in primary_returns) / len(primary_returns)
+    var_s = sum((s - s_mean) ** 2 for s in secondary_returns) / len(secondary_returns)
+    if var_p <= 0 or var_s <= 0:
+        return 0.0
+    return cov / (math.sqrt(var_p) * math.sqrt(var_s))
+
+def calculate_beta(primary_closes, secondary_closes, period=60):
+    """
+    Calculate dynamic beta between two assets based on their log returns.
+
+    Beta = Covariance(primary, secondary) / Variance(secondary)
+
+    Uses log returns for better statistical properties.
+    """
+    # Use the most recent 'period' days, or all available data
+    n = min(len(primary_closes), len(secondary_closes), period)
+
+    if n < 14:  # Need at least 14 days for meaningful calculation
+        return 1.0, 0.0  # Default fallback
+
+    # Calculate daily LOG returns for both assets
+    primary_returns = []
+    secondary_returns = []
+
+    for i in range(-n + 1, 0):
+        if primary_closes[i-1] > 0 and secondary_closes[i-1] > 0 and \
+           primary_closes[i] > 0 and secondary_closes[i] > 0:
+            p_return = math.log(primary_closes[i] / primary_closes[i-1])
+            s_return = math.log(secondary_closes[i] / secondary_closes[i-1])
+            primary_returns.append(p_return)
+            secondary_returns.append(s_return)
+
+    if len(primary_returns) < 10:
+        return 1.0, 0.0
+
+    # Calculate means
+    p_mean = sum(primary_returns) / len(primary_returns)
+    s_mean = sum(secondary_returns) / len(secondary_returns)
+
+    # Calculate covariance and variance
+    covariance = 0
+    s_variance = 0
+    p_variance = 0
+
+    for i in range(len(primary_returns)):
+        p_diff = primary_returns[i] - p_mean
+        s_diff = secondary_returns[i] - s_mean
+        covariance += p_diff * s_diff
+        s_variance += s_diff * s_diff
+        p_variance += p_diff * p_diff
+
+    covariance /= len(primary_returns)
+    s_variance /= len(secondary_returns)
+    p_variance /= len(primary_returns)
+
+    # Calculate beta
+    if s_variance == 0:
+        beta = 1.0
+    else:
+        beta = covariance / s_variance
+
+    # Calculate correlation (for confidence)
+    if p_variance > 0 and s_variance > 0:
+        correlation = covariance / (math.sqrt(p_variance) * math.sqrt(s_variance))
+    else:
+        correlation = 0
+
+    # Clamp beta to reasonable range (0.1 to 5.0)
+    beta = max(0.1, min(5.0, beta))
+
+    return beta, correlation
+
+def daily_return_sigma(closes, window=20):
+    """Population std dev of the last 'window' simple daily returns (None if there are none)"""
+    daily_returns = []
+    for i in range(-window, 0):
+        if closes[i - 1] > 0:
+            daily_returns.append(closes[i] / closes[i - 1] - 1)
+    if not daily_returns:
+        return None
+    mean_ret = sum(daily_returns) / len(daily_returns)
+    variance = sum((r - mean_ret) ** 2 for r in daily_returns) / len(daily_returns)
+    return math.sqrt(variance)
+
+def simple_correlation(series1, series2):
+    """Calculate Pearson correlation between two price series"""
+    n = min(len(series1), len(series2))
+    if n < 5:
+        return 0
+
+    s1 = series1[-n:]
+    s2 = series2[-n:]
+
+    mean1 = sum(s1) / n
+    mean2 = sum(s2) / n
+
+    cov = sum((s1[i] - mean1) * (s2[i] - mean2) for i in range(n)) / n
+    var1 = sum((x - mean1) ** 2 for x in s1) / n
+    var2 = sum((x - mean2) ** 2 for x in s2) / n
+
+    if var1 <= 0 or var2 <= 0:
+        return 0
+
+    return cov / (math.sqrt(var1) * math.sqrt(var2))
+
+
+# =============================================================================
+# TUNABLE PARAMETERS
+# =============================================================================
+# The regime/clamp/crash constants above that the engine reads through its
+# params, so a back test can try other values without touching the module.
+# Window lengths (moving averages, correlation periods) stay fixed: the
+# indicator series behind them are computed once and shared.
+PREDICTION_PARAM_NAMES = (
+    'correlation_regime_divergence',
+    'clamp_normal',
+    'clamp_elevated',
+    'clamp_crisis',
+    'clamp_recovery',
+    'clamp_crash_sigma',
+    'volatility_elevated_pct',
+    'volatility_crisis_pct',
+    'bear_beta_shrink',
+    'regime_beta_shrink',
+    'crash_vix_threshold',
+    'crash_gsr_threshold',
+    'crash_atr_pct_threshold',
+    'crash_consecutive_move',
+    'crash_dxy_rise',
+    'crash_metal_drop',
+    'crash_triggers_needed',
+    'crash_reversion_factor',
+    'recovery_reversion_factor',
+    'ratio_base_multiplier_factor',
+    'ratio_sideways_boost',
+)
+PredictionParams = namedtuple('PredictionParams', PREDICTION_PARAM_NAMES)
+
+DEFAULT_PARAMS = PredictionParams(
+    correlation_regime_divergence=CORRELATION_REGIME_DIVERGENCE,
+    clamp_normal=CLAMP_NORMAL,
+    clamp_elevated=CLAMP_ELEVATED,
+    clamp_crisis=CLAMP_CRISIS,
+    clamp_recovery=CLAMP_RECOVERY,
+    clamp_crash_sigma=CLAMP_CRASH_SIGMA,
+    volatility_elevated_pct=VOLATILITY_ELEVATED_PCT,
+    volatility_crisis_pct=VOLATILITY_CRISIS_PCT,
+    bear_beta_shrink=BEAR_BETA_SHRINK,
+    regime_beta_shrink=REGIME_BETA_SHRINK,
+    crash_vix_threshold=CRASH_VIX_THRESHOLD,
+    crash_gsr_threshold=CRASH_GSR_THRESHOLD,
+    crash_atr_pct_threshold=CRASH_ATR_PCT_THRESHOLD,
+    crash_consecutive_move=CRASH_CONSECUTIVE_MOVE,
+    crash_dxy_rise=CRASH_DXY_RISE,
+    crash_metal_drop=CRASH_METAL_DROP,
+    crash_triggers_needed=CRASH_TRIGGERS_NEEDED,
+    crash_reversion_factor=CRASH_REVERSION_FACTOR,
+    recovery_reversion_factor=RECOVERY_REVERSION_FACTOR,
+    ratio_base_multiplier_factor=RATIO_BASE_MULTIPLIER_FACTOR,
+    ratio_sideways_boost=RATIO_SIDEWAYS_BOOST,
+)
+
+
+# =============================================================================
+# PREDICTION ENGINE
+# =============================================================================
+class PredictionEngine:
+    """
+    v4 regime-aware prediction over a MarketSnapshot.
+
+    The engine holds no market data or crash state, so one instance can be
+    shared by any number of threads, and it pickles cleanly for worker
+    processes. params (a PredictionParams, default DEFAULT_PARAMS) holds the
+    regime/clamp/crash constants it uses.
+    """
+
+    def __init__(self, params=None):
+        self.params = params or DEFAULT_PARAMS
+
+    def predict(self, snapshot, primary_metal, secondary_name):
+        """Returns (prediction, confidence_pct, signals); prediction is None when there is too little data"""
+        prediction = self.calculate_prediction(snapshot, primary_metal, secondary_name)
+        confidence, signals = self.calculate_confidence(snapshot, primary_metal, secondary_name, prediction)
+        return prediction, confidence, signals
+
+    def detect_crash_triggers(self, snapshot, primary_metal):
+        """
+        Crash Detection System with 5 triggers. Returns (trigger_count, trigger_details).
+        Triggers:
+          1. VIX > 25
+          2. Gold/Silver Ratio (GSR) > 85
+          3. ATR% > 5%
+          4. 3+ consecutive days with >2% daily moves
+          5. DXY +1% AND metal -2% (5-day divergence)
+        """
+        params = self.params
+        triggers = []
+        trigger_count = 0
+
+        # Get primary data
+        primary = snapshot.get(primary_metal, {})
+        primary_closes = primary.get('closes', [])
+
+        # Trigger 1: VIX > 25
+        vix_data = snapshot.get('VIX')
+        if vix_data and vix_data.get('closes'):
+            vix_cur = vix_data['closes'][-1]
+            if vix_cur > params.crash_vix_threshold:
+                trigger_count += 1
+                triggers.append(f"VIX={vix_cur:.1f} > {params.crash_vix_threshold}")
+            else:
+                triggers.append(f"VIX={vix_cur:.1f} OK")
+        else:
+            triggers.append("VIX: no data")
+
+        # Trigger 2: GSR > 85
+        gold_closes = None
+        silver_closes = None
+        # Try to get gold/silver data from various sources
+        if 'Gold' in snapshot:
+            gold_closes = snapshot['Gold'].get('closes', [])
+        elif 'Gold_GSR' in snapshot and snapshot['Gold_GSR']:
+            gold_closes = snapshot['Gold_GSR'].get('closes', [])
+        if 'Silver' in snapshot:
+            silver_closes = snapshot['Silver'].get('closes', [])
+        elif 'Silver_GSR' in snapshot and snapshot['Silver_GSR']:
+            silver_closes = snapshot['Silver_GSR'].get('closes', [])
+
+        if gold_closes and silver_closes and silver_closes[-1] > 0:
+            gsr = gold_closes[-1] / silver_closes[-1]
+            if gsr > params.crash_gsr_threshold:
+                trigger_count += 1
+                triggers.append(f"GSR={gsr:.1f} > {params.crash_gsr_threshold}")
+            else:
+                triggers.append(f"GSR={gsr:.1f} OK")
+        else:
+            triggers.append("GSR: no data")
+
+        # Trigger 3: ATR% > 5%
+        atr_val = series_indicators(primary).atr()
+        if atr_val and len(primary_closes) > 0 and primary_closes[-1] > 0:
+            atr_pct = (atr_val / primary_closes[-1]) * 100
+            if atr_pct > params.crash_atr_pct_threshold:
+                trigger_count += 1
+                triggers.append(f"ATR%={atr_pct:.1f}% > {params.crash_atr_pct_threshold}%")
+            else:
+                triggers.append(f"ATR%={atr_pct:.1f}% OK")
+        else:
+            triggers.append("ATR%: no data")
+
+        # Trigger 4: 3+ consecutive days with >2% daily moves
+        if len(primary_closes) >= CRASH_CONSECUTIVE_DAYS + 1:
+            consecutive = 0
+            max_consecutive = 0
+            for i in range(-CRASH_CONSECUTIVE_DAYS - 5, 0):
+                if i - 1 >= -len(primary_closes) and primary_closes[i - 1] > 0:
+                    daily_move = abs(primary_closes[i] / primary_closes[i - 1] - 1)
+                    if daily_move > params.crash_consecutive_move:
+                        consecutive += 1
+                        max_consecutive = max(max_consecutive, consecutive)
+                    else:
+                        consecutive = 0
+            if max_consecutive >= CRASH_CONSECUTIVE_DAYS:
+                trigger_count += 1
+                triggers.append(f"Consecutive={max_consecutive}d > {CRASH_CONSECUTIVE_DAYS}d")
+            else:
+                triggers.append(f"Consecutive={max_consecutive}d OK")
+        else:
+            triggers.append("Consecutive: no data")
+
+        # Trigger 5: DXY +1% AND metal -2% (5-day divergence)
+        dxy_data = snapshot.get('DXY')
+        if dxy_data and dxy_data.get('closes') and len(dxy_data['closes']) >= 6 and len(primary_closes) >= 6:
+            dxy_closes = dxy_data['closes']
+            dxy_5d_change = (dxy_closes[-1] / dxy_closes[-6]) - 1
+            metal_5d_change = (primary_closes[-1] / primary_closes[-6]) - 1
+            if dxy_5d_change >= params.crash_dxy_rise and metal_5d_change <= params.crash_metal_drop:
+                trigger_count += 1
+                triggers.append(f"DXY={dxy_5d_change*100:+.1f}%/Metal={metal_5d_change*100:+.1f}% DIVERGE")
+            else:
+                triggers.append(f"DXY={dxy_5d_change*100:+.1f}%/Metal={metal_5d_change*100:+.1f}% OK")
+        else:
+            triggers.append("DXY/Metal divergence: no data")
+
+        return trigger_count, triggers
+
+    def get_regime(self, snapshot, primary_metal):
+        """
+        Classify market regime with 5 regimes.
+        CRASH: 3/5 crash triggers active. Mean reversion to 20d MA, 30% reversion towards 50d MA.
+        RECOVERY: 10 day buffer after crash. Mean reversion to 20d MA, 20% reversion towards 20d MA.
+        SIDEWAYS: Primary RSI 45-55, 7d/14d SMA momentum, beta 1.0x.
+        BULL: S&P 500 > 20d MA, 7d/14d SMA momentum, beta 1.0x.
+        BEAR: S&P 500 < 20d MA, 7d/14d SMA momentum, beta 0.7x.
+        Returns (regime_str, sp500_cur, sp500_ma, extra_info) where extra_info is a dict.
+        """
+        params = self.params
+        sp_data = snapshot.get('SP500_REGIME') if snapshot else None
+        if not sp_data or not sp_data.get('closes'):
+            return None, None, None, {}
+        closes = sp_data['closes']
+        if len(closes) < REGIME_MA_DAYS:
+            return None, None, None, {}
+        sp500_cur = closes[-1]
+        sp500_ma = sum(closes[-REGIME_MA_DAYS:]) / REGIME_MA_DAYS
+
+        extra_info = {}
+
+        # Check for CRASH first (highest priority)
+        crash_triggers, crash_details = self.detect_crash_triggers(snapshot, primary_metal)
+        extra_info['crash_triggers'] = crash_triggers
+        extra_info['crash_details'] = crash_details
+
+        if crash_triggers >= params.crash_triggers_needed:
+            return 'CRASH', sp500_cur, sp500_ma, extra_info
+
+        # Check for RECOVERY (if we were recently in crash)
+        # Use a simple heuristic: if crash triggers were recently high but now below threshold,
+        # and VIX is still elevated (> 20), treat as recovery.
+        # The engine keeps no crash state of its own - the caller passes the last crash it saw.
+        if snapshot.last_crash_time:
+            days_since_crash = (snapshot.as_of - snapshot.last_crash_time).days
+            if days_since_crash <= RECOVERY_BUFFER_DAYS:
+                if crash_triggers < params.crash_triggers_needed:
+                    extra_info['recovery_days_remaining'] = RECOVERY_BUFFER_DAYS - days_since_crash
+                    return 'RECOVERY', sp500_cur, sp500_ma, extra_info
+
+        # Check primary RSI for SIDEWAYS
+        primary = snapshot.get(primary_metal, {})
+        primary_closes = primary.get('closes', [])
+        rsi = series_indicators(primary).rsi() if len(primary_closes) >= 15 else None
+
+        if rsi is not None and 45 <= rsi <= 55:
+            return 'SIDEWAYS', sp500_cur, sp500_ma, extra_info
+
+        # BULL vs BEAR based on S&P 500 vs 20d MA
+        if sp500_cur > sp500_ma:
+            return 'BULL', sp500_cur, sp500_ma, extra_info
+        return 'BEAR', sp500_cur, sp500_ma, extra_info
+
+    def pair_statistics(self, primary, secondary):
+        """
+        Slow (60d) and fast correlation, beta/correlation and the primary's 20d
+        daily sigma as of the latest bar. Back test days carry these precomputed;
+        otherwise they come from vector_indicators (or the scalar functions above
+        when NumPy is unavailable).
+        """
+        stats = primary.get('pair_stats')
+        if stats is not None:
+            return stats
+
+        primary_closes = primary['closes']
+        secondary_closes = secondary['closes']
+
+        if vector_indicators.np is None:
+            beta, correlation = calculate_beta(primary_closes, secondary_closes)
+            return {
+                'correlation_slow': correlation_over_period(primary_closes, secondary_closes, 60),
+                'correlation_fast': correlation_over_period(primary_closes, secondary_closes, CORRELATION_FAST_DAYS),
+                'beta': beta,
+                'correlation': correlation,
+                'sigma': daily_return_sigma(primary_closes) if len(primary_closes) >= 21 else None,
+            }
+
+        # Pair statistics line the two series up from the end, like the scalar functions
+        n = min(len(primary_closes), len(secondary_closes))
+        series = vector_indicators.pair_statistics(primary_closes[-n:], secondary_closes[-n:],
+                                                   fast_period=CORRELATION_FAST_DAYS)
+        stats = {key: float(values[-1]) for key, values in series.items()}
+        sigma = vector_indicators.rolling_sigma(primary_closes)[-1]
+        stats['sigma'] = None if math.isnan(sigma) else float(sigma)
+        return stats
+
+    def calculate_prediction(self, snapshot, primary_metal, secondary_name):
+        """Calculate predicted price using v4 regime-aware logic with 5 regimes."""
+        params = self.params
+        if primary_metal not in snapshot or secondary_name not in snapshot:
+            return None
+
+        primary = snapshot[primary_metal]
+        secondary = snapshot[secondary_name]
+
+        primary_closes = primary['closes']
+        secondary_closes = secondary['closes']
+
+        if len(primary_closes) < 30 or len(secondary_closes) < 30:
+            return None
+
+        # Current prices
+        primary_cur = primary_closes[-1]
+        secondary_cur = secondary_closes[-1]
+
+        # Regime detection (5 regimes: CRASH, RECOVERY, SIDEWAYS, BULL, BEAR)
+        regime, sp500_cur, sp500_ma, regime_extra = self.get_regime(snapshot, primary_metal)
+
+        # Dual correlation: fast (10d) vs slow (60d) for regime-change detection
+        pair_stats = self.pair_statistics(primary, secondary)
+        corr_slow = pair_stats['correlation_slow']
+        corr_fast = pair_stats['correlation_fast']
+        regime_change = abs(corr_fast - corr_slow) > params.correlation_regime_divergence
+
+        # ATR and volatility
+        atr_val = None
+        volatility_pct = None
+        if primary_cur > 0:
+            atr_val = series_indicators(primary).atr()
+            volatility_pct = (atr_val / primary_cur) * 100 if atr_val else 0
+
+        # === MOMENTUM CALCULATION (regime-dependent) ===
+        if regime == 'CRASH':
+            # Mean reversion to 20d MA momentum calculation
+            if len(primary_closes) >= REGIME_MA_DAYS:
+                ma_20d = sum(primary_closes[-REGIME_MA_DAYS:]) / REGIME_MA_DAYS
+                # Reversion: 30% towards 50d MA
+                if len(primary_closes) >= CRASH_REVERSION_MA:
+                    ma_50d = sum(primary_closes[-CRASH_REVERSION_MA:]) / CRASH_REVERSION_MA
+                    reversion_target = primary_cur + params.crash_reversion_factor * (ma_50d - primary_cur)
+                    secondary_momentum = (reversion_target / primary_cur) - 1
+                else:
+                    secondary_momentum = (ma_20d / primary_cur) - 1
+            else:
+                secondary_momentum = 0
+        elif regime == 'RECOVERY':
+            # Mean reversion to 20d MA momentum calculation
+            if len(primary_closes) >= RECOVERY_REVERSION_MA:
+                ma_20d = sum(primary_closes[-RECOVERY_REVERSION_MA:]) / RECOVERY_REVERSION_MA
+                reversion_target = primary_cur + params.recovery_reversion_factor * (ma_20d - primary_cur)
+                secondary_momentum = (reversion_target / primary_cur) - 1
+            else:
+                secondary_momentum = 0
+        else:
+            # SIDEWAYS, BULL, BEAR: 7d/14d SMA momentum calculation
+            secondary_7davg = sum(secondary_closes[-7:]) / 7
+            secondary_14davg = sum(secondary_closes[-14:]) / 14
+            if secondary_14davg <= 0 or secondary_7davg <= 0:
+                return None
+            secondary_momentum_log = math.log(secondary_7davg / secondary_14davg)
+            secondary_momentum = math.exp(secondary_momentum_log) - 1
+
+        # === DYNAMIC BETA with regime adjustment ===
+        beta, correlation = pair_stats['beta'], pair_stats['correlation']
+        beta_for_move = beta
+
+        if regime == 'CRASH' or regime == 'RECOVERY':
+            # Crash/Recovery use mean reversion, beta not applied to momentum
+            beta_for_move = 1.0
+        elif regime == 'SIDEWAYS':
+            beta_for_move = beta * 1.0  # full beta
+        elif regime == 'BULL':
+            beta_for_move = beta * 1.0  # full beta
+        elif regime == 'BEAR':
+            beta_for_move = beta * params.bear_beta_shrink  # 0.7x
+
+        # Apply regime change shrink on top
+        if regime_change and regime not in ('CRASH', 'RECOVERY'):
+            beta_for_move = beta_for_move * params.regime_beta_shrink
+
+        # Expected move
+        primary_expected_move = secondary_momentum * beta_for_move
+
+        # === DYNAMIC CLAMP (regime-dependent) ===
+        if regime == 'CRASH':
+            # Dynamic σ-based clamp (3σ max)
+            if atr_val and primary_cur > 0:
+                # Use daily returns std dev * sqrt(7) for weekly σ
+                if len(primary_closes) >= 21:
+                    daily_sigma = pair_stats['sigma']
+                    if daily_sigma is not None:
+                        weekly_sigma = daily_sigma * SQRT_7
+                        clamp = min(weekly_sigma * params.clamp_crash_sigma, 0.50)  # cap at 50% max
+                    else:
+                        clamp = params.clamp_crisis
+                else:
+                    clamp = params.clamp_crisis
+            else:
+                clamp = params.clamp_crisis
+        elif regime == 'RECOVERY':
+            clamp = params.clamp_recovery
+        elif regime_change:
+            clamp = params.clamp_crisis
+        elif volatility_pct is not None and volatility_pct >= params.volatility_crisis_pct:
+            clamp = params.clamp_crisis
+        elif volatility_pct is not None and volatility_pct >= params.volatility_elevated_pct:
+            clamp = params.clamp_elevated
+        else:
+            clamp = params.clamp_normal
+
+        primary_expected_move = max(-clamp, min(clamp, primary_expected_move))
+
+        # === RATIO AND MEAN REVERSION PRESSURE ===
+        current_ratio = secondary_cur / primary_cur if primary_cur > 0 else 0
+        if len(primary_closes) >= 28 and len(secondary_closes) >= 28:
+            ratio_history = []
+            for i in range(-28, 0):
+                if primary_closes[i] > 0:
+                    ratio_history.append(secondary_closes[i] / primary_closes[i])
+            avg_ratio = sum(ratio_history) / len(ratio_history) if ratio_history else current_ratio
+        else:
+            avg_ratio = current_ratio
+
+        ratio_deviation = (current_ratio - avg_ratio) / avg_ratio if avg_ratio > 0 else 0
+
+        # Base multiplier: |ρ| × 0.15
+        if correlation < 0:
+            pressure_multiplier = 0  # Negative correlation pressure = 0
+        else:
+            pressure_multiplier = abs(correlation) * params.ratio_base_multiplier_factor
+
+        # SIDEWAYS: 2.0x boost
+        if regime == 'SIDEWAYS':
+            pressure_multiplier *= params.ratio_sideways_boost
+
+        ratio_pressure = ratio_deviation * pressure_multiplier
+
+        # Bear disable condition: primary 14d momentum < 0
+        primary_14d_momentum = None
+        if len(primary_closes) >= 15 and primary_closes[-15] > 0:
+            primary_14d_momentum = (primary_closes[-1] / primary_closes[-15]) - 1
+        if regime == 'BEAR' and primary_14d_momentum is not None and primary_14d_momentum < 0:
+            ratio_pressure = 0.0
+
+        # Bull disable condition: MACD histogram < 0
+        if regime == 'BULL':
+            macd_hist = series_indicators(secondary).macd_histogram()
+            if macd_hist is not None and macd_hist < 0:
+                ratio_pressure = 0.0
+
+        # No ratio pressure in crash/recovery (mean reversion handles it)
+        if regime in ('CRASH', 'RECOVERY'):
+            ratio_pressure = 0.0
+
+        # === FINAL PREDICTION ===
+        predicted_price = primary_cur * (1 + primary_expected_move + ratio_pressure)
+
+        return {
+            'predicted_price': predicted_price,
+            'current_price': primary_cur,
+            'secondary_momentum': secondary_momentum * 100,
+            'primary_expected_move': primary_expected_move * 100,
+            'current_ratio': current_ratio,
+            'avg_ratio': avg_ratio,
+            'ratio_deviation': ratio_deviation * 100,
+            'ratio_pressure': ratio_pressure * 100,
+            'pressure_multiplier': pressure_multiplier,
+            'beta': beta,
+            'correlation': correlation,
+            'regime': regime,
+            'regime_change': regime_change,
+            'regime_extra': regime_extra,
+            'clamp_used': clamp,
+            'correlation_fast': corr_fast,
+            'correlation_slow': corr_slow,
+            'volatility_pct': volatility_pct,
+        }
+
+    def calculate_confidence(self, snapshot, primary_metal, secondary_name, prediction_result):
+        """Calculate confidence percentage based on 8 weighted factors (v4)."""
+        if not prediction_result:
+            return 0, []
+
+        primary = snapshot.get(primary_metal, {})
+        secondary = snapshot.get(secondary_name, {})
+        dxy_data = snapshot.get('DXY', None)
+
+        signals = []
+        confidence_points = 0
+
+        # v4 weights: Correlation 40%, DXY 7%(4% copper), Regime Fit 10%, RSI 10%,
+        #             Volatility 5%, Ratio 10%, RSI Divergence 8%, Correlation Agreement 10%
+        is_copper = (primary_metal == 'Copper')
+        W_CORRELATION = CONF_W_CORRELATION          # 40
+        W_DXY = CONF_W_DXY_COPPER if is_copper else CONF_W_DXY  # 4 or 7
+        W_REGIME_FIT = CONF_W_REGIME_FIT            # 10
+        W_RSI = CONF_W_RSI                          # 10
+        W_VOLATILITY = CONF_W_VOLATILITY            # 5
+        W_RATIO = CONF_W_RATIO                      # 10
+        W_RSI_DIVERGENCE = CONF_W_RSI_DIVERGENCE    # 8
+        W_CORR_AGREEMENT = CONF_W_CORR_AGREEMENT    # 10
+        max_points = W_CORRELATION + W_DXY + W_REGIME_FIT + W_RSI + W_VOLATILITY + W_RATIO + W_RSI_DIVERGENCE + W_CORR_AGREEMENT
+
+        primary_closes = primary.get('closes', [])
+        secondary_closes = secondary.get('closes', [])
+        primary_indicators = series_indicators(primary)
+        regime = prediction_result.get('regime')
+        regime_change = prediction_result.get('regime_change', False)
+        ratio_deviation_abs = abs(prediction_result.get('ratio_deviation', 0)) / 100
+
+        # =====================
+        # FACTOR 1: Correlation (60d) - 40%
+        # =====================
+        correlation = prediction_result.get('correlation', 0)
+        abs_corr = abs(correlation)
+        if abs_corr >= 0.7:
+            confidence_points += W_CORRELATION
+            signals.append(("Correlation", f"✓ Strong ({correlation:.2f}) - reliable beta (+{W_CORRELATION}pts)", True))
+        elif abs_corr >= 0.5:
+            scaled_pts = int(W_CORRELATION * (abs_corr - 0.3) / 0.4)
+            confidence_points += scaled_pts
+            signals.append(("Correlation", f"△ Moderate ({correlation:.2f}) (+{scaled_pts}pts)", False))
+        elif abs_corr >= 0.3:
+            quarter_pts = W_CORRELATION // 4
+            confidence_points += quarter_pts
+            signals.append(("Correlation", f"✗ Weak ({correlation:.2f}) (+{quarter_pts}pts)", False))
+        else:
+            signals.append(("Correlation", f"✗ Very weak ({correlation:.2f}) - beta unreliable (+0pts)", False))
+
+        # =====================
+        # FACTOR 2: DXY Health - 7% (4% copper)
+        # =====================
+        if dxy_data is not None and 'closes' in dxy_data:
+            dxy_closes = dxy_data['closes']
+            if len(primary_closes) >= 14 and len(dxy_closes) >= 14:
+                dxy_corr = simple_correlation(
+                    primary_closes[-14:], dxy_closes[-min(14, len(dxy_closes)):]
+                )
+                if dxy_corr <= -0.5:
+                    confidence_points += W_DXY
+                    signals.append(("DXY Health", f"✓ Healthy inverse ({dxy_corr:.2f}) (+{W_DXY}pts)", True))
+                elif dxy_corr < 0:
+                    scaled_pts = int(W_DXY * abs(dxy_corr) / 0.5)
+                    confidence_points += scaled_pts
+                    signals.append(("DXY Health", f"△ Mild inverse ({dxy_corr:.2f}) (+{scaled_pts}pts)", False))
+                else:
+                    signals.append(("DXY Health", f"✗ Moving with USD ({dxy_corr:.2f}) (+0pts)", False))
+            else:
+                signals.append(("DXY Health", "? Insufficient DXY data", False))
+        else:
+            signals.append(("DXY Health", "? DXY data unavailable", False))
+
+        # =====================
+        # FACTOR 3: Regime Fit - 10%
+        # =====================
+        regime_fit = False
+        if regime == 'BULL' and secondary_name == 'Gold':
+            regime_fit = True
+            regime_desc = "Bull + Gold anchor"
+        elif regime == 'BEAR' and secondary_name == 'S&P 500':
+            regime_fit = True
+            regime_desc = "Bear + S&P 500 anchor"
+        elif regime == 'SIDEWAYS' and ratio_deviation_abs < 0.10:
+            regime_fit = True
+            regime_desc = "Sideways + stable ratio"
+        elif regime == 'CRASH':
+            regime_fit = True  # crash regime is always a "fit" since it overrides
+            regime_desc = "Crash - mean reversion active"
+        elif regime == 'RECOVERY':
+            regime_fit = True
+            regime_desc = "Recovery - buffer active"
+        else:
+            regime_desc = f"Regime {regime or '?'} / {secondary_name}"
+        if regime_fit:
+            confidence_points += W_REGIME_FIT
+            signals.append(("Regime Fit", f"✓ {regime_desc} (+{W_REGIME_FIT}pts)", True))
+        else:
+            signals.append(("Regime Fit", f"△ {regime_desc} (+0pts)", False))
+
+        # =====================
+        # FACTOR 4: RSI Range - 10%
+        # =====================
+        rsi = primary_indicators.rsi()
+        if rsi is not None:
+            if 30 <= rsi <= 70:
+                confidence_points += W_RSI
+                signals.append(("RSI Range", f"✓ RSI ({rsi:.1f}) neutral (+{W_RSI}pts)", True))
+            elif 20 <= rsi < 30 or 70 < rsi <= 80:
+                half_pts = W_RSI // 2
+                confidence_points += half_pts
+                signals.append(("RSI Range", f"△ RSI ({rsi:.1f}) near extreme (+{half_pts}pts)", False))
+            else:
+                signals.append(("RSI Range", f"✗ RSI ({rsi:.1f}) extreme (+0pts)", False))
+
+        # =====================
+        # FACTOR 5: Volatility - 5%
+        # =====================
+        atr = primary_indicators.atr()
+        if atr is not None and len(primary_closes) > 0:
+            current_price = primary_closes[-1]
+            volatility_pct = (atr / current_price) * 100 if current_price > 0 else 0
+            if volatility_pct < 2:
+                confidence_points += W_VOLATILITY
+                signals.append(("Volatility", f"✓ Low ({volatility_pct:.1f}%) (+{W_VOLATILITY}pts)", True))
+            elif volatility_pct < 4:
+                half_pts = W_VOLATILITY // 2
+                confidence_points += half_pts
+                signals.append(("Volatility", f"△ Moderate ({volatility_pct:.1f}%) (+{half_pts}pts)", False))
+            else:
+                signals.append(("Volatility", f"✗ High ({volatility_pct:.1f}%) (+0pts)", False))
+
+        # =====================
+        # FACTOR 6: Ratio Stability - 10%
+        # =====================
+        if ratio_deviation_abs < 0.05:
+            confidence_points += W_RATIO
+            signals.append(("Ratio Stability", f"✓ Near average ({ratio_deviation_abs*100:.1f}% dev) (+{W_RATIO}pts)", True))
+        elif ratio_deviation_abs < 0.15:
+            half_pts = W_RATIO // 2
+            confidence_points += half_pts
+            signals.append(("Ratio Stability", f"△ Extended ({ratio_deviation_abs*100:.1f}% dev) (+{half_pts}pts)", False))
+        else:
+            signals.append(("Ratio Stability", f"✗ Far from avg ({ratio_deviation_abs*100:.1f}% dev) (+0pts)", False))
+
+        # =====================
+        # FACTOR 7: RSI Divergence - 8%
+        # Price making new highs/lows but RSI isn't confirming
+        # =====================
+        rsi_divergence_pts = 0
+        if rsi is not None and len(primary_closes) >= 14:
+            # Check if price trend matches RSI trend (last 14 days)
+            price_trend = (primary_closes[-1] / primary_closes[-14]) - 1
+
+            # RSI as it was 14 days ago (bar -15) for comparison
+            if len(primary_closes) >= 28:
+                rsi_old = primary_indicators.rsi_at(-15)
+                if rsi_old is not None:
+                    rsi_trend = rsi - rsi_old
+                    # Divergence: price up but RSI down, or price down but RSI up
+                    if (price_trend > 0.02 and rsi_trend < -5) or (price_trend < -0.02 and rsi_trend > 5):
+                        # Divergence detected - this is informative but lowers confidence
+                        signals.append(("RSI Divergence", f"✗ Divergence detected (price {price_trend*100:+.1f}%, RSI {rsi_trend:+.1f}) (+0pts)", False))
+                    else:
+                        # No divergence - price and RSI agree
+                        rsi_divergence_pts = W_RSI_DIVERGENCE
+                        confidence_points += rsi_divergence_pts
+                        signals.append(("RSI Divergence", f"✓ Price/RSI aligned (+{W_RSI_DIVERGENCE}pts)", True))
+                else:
+                    signals.append(("RSI Divergence", "? Insufficient RSI history", False))
+            else:
+                signals.append(("RSI Divergence", "? Insufficient data for RSI divergence", False))
+        else:
+            signals.append(("RSI Divergence", "? RSI unavailable", False))
+
+        # =====================
+        # FACTOR 8: Correlation Agreement - 10%
+        # Fast (10d) and slow (60d) correlations should agree in sign and magnitude
+        # =====================
+        corr_fast = prediction_result.get('correlation_fast', 0)
+        corr_slow = prediction_result.get('correlation_slow', 0)
+        corr_diff = abs(corr_fast - corr_slow)
+        if corr_diff < 0.15 and (corr_fast * corr_slow > 0):
+            # Strong agreement: same sign and close magnitude
+            confidence_points += W_CORR_AGREEMENT
+            signals.append(("Corr Agreement", f"✓ Fast/slow aligned ({corr_fast:.2f}/{corr_slow:.2f}, diff={corr_diff:.2f}) (+{W_CORR_AGREEMENT}pts)", True))
+        elif corr_diff < 0.30 and (corr_fast * corr_slow > 0):
+            # Moderate agreement
+            half_pts = W_CORR_AGREEMENT // 2
+            confidence_points += half_pts
+            signals.append(("Corr Agreement", f"△ Partial alignment ({corr_fast:.2f}/{corr_slow:.2f}, diff={corr_diff:.2f}) (+{half_pts}pts)", False))
+        else:
+            signals.append(("Corr Agreement", f"✗ Fast/slow diverging ({corr_fast:.2f}/{corr_slow:.2f}, diff={corr_diff:.2f}) (+0pts)", False))
+
+        confidence_pct = (confidence_points / max_points) * 100 if max_points > 0 else 0
+        # Cap confidence when regime change detected
+        if regime_change:
+            confidence_pct = min(confidence_pct, CONFIDENCE_CAP_REGIME_CHANGE)
+            signals.append(("Regime Change", f"⚠ Confidence capped at {CONFIDENCE_CAP_REGIME_CHANGE}% (fast/slow correlation divergence)", False))
+
+        return confidence_pct, signals
@@ -0,0 +1,311 @@
+"""
+Local HTTP pricing service for the Metal Price Calculator.
+
+Serves the numbers the calculator tab shows - the current price, the
+AVAILABLE_METRICS snapshot and every custom formula's price after sales
+tax - plus the latest prediction of each metal's suggested pairing, as JSON
+for other tools on this machine:
+
+    GET /health                 refresher state and the age of each metal's data
+    GET /prices                 current price of every metal ($/gram and $/oz)
+    GET /metals/<metal>         price, metrics, tax rate and formula prices
+    GET /predictions/<metal>    latest 7-day prediction (suggested pairing)
+
+Requests never fetch anything. One background refresher (an asyncio task)
+brings every metal up to date each refresh interval through AppCore - the
+same spot price cache, history store, formulas and settings the desktop app
+uses - and encodes each response body once. A request only looks up those
+bytes, so the server answers hundreds of requests per second on one core.
+
+Stale-while-revalidate: when a refresh fails (upstream outage, no network)
+the last good body keeps being served, marked stale (Warning: 110 and an
+X-Refresh-Error header) with its Age. After a failed refresh the next one
+waits twice as long each time (up to REFRESH_BACKOFF_MAX). A request for
+data older than twice its refresh interval brings that retry forward to
+half the back-off, but never sooner than one refresh interval after the
+last attempt started, and is still answered immediately with what is
+cached. 503 only until a metal's first refresh.
+
+Run it with:  python metal_cli.py serve [--port 8765]
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import time
+from datetime import datetime
+from urllib.parse import urlsplit, unquote
+
+from app_config import (METALS, SUGGESTED_PAIRINGS, TROY_OUNCE_TO_GRAMS, AVAILABLE_METRICS, METRIC_LABELS)
+from app_core import read_settings, settings_tax_rate, formula_price
+
+SERVICE_HOST = '127.0.0.1'       # local tools only
+SERVICE_PORT = 8765
+SERVICE_REFRESH_INTERVAL = 300   # seconds between refreshes of prices, metrics and formula prices
+PREDICTION_REFRESH_INTERVAL = 3600  # predictions use 3 months of daily bars - hourly is plenty
+REFRESH_BACKOFF_MAX = 3600       # longest wait between refreshes while they keep failing
+KEEPALIVE_TIMEOUT = 15           # seconds an idle keep-alive connection is held open
+MAX_HEADER_LINES = 100
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+            503: 'Service Unavailable'}
+
+
+def _json(data):
+    return json.dumps(data, separators=(',', ':'), default=str).encode('utf-8')
+
+
+class CachedResponse:
+    """One encoded response body and when its data was last refreshed successfully."""
+
+    __slots__ = ('body', 'updated', 'error')
+
+    def __init__(self, body, updated, error=None):
+        self.body = body
+        self.updated = updated  # time.time() of the last successful refresh
+        self.error = error      # message of the last failed refresh since then, or None
+
+    def age(self, now=None):
+        return (now or time.time()) - self.updated
+
+
+class PriceService:
+    """Shared response cache, its background refresher and the HTTP front end."""
+
+    def __init__(self, core, metals=None, refresh_interval=SERVICE_REFRESH_INTERVAL,
+                 prediction_interval=PREDICTION_REFRESH_INTERVAL, predictions=True):
+        self.core = core
+        self.metals = list(metals or METALS)
+        self.refresh_interval = refresh_interval
+        self.prediction_interval = prediction_interval
+        self.predictions = predictions
+
+        self.responses = {}  # path -> CachedResponse
+        self.last_refresh = None
+        self._predicted_at = {}  # metal -> time.time() of the last prediction attempt
+        self._lookup = {metal.lower(): metal for metal in self.metals}
+        self._wake = None
+        self._failures = 0       # consecutive refreshes with at least one failed fetch
+        self._refresh_errors = 0  # failed fetches in the refresh running now
+        # Blocking AppCore calls run on one worker thread, created once for the life of the service
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='price-refresh')
+
+    # =========================================================================
+    # REFRESHER
+    # =========================================================================
+
+    async def refresher(self):
+        """Refresh every metal, then wait for the interval (backed off after failures), forever"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            try:
+                refreshed = await loop.run_in_executor(self._executor, self.refresh)
+            except Exception as e:
+                print(f"Price service refresh failed: {e}")
+                refreshed = False
+            self._failures = 0 if refreshed else self._failures + 1
+            # Requests that came in while refreshing are answered by this refresh
+            self._wake.clear()
+
+            delay = self.retry_delay()
+            next_refresh = started + delay
+            while True:
+                remaining = next_refresh - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=remaining)
+                except asyncio.TimeoutError:
+                    break
+                # A stale read brings the retry forward, but never sooner than one interval after the last attempt
+                self._wake.clear()
+                next_refresh = min(next_refresh, started + max(self.refresh_interval, delay / 2))
+
+    def retry_delay(self):
+        """Seconds from the start of one refresh to the next: the interval, doubled per consecutive failure"""
+        return min(self.refresh_interval * 2 ** self._failures, max(self.refresh_interval, REFRESH_BACKOFF_MAX))
+
+    def refresh(self):
+        """
+        Bring every metal's responses up to date (blocking; runs on the
+        refresher thread). Returns False if any fetch failed.
+        """
+        self._refresh_errors = 0
+        # Formulas and the tax setting are read each time so edits in the desktop app show up
+        formulas = self.core.store.formulas()
+        tax_rate = settings_tax_rate(read_settings(self.core.data_path))
+
+        spot_fetched = self.core.refresh_spot_prices(self.metals)
+        now = time.time()
+        for metal in self.metals:
+            result, error = self.core.price_metrics(metal)
+            if error:
+                self._mark_failed(f'/metals/{metal.lower()}', error.split('\n')[0])
+            else:
+                self._store(f'/metals/{metal.lower()}', self.metal_payload(metal, result, formulas, tax_rate), now)
+
+            if self.predictions and now - self._predicted_at.get(metal, 0) >= self.prediction_interval:
+                self._predicted_at[metal] = now
+                self.refresh_prediction(metal)
+
+        if not spot_fetched:
+            self._mark_failed('/prices', "no spot price could be fetched")
+            self.last_refresh = now
+            return False
+        prices = self.core.spot_prices.snapshot()
+        self._store('/prices', {
+            'updated': datetime.fromtimestamp(now).isoformat(),
+            'prices': {metal: {'per_gram': prices[metal] / TROY_OUNCE_TO_GRAMS, 'per_oz': prices[metal]}
+                       for metal in self.metals if metal in prices},
+        }, now)
+        self.last_refresh = now
+        return self._refresh_errors == 0
+
+    def refresh_prediction(self, metal):
+        secondary = SUGGESTED_PAIRINGS[metal]
+        path = f'/predictions/{metal.lower()}'
+        try:
+            data = self.core.fetch_prediction_data(metal, secondary)
+            analysis = self.core.analyze_prediction(data, metal, secondary)
+            if analysis is None or analysis['result'] is None:
+                raise Exception(f"Could not calculate a prediction for {metal} / {secondary}.")
+            self._store(path, dict(analysis['result'], timestamp=datetime.now().isoformat()), time.time())
+        except Exception as e:
+            self._mark_failed(path, str(e).split('\n')[0])
+
+    def metal_payload(self, metal, result, formulas, tax_rate):
+        """JSON body of /metals/<metal>: what the calculator tab shows, in $/gram"""
+        metrics = result['metrics']
+        formula_prices = []
+        for formula in formulas:
+            formula_prices.append({
+                'name': formula.get('name'),
+                'group': formula.get('group', 'Default'),
+                'price': formula_price(formula, metrics, result['rolling'], tax_rate, self.core.formula_cache),
+                'apply_tax': formula.get('apply_tax', True),
+            })
+        return {
+            'metal': metal,
+            'updated': datetime.now().isoformat(),
+            'unit': 'per gram',
+            'current_price': metrics['current_price'],
+            'metrics': {metric: metrics.get(metric) for metric in AVAILABLE_METRICS},
+            'metric_labels': METRIC_LABELS,
+            'tax_rate': tax_rate,
+            'formulas': formula_prices,
+        }
+
+    def _store(self, path, data, now):
+        self.responses[path] = CachedResponse(_json(data), now)
+
+    def _mark_failed(self, path, error):
+        print(f"Price service: {path} not refreshed: {error}")
+        self._refresh_errors += 1
+        cached = self.responses.get(path)
+        if cached is not None:
+            cached.error = error  # keep serving the last good body, now marked stale
+
+    # =========================================================================
+    # HTTP
+    # =========================================================================
+
+    def respond(self, method, target):
+        """(status, body, extra headers) for one request - from the cache only"""
+        if method not in ('GET', 'HEAD'):
+            return 405, _json({'error': 'only GET is supported'}), [('Allow', 'GET, HEAD')]
+
+        path = unquote(urlsplit(target).path).rstrip('/').lower() or '/'
+        if path in ('/', '/health'):
+            now = time.time()
+            return 200, _json({
+                'status': 'ok' if self.last_refresh is not None else 'starting',
+                'last_refresh': datetime.fromtimestamp(self.last_refresh).isoformat() if self.last_refresh else None,
+                'refresh_interval': self.refresh_interval,
+                'data': {p: {'age_seconds': round(r.age(now), 1), 'error': r.error}
+                         for p, r in sorted(self.responses.items())},
+            }), []
+
+        parts = path.split('/')
+        if len(parts) == 3 and parts[1] in ('metals', 'predictions') and parts[2] not in self._lookup:
+            return 404, _json({'error': f"unknown metal '{parts[2]}'", 'metals': self.metals}), []
+        if path != '/prices' and not (len(parts) == 3 and parts[1] in ('metals', 'predictions')):
+            return 404, _json({'error': f"no such resource '{path}'"}), []
+
+        cached = self.responses.get(path)
+        if cached is None:
+            return 503, _json({'error': 'not available yet - the first refresh has not finished'}), \
+                [('Retry-After', str(min(self.refresh_interval, 30)))]
+
+        age = cached.age()
+        interval = self.prediction_interval if parts[1] == 'predictions' else self.refresh_interval
+        if age > 2 * interval:
+            self._wake.set()  # serve what we have, revalidate in the background
+        headers = [('Age', str(int(age))),
+                   ('Cache-Control', f'max-age={interval}, stale-while-revalidate={interval}')]
+        if cached.error is not None or age > 2 * interval:
+            headers.append(('Warning', '110 - "Response is Stale"'))
+        if cached.error is not None:
+            headers.append(('X-Refresh-Error', cached.error.encode('ascii', 'replace').decode('ascii')))
+        return 200, cached.body, headers
+
+    async def handle(self, reader, writer):
+        """Serve the requests of one connection (HTTP/1.1 keep-alive)"""
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), timeout=KEEPALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break
+
+                headers = {}
+                for _ in range(MAX_HEADER_LINES):
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    status, body, extra, version = 400, _json({'error': 'bad request line'}), [], 'HTTP/1.0'
+                    method = 'GET'
+                else:
+                    status, body, extra = self.respond(method, target)
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+                head = [f"HTTP/1.1 {status} {_REASONS[status]}",
+                        "Content-Type: application/json",
+                        f"Content-Length: {len(body)}",
+                        f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                head += [f"{name}: {value}" for name, value in extra]
+                writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+                if method != 'HEAD':
+                    writer.write(body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            pass  # server shutting down
+        finally:
+            writer.close()
+
+    async def serve(self, host=SERVICE_HOST, port=SERVICE_PORT, ready=None):
+        """Run the refresher and the HTTP server until cancelled; ready(server) once listening"""
+        self._wake = asyncio.Event()
+        server = await asyncio.start_server(self.handle, host, port)
+        refresher = asyncio.create_task(self.refresher())
+        if ready is not None:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            refresher.cancel()
+            self._executor.shutdown(wait=False, cancel_futures=True)
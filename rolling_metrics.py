@@ -0,0 +1,192 @@
+"""
+Rolling-window price metrics for the Metal Price Calculator.
+
+RollingMetrics turns one series of daily closes into every formula
+variable as a full series - element t is the metric as it stood after day
+t, NaN until the window has filled. Each series is built in one pass:
+
+    Nd avg   running window sum                          O(n)
+    Nd med   two heaps with lazy deletion                O(n log N)
+    Nd hi/lo monotonic deque                             O(n)
+    1yavg    running sum over every close so far         O(n)
+    cur      the close itself
+
+Window lengths are read from the variable name, so any 'Nd' window
+(60davg, 90dmed, 20dhi ...) works in a formula without being listed
+anywhere. A median is sorted(window)[N // 2] - the upper middle value for
+even windows - matching the metrics the calculator has always shown.
+"""
+
+import heapq
+import math
+import re
+from collections import deque
+
+WINDOW_METRIC_PATTERN = re.compile(r'^([1-9][0-9]*)d(avg|med|hi|lo)$')
+FIXED_METRICS = ('cur', '1yavg')
+
+_TOKEN_PATTERN = re.compile(r'[A-Za-z0-9_]+')
+
+
+def is_metric_name(name):
+    """True for a variable RollingMetrics can compute (cur, 1yavg or any Nd avg/med/hi/lo)"""
+    return name in FIXED_METRICS or WINDOW_METRIC_PATTERN.match(name) is not None
+
+
+def window_metrics_in(expression):
+    """The Nd avg/med/hi/lo variables an expression uses, in order of first use"""
+    names = []
+    for token in _TOKEN_PATTERN.findall(expression):
+        if WINDOW_METRIC_PATTERN.match(token) and token not in names:
+            names.append(token)
+    return names
+
+
+def rolling_mean(values, window):
+    """Mean of the last 'window' values (NaN before 'window' values)"""
+    out = [math.nan] * len(values)
+    total = 0.0
+    for i, value in enumerate(values):
+        total += value
+        if i >= window:
+            total -= values[i - window]
+        if i >= window - 1:
+            out[i] = total / window
+    return out
+
+
+def rolling_median(values, window):
+    """sorted(last 'window' values)[window // 2] (NaN before 'window' values)"""
+    out = [math.nan] * len(values)
+    low = []    # max-heap (negated) of the smaller window // 2 values, as (-value, index)
+    high = []   # min-heap of the rest, as (value, index); high[0] is the median
+    in_low = [False] * len(values)
+    low_size = high_size = 0  # live entries - expired ones stay in the heaps until they reach the top
+
+    def prune(heap, oldest):
+        while heap and heap[0][1] < oldest:
+            heapq.heappop(heap)
+
+    for i, value in enumerate(values):
+        oldest = i - window + 1  # first index still in the window
+
+        # Expire the value that just left the window
+        if oldest > 0:
+            if in_low[oldest - 1]:
+                low_size -= 1
+            else:
+                high_size -= 1
+
+        # Insert through low so every low value stays <= every high value
+        heapq.heappush(low, (-value, i))
+        in_low[i] = True
+        prune(low, oldest)
+        neg, index = heapq.heappop(low)
+        heapq.heappush(high, (-neg, index))
+        in_low[index] = False
+        high_size += 1
+
+        # Rebalance to low_size == live // 2
+        target = (low_size + high_size) // 2
+        while low_size < target:
+            prune(high, oldest)
+            item, index = heapq.heappop(high)
+            heapq.heappush(low, (-item, index))
+            in_low[index] = True
+            high_size -= 1
+            low_size += 1
+        while low_size > target:
+            prune(low, oldest)
+            neg, index = heapq.heappop(low)
+            heapq.heappush(high, (-neg, index))
+            in_low[index] = False
+            low_size -= 1
+            high_size += 1
+
+        # Drop expired entries once they outnumber the live ones (keeps the heaps O(window))
+        if len(low) + len(high) > 2 * window:
+            low = [entry for entry in low if entry[1] >= oldest]
+            high = [entry for entry in high if entry[1] >= oldest]
+            heapq.heapify(low)
+            heapq.heapify(high)
+
+        if oldest >= 0:
+            prune(high, oldest)
+            out[i] = high[0][0]
+    return out
+
+
+def _rolling_extreme(values, window, better):
+    out = [math.nan] * len(values)
+    candidates = deque()  # indices whose values are still able to become the extreme
+    for i, value in enumerate(values):
+        while candidates and not better(values[candidates[-1]], value):
+            candidates.pop()
+        candidates.append(i)
+        if candidates[0] <= i - window:
+            candidates.popleft()
+        if i >= window - 1:
+            out[i] = values[candidates[0]]
+    return out
+
+
+def rolling_max(values, window):
+    """Highest of the last 'window' values (NaN before 'window' values)"""
+    return _rolling_extreme(values, window, lambda kept, new: kept > new)
+
+
+def rolling_min(values, window):
+    """Lowest of the last 'window' values (NaN before 'window' values)"""
+    return _rolling_extreme(values, window, lambda kept, new: kept < new)
+
+
+def expanding_mean(values):
+    """Mean of every value up to and including each one"""
+    out = []
+    total = 0.0
+    for i, value in enumerate(values):
+        total += value
+        out.append(total / (i + 1))
+    return out
+
+
+_WINDOW_FUNCTIONS = {
+    'avg': rolling_mean,
+    'med': rolling_median,
+    'hi': rolling_max,
+    'lo': rolling_min,
+}
+
+
+class RollingMetrics:
+    """Every formula variable as a daily series over one set of closes (series built on first use)."""
+
+    def __init__(self, closes):
+        self.closes = [float(c) for c in closes]
+        self._series = {}
+
+    def __len__(self):
+        return len(self.closes)
+
+    def series(self, name):
+        """The metric after each day (list of floats, NaN until its window fills); KeyError for unknown names"""
+        values = self._series.get(name)
+        if values is None:
+            if name == 'cur':
+                values = list(self.closes)
+            elif name == '1yavg':
+                values = expanding_mean(self.closes)
+            else:
+                match = WINDOW_METRIC_PATTERN.match(name)
+                if match is None:
+                    raise KeyError(name)
+                values = _WINDOW_FUNCTIONS[match.group(2)](self.closes, int(match.group(1)))
+            self._series[name] = values
+        return values
+
+    def latest(self, name):
+        """The metric after the last day, or None if there is not enough history for it"""
+        if not self.closes:
+            return None
+        value = self.series(name)[-1]
+        return None if math.isnan(value) else value
@@ -0,0 +1,149 @@
+"""
+Parity tests: vector_indicators against the scalar reference functions in
+prediction_engine, and SeriesIndicators (vectorized load + O(1) appends)
+against the same references.
+
+Every vectorized series is compared at every bar where the scalar function,
+run on the series cut off at that bar, returns a value; where the scalar
+function has no value yet the vectorized one must be NaN. Values must agree
+within vector_indicators.PARITY_TOLERANCE.
+
+Run with:  python -m pytest test_vector_indicators.py
+"""
+
+import math
+import random
+import unittest
+
+import vector_indicators
+from vector_indicators import PARITY_TOLERANCE
+from indicators import SeriesIndicators, MACD_MIN_BARS
+from prediction_engine import (calculate_rsi, calculate_atr, calculate_macd_histogram, correlation_over_period,
+                               calculate_beta, daily_return_sigma)
+
+BARS = 260
+SEEDS = (1, 7, 42)
+
+
+def random_walk(seed, bars=BARS, start=25.0, volatility=0.02):
+    """Seeded (closes, highs, lows) of a geometric random walk"""
+    rng = random.Random(seed)
+    closes, highs, lows = [], [], []
+    price = start
+    for _ in range(bars):
+        price *= math.exp(rng.gauss(0, volatility))
+        spread = price * abs(rng.gauss(0, volatility / 2))
+        closes.append(price)
+        highs.append(price + spread * rng.random())
+        lows.append(price - spread * rng.random())
+    return closes, highs, lows
+
+
+def with_gaps(closes, seed):
+    """Copy of closes with a flat stretch (no losses) and a zero price, to exercise the filters"""
+    rng = random.Random(seed)
+    closes = list(closes)
+    flat = rng.randrange(40, BARS - 40)
+    for i in range(flat, flat + 16):
+        closes[i] = closes[flat - 1] * (1 + 0.001 * (i - flat + 1))
+    closes[rng.randrange(80, BARS - 20)] = 0.0
+    return closes
+
+
+@unittest.skipIf(vector_indicators.np is None, "NumPy is not installed")
+class VectorParityTest(unittest.TestCase):
+
+    def assert_matches(self, vector_series, scalar_at, bars, label):
+        """vector_series[t] == scalar_at(t) within PARITY_TOLERANCE (NaN where scalar_at is None)"""
+        self.assertEqual(len(vector_series), bars, label)
+        compared = 0
+        for t in range(bars):
+            expected = scalar_at(t)
+            actual = float(vector_series[t])
+            if expected is None:
+                self.assertTrue(math.isnan(actual), f"{label}[{t}]: expected no value, got {actual}")
+                continue
+            self.assertFalse(math.isnan(actual), f"{label}[{t}]: expected {expected}, got NaN")
+            self.assertLessEqual(abs(actual - expected), PARITY_TOLERANCE,
+                                 f"{label}[{t}]: {actual} != {expected}")
+            compared += 1
+        self.assertGreater(compared, 0, f"{label}: the scalar function never had a value")
+
+    def test_rsi(self):
+        for seed in SEEDS:
+            closes, _, _ = random_walk(seed)
+            for series, label in ((closes, 'rsi'), (with_gaps(closes, seed), 'rsi (gaps)')):
+                self.assert_matches(vector_indicators.rsi(series), lambda t: calculate_rsi(series[:t + 1]),
+                                    BARS, f"{label} seed {seed}")
+
+    def test_atr(self):
+        for seed in SEEDS:
+            closes, highs, lows = random_walk(seed)
+            self.assert_matches(vector_indicators.atr(highs, lows, closes),
+                                lambda t: calculate_atr(highs[:t + 1], lows[:t + 1], closes[:t + 1]),
+                                BARS, f"atr seed {seed}")
+
+    def test_macd_histogram(self):
+        for seed in SEEDS:
+            closes, _, _ = random_walk(seed)
+            self.assert_matches(vector_indicators.macd_histogram(closes),
+                                lambda t: calculate_macd_histogram(closes[:t + 1]),
+                                BARS, f"macd seed {seed}")
+
+    def test_rolling_correlation(self):
+        for seed in SEEDS:
+            primary, _, _ = random_walk(seed)
+            secondary = with_gaps(random_walk(seed + 100)[0], seed)
+            for period in (10, 60):
+                self.assert_matches(vector_indicators.rolling_correlation(primary, secondary, period),
+                                    lambda t: correlation_over_period(primary[:t + 1], secondary[:t + 1], period),
+                                    BARS, f"correlation({period}) seed {seed}")
+
+    def test_rolling_beta(self):
+        for seed in SEEDS:
+            primary, _, _ = random_walk(seed)
+            secondary = with_gaps(random_walk(seed + 100)[0], seed)
+            beta, correlation = vector_indicators.rolling_beta(primary, secondary, 60)
+            self.assert_matches(beta, lambda t: calculate_beta(primary[:t + 1], secondary[:t + 1], 60)[0],
+                                BARS, f"beta seed {seed}")
+            self.assert_matches(correlation, lambda t: calculate_beta(primary[:t + 1], secondary[:t + 1], 60)[1],
+                                BARS, f"beta correlation seed {seed}")
+
+    def test_rolling_sigma(self):
+        for seed in SEEDS:
+            closes = with_gaps(random_walk(seed)[0], seed)
+            # The scalar function reads the last 21 closes, so it is defined from bar 20 on
+            self.assert_matches(vector_indicators.rolling_sigma(closes, 20),
+                                lambda t: daily_return_sigma(closes[:t + 1], 20) if t >= 20 else None,
+                                BARS, f"sigma seed {seed}")
+
+
+class SeriesIndicatorsParityTest(unittest.TestCase):
+
+    def assert_state_matches(self, indicators, closes, highs, lows, label):
+        for t in range(len(closes)):
+            for name, actual, expected in (
+                    ('rsi', indicators.rsi_at(t), calculate_rsi(closes[:t + 1])),
+                    ('atr', indicators.atr_at(t), calculate_atr(highs[:t + 1], lows[:t + 1], closes[:t + 1])),
+                    ('macd', indicators.macd_histogram_at(t), calculate_macd_histogram(closes[:t + 1]))):
+                if expected is None:
+                    self.assertIsNone(actual, f"{label} {name}[{t}]")
+                else:
+                    self.assertIsNotNone(actual, f"{label} {name}[{t}]")
+                    self.assertLessEqual(abs(actual - expected), PARITY_TOLERANCE,
+                                         f"{label} {name}[{t}]: {actual} != {expected}")
+
+    def test_from_series_then_append(self):
+        for seed in SEEDS:
+            closes, highs, lows = random_walk(seed)
+            # Long enough for the vectorized load (when NumPy is there), then bar-by-bar appends
+            for loaded in (MACD_MIN_BARS, 120, 10):
+                indicators = SeriesIndicators.from_series(closes[:loaded], highs[:loaded], lows[:loaded])
+                for t in range(loaded, BARS):
+                    indicators.append(closes[t], highs[t], lows[t])
+                self.assertEqual(len(indicators), BARS)
+                self.assert_state_matches(indicators, closes, highs, lows, f"seed {seed} loaded {loaded}")
+
+
+if __name__ == '__main__':
+    unittest.main()
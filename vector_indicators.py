@@ -0,0 +1,223 @@
+"""
+Vectorized indicator functions for the Metal Price Calculator.
+
+Every function takes float64 arrays (or lists) and returns a whole series:
+element t is the indicator as it would be computed from bars 0..t, NaN where
+there is not enough data yet. Pair statistics (correlation, beta) expect the
+two series aligned bar for bar.
+
+These follow the scalar functions in prediction_engine exactly in definition
+(same seeding, windows, filters and fallbacks); results agree with them to
+within 1e-9 (absolute - RSI in points, ATR/MACD/sigma in price units,
+correlation and beta unitless). The only differences are floating point
+summation order. test_vector_indicators.py checks this at every bar of
+seeded random series.
+"""
+
+try:
+    import numpy as np
+    from numpy.lib.stride_tricks import sliding_window_view
+except ImportError:
+    np = None
+
+PARITY_TOLERANCE = 1e-9
+
+# Recurrences are evaluated in blocks so the a**-k scaling stays well inside float64 range
+_BLOCK = 64
+
+
+def _recurrence(x, a, b, init):
+    """y[k] = a * y[k-1] + b * x[k] with y[-1] = init, for every k"""
+    x = np.asarray(x, dtype=np.float64)
+    out = np.empty(len(x))
+    k = np.arange(_BLOCK)
+    powers = a ** (k + 1)       # a^(k+1)
+    inverse = a ** -k           # a^-k
+    prev = init
+    for start in range(0, len(x), _BLOCK):
+        chunk = x[start:start + _BLOCK]
+        m = len(chunk)
+        y = powers[:m] * prev + b * (powers[:m] / a) * np.cumsum(chunk * inverse[:m])
+        out[start:start + m] = y
+        prev = y[-1]
+    return out
+
+
+def wilder_average(values, period, offset=0):
+    """
+    Wilder smoothing of values (which start at bar 'offset'): SMA of the first
+    'period' values, then avg = (avg * (period - 1) + v) / period.
+    Returns a series aligned to bars (length offset + len(values)).
+    """
+    out = np.full(offset + len(values), np.nan)
+    if len(values) < period:
+        return out
+    seed = values[:period].sum() / period
+    out[offset + period - 1] = seed
+    if len(values) > period:
+        out[offset + period:] = _recurrence(values[period:], (period - 1) / period, 1 / period, seed)
+    return out
+
+
+def ema(values, period):
+    """EMA seeded with the SMA of the first 'period' values (NaN before that)"""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if len(values) < period:
+        return out
+    seed = values[:period].sum() / period
+    out[period - 1] = seed
+    if len(values) > period:
+        multiplier = 2 / (period + 1)
+        out[period:] = _recurrence(values[period:], 1 - multiplier, multiplier, seed)
+    return out
+
+
+def rsi(closes, period=14):
+    """Wilder RSI series (0-100)"""
+    return rsi_components(closes, period)[0]
+
+
+def rsi_components(closes, period=14):
+    """(rsi, avg_gain, avg_loss) series - the averages are the Wilder state behind the RSI"""
+    closes = np.asarray(closes, dtype=np.float64)
+    if len(closes) < 2:
+        return (np.full(len(closes), np.nan),) * 3
+    changes = np.diff(closes)
+    avg_gain = wilder_average(np.maximum(changes, 0), period, 1)
+    avg_loss = wilder_average(np.maximum(-changes, 0), period, 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out = 100 - (100 / (1 + avg_gain / avg_loss))
+    out[avg_loss == 0] = 100  # No losses = RSI of 100
+    return out, avg_gain, avg_loss
+
+
+def atr(highs, lows, closes, period=14):
+    """Wilder Average True Range series"""
+    highs = np.asarray(highs, dtype=np.float64)
+    lows = np.asarray(lows, dtype=np.float64)
+    closes = np.asarray(closes, dtype=np.float64)
+    if len(closes) < 2:
+        return np.full(len(closes), np.nan)
+    prev_close = closes[:-1]
+    true_range = np.maximum.reduce([
+        highs[1:] - lows[1:],
+        np.abs(highs[1:] - prev_close),
+        np.abs(lows[1:] - prev_close),
+    ])
+    return wilder_average(true_range, period, 1)
+
+
+def macd_histogram(closes, fast=12, slow=26, signal=9, min_bars=35):
+    """MACD histogram series (MACD line - signal line), NaN until min_bars closes"""
+    return macd_components(closes, fast, slow, signal, min_bars)[0]
+
+
+def macd_components(closes, fast=12, slow=26, signal=9, min_bars=35):
+    """(histogram, fast_ema, slow_ema, signal_ema) series, all aligned to bars"""
+    closes = np.asarray(closes, dtype=np.float64)
+    histogram = np.full(len(closes), np.nan)
+    signal_ema = np.full(len(closes), np.nan)
+    fast_ema = ema(closes, fast)
+    slow_ema = ema(closes, slow)
+    if len(closes) >= slow:
+        macd_line = fast_ema[slow - 1:] - slow_ema[slow - 1:]
+        signal_ema[slow - 1:] = ema(macd_line, signal)
+        histogram[slow - 1:] = macd_line - signal_ema[slow - 1:]
+        histogram[:min_bars - 1] = np.nan
+    return histogram, fast_ema, slow_ema, signal_ema
+
+
+def _return_windows(primary_closes, secondary_closes, period):
+    """
+    Log return windows, one row per bar: row t holds the returns of bars
+    max(1, t - period + 2)..t, NaN-padded (and NaN where either price is not
+    positive). Row 0 is all NaN.
+    """
+    p = np.asarray(primary_closes, dtype=np.float64)
+    s = np.asarray(secondary_closes, dtype=np.float64)
+    valid = (p[:-1] > 0) & (s[:-1] > 0) & (p[1:] > 0) & (s[1:] > 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rp = np.where(valid, np.log(p[1:] / p[:-1]), np.nan)
+        rs = np.where(valid, np.log(s[1:] / s[:-1]), np.nan)
+    width = period - 1
+    pad = np.full(width, np.nan)
+    wp = sliding_window_view(np.concatenate([pad, rp]), width)
+    ws = sliding_window_view(np.concatenate([pad, rs]), width)
+    return wp, ws
+
+
+def _pair_moments(primary_closes, secondary_closes, period):
+    """Per-bar (count, covariance, var_primary, var_secondary) of windowed log returns"""
+    wp, ws = _return_windows(primary_closes, secondary_closes, period)
+    count = np.sum(~np.isnan(wp), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        dp = wp - (np.nansum(wp, axis=1) / count)[:, None]
+        ds = ws - (np.nansum(ws, axis=1) / count)[:, None]
+        cov = np.nansum(dp * ds, axis=1) / count
+        var_p = np.nansum(dp * dp, axis=1) / count
+        var_s = np.nansum(ds * ds, axis=1) / count
+    return count, cov, var_p, var_s
+
+
+def rolling_correlation(primary_closes, secondary_closes, period):
+    """Pearson correlation of log returns over the trailing 'period' bars (0.0 when too little data)"""
+    n_bars = min(len(primary_closes), len(secondary_closes))
+    if n_bars < 2:
+        return np.zeros(n_bars)
+    count, cov, var_p, var_s = _pair_moments(primary_closes[:n_bars], secondary_closes[:n_bars], period)
+    bars = np.arange(n_bars)
+    ok = (np.minimum(bars + 1, period) >= 5) & (count >= 5) & (var_p > 0) & (var_s > 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        corr = cov / (np.sqrt(var_p) * np.sqrt(var_s))
+    return np.where(ok, corr, 0.0)
+
+
+def rolling_beta(primary_closes, secondary_closes, period=60):
+    """
+    (beta, correlation) series of log returns over the trailing 'period' bars.
+    Beta falls back to 1.0 (correlation 0.0) with too little data and is clamped to 0.1-5.0.
+    """
+    n_bars = min(len(primary_closes), len(secondary_closes))
+    if n_bars < 2:
+        return np.ones(n_bars), np.zeros(n_bars)
+    count, cov, var_p, var_s = _pair_moments(primary_closes[:n_bars], secondary_closes[:n_bars], period)
+    bars = np.arange(n_bars)
+    enough = (np.minimum(bars + 1, period) >= 14) & (count >= 10)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        raw_beta = np.where(var_s == 0, 1.0, cov / var_s)
+        raw_corr = np.where((var_p > 0) & (var_s > 0), cov / (np.sqrt(var_p) * np.sqrt(var_s)), 0.0)
+    beta = np.where(enough, np.clip(raw_beta, 0.1, 5.0), 1.0)
+    corr = np.where(enough, raw_corr, 0.0)
+    return beta, corr
+
+
+def rolling_sigma(closes, window=20):
+    """Population std dev of the last 'window' simple daily returns (NaN before window + 1 bars)"""
+    closes = np.asarray(closes, dtype=np.float64)
+    out = np.full(len(closes), np.nan)
+    if len(closes) < window + 1:
+        return out
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.where(closes[:-1] > 0, closes[1:] / closes[:-1] - 1, np.nan)
+    windows = sliding_window_view(returns, window)
+    count = np.sum(~np.isnan(windows), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(windows, axis=1) / count
+        variance = np.nansum((windows - mean[:, None]) ** 2, axis=1) / count
+    out[window:] = np.where(count > 0, np.sqrt(variance), np.nan)
+    return out
+
+
+def pair_statistics(primary_closes, secondary_closes, slow_period=60, fast_period=10, beta_period=60):
+    """
+    Everything the prediction needs from a primary/secondary pair, as whole series:
+    {'correlation_slow', 'correlation_fast', 'beta', 'correlation'}.
+    """
+    beta, correlation = rolling_beta(primary_closes, secondary_closes, beta_period)
+    return {
+        'correlation_slow': rolling_correlation(primary_closes, secondary_closes, slow_period),
+        'correlation_fast': rolling_correlation(primary_closes, secondary_closes, fast_period),
+        'beta': beta,
+        'correlation': correlation,
+    }